@@ -0,0 +1,107 @@
+"""
+Transient Magnetic Dipole over a Layered Earth
+==============================================
+
+:py:class:`~geoana.em.tdem.MagneticDipoleLayeredHalfSpace` computes off-time
+fields over a layered earth by transforming the frequency domain response with
+digital linear sine and cosine filters. Here we compare it to a direct
+evaluation of the filters, which needs the frequency domain response at every
+filter abscissa of every time channel, and then convolve the step-off response
+with a ramp-off current waveform.
+
+"""
+
+from time import perf_counter
+
+import numpy as np
+import matplotlib.pyplot as plt
+import libdlf
+
+from geoana.em import fdem, tdem
+
+###############################################################################
+# Setup
+# -----
+#
+# A vertical magnetic dipole on the surface of a three layer earth, with 21
+# time channels and receivers every 25 m along a 500 m profile.
+
+times = np.logspace(-5, -2, 21)
+thickness = np.r_[10., 20.]
+sigma = np.r_[0.05, 0.5, 0.01]
+
+x = np.arange(10., 510., 25.)
+xyz = np.c_[x, np.zeros_like(x), np.zeros_like(x)]
+
+simulation = tdem.MagneticDipoleLayeredHalfSpace(
+    times, thickness, sigma=sigma, orientation="Z"
+)
+
+###############################################################################
+# Direct filter evaluation
+# ------------------------
+#
+# The step-off field is
+#
+# .. math::
+#     h(t) = -\frac{2}{\pi t}\sum_i \frac{\textrm{Im}[H(b_i/t)]}{b_i/t} c_i
+#
+# for the filter base :math:`b_i` and cosine weights :math:`c_i`, so every time
+# channel needs its own set of frequencies.
+
+
+def direct_step_off(times, xyz):
+    base, _, f_cos = libdlf.fourier.key_201_2012()
+    omega = (base[:, None] / times).reshape(-1)
+    sim = fdem.MagneticDipoleLayeredHalfSpace(
+        omega / (2 * np.pi), thickness, sigma=sigma, orientation="Z", quasistatic=True
+    )
+    h_freq = sim.magnetic_field(xyz, field="secondary").imag
+    h_freq = h_freq.reshape((len(base), len(times), len(xyz), 3))
+    omega = omega.reshape((len(base), len(times), 1, 1))
+    return -2 / np.pi * np.einsum("i,itlc->tlc", f_cos, h_freq / omega) / times[:, None, None]
+
+
+###############################################################################
+# Benchmark
+# ---------
+#
+# Time both approaches. The direct evaluation is slow, so it is only run once.
+
+timings = {}
+t0 = perf_counter()
+reference = direct_step_off(times, xyz)
+timings["direct"] = perf_counter() - t0
+
+t0 = perf_counter()
+h_step = simulation.magnetic_field(xyz)
+timings["lagged"] = perf_counter() - t0
+
+error = np.abs(h_step - reference).max() / np.abs(reference).max()
+print(f"direct: {timings['direct']*1E3:8.1f} ms")
+print(
+    f"lagged: {timings['lagged']*1E3:8.1f} ms, "
+    f"speedup {timings['direct']/timings['lagged']:6.1f}x, max relative error {error:.1e}"
+)
+
+###############################################################################
+# Ramp-off waveform
+# -----------------
+#
+# The same simulation, with the current switched off linearly over 0.5 ms.
+
+simulation.waveform = np.c_[[-5E-4, 0.], [1., 0.]]
+h_ramp = simulation.magnetic_field(xyz)
+
+i_rx = np.searchsorted(x, 100.)
+fig, ax = plt.subplots(1, 1, figsize=(6, 4))
+ax.loglog(times, np.abs(reference[:, i_rx, 2]), "k", label="step-off (direct)")
+ax.loglog(times, np.abs(h_step[:, i_rx, 2]), "C0--", label="step-off")
+ax.loglog(times, np.abs(h_ramp[:, i_rx, 2]), "C1", label="0.5 ms ramp-off")
+ax.set_xlabel("Time (s)")
+ax.set_ylabel("|H$_z$| (A/m)")
+ax.set_title(f"Vertical magnetic field at {x[i_rx]:.0f} m offset")
+ax.legend()
+ax.grid()
+plt.tight_layout()
+plt.show()
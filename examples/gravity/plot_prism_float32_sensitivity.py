@@ -0,0 +1,98 @@
+"""
+Single Precision Prism Sensitivities
+====================================
+
+Sensitivity matrices of gravity surveys over large meshes are limited by memory
+(and the memory bandwidth of multiplying them with a model) rather than by
+accuracy. :py:class:`~geoana.gravity.PrismCollection` can compute them in single
+precision with ``dtype=np.float32``, which halves their size.
+
+The prism kernels are still evaluated in double precision: the definite integral
+over a prism is the alternating sum of the kernel at its 8 corners, which
+cancels badly for small prisms far from the receivers, so only the final value
+is rounded to single precision. Here we compare the cost and accuracy of both
+precisions for the vertical gravitational field of a mesh.
+
+"""
+
+from time import perf_counter
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from geoana.gravity import PrismCollection
+
+###############################################################################
+# Setup
+# -----
+#
+# A 40 x 40 x 20 cell tensor mesh with a random density model, and a 20 x 20
+# grid of receivers 5 m above it.
+
+rng = np.random.default_rng(0)
+x_nodes = np.linspace(-200., 200., 41)
+y_nodes = np.linspace(-200., 200., 41)
+z_nodes = np.linspace(-200., 0., 21)
+rho = rng.normal(size=40 * 40 * 20)
+
+rx = np.linspace(-190., 190., 20)
+rx_x, rx_y = np.meshgrid(rx, rx)
+xyz = np.c_[rx_x.ravel(), rx_y.ravel(), np.full(rx_x.size, 5.)]
+
+###############################################################################
+# Benchmark
+# ---------
+#
+# Time building the sensitivity matrix of :math:`g_z` (once, as it is slow) and
+# multiplying it with the model (the best of several repeats), in both precisions.
+
+results = {}
+for dtype in [np.float64, np.float32]:
+    prisms = PrismCollection.from_tensor_nodes(
+        x_nodes, y_nodes, z_nodes, rho=rho, dtype=dtype
+    )
+    t0 = perf_counter()
+    G_z = prisms.gravitational_field_sensitivity(xyz)[:, 2]
+    build = perf_counter() - t0
+    matvec = []
+    G_z = np.ascontiguousarray(G_z)
+    m = rho.astype(dtype)
+    for _ in range(20):
+        t0 = perf_counter()
+        g_z = G_z @ m
+        matvec.append(perf_counter() - t0)
+    results[np.dtype(dtype).name] = (G_z, g_z, build, min(matvec))
+
+G_64, g_64 = results["float64"][:2]
+for name, (G_z, g_z, build, matvec) in results.items():
+    error_G = np.abs(G_z - G_64).max() / np.abs(G_64).max()
+    error_g = np.abs(g_z - g_64).max() / np.abs(g_64).max()
+    print(
+        f"{name}: {G_z.nbytes / 2**20:6.1f} MiB, build {build * 1E3:7.1f} ms, "
+        f"matvec {matvec * 1E3:6.2f} ms, max relative error of G {error_G:.1e} "
+        f"and of g_z {error_g:.1e}"
+    )
+
+###############################################################################
+# Accuracy
+# --------
+#
+# The error of the single precision field, relative to the largest field, is at
+# the level of single precision round off.
+
+G_32, g_32 = results["float32"][:2]
+error = np.abs(g_32 - g_64) / np.abs(g_64).max()
+
+fig, axs = plt.subplots(1, 2, figsize=(10, 4))
+im = axs[0].pcolormesh(rx, rx, g_64.reshape(rx_x.shape), shading="auto")
+plt.colorbar(im, ax=axs[0])
+axs[0].set_title("$g_z$ (float64)")
+im = axs[1].pcolormesh(rx, rx, error.reshape(rx_x.shape), shading="auto")
+plt.colorbar(im, ax=axs[1])
+axs[1].set_title("Relative error of $g_z$ (float32)")
+for ax in axs:
+    ax.set_xlabel("x (m)")
+    ax.set_ylabel("y (m)")
+    ax.set_aspect("equal")
+plt.tight_layout()
+plt.show()
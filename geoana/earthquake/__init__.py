@@ -13,6 +13,7 @@ The ``geoana.earthquake.oksar`` etc...
 
   EarthquakeInterferogram
   Oksar
+  OksarPatches
 
 """
 from . import oksar
@@ -14,6 +14,9 @@ Heritage:
 
 """
 
+import os
+from collections import deque
+
 import numpy as np
 try:
     import utm
@@ -26,6 +29,71 @@ except ImportError:
     matplotlib = False
 from datetime import datetime
 from geoana.utils import requires
+try:
+    from geoana.kernels._extensions.okada import (
+        okada_surface_displacement, okada_point_displacement
+    )
+except ImportError:
+    okada_surface_displacement = None
+    okada_point_displacement = None
+
+def _snapping_scales(x, y, params):
+    """Scales of the fault coordinates over the locations x, y.
+
+    Okada's ``dccon2`` snaps the (xi, et, q) coordinates of each corner of a fault
+    to zero when they are negligible relative to their largest magnitude over the
+    locations. As every coordinate is a monotonic function of the location's X or Y
+    in the fault's frame, only the extremes of X and Y are needed, so passing the
+    corners of a grid gives the scales of the whole grid.
+
+    Returns
+    -------
+    (n_patch, 4) numpy.ndarray
+        The scale of each patch for its corners, ordered as (aw1, al1), (aw1, al2),
+        (aw2, al1), (aw2, al2).
+    """
+    EPS = 1.0E-6
+    pl8 = 0.017453292519943
+    center = np.atleast_2d(params["center"])
+    strike_vector = np.atleast_2d(params["strike_vector"])
+    x0, y0, ct, st, dip, al1, al2, aw1, aw2 = (
+        v[:, None] for v in np.broadcast_arrays(
+            center[:, 0], center[:, 1], strike_vector[:, 0], strike_vector[:, 1],
+            *(np.atleast_1d(params[key]) for key in ["dip", "al1", "al2", "aw1", "aw2"])
+        )
+    )
+
+    # dccon0: fault dip constants
+    sd = np.sin(dip*pl8)
+    cd = np.cos(dip*pl8)
+    vertical = np.abs(cd) < EPS
+    cd = np.where(vertical, 0.0, cd)
+    sd = np.where(vertical, np.sign(sd), sd)
+
+    X = ct * (-x0 + x) - st * (-y0 + y)
+    Y = ct * (-y0 + y) + st * (-x0 + x)
+    X_min, X_max = X.min(axis=1), X.max(axis=1)
+    Y_min, Y_max = Y.min(axis=1), Y.max(axis=1)
+    sd, cd = sd[:, 0], cd[:, 0]
+    p_min, p_max = Y_min * cd, Y_max * cd
+    q_max = np.maximum(np.abs(Y_min * sd), np.abs(Y_max * sd))
+
+    def snap(v, dc_max):
+        return np.where((np.abs(v/dc_max) < EPS) | (np.abs(v) < EPS), 0.0, v)
+
+    scales = []
+    for aw in (aw1[:, 0], aw2[:, 0]):
+        et_max = np.maximum(np.abs(p_min - aw), np.abs(p_max - aw))
+        for al in (al1[:, 0], al2[:, 0]):
+            xi_max = np.maximum(np.abs(X_min - al), np.abs(X_max - al))
+            dc_max = np.maximum(xi_max, np.maximum(et_max, q_max))
+            scales.append(dc_max)
+            # et and q stay snapped, so if their largest value is snapped they are
+            # all zero in the next corners
+            et_max = snap(et_max, dc_max)
+            q_max = snap(q_max, dc_max)
+    return np.stack(scales, axis=-1)
+
 
 def _date_time_from_json(value):
     if len(value) == 10:
@@ -71,6 +139,7 @@ class EarthquakeInterferogram:
         self.satellite_fringe_interval = satellite_fringe_interval
         self.local_earth_radius = local_earth_radius
         self.local_rigidity = local_rigidity
+        self._los_cache = None
 
         kwargs_list = [
             'description', 'event_country', 'event_name', 'copyright', 'data_source',
@@ -83,10 +152,51 @@ class EarthquakeInterferogram:
 
         super().__init__(**kwargs)
 
+    @classmethod
+    def from_file(cls, filename, *args, dtype=np.float32, offset=0, **kwargs):
+        """Create an interferogram from a raw binary file without reading it.
+
+        The file, such as an ``.r4`` file of float32 values, is memory-mapped, so the
+        interferogram's data is only read from disk when (and where) it is used.
+        Combined with the `window` and `decimate` options of the plotting methods,
+        this allows working with interferograms that are larger than memory.
+
+        Parameters
+        ----------
+        filename : str or pathlib.Path
+            Path to the raw file, which holds the ``shape[0] * shape[1]`` pixels of
+            the interferogram.
+        *args
+            The other arguments of :class:`EarthquakeInterferogram`, starting with
+            its `title`.
+        dtype : numpy.dtype, optional
+            Data type of the values in the file, including its byte order, e.g.
+            ``'>f4'`` for big endian float32 values.
+        offset : int, optional
+            Number of bytes to skip at the start of the file (e.g. for a header).
+        **kwargs
+            The other keyword arguments of :class:`EarthquakeInterferogram`.
+
+        Returns
+        -------
+        EarthquakeInterferogram
+        """
+        data = np.memmap(filename, dtype=dtype, mode='r', offset=offset)
+        obj = cls(data, *args, **kwargs)
+        if data.size != obj.shape[0] * obj.shape[1]:
+            raise ValueError(
+                f"{filename} holds {data.size} values, which does not match the "
+                f"interferogram shape {obj.shape}"
+            )
+        return obj
+
     @property
     def data(self):
         """Processed interferogram data (unwrapped).
 
+        Floating point data is stored as is, without copying it, so this can be a
+        (memory-mapped) float32 array.
+
         Returns
         -------
         numpy.ndarray of float
@@ -98,7 +208,10 @@ class EarthquakeInterferogram:
     @data.setter
     def data(self, var):
         try:
-            var = np.asarray(var, dtype=float)
+            if not isinstance(var, np.ndarray):
+                var = np.asarray(var)
+            if not np.issubdtype(var.dtype, np.floating):
+                var = var.astype(float)
         except:
             raise TypeError("Location must be a array_like of float")
 
@@ -653,34 +766,48 @@ class EarthquakeInterferogram:
                     )
         self._event_date = date_time
 
-    def _get_plot_data(self):
+    def _pixel_range(self, window, decimate, axis):
+        "indices of the (decimated) pixels of a window along an axis, and its end"
+        n = self.shape[axis]
+        start, stop = (0, n) if window is None else window[axis]
+        start, stop, _ = slice(start, stop).indices(n)
+        if stop <= start:
+            raise ValueError(f"window must select at least one pixel, got {window}")
+        return np.arange(start, stop, decimate), stop
 
-        vectorNx = (
-            np.r_[
-                0,
-                np.cumsum(
-                    (self.pixel_size[0],) * self.shape[0]
-                )
-            ] + self.location[0]
-        )
-        vectorNy = (
-            np.r_[
-                0,
-                np.cumsum(
-                    (self.pixel_size[1],) * self.shape[1]
-                )
-            ] + self.location[1]
-        ) - self.pixel_size[1] * self.shape[1]
+    def _get_plot_data(self, window=None, decimate=1):
+        """Node locations and scaled data of a window of the interferogram.
 
-        data = self.data.copy()
-        data = np.flipud(data.reshape(self.shape, order='F').T)
+        Only the pixels of the window (every `decimate` pixels) are read from the
+        data, which matters when it is memory-mapped.
+        """
+        decimate = int(decimate)
+        if decimate < 1:
+            raise ValueError(f"decimate must be a positive integer, got {decimate}")
+        i_pix, i_stop = self._pixel_range(window, decimate, 0)
+        j_pix, j_stop = self._pixel_range(window, decimate, 1)
+
+        vectorNx = self.location[0] + self.pixel_size[0] * np.r_[
+            i_pix, min(i_pix[-1] + decimate, i_stop)
+        ]
+        # the rows of the data run south from the location
+        vectorNy = self.location[1] - self.pixel_size[1] * np.r_[
+            min(j_pix[-1] + decimate, j_stop), j_pix[::-1]
+        ]
+
+        data = self.data.reshape(self.shape, order='F')
+        data = np.array(
+            data[i_pix[0]:i_pix[-1] + 1:decimate, j_pix[0]:j_pix[-1] + 1:decimate],
+            dtype=float
+        )
+        data = np.flipud(data.T)
         data[data == 0] = np.nan
         data *= self.scaling
 
         return vectorNx, vectorNy, data
 
     @requires({"matplotlib": matplotlib})
-    def plot_interferogram(self, wrap=True, ax=None):
+    def plot_interferogram(self, wrap=True, ax=None, window=None, decimate=1):
         """Plot interferogram
 
         Parameters
@@ -689,6 +816,11 @@ class EarthquakeInterferogram:
             If ``True``, wrap the function
         ax: matplotlib.ax.Axes
             An axes object
+        window: tuple of (2,) tuple of int, optional
+            ``((i_min, i_max), (j_min, j_max))`` ranges of the pixel indices to plot
+            along each dimension of `shape`. Defaults to the whole interferogram.
+        decimate: int, optional
+            Only plot every `decimate` pixels along each dimension.
 
         Returns
         -------
@@ -701,7 +833,7 @@ class EarthquakeInterferogram:
             plt.figure()
             ax = plt.subplot(111)
 
-        vectorNx, vectorNy, data = self._get_plot_data()
+        vectorNx, vectorNy, data = self._get_plot_data(window=window, decimate=decimate)
 
         if wrap:
             cmap = plt.cm.hsv
@@ -734,7 +866,7 @@ class EarthquakeInterferogram:
         return out
 
     @requires({"matplotlib": matplotlib})
-    def plot_mask(self, ax=None, opacity=0.2):
+    def plot_mask(self, ax=None, opacity=0.2, window=None, decimate=1):
         """Plot masked interferogram
 
         Parameters
@@ -743,6 +875,11 @@ class EarthquakeInterferogram:
             An axes object
         opacity: float
             The opacity, default = 0.2
+        window: tuple of (2,) tuple of int, optional
+            ``((i_min, i_max), (j_min, j_max))`` ranges of the pixel indices to plot
+            along each dimension of `shape`. Defaults to the whole interferogram.
+        decimate: int, optional
+            Only plot every `decimate` pixels along each dimension.
 
         Returns
         -------
@@ -755,7 +892,7 @@ class EarthquakeInterferogram:
             plt.figure()
             ax = plt.subplot(111)
 
-        vectorNx, vectorNy, data = self._get_plot_data()
+        vectorNx, vectorNy, data = self._get_plot_data(window=window, decimate=decimate)
 
         from matplotlib import colors
         cmap = colors.ListedColormap([(1, 1, 1, opacity)])
@@ -777,23 +914,64 @@ class EarthquakeInterferogram:
         return out
 
     @requires({"utm":utm})
-    def get_LOS_vector(self, locations):
+    def get_LOS_vector(self, locations, cache=False):
         """calculate beta - the angle at earth center between reference point
         and satellite nadir
 
+        The locations are projected and the line of sight (LOS) vectors are
+        computed with array operations, so this handles every pixel of a scene
+        at once.
+
         Parameters
         ----------
-        locations: list
-            list of locations
+        locations: list or (n, 2) array_like
+            UTM easting and northing of the locations; any further columns (e.g.
+            elevation) are ignored. A list holds one location per item.
+        cache: bool
+            If ``True``, keep the LOS vectors of these locations and reuse them
+            while the same locations and satellite geometry are requested with
+            ``cache=True``, e.g. when comparing many forward models with the
+            interferogram. The cached array is read-only.
 
         Returns
         -------
         numpy.ndarray
-            The LOS vectors
+            The (n, 3) LOS vectors, or (3,) for a single location. A list of
+            locations returns them squeezed from shape (3, n), as before.
         """
-        if not isinstance(locations, list):
-            locations = [locations]
+        legacy = isinstance(locations, list)
+        locations = np.asarray(locations, dtype=float)
+        single = locations.ndim == 1
+        locations = np.atleast_2d(locations)
+        if locations.ndim != 2 or locations.shape[1] < 2:
+            raise ValueError(
+                f"locations must have shape (n, 2) or (2,), got {locations.shape}"
+            )
 
+        geometry = (
+            self.location_UTM_zone, *self.ref, self.satellite_altitude,
+            self.satellite_azimuth, self.ref_incidence, self.local_earth_radius
+        )
+        cached = self._los_cache if cache else None
+        if (
+            cached is not None and cached[0] == geometry
+            and np.array_equal(cached[1], locations[:, :2])
+        ):
+            los = cached[2]
+        else:
+            los = self._los_vectors(locations[:, :2])
+            if cache:
+                los.flags.writeable = False
+                self._los_cache = (geometry, locations[:, :2].copy(), los)
+
+        if legacy:
+            return np.squeeze(los.T)
+        if single:
+            return los[0]
+        return los
+
+    def _los_vectors(self, locations):
+        "(n, 3) LOS vectors of (n, 2) UTM locations"
         utmZone = self.location_UTM_zone
         refPoint = self.ref
         satAltitude = self.satellite_altitude
@@ -815,12 +993,9 @@ class EarthquakeInterferogram:
             refPoint[0], refPoint[1], np.abs(utmZone), northern=utmZone > 0
         )
 
-        xy = np.array([
-            utm.to_latlon(u[0], u[1], np.abs(utmZone), northern=utmZone > 0)
-            for u in locations
-        ])
-        y = xy[:, 0]
-        x = xy[:, 1]
+        y, x = utm.to_latlon(
+            locations[:, 0], locations[:, 1], np.abs(utmZone), northern=utmZone > 0
+        )
 
         angdist = self._ang_to_gc(x, y, origx, origy, satAzimuth)
 
@@ -847,7 +1022,7 @@ class EarthquakeInterferogram:
         los_y = -np.sin(satAzimuth * DEG2RAD) * np.cos(satIncidence * DEG2RAD)
         los_z = np.sin(satIncidence * DEG2RAD)
 
-        return np.squeeze(np.array([los_x, los_y, los_z]))
+        return np.stack(np.broadcast_arrays(los_x, los_y, los_z), axis=-1)
 
     @staticmethod
     def _ang_to_gc(x, y, origx, origy, satAzimuth):
@@ -857,7 +1032,6 @@ class EarthquakeInterferogram:
         """
 
         Ngc = np.zeros(3)
-        cartxy = np.zeros((len(x), 3))
         satAzimuth = np.deg2rad(satAzimuth)
         origx = np.deg2rad(origx)
         origy = np.deg2rad(origy)
@@ -882,19 +1056,15 @@ class EarthquakeInterferogram:
         Ngc[2] = -np.sin(satAzimuth) * np.cos(origy)
 
         # 2. calculate unit vector geocentric coordinates for lon/lat
-        #    position (x,y)
-
-        cartxy[:, 0] = np.cos(x) * np.cos(y)
-        cartxy[:, 1] = np.sin(x) * np.cos(y)
-        cartxy[:, 2] = np.sin(y)
-
+        #    position (x,y), and
         # 3. Dot product between Ngc and cartxy gives angle 90 degrees
         #    bigger than what we want
 
+        cos_y = np.cos(y)
         angdist = (
-                        Ngc[0]*cartxy[:, 0] +
-                        Ngc[1]*cartxy[:, 1] +
-                        Ngc[2]*cartxy[:, 2]
+                        Ngc[0]*(np.cos(x)*cos_y) +
+                        Ngc[1]*(np.sin(x)*cos_y) +
+                        Ngc[2]*np.sin(y)
                   )
 
         angdist = np.rad2deg(np.arccos(angdist)) - 90
@@ -995,7 +1165,7 @@ class Oksar:
             V direction of the simulation domain
 
         """
-        return self._location
+        return self._V
 
     @V.setter
     def V(self, var):
@@ -1292,6 +1462,10 @@ class Oksar:
     def displacement_vector(self):
         """Compute displacement vector
 
+        When the compiled extensions are available, the displacement is evaluated
+        point by point in a compiled loop, which is split over the number of
+        threads set by :func:`geoana.kernels.set_num_threads`.
+
         Returns
         -------
         numpy.ndarray
@@ -1300,25 +1474,133 @@ class Oksar:
         """
 
         vec = self.simulation_grid
-        x, y = vec[:, 0], vec[:, 1]
+        return self._surface_displacement(vec[:, 0], vec[:, 1], self._source_parameters())
+
+    def displacement_tiles(self, tile_size=65536, executor=None, max_pending=None):
+        """Iterate over the displacement vector in tiles of the simulation grid.
+
+        Only the locations of each tile are generated, so the working memory is
+        bounded by `tile_size` instead of the size of the simulation grid, and the
+        tiles can be evaluated concurrently by a thread or process pool. Every
+        tile matches the corresponding rows of :attr:`displacement_vector`.
+
+        Parameters
+        ----------
+        tile_size : int, optional
+            Number of grid locations per tile.
+        executor : concurrent.futures.Executor, optional
+            Pool that evaluates the tiles, e.g. a
+            :class:`~concurrent.futures.ProcessPoolExecutor` (which requires the
+            model to be picklable). By default, the tiles are evaluated one at a time
+            as they are requested.
+        max_pending : int, optional
+            Maximum number of tiles submitted to the `executor` but not yet
+            yielded, which bounds the memory held by finished tiles. Defaults to
+            twice the number of CPUs.
+
+        Yields
+        ------
+        index : slice
+            Rows of the displacement vector covered by the tile.
+        displacement : (n_tile, 3) numpy.ndarray
+            Displacement vector of the tile.
+        """
+        tile_size = int(tile_size)
+        if tile_size < 1:
+            raise ValueError(f"tile_size must be a positive integer, got {tile_size}")
+        n = self.shape[0] * self.shape[1]
+        tiles = [slice(start, min(start + tile_size, n)) for start in range(0, n, tile_size)]
+        # Coordinates that are negligible relative to the largest one over the grid
+        # are snapped to zero, so every tile uses the scales of the whole grid.
+        corners = self._grid_locations(np.r_[0, self.shape[0] - 1, n - self.shape[0], n - 1])
+        dc_max = _snapping_scales(corners[:, 0], corners[:, 1], self._source_parameters())
+
+        if executor is None:
+            for tile in tiles:
+                yield tile, self._displacement_tile(tile.start, tile.stop, dc_max)
+            return
+
+        if max_pending is None:
+            max_pending = 2 * (os.cpu_count() or 1)
+        pending = deque()
+        try:
+            for tile in tiles:
+                if len(pending) >= max_pending:
+                    done_tile, future = pending.popleft()
+                    yield done_tile, future.result()
+                pending.append(
+                    (tile, executor.submit(
+                        self._displacement_tile, tile.start, tile.stop, dc_max
+                    ))
+                )
+            while pending:
+                done_tile, future = pending.popleft()
+                yield done_tile, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
 
+    def compute_displacement(self, out=None, tile_size=65536, executor=None):
+        """Compute the displacement vector tile by tile into an output array.
+
+        Parameters
+        ----------
+        out : (n_pix, 3) numpy.ndarray, optional
+            Array to write the displacement vector to, e.g. a memory-mapped array
+            from :func:`numpy.lib.format.open_memmap`, in which case the whole
+            displacement vector never has to fit in memory.
+        tile_size : int, optional
+            Number of grid locations per tile.
+        executor : concurrent.futures.Executor, optional
+            Pool that evaluates the tiles, see :meth:`displacement_tiles`.
+
+        Returns
+        -------
+        (n_pix, 3) numpy.ndarray
+            The displacement vector, `out` if it was given.
+        """
+        n = self.shape[0] * self.shape[1]
+        if out is None:
+            out = np.empty((n, 3))
+        elif out.shape != (n, 3):
+            raise ValueError(f"out must have shape {(n, 3)}, got {out.shape}")
+        for tile, u in self.displacement_tiles(tile_size=tile_size, executor=executor):
+            out[tile] = u
+        return out
+
+    def _grid_locations(self, index):
+        """Locations of the simulation grid points with the given flat indices"""
+        shape = self.shape
+        R = np.stack([self.U, self.V])
+        square = np.stack([
+            np.linspace(0, 1, shape[0])[index % shape[0]],
+            np.linspace(0, 1, shape[1])[index // shape[0]],
+        ], axis=-1)
+        return self.O + np.einsum('ij,...j->...i', R, square)
+
+    def _displacement_tile(self, start, stop, dc_max):
+        """Displacement vector of the grid points start to stop, with the
+        coordinate scales dc_max of the whole grid"""
+        vec = self._grid_locations(np.arange(start, stop))
+        return self._surface_displacement(
+            vec[:, 0], vec[:, 1], self._source_parameters(), dc_max=dc_max
+        )
+
+    def _source_parameters(self, slip=None):
+        """Okada source parameters of the fault (arrays for multiple patches)"""
         DEG2RAD = 0.017453292519943
         alpha = (self.beta + self.mu) / (self.beta + 2.0 * self.mu)
 
-        #  Here we could loop over models
-        flt_x = self.center[0]
-        flt_y = self.center[1]
         strike = self.strike
         dip = self.dip
         rake = self.rake
-        slip = self.slip
+        slip = self.slip if slip is None else slip
         length = self.length
         hmin = self.depth_top
         hmax = self.depth_bottom
 
         rrake = (rake+90.0)*DEG2RAD
         sindip = np.sin(dip*DEG2RAD)
-        w = (hmax-hmin)/sindip
         ud = slip*np.cos(rrake)
         us = -slip*np.sin(rrake)
         halflen = length/2.0
@@ -1327,34 +1609,72 @@ class Oksar:
         aw1 = hmin/sindip
         aw2 = hmax/sindip
 
-        if(hmin == 0.0):
-            hmin = 0.00001
-
         sstrike = (strike+90.0)*DEG2RAD
 
         ct = np.cos(sstrike)
         st = np.sin(sstrike)
 
-        X = ct * (-flt_x + x) - st * (-flt_y + y)
-        Y = ct * (-flt_y + y) + st * (-flt_x + x)
+        return dict(
+            center=self.center, strike_vector=np.stack([ct, st], axis=-1), alpha=alpha,
+            dip=-dip, al1=al1, al2=al2, aw1=aw1, aw2=aw2, disl1=us, disl2=ud
+        )
+
+    def _surface_displacement(self, x, y, params, sum_patches=True, dc_max=None):
+        """Surface displacement at x, y of the faults described by params, either
+        summed (n, 3), or for each fault (n, n_patch, 3). Coordinates are snapped
+        relative to the scales dc_max (n_patch, 4), by default those of x, y (see
+        _snapping_scales)"""
+        if okada_surface_displacement is not None:
+            return okada_surface_displacement(
+                x, y, sum_patches=sum_patches, dc_max=dc_max, **params
+            )
+        if dc_max is None:
+            dc_max = _snapping_scales(x, y, params)
+
+        center = np.atleast_2d(params["center"])
+        strike_vector = np.atleast_2d(params["strike_vector"])
+        patches = np.broadcast_arrays(
+            center[:, 0], center[:, 1], strike_vector[:, 0], strike_vector[:, 1],
+            *(
+                np.atleast_1d(params[key])
+                for key in ["dip", "al1", "al2", "aw1", "aw2", "disl1", "disl2"]
+            )
+        )
+        alpha = params["alpha"]
+
+        out = np.zeros((len(x), 3)) if sum_patches else []
+        for i_patch, (flt_x, flt_y, ct, st, dip, al1, al2, aw1, aw2, us, ud) in enumerate(
+            zip(*patches)
+        ):
+            X = ct * (-flt_x + x) - st * (-flt_y + y)
+            Y = ct * (-flt_y + y) + st * (-flt_x + x)
+
+            u = self._dc3d3(
+                alpha, X, Y, dip, al1, al2, aw1, aw2, us, ud, scales=dc_max[i_patch]
+            )
 
-        u = self._dc3d3(alpha, X, Y, -dip, al1, al2, aw1, aw2, us, ud)
+            UX = ct*u[...,0] + st*u[...,1]
+            UY = -st*u[...,0] + ct*u[...,1]
+            UZ = u[..., 2]
 
-        UX = ct*u[...,0] + st*u[...,1]
-        UY = -st*u[...,0] + ct*u[...,1]
-        UZ = u[..., 2]
+            if sum_patches:
+                out += np.stack([UX, UY, UZ], axis=-1)
+            else:
+                out.append(np.stack([UX, UY, UZ], axis=-1))
 
-        return np.stack([UX, UY, UZ], axis=-1)
+        if sum_patches:
+            return out
+        return np.stack(out, axis=1).reshape(len(x), len(patches[0]), 3)
 
-    def _dc3d3(self, alpha, X, Y, dip, al1, al2, aw1, aw2, disl1, disl2):
+    @staticmethod
+    def _dc3d3(alpha, X, Y, dip, al1, al2, aw1, aw2, disl1, disl2, scales=None):
         F0 = 0.0
         F1 = 1.0
         F2 = 2.0
         PI2 = 6.283185307179586
         EPS = 1.0E-6
 
-        u = np.array([F0, F0, F0])
-        dub = np.array([F0, F0, F0])
+        u = np.zeros((3, ) + X.shape)
 
         #  %%dccon0 subroutine
         #  Calculates medium and fault dip constants
@@ -1401,7 +1721,11 @@ class Oksar:
                 # %%dccon2 subroutine
                 # % calculates station geometry constants for finite source
 
-                dc_max = np.max(np.abs(np.c_[xi, et, q]))
+                if scales is None:
+                    dc_max = np.max(np.abs(np.c_[xi, et, q]))
+                else:
+                    # the scale of this corner over the whole grid
+                    dc_max = scales[int(2*(k - 1) + (j - 1))]
 
                 # dc_max = max(np.abs(xi),max(np.abs(et),np.abs(q)))
 
@@ -1503,7 +1827,7 @@ class Oksar:
                     du2 = np.array([du2x, du2y, du2z])
                     dub = du2 * (disl1 / PI2)
                 else:
-                    dub = np.zeros(3)
+                    dub = np.zeros((3, ) + X.shape)
 
                 # dip-slip contribution
                 if(disl2 != F0):
@@ -1523,7 +1847,7 @@ class Oksar:
                     u = + du + u
                 else:
                     u = - du + u
-        return u
+        return np.moveaxis(u, 0, -1)
 
     @requires({"matplotlib": matplotlib})
     def plot_displacement(self, eq=None, ax=None, wrap=True, mask_opacity=0.2):
@@ -1575,8 +1899,8 @@ class Oksar:
         if eq is None:
             LOS = np.array([0, 0, 1])
         else:
-            LOS = eq.get_LOS_vector(grid)
-        data = DIR.dot(LOS)
+            LOS = eq.get_LOS_vector(grid, cache=True)
+        data = np.sum(DIR * LOS, axis=-1)
         data = np.flipud(data.reshape(self.shape, order='F').T)
         # data[data == 0] = np.nan
         # data *= self.scaling
@@ -1613,51 +1937,289 @@ class Oksar:
         return out
 
 
-def example():
+class OksarPatches(Oksar):
+    """Surface displacement of a fault made of many rectangular slip patches.
+
+    The ``OksarPatches`` class models a distributed slip model, where each patch is
+    a rectangular fault like the one modelled by :class:`Oksar`. The geometry and
+    slip of the patches are given as arrays (scalars are shared by all of the
+    patches), and all of the patches are evaluated together, in a single pass over
+    the simulation grid when the compiled extensions are available.
+
+    Parameters
+    ----------
+    O, U, V : (2) array_like
+        Origin, and the two edge vectors, of the simulation domain.
+    center : (n_patch, 2) array_like
+        Easting and northing of the center of each patch.
+    depth_top, depth_bottom : float or (n_patch) array_like
+        Depth to the top and the bottom of each patch (m).
+    strike, dip, rake : float or (n_patch) array_like
+        Strike (0 to 360), dip (0 to 90) and rake (-180 to 180) angles of each patch
+        in degrees.
+    slip : float or (n_patch) array_like
+        Slip of each patch (m).
+    length : float or (n_patch) array_like
+        Length of each patch along strike (m).
+    beta, mu : float
+        Lamé parameters of the medium.
+    shape : (2) array_like of int
+        Number of pixels of the simulation grid in the North and Easting directions.
+
+    Examples
+    --------
+    Split a fault into 4 patches along strike and 3 down dip, and compute the
+    displacement and the matrix that maps the slip of each patch to it.
+
+    >>> import numpy as np
+    >>> from geoana.earthquake.oksar import OksarPatches
+    >>> along, down = np.meshgrid(np.arange(4) - 1.5, np.arange(3))
+    >>> strike = np.deg2rad(30.)
+    >>> center = np.c_[
+    ...     1E4 + 2E3 * along.ravel() * np.sin(strike),
+    ...     1E4 + 2E3 * along.ravel() * np.cos(strike),
+    ... ]
+    >>> patches = OksarPatches(
+    ...     [0., 0.], [2E4, 0.], [0., 2E4], center, 1E3 + 2E3 * down.ravel(),
+    ...     depth_bottom=3E3 + 2E3 * down.ravel(), strike=30., dip=90., rake=0.,
+    ...     slip=np.linspace(0.1, 1.0, 12), length=2E3, shape=(50, 50)
+    ... )
+    >>> u, G = patches.displacement(return_greens_function=True)
+    >>> u.shape, G.shape
+    ((2500, 3), (2500, 12, 3))
+    >>> np.allclose(u, patches.displacement_vector)
+    True
+    """
 
-    import requests
-    dinar_file = requests.get(
-        'https://storage.googleapis.com/simpeg/geoana/dinar.r4'
-    )
+    @property
+    def n_patch(self):
+        """Number of patches
+
+        Returns
+        -------
+        int
+            Number of patches
+        """
+        return self.center.shape[0]
+
+    def _patch_array(self, var, name):
+        """validate a patch parameter as a float or (n_patch) array_like"""
+        try:
+            var = np.asarray(var, dtype=float)
+        except:
+            raise TypeError(f"{name} must be a float or array_like of float")
+        if var.ndim == 0:
+            var = np.full(self.n_patch, var)
+        if var.shape != (self.n_patch, ):
+            raise ValueError(
+                f"{name} must be a float or have shape ({self.n_patch},), got {var.shape}"
+            )
+        return var
+
+    @property
+    def center(self):
+        """Center of each patch (Easting, Northing).
+
+        Returns
+        -------
+        (n_patch, 2) numpy.ndarray
+            Center of each patch
+        """
+        return self._center
+
+    @center.setter
+    def center(self, var):
+        try:
+            var = np.asarray(var, dtype=float)
+        except:
+            raise TypeError("center must be array_like of float")
+        var = np.atleast_2d(var)
+        if var.ndim != 2 or var.shape[1] != 2:
+            raise ValueError(f"center must have a shape of (n_patch, 2) not {var.shape}")
+        self._center = var
+
+    @property
+    def depth_top(self):
+        """Depth to the top of each patch (m)
+
+        Returns
+        -------
+        (n_patch) numpy.ndarray
+            Depth to the top of each patch (m)
+        """
+        return self._depth_top
+
+    @depth_top.setter
+    def depth_top(self, var):
+        var = self._patch_array(var, "depth_top")
+        if np.any(var < 0.):
+            raise ValueError("depth_top must be equal or greather than 0")
+        self._depth_top = var
+
+    @property
+    def depth_bottom(self):
+        """Depth to the bottom of each patch (m)
+
+        Returns
+        -------
+        (n_patch) numpy.ndarray
+            Depth to the bottom of each patch (m)
+        """
+        return self._depth_bottom
+
+    @depth_bottom.setter
+    def depth_bottom(self, var):
+        var = self._patch_array(var, "depth_bottom")
+        if np.any(var < self.depth_top):
+            raise ValueError("depth_bottom must be larger than depth_top")
+        self._depth_bottom = var
+
+    @property
+    def strike(self):
+        """Strike angle (0 to 360) of each patch in degrees
+
+        Returns
+        -------
+        (n_patch) numpy.ndarray
+            Strike angle (0 to 360)
+        """
+        return self._strike
+
+    @strike.setter
+    def strike(self, var):
+        var = self._patch_array(var, "strike")
+        if np.any((var < 0.) | (var > 360.)):
+            raise ValueError("strike must be within [0, 360]")
+        self._strike = var
+
+    @property
+    def dip(self):
+        """Dip angle (0 to 90) of each patch in degrees
+
+        Returns
+        -------
+        (n_patch) numpy.ndarray
+            Dip angle (0 to 90) in degrees
+        """
+        return self._dip
+
+    @dip.setter
+    def dip(self, var):
+        var = self._patch_array(var, "dip")
+        if np.any((var < 0.) | (var > 90.)):
+            raise ValueError("dip must be within [0, 90]")
+        self._dip = var
+
+    @property
+    def rake(self):
+        """Rake angle (-180 to 180) of each patch
+
+        Returns
+        -------
+        (n_patch) numpy.ndarray
+            Rake angle (-180 to 180)
+        """
+        return self._rake
+
+    @rake.setter
+    def rake(self, var):
+        var = self._patch_array(var, "rake")
+        if np.any((var < -180) | (var > 180.)):
+            raise ValueError("rake must be within [-180, 180]")
+        self._rake = var
+
+    @property
+    def slip(self):
+        """Slip of each patch
+
+        Returns
+        -------
+        (n_patch) numpy.ndarray
+            Slip
+        """
+        return self._slip
+
+    @slip.setter
+    def slip(self, var):
+        var = self._patch_array(var, "slip")
+        if np.any(var < 0.):
+            raise ValueError("slip must be greater than or equal to 0")
+        self._slip = var
+
+    @property
+    def length(self):
+        """Length of each patch
 
-    # data = np.fromstring(dinar_file.content, np.float32)
-
-    # dinar = EarthquakeInterferogram(
-    #     # uid='dinar',
-    #     title='Dinar, Turkey',
-    #     description=(
-    #         'On October 1, 1995, a strong earthquake ruptured a section of '
-    #         'the Dinar-Civril fault in SW Turkey. Around 30% of the buildings '
-    #         'in the nearby town of Dinar were destroyed. 92 inhabitants were '
-    #         'killed and over 200 injured.'
-    #     ),
-    #     event_country='Turkey',
-    #     event_date='1995-09-30T18:00:00Z',
-    #     event_gcmt_id='100195B',
-    #     event_name='Dinar',
-    #     copyright='ESA',
-    #     data_source='ESA',
-    #     date1='1995-08-12T18:00:00Z',
-    #     date2='1995-12-31T17:00:00Z',
-    #     processed_by='GarethFunning',
-    #     processed_date='2003-01-20T17:00:00Z',
-    #     ref_incidence=23,
-    #     ref=[741140., 4230327.],
-    #     scaling=0.0045040848895,
-    #     local_earth_radius=6386232,
-    #     local_rigidity=30000000000,
-    #     location=[706216.0606, 4269238.9999],
-    #     shape=(1024, 1024),
-    #     location_UTM_zone=35,
-    #     pixel_size=[80., 80.],
-    #     satellite_altitude=788792,
-    #     satellite_azimuth=192,
-    #     satellite_fringe_interval=0.028333333,
-    #     satellite_name='ERS',
-    #     data=data
-    # )
-
-    data = np.fromstring(dinar_file.content, np.float32)
+        Returns
+        -------
+        (n_patch) numpy.ndarray
+            Length
+        """
+        return self._length
+
+    @length.setter
+    def length(self, var):
+        var = self._patch_array(var, "length")
+        if np.any(var < 0.):
+            raise ValueError("length must be greater than or equal to 0")
+        self._length = var
+
+    @property
+    def displacement_vector(self):
+        """Compute displacement vector summed over the patches
+
+        Returns
+        -------
+        (n_pixel, 3) numpy.ndarray
+            Displacement vector
+
+        """
+        return self.displacement()
+
+    def displacement(self, return_greens_function=False):
+        """Compute the displacement, and optionally the Green's functions of the patches.
+
+        Parameters
+        ----------
+        return_greens_function : bool, optional
+            If ``True``, also return the displacement of each patch for a unit slip
+            (at its rake). This is computed in a single pass over the patches, and
+            the summed displacement is formed from it.
+
+        Returns
+        -------
+        u : (n_pixel, 3) numpy.ndarray
+            Displacement vector summed over the patches.
+        G : (n_pixel, n_patch, 3) numpy.ndarray
+            Displacement of each patch for a unit slip, such that
+            ``u = np.einsum('ipc,p->ic', G, slip)``. Only returned if
+            `return_greens_function` is ``True``.
+        """
+        vec = self.simulation_grid
+        x, y = vec[:, 0], vec[:, 1]
+        if not return_greens_function:
+            return self._surface_displacement(x, y, self._source_parameters())
+
+        G = self._surface_displacement(
+            x, y, self._source_parameters(slip=1.0), sum_patches=False
+        )
+        return np.einsum('ipc,p->ic', G, self.slip), G
+
+
+def example(filename=None):
+    """Example interferogram and forward model of the Dinar earthquake.
+
+    Parameters
+    ----------
+    filename : str or pathlib.Path, optional
+        Local copy of ``dinar.r4``, which is then memory-mapped instead of being
+        downloaded into memory.
+
+    Returns
+    -------
+    dinar : EarthquakeInterferogram
+    dinar_fwd : Oksar
+    """
     title = 'Dinar, Turkey'
     location = [706216.0606, 4269238.9999]
     location_UTM_zone = 35
@@ -1669,8 +2231,7 @@ def example():
     satellite_altitude=788792
     processed_by='GarethFunning'
 
-    dinar = EarthquakeInterferogram(
-        data,
+    args = (
         title,
         location,
         location_UTM_zone,
@@ -1681,6 +2242,8 @@ def example():
         satellite_azimuth,
         satellite_altitude,
         processed_by,
+    )
+    kwargs = dict(
         scaling=0.0045040848895,
         satellite_fringe_interval=0.028333333,
         local_earth_radius=6386232,
@@ -1703,6 +2266,16 @@ def example():
         satellite_name='ERS',
     )
 
+    if filename is not None:
+        dinar = EarthquakeInterferogram.from_file(filename, *args, **kwargs)
+    else:
+        import requests
+        dinar_file = requests.get(
+            'https://storage.googleapis.com/simpeg/geoana/dinar.r4'
+        )
+        data = np.frombuffer(dinar_file.content, np.float32)
+        dinar = EarthquakeInterferogram(data, *args, **kwargs)
+
     O = [706216.0606, 4187318.9999]
     U = [81920, 0]
     V = [0, 81920]
@@ -18,12 +18,16 @@ Base Classes
   BaseDipole
   BaseElectricDipole
   BaseMagneticDipole
+  BaseDipoleCollection
   BaseLineCurrent
 
 """
 from . import static
 from . import fdem
 from . import tdem
-from .base import BaseEM, BaseDipole, BaseElectricDipole, BaseMagneticDipole, BaseLineCurrent
+from .base import (
+    BaseEM, BaseDipole, BaseElectricDipole, BaseMagneticDipole, BaseDipoleCollection,
+    BaseLineCurrent
+)
 
 
@@ -1,5 +1,6 @@
 import numpy as np
 from scipy.constants import mu_0, epsilon_0
+from geoana.utils import Workspace
 
 ###############################################################################
 #                                                                             #
@@ -32,6 +33,7 @@ class BaseEM:
         self.sigma = sigma
         self.mu = mu
         self.epsilon = epsilon
+        self._workspace = Workspace()
         super().__init__(**kwargs)
 
     @property
@@ -57,6 +59,7 @@ class BaseEM:
             raise ValueError("sigma must be greater than 0")
 
         self._sigma = value
+        self._derived_cache = {}
 
     @property
     def mu(self):
@@ -81,6 +84,7 @@ class BaseEM:
             raise ValueError("mu must be greater than 0")
 
         self._mu = value
+        self._derived_cache = {}
 
     @property
     def epsilon(self):
@@ -108,6 +112,22 @@ class BaseEM:
             )
 
         self._epsilon = value
+        self._derived_cache = {}
+
+    def _get_derived(self, name, func):
+        """Return the quantity ``name`` derived from the physical properties.
+
+        The value is computed with ``func()`` on first access and cached until one of
+        the properties it is derived from is set again. Arrays are returned as copies,
+        so callers may modify them without changing the cached value.
+        """
+        cache = self._derived_cache
+        value = cache.get(name)
+        if value is None:
+            value = cache[name] = func()
+        if isinstance(value, np.ndarray):
+            value = value.copy()
+        return value
 
 
 class BaseDipole:
@@ -415,6 +435,97 @@ class BaseMagneticDipole(BaseDipole):
         self._moment = value
 
 
+class BaseDipoleCollection:
+    """Base class for collections of dipoles; namely their locations and moments.
+
+    The orientation and strength of each dipole are combined into a single moment
+    vector, so that the fields of all of the dipoles can be evaluated in one pass.
+
+    Parameters
+    ----------
+    location : (n_dipole, 3) array_like
+        Location of each dipole.
+    moment : (3) or (n_dipole, 3) array_like
+        Moment vector of each dipole. A single (3) moment is used for all dipoles.
+    """
+
+    def __init__(self, location, moment, **kwargs):
+
+        self.location = location
+        self.moment = moment
+        super().__init__(**kwargs)
+
+    @property
+    def n_dipole(self):
+        """Number of dipoles
+
+        Returns
+        -------
+        int
+        """
+        return self._location.shape[0]
+
+    @property
+    def location(self):
+        """Location of each dipole
+
+        Returns
+        -------
+        (n_dipole, 3) numpy.ndarray of float
+            xyz dipole locations
+        """
+        return self._location
+
+    @location.setter
+    def location(self, vec):
+
+        try:
+            vec = np.asarray(vec, dtype=float)
+        except:
+            raise TypeError(f"location must be array_like of float, got {type(vec)}")
+
+        if vec.ndim != 2 or vec.shape[1] != 3:
+            raise ValueError(
+                f"location must be array_like with shape (n_dipole, 3), got {vec.shape}"
+            )
+        if hasattr(self, "_moment") and vec.shape[0] != self.n_dipole:
+            raise ValueError(
+                f"location must have {self.n_dipole} rows to match moment, "
+                f"got {vec.shape[0]}"
+            )
+
+        self._location = vec
+
+    @property
+    def moment(self):
+        """Moment vector of each dipole
+
+        Returns
+        -------
+        (n_dipole, 3) numpy.ndarray of float
+            Moment vectors, whose directions are the orientations of the dipoles
+        """
+        return self._moment
+
+    @moment.setter
+    def moment(self, vec):
+
+        try:
+            vec = np.asarray(vec, dtype=float)
+        except:
+            raise TypeError(f"moment must be array_like of float, got {type(vec)}")
+
+        if vec.shape == (3, ):
+            vec = np.tile(vec, (self.n_dipole, 1))
+        if vec.shape != (self.n_dipole, 3):
+            raise ValueError(
+                f"moment must be array_like with shape (3,) or ({self.n_dipole}, 3), "
+                f"got {vec.shape}"
+            )
+
+        self._moment = vec
+
+
 class BaseLineCurrent:
     """Base class for connected segments of current-carrying wire.
 
@@ -15,6 +15,8 @@ Simulation Classes
   BaseFDEM
   ElectricDipoleWholeSpace
   MagneticDipoleWholeSpace
+  ElectricDipoleCollectionWholeSpace
+  MagneticDipoleCollectionWholeSpace
   MagneticDipoleHalfSpace
   MagneticDipoleLayeredHalfSpace
   HarmonicPlaneWave
@@ -37,7 +39,8 @@ from geoana.em.fdem.base import (
 )
 
 from geoana.em.fdem.wholespace import (
-    ElectricDipoleWholeSpace, MagneticDipoleWholeSpace, HarmonicPlaneWave
+    ElectricDipoleWholeSpace, MagneticDipoleWholeSpace, HarmonicPlaneWave,
+    ElectricDipoleCollectionWholeSpace, MagneticDipoleCollectionWholeSpace
 )
 
 from geoana.em.fdem.halfspace import MagneticDipoleHalfSpace
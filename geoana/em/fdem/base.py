@@ -1,3 +1,6 @@
+import copy
+import numbers
+
 from geoana.em.base import BaseEM
 import numpy as np
 from scipy.constants import mu_0, epsilon_0
@@ -156,6 +159,31 @@ def sigma_hat(frequency, sigma, epsilon=epsilon_0, quasistatic=False):
     return sigma + 1j*omega(frequency)*epsilon
 
 
+def _check_chunk(value, n, name):
+    # the block size along an axis of length n, which defaults to the whole axis
+    if value is None:
+        return max(n, 1)
+    if isinstance(value, (bool, np.bool_)) or not isinstance(value, numbers.Real):
+        raise TypeError(f"{name} must be an integer, got {type(value).__name__}")
+    if not isinstance(value, numbers.Integral) or value < 1:
+        raise ValueError(f"{name} must be a positive integer, got {value}")
+    return int(value)
+
+
+def _restore_block(values, n_f, n_l, method):
+    # the (n_f, n_l, n_comp) values of a block, whose singleton frequency, location
+    # and component axes may have been squeezed by the method
+    values = np.squeeze(values)
+    leading = tuple(n for n in (n_f, n_l) if n != 1)
+    rest = values.shape[len(leading):]
+    if values.shape[:len(leading)] != leading or len(rest) > 1:
+        raise ValueError(
+            f"{method} must return values of shape (n_freq, n_loc[, n_comp]), got "
+            f"{values.shape} for {n_f} frequencies and {n_l} locations"
+        )
+    return values.reshape(n_f, n_l, -1)
+
+
 ###############################################################################
 #                                                                             #
 #                                  Classes                                    #
@@ -176,6 +204,15 @@ class BaseFDEM(BaseEM):
     quasistatic : bool
         If ``True``, we assume the quasistatic approximation and dielectric permittivity
         is neglected in all computations. Default is ``False``.
+
+    Notes
+    -----
+    The angular frequencies, :py:attr:`sigma_hat`, :py:attr:`wavenumber`,
+    :py:attr:`wavenumber_squared` and :py:attr:`skin_depth` are computed on first
+    access and cached, so repeated evaluations for a fixed model skip their setup.
+    The cached values are cleared whenever the *frequency*, *sigma*, *mu*, *epsilon*
+    or *quasistatic* are set. The stored *frequency* array is read only, so it can
+    only be changed by setting it again.
     """
 
     def __init__(self, frequency, quasistatic=False, **kwargs):
@@ -200,7 +237,7 @@ class BaseFDEM(BaseEM):
 
         # Ensure float or numpy array of float
         try:
-            value = np.asarray(value, dtype=float)
+            value = np.array(value, dtype=float)
         except:
             raise TypeError(f"frequencies are not a valid type")
         value = np.atleast_1d(value)
@@ -211,7 +248,29 @@ class BaseFDEM(BaseEM):
         if value.ndim > 1:
             raise TypeError(f"frequencies must be ('*') array")
 
+        value.flags.writeable = False
         self._frequency = value
+        self._derived_cache = {}
+
+    @property
+    def quasistatic(self):
+        """Whether the quasistatic approximation is used
+
+        Returns
+        -------
+        bool
+            If ``True``, dielectric permittivity is neglected in all computations.
+        """
+        return self._quasistatic
+
+    @quasistatic.setter
+    def quasistatic(self, value):
+        try:
+            value = bool(value)
+        except (TypeError, ValueError):
+            raise TypeError(f"quasistatic must be a bool, got {type(value)}")
+        self._quasistatic = value
+        self._derived_cache = {}
 
     @property
     def omega(self):
@@ -228,7 +287,7 @@ class BaseFDEM(BaseEM):
         float
             Angular frequency (rad/s)
         """
-        return omega(self.frequency)
+        return self._get_derived("omega", lambda: omega(self.frequency))
 
     @property
     def sigma_hat(self):
@@ -248,6 +307,9 @@ class BaseFDEM(BaseEM):
             conductivity :math:`\\sigma` if the property `quasistatic` is ``True``.
 
         """
+        return self._get_derived("sigma_hat", self._compute_sigma_hat)
+
+    def _compute_sigma_hat(self):
         sigma = sigma_hat(
             self.frequency, self.sigma, epsilon=self.epsilon,
             quasistatic=self.quasistatic
@@ -280,9 +342,27 @@ class BaseFDEM(BaseEM):
             class instance is ``True``.
 
         """
-        return wavenumber(
+        return self._get_derived("wavenumber", lambda: wavenumber(
             self.frequency, self.sigma, mu=self.mu, epsilon=self.epsilon, quasistatic=self.quasistatic
-        )
+        ))
+
+    @property
+    def wavenumber_squared(self):
+        r"""Squared wavenumber for an electromagnetic planewave in a homogenous isotropic medium.
+
+        Where :math:`k` is the :py:attr:`wavenumber`, this property returns:
+
+        .. math::
+            k^2 = \omega^2 \mu \varepsilon - i \omega \mu \sigma
+
+        Returns
+        -------
+        complex
+            Squared wavenumber. Returns the quasistatic approximation if the property
+            `quasistatic` of the class instance is ``True``.
+
+        """
+        return self._get_derived("wavenumber_squared", lambda: self.wavenumber**2)
 
     @property
     def skin_depth(self):
@@ -316,6 +396,162 @@ class BaseFDEM(BaseEM):
             if the property `quasistatic` of the class instance is ``True``.
 
         """
-        return skin_depth(
+        return self._get_derived("skin_depth", lambda: skin_depth(
             self.frequency, self.sigma, mu=self.mu, epsilon=self.epsilon, quasistatic=self.quasistatic
+        ))
+
+    def _frequency_block(self, index):
+        """A shallow copy of the instance restricted to the frequencies at ``index``."""
+        block = copy.copy(self)
+        block.frequency = self.frequency[index]
+        return block
+
+    def iter_chunks(
+        self, method, xyz, frequency_chunk=None, location_chunk=None, **kwargs
+    ):
+        r"""Evaluate a method over blocks of frequencies and locations.
+
+        The methods of FDEM classes broadcast over all frequencies and locations at
+        once, so their temporaries scale with ``n_freq * n_loc``. This generator
+        instead evaluates `method` for at most `frequency_chunk` frequencies and
+        `location_chunk` locations at a time, bounding the memory used by each call.
+        `method` must return its values with the frequencies and locations as their
+        leading axes, followed by at most one component axis.
+
+        Parameters
+        ----------
+        method : str
+            Name of the method to evaluate, e.g. ``"electric_field"``.
+        xyz : (..., dim) numpy.ndarray
+            Locations passed to `method`. They are flattened to ``(n_loc, dim)``
+            before being split into blocks.
+        frequency_chunk : int, optional
+            Maximum number of frequencies in a block. Defaults to all frequencies.
+        location_chunk : int, optional
+            Maximum number of locations in a block. Defaults to all locations.
+        **kwargs
+            Additional keyword arguments passed to `method`.
+
+        Yields
+        ------
+        frequency_slice : slice
+            The frequencies of the block.
+        location_slice : slice
+            The flattened locations of the block.
+        values : (n_freq_chunk, n_loc_chunk, n_comp) numpy.ndarray
+            The output of `method` for the block, with its squeezed dimensions
+            restored.
+
+        Examples
+        --------
+        Write the electric field of a dipole into a preallocated array one
+        frequency at a time.
+
+        >>> from geoana.em.fdem import ElectricDipoleWholeSpace
+        >>> import numpy as np
+        >>> simulation = ElectricDipoleWholeSpace(np.logspace(1, 3, 3), orientation="x")
+        >>> xyz = np.random.default_rng(0).uniform(-1, 1, size=(100, 3))
+        >>> e = np.empty((3, 100, 3), dtype=complex)
+        >>> for i_f, i_loc, block in simulation.iter_chunks("electric_field", xyz, frequency_chunk=1):
+        ...     e[i_f, i_loc] = block
+        >>> np.allclose(e, simulation.electric_field(xyz))
+        True
+        """
+        if not isinstance(method, str):
+            raise TypeError(f"method must be a str, got {type(method).__name__}")
+        if not callable(getattr(self, method, None)):
+            raise ValueError(f"{type(self).__name__} has no method {method!r}")
+
+        xyz = np.asarray(xyz)
+        xyz = xyz.reshape(-1, xyz.shape[-1])
+        n_freq = len(self.frequency)
+        n_loc = xyz.shape[0]
+        frequency_chunk = _check_chunk(frequency_chunk, n_freq, "frequency_chunk")
+        location_chunk = _check_chunk(location_chunk, n_loc, "location_chunk")
+
+        for f_start in range(0, n_freq, frequency_chunk):
+            f_slice = slice(f_start, min(f_start + frequency_chunk, n_freq))
+            if frequency_chunk >= n_freq:
+                block = self
+            else:
+                block = self._frequency_block(f_slice)
+            func = getattr(block, method)
+            n_f = f_slice.stop - f_slice.start
+            for l_start in range(0, n_loc, location_chunk):
+                l_slice = slice(l_start, min(l_start + location_chunk, n_loc))
+                values = np.asarray(func(xyz[l_slice], **kwargs))
+                n_l = l_slice.stop - l_slice.start
+                yield f_slice, l_slice, _restore_block(values, n_f, n_l, method)
+
+    def evaluate_chunked(
+        self, method, xyz, out=None, frequency_chunk=None, location_chunk=None,
+        **kwargs
+    ):
+        r"""Evaluate a method into a single array, a block of frequencies and locations at a time.
+
+        Fills `out` with the blocks of :meth:`iter_chunks`, so the peak memory of the
+        evaluation is set by the block size rather than by the number of
+        frequencies and locations. Pairing this with a memory-mapped `out`
+        (e.g. from :func:`numpy.lib.format.open_memmap`) allows outputs larger than
+        the available memory.
+
+        Parameters
+        ----------
+        method : str
+            Name of the method to evaluate, e.g. ``"electric_field"``.
+        xyz : (..., dim) numpy.ndarray
+            Locations passed to `method`.
+        out : (n_freq, ..., n_comp) numpy.ndarray, optional
+            C-contiguous array to write the output into. If ``None``, a new array
+            is allocated.
+        frequency_chunk : int, optional
+            Maximum number of frequencies in a block. Defaults to all frequencies.
+        location_chunk : int, optional
+            Maximum number of locations in a block. Defaults to all locations.
+        **kwargs
+            Additional keyword arguments passed to `method`.
+
+        Returns
+        -------
+        (n_freq, ..., n_comp) numpy.ndarray
+            The output of `method` for all frequencies and locations. Unlike the
+            output of `method`, it is not squeezed.
+
+        Examples
+        --------
+        >>> from geoana.em.fdem import MagneticDipoleWholeSpace
+        >>> import numpy as np
+        >>> simulation = MagneticDipoleWholeSpace(np.logspace(1, 3, 3), orientation="z")
+        >>> xyz = np.random.default_rng(0).uniform(-1, 1, size=(10, 10, 3))
+        >>> h = simulation.evaluate_chunked("magnetic_field", xyz, frequency_chunk=2, location_chunk=30)
+        >>> h.shape
+        (3, 10, 10, 3)
+        >>> np.allclose(h, simulation.magnetic_field(xyz))
+        True
+        """
+        xyz = np.asarray(xyz)
+        loc_shape = xyz.shape[:-1]
+        n_freq = len(self.frequency)
+        if out is not None:
+            if not isinstance(out, np.ndarray):
+                raise TypeError(f"out must be a numpy.ndarray, got {type(out).__name__}")
+            if out.shape[:-1] != (n_freq, *loc_shape):
+                raise ValueError(
+                    f"out must have shape ({n_freq}, {', '.join(map(str, loc_shape))}"
+                    f"{', ' if loc_shape else ''}n_comp), got {out.shape}"
+                )
+            if not out.flags.c_contiguous:
+                raise ValueError("out must be C contiguous")
+
+        blocks = self.iter_chunks(
+            method, xyz, frequency_chunk=frequency_chunk,
+            location_chunk=location_chunk, **kwargs
         )
+        flat = None if out is None else out.reshape(n_freq, -1, out.shape[-1])
+        for f_slice, l_slice, values in blocks:
+            if out is None:
+                out = np.empty((n_freq, *loc_shape, values.shape[-1]), dtype=values.dtype)
+                flat = out.reshape(n_freq, -1, out.shape[-1])
+            flat[f_slice, l_slice] = values
+        return out
+
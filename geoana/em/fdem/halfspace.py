@@ -81,9 +81,8 @@ class MagneticDipoleHalfSpace(BaseFDEM, BaseMagneticDipole):
 
 
         """
-        f = self.frequency
         sig = self.sigma_hat
-        w = 2*np.pi*f
+        w = self.omega
         k = np.sqrt(-1j*w*mu_0*sig)  # K shape is (n_freq, )
 
         dxy = xy[..., :2] - self.location[:2]
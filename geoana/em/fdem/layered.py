@@ -1,11 +1,35 @@
+from collections import OrderedDict
+from functools import lru_cache
+
 import numpy as np
 from geoana.em.base import BaseMagneticDipole
 from geoana.em.fdem.base import BaseFDEM, sigma_hat
 from scipy.constants import mu_0, epsilon_0
+from scipy.interpolate import CubicSpline
 from geoana.kernels.tranverse_electric_reflections import rTE_forward
 import libdlf
 
 
+@lru_cache(maxsize=None)
+def _get_hankel_filter(name):
+    """Load (and remember) a digital linear filter for the Hankel transform.
+
+    Parameters
+    ----------
+    name : str
+        Name of a Hankel filter in ``libdlf.hankel``.
+
+    Returns
+    -------
+    base, j0, j1 : numpy.ndarray
+        Read-only filter base and its J0 and J1 weights.
+    """
+    base, j0, j1 = (np.array(arr, dtype=float) for arr in getattr(libdlf.hankel, name)())
+    for arr in (base, j0, j1):
+        arr.flags.writeable = False
+    return base, j0, j1
+
+
 class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
     """Simulation class for a harmonic magnetic dipole over a layered halfspace.
 
@@ -36,15 +60,37 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
         **MagneticDipoleLayeredHalfSpace** at a single frequency, *epsilon* is assigned with
         a (n_layer) np.ndarray. For dispersive permittivity and multiple frequencies,
         *epsilon* is assigned with a (n_layer, n_frequency) np.ndarray.
-
+    hankel_filter : str, optional
+        Name of the ``libdlf.hankel`` digital linear filter used to compute the
+        Hankel transforms. Default is ``"key_101_2009"``.
+
+    Notes
+    -----
+    The Hankel filter, the spatial wavenumbers for recently used sets of horizontal
+    offsets and the layer properties expanded over all frequencies are cached on
+    the instance, so repeated calls to :py:meth:`magnetic_field` at a fixed geometry
+    skip their setup. The cached layer properties are cleared whenever the
+    *frequency*, *thickness*, *sigma*, *mu* or *epsilon* are set.
     """
 
-    def __init__(self, frequency, thickness, **kwargs):
+    _max_cached_geometries = 8
+
+    def __init__(self, frequency, thickness, hankel_filter="key_101_2009", **kwargs):
 
         self.thickness = thickness
+        self.hankel_filter = hankel_filter
         super().__init__(frequency=frequency, **kwargs)
         self._check_is_valid_location()
 
+    def _frequency_block(self, index):
+        block = super()._frequency_block(index)
+        # frequency dependent layer properties are sliced to the block's frequencies
+        for name in ("_sigma", "_mu", "_epsilon"):
+            value = getattr(self, name)
+            if value.ndim == 2:
+                setattr(block, name, value[:, index])
+        return block
+
     def _check_is_valid_location(self):
         if self.location[2] < 0.0:
             raise ValueError("Source must be above the surface of the earth (i.e. z >= 0.0)")
@@ -75,7 +121,32 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
         if value.ndim > 1:
             raise TypeError(f"frequencies must be ('*') array")
 
+        value.flags.writeable = False
         self._frequency = value
+        self._model_cache = None
+        self._derived_cache = {}
+
+    @property
+    def hankel_filter(self):
+        """Name of the digital linear filter used for the Hankel transforms
+
+        Returns
+        -------
+        str
+            Name of a Hankel filter in ``libdlf.hankel``
+        """
+        return self._hankel_filter
+
+    @hankel_filter.setter
+    def hankel_filter(self, value):
+
+        if not isinstance(value, str):
+            raise TypeError(f"hankel_filter must be a str, got {type(value)}")
+        if not callable(getattr(libdlf.hankel, value, None)) or value.startswith("_"):
+            raise ValueError(f"{value} is not a Hankel filter available in libdlf")
+
+        self._hankel_filter = value
+        self._geometry_cache = OrderedDict()
 
     @property
     def thickness(self):
@@ -106,7 +177,10 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
         if value.ndim > 1:
             raise TypeError(f"Thicknesses must be ('*') array")
 
+        value.flags.writeable = False
         self._thickness = value
+        self._model_cache = None
+        self._derived_cache = {}
 
     @property
     def sigma(self):
@@ -148,7 +222,10 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
         elif value.ndim > 2:
             raise TypeError(f"sigma must be (n_layer) or (n_layer, n_frequency) np.ndarray")
 
+        value.flags.writeable = False
         self._sigma = value
+        self._model_cache = None
+        self._derived_cache = {}
 
     @property
     def mu(self):
@@ -190,7 +267,10 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
         elif value.ndim > 2:
             raise TypeError(f"mu must be (n_layer) or (n_layer, n_frequency) np.ndarray")
 
+        value.flags.writeable = False
         self._mu = value
+        self._model_cache = None
+        self._derived_cache = {}
 
 
     @property
@@ -233,7 +313,10 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
         elif value.ndim > 2:
             raise TypeError(f"epsilon must be (n_layer) or (n_layer, n_frequency) np.ndarray")
 
+        value.flags.writeable = False
         self._epsilon = value
+        self._model_cache = None
+        self._derived_cache = {}
 
     # def _get_valid_properties(self):
     #     thick = self.thickness
@@ -270,8 +353,215 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
 
         return self.thickness, sigma, epsilon, mu
 
+    def _get_rTE_properties(self):
+        """Layer properties in the form used by the rTE kernel.
+
+        Returns the thicknesses, the (n_layer, n_frequency) conductivity including
+        electric displacement and the (n_layer, n_frequency) permeability, laid out
+        so that ``rTE_forward`` does not need to copy them. The result is cached
+        until one of the physical properties, the thicknesses or the frequencies
+        are set again.
+        """
+        cache = self._model_cache
+        if cache is None or cache[0] != self.quasistatic:
+            n_layer = len(self.thickness) + 1
+            n_frequency = len(self.frequency)
+            thick, sigma, epsilon, mu = self._get_valid_properties_array()
+
+            sigh = sigma_hat(
+                np.tile(self.frequency.reshape((1, n_frequency)), (n_layer, 1)),
+                sigma, epsilon,
+                quasistatic=self.quasistatic
+            )
+            sigh = np.require(sigh, dtype=np.complex128, requirements="F")
+            # rTE_forward only uses the real part of the permeability
+            mu = np.require(np.real(mu), dtype=np.float64, requirements="F")
+            cache = (self.quasistatic, thick, sigh, mu)
+            self._model_cache = cache
+        return cache[1:]
+
+    def _get_hankel_lambda(self, offsets):
+        """Spatial wavenumbers and filter weights for a set of horizontal offsets.
+
+        The most recently used offset sets (up to ``_max_cached_geometries``) are
+        cached for the current Hankel filter.
+
+        Parameters
+        ----------
+        offsets : (n_loc) numpy.ndarray
+            Horizontal source-receiver offsets.
+
+        Returns
+        -------
+        lambd : (n_loc, n_filter) numpy.ndarray
+            Spatial wavenumbers for every offset.
+        i_unique : (n_unique) numpy.ndarray of int
+            Index of the first occurrence of each unique offset.
+        i_inverse : (n_loc) numpy.ndarray of int
+            Index of each offset in the unique offsets.
+        filt_j0, filt_j1 : (n_filter) numpy.ndarray
+            Filter weights for the J0 and J1 transforms.
+        """
+        filt_base, filt_j0, filt_j1 = _get_hankel_filter(self.hankel_filter)
+
+        offsets = np.ascontiguousarray(offsets, dtype=float)
+        key = (offsets.shape, offsets.tobytes())
+        cache = self._geometry_cache
+        geometry = cache.get(key)
+        if geometry is None:
+            lambd = filt_base/offsets[:, None]
+            _, i_unique, i_inverse = np.unique(
+                offsets, return_index=True, return_inverse=True
+            )
+            geometry = (lambd, i_unique, i_inverse.reshape(-1))
+            for arr in geometry:
+                arr.flags.writeable = False
+            cache[key] = geometry
+            while len(cache) > self._max_cached_geometries:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return (*geometry, filt_j0, filt_j1)
+
+    def _evaluate_rTE(self, lambd, i_unique, i_inverse, hankel_method):
+        """Evaluate the TE reflection coefficients for every offset's lambdas.
+
+        The kernel only depends on the spatial wavenumber, so it is evaluated once
+        per unique offset and scattered back to all of the receivers sharing it.
+        For ``hankel_method="spline"``, it is instead evaluated on a single
+        logarithmically spaced wavenumber grid, with twice the sampling density
+        of the filter, and interpolated onto the unique offsets' wavenumbers with
+        a cubic spline.
+
+        Returns
+        -------
+        (n_frequency, n_loc, n_filter) numpy.ndarray of complex
+        """
+        f = self.frequency
+        n_frequency = len(f)
+        thick, sigh, mu = self._get_rTE_properties()
+
+        lambd = lambd[i_unique]
+        if hankel_method == "spline" and lambd.shape[0] > 1:
+            filt_base, _, _ = _get_hankel_filter(self.hankel_filter)
+            d_log = 0.5*np.log(filt_base[1]/filt_base[0])
+            log_min = np.log(lambd.min())
+            log_max = np.log(lambd.max())
+            n_grid = max(int(np.ceil((log_max - log_min)/d_log)) + 1, 4)
+            log_grid = np.linspace(log_min, log_max, n_grid)
+
+            rTE = rTE_forward(f, np.exp(log_grid), sigh, mu, thick)
+            rTE = CubicSpline(log_grid, rTE, axis=-1)(np.log(lambd))
+        else:
+            rTE = rTE_forward(f, lambd.reshape(-1), sigh, mu, thick)
+            rTE = rTE.reshape((n_frequency, *lambd.shape))
+        return rTE[:, i_inverse]
+
+    def _filter_hankel_fields(self, dxyz, offsets, heights, hankel_method):
+        """Evaluate the secondary field components with the digital linear filter.
+
+        Returns
+        -------
+        em_x, em_y, em_z : (n_frequency, n_loc) numpy.ndarray of complex
+        """
+        lambd, i_unique, i_inverse, filt_j0, filt_j1 = self._get_hankel_lambda(offsets)
+
+        rTE = self._evaluate_rTE(lambd, i_unique, i_inverse, hankel_method)
+
+        rTE *= np.exp(-lambd*heights[:, None])
+        # works for variable xyz because each point has it's own lambdas
+
+        src_x, src_y, src_z = self.orientation
+        C0x = C0y = C0z = 0.0
+        C1x = C1y = C1z = 0.0
+        if src_x != 0.0:
+            C0x += src_x*(dxyz[:, 0]**2/offsets**2)[:, None]*lambd**2
+            C1x += src_x*(1/offsets - 2*dxyz[:, 0]**2/offsets**3)[:, None]*lambd
+            C0y += src_x*(dxyz[:, 0]*dxyz[:, 1]/offsets**2)[:, None]*lambd**2
+            C1y -= src_x*(2*dxyz[:, 0]*dxyz[:, 1]/offsets**3)[:, None]*lambd
+            # C0z += 0.0
+            C1z -= (src_x*dxyz[:, 0]/offsets)[:, None]*lambd**2
+
+        if src_y != 0.0:
+            C0x += src_y*(dxyz[:, 0]*dxyz[:, 1]/offsets**2)[:, None]*lambd**2
+            C1x -= src_y*(2*dxyz[:, 0]*dxyz[:, 1]/offsets**3)[:, None]*lambd
+            C0y += src_y*(dxyz[:, 1]**2/offsets**2)[:, None]*lambd**2
+            C1y += src_y*(1/offsets - 2*dxyz[:, 1]**2/offsets**3)[:, None]*lambd
+            # C0z += 0.0
+            C1z -= (src_y*dxyz[:, 1]/offsets)[:, None]*lambd**2
+
+        if src_z != 0.0:
+            # C0x += 0.0
+            C1x += (src_z*dxyz[:, 0]/offsets)[:, None]*lambd**2
+            # C0y += 0.0
+            C1y += (src_z*dxyz[:, 1]/offsets)[:, None]*lambd**2
+            C0z += src_z*lambd**2
+            # C1z += 0.0
+
+        # Do the hankel transform on each component
+        em_x = ((C0x*rTE)@filt_j0 + (C1x*rTE)@filt_j1)/offsets
+        em_y = ((C0y*rTE)@filt_j0 + (C1y*rTE)@filt_j1)/offsets
+        em_z = ((C0z*rTE)@filt_j0 + (C1z*rTE)@filt_j1)/offsets
+        return em_x, em_y, em_z
+
+    def _lagged_hankel_transforms(self, offsets, heights):
+        """Evaluate the hankel transforms with a lagged convolution.
+
+        Parameters
+        ----------
+        offsets : (n_loc) numpy.ndarray
+            Horizontal source-receiver offsets.
+        heights : (n_loc) numpy.ndarray
+            Receiver height plus source height.
+
+        Returns
+        -------
+        I0_2, I1_1, I1_2 : (n_frequency, n_loc) numpy.ndarray of complex
+            The lambda^2 J0, lambda J1 and lambda^2 J1 transforms divided by the
+            offsets.
+        """
+        filt_base, filt_j0, filt_j1 = _get_hankel_filter(self.hankel_filter)
+        n_filter = len(filt_base)
+        d_log = np.log(filt_base[1]/filt_base[0])
+
+        r_max = offsets.max()
+        n_lag = max(int(np.ceil(np.log(r_max/offsets.min())/d_log)) + 1, 4)
+        # lags in increasing offset
+        r_lag = r_max*np.exp(-d_log*np.arange(n_lag))[::-1]
+        log_r_lag = np.log(r_lag)
+        lambd = filt_base[0]/r_max*np.exp(d_log*np.arange(n_filter + n_lag - 1))
+
+        thick, sigh, mu = self._get_rTE_properties()
+        rTE = rTE_forward(self.frequency, lambd, sigh, mu, thick)
+
+        n_frequency = len(self.frequency)
+        out = np.empty((3, n_frequency, len(offsets)), dtype=complex)
+        u_heights, i_inverse = np.unique(heights, return_inverse=True)
+        i_inverse = i_inverse.reshape(-1)
+        for i_height, height in enumerate(u_heights):
+            kernel = rTE*np.exp(-lambd*height)
+
+            # window k holds the lambdas for the k-th largest lag offset
+            kernel *= lambd
+            windows = np.lib.stride_tricks.sliding_window_view(kernel, n_filter, axis=-1)
+            I1_1 = windows[:, ::-1]@filt_j1
+            kernel *= lambd
+            windows = np.lib.stride_tricks.sliding_window_view(kernel, n_filter, axis=-1)
+            I0_2 = windows[:, ::-1]@filt_j0
+            I1_2 = windows[:, ::-1]@filt_j1
+
+            transforms = np.stack((I0_2, I1_1, I1_2))/r_lag
+            in_group = i_inverse == i_height
+            out[:, :, in_group] = CubicSpline(log_r_lag, transforms, axis=-1)(
+                np.log(offsets[in_group])
+            )
+        return out
+
     @property
     def sigma_hat(self):
+        return self._get_derived("sigma_hat", self._compute_sigma_hat)
+
+    def _compute_sigma_hat(self):
         _, sigma, epsilon, _ = self._get_valid_properties_array()
         return sigma_hat(
             self.frequency[:, None], sigma, epsilon,
@@ -286,7 +576,7 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
     def skin_depth(self):
         raise NotImplementedError()
 
-    def magnetic_field(self, xyz, field="secondary"):
+    def magnetic_field(self, xyz, field="secondary", hankel_method="dlf"):
         r"""
         Compute the magnetic field produced by a magnetic dipole over a layered halfspace.
 
@@ -297,6 +587,15 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
             The z component cannot be below the surface (z >= 0.0).
         field : ("secondary", "total")
             Flag for the type of field to return.
+        hankel_method : {"dlf", "spline", "lagged"}
+            How the Hankel transforms are evaluated. ``"dlf"`` evaluates the TE
+            reflection coefficients at every lambda of the digital linear filter,
+            once for each unique horizontal offset. ``"spline"`` evaluates them once
+            on a logarithmic lambda grid covering all offsets, and interpolates them
+            onto each offset's lambdas with a cubic spline, with errors typically
+            below 1E-6 relative to the largest field. ``"lagged"`` uses a lagged
+            convolution (see Notes). Both alternatives are much cheaper for many
+            distinct offsets (e.g. map-style receiver grids or profiles).
 
         Returns
         -------
@@ -331,6 +630,23 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
         .. math::
             H_z = \frac{m_x}{4\pi} \frac{x}{\rho}  \int_0^\infty \bigg [ e^{-u_0 (z - h)} + r_{te} e^{u_0 (z + h)} \bigg ] \lambda^2 J_1 (\lambda \rho) \, d\lambda
 
+        All of these are combinations of three Hankel transforms of the secondary
+        kernel, with :math:`\lambda^2 J_0`, :math:`\lambda J_1` and :math:`\lambda^2 J_1`,
+        which are evaluated with a digital linear filter.
+
+        With ``hankel_method="lagged"``, the fact that the filter's abscissae are
+        logarithmically spaced (with spacing :math:`\Delta`) is used to evaluate the
+        transforms at the offsets :math:`\rho_k = \rho_{max} e^{-k \Delta}` from a
+        single sequence of lambdas, and they are then interpolated onto the receiver
+        offsets with a cubic spline in :math:`\log \rho`. The reflection coefficients
+        are evaluated at only :math:`n_{filter} + n_{lag} - 1` lambdas in total, where
+        :math:`n_{lag}` is the number of filter spacings spanned by the offsets, and
+        the transforms cost :math:`n_{lag} \times n_{filter}` operations for each
+        unique receiver height, independent of the number of receivers. For the
+        provided filters, the interpolation error of the transforms is a few 1E-6 of
+        the largest field (below 1E-5 for offsets from 2 m to 500 m), so it
+        is best suited to dense profiles and maps at a fixed receiver height.
+
         Examples
         --------
         Here, we define an z-oriented magnetic dipole at (0, 0, 0) and plot
@@ -396,72 +712,32 @@ class MagneticDipoleLayeredHalfSpace(BaseFDEM, BaseMagneticDipole):
 
         if (xyz[:, 2] < 0.0).any():
             raise ValueError("Cannot compute fields below the surface")
+        if hankel_method not in ("dlf", "spline", "lagged"):
+            raise ValueError(
+                f"hankel_method must be one of 'dlf', 'spline' or 'lagged', got {hankel_method}"
+            )
         h = self.location[2]
         dxyz = xyz - self.location
         offsets = np.linalg.norm(dxyz[:, :-1], axis=-1)
-
-        # Compute transform operations
-        filt_base, filt_j0, filt_j1 = libdlf.hankel.key_101_2009()
-        lambd = filt_base/offsets[:, None]
-
-        f = self.frequency
-        n_frequency = len(f)
-
-        thick = self.thickness
-        n_layer = len(thick) + 1
-
-        thick, sigma, epsilon, mu = self._get_valid_properties_array()
-
-        # sigh = sigma_hat(
-        #     self.frequency[:, None], sigma, epsilon,
-        #     quasistatic=self.quasistatic
-        # ).T  # this gets sigh with proper shape (n_layer x n_freq) and fortran ordering.
-        # mu = np.tile(mu, (n_frequency, 1)).T  # shape(n_layer x n_freq)
-
-        sigh = sigma_hat(
-            np.tile(self.frequency.reshape((1, n_frequency)), (n_layer, 1)),
-            sigma, epsilon,
-            quasistatic=self.quasistatic
-        )
-
-        rTE = rTE_forward(f, lambd.reshape(-1), sigh, mu, thick)
-        rTE = rTE.reshape((n_frequency, *lambd.shape))
-
         # secondary is height of receiver plus height of source
-        rTE *= np.exp(-lambd*(xyz[:, -1] + h)[:, None])
-        # works for variable xyz because each point has it's own lambdas
+        heights = xyz[:, -1] + h
 
         src_x, src_y, src_z = self.orientation
-        C0x = C0y = C0z = 0.0
-        C1x = C1y = C1z = 0.0
-        if src_x != 0.0:
-            C0x += src_x*(dxyz[:, 0]**2/offsets**2)[:, None]*lambd**2
-            C1x += src_x*(1/offsets - 2*dxyz[:, 0]**2/offsets**3)[:, None]*lambd
-            C0y += src_x*(dxyz[:, 0]*dxyz[:, 1]/offsets**2)[:, None]*lambd**2
-            C1y -= src_x*(2*dxyz[:, 0]*dxyz[:, 1]/offsets**3)[:, None]*lambd
-            # C0z += 0.0
-            C1z -= (src_x*dxyz[:, 0]/offsets)[:, None]*lambd**2
-
-        if src_y != 0.0:
-            C0x += src_y*(dxyz[:, 0]*dxyz[:, 1]/offsets**2)[:, None]*lambd**2
-            C1x -= src_y*(2*dxyz[:, 0]*dxyz[:, 1]/offsets**3)[:, None]*lambd
-            C0y += src_y*(dxyz[:, 1]**2/offsets**2)[:, None]*lambd**2
-            C1y += src_y*(1/offsets - 2*dxyz[:, 1]**2/offsets**3)[:, None]*lambd
-            # C0z += 0.0
-            C1z -= (src_y*dxyz[:, 1]/offsets)[:, None]*lambd**2
-
-        if src_z != 0.0:
-            # C0x += 0.0
-            C1x += (src_z*dxyz[:, 0]/offsets)[:, None]*lambd**2
-            # C0y += 0.0
-            C1y += (src_z*dxyz[:, 1]/offsets)[:, None]*lambd**2
-            C0z += src_z*lambd**2
-            # C1z += 0.0
-
-        # Do the hankel transform on each component
-        em_x = ((C0x*rTE)@filt_j0 + (C1x*rTE)@filt_j1)/offsets
-        em_y = ((C0y*rTE)@filt_j0 + (C1y*rTE)@filt_j1)/offsets
-        em_z = ((C0z*rTE)@filt_j0 + (C1z*rTE)@filt_j1)/offsets
+        if hankel_method == "lagged":
+            # Combine the lambda^2 J0, lambda J1 and lambda^2 J1 transforms
+            # for each component of the source
+            I0_2, I1_1, I1_2 = self._lagged_hankel_transforms(offsets, heights)
+            cos_x = dxyz[:, 0]/offsets
+            cos_y = dxyz[:, 1]/offsets
+            m_h = src_x*cos_x + src_y*cos_y
+
+            em_x = cos_x*m_h*I0_2 + (src_x - 2*cos_x*m_h)/offsets*I1_1 + src_z*cos_x*I1_2
+            em_y = cos_y*m_h*I0_2 + (src_y - 2*cos_y*m_h)/offsets*I1_1 + src_z*cos_y*I1_2
+            em_z = src_z*I0_2 - m_h*I1_2
+        else:
+            em_x, em_y, em_z = self._filter_hankel_fields(
+                dxyz, offsets, heights, hankel_method
+            )
 
         if field == "total":
             # add in the primary field
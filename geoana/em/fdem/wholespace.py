@@ -2,7 +2,58 @@ import numpy as np
 from geoana.em.fdem.base import BaseFDEM
 from geoana.spatial import repeat_scalar
 from geoana.utils import check_xyz_dim
-from geoana.em.base import BaseElectricDipole, BaseMagneticDipole
+from geoana.em.base import BaseElectricDipole, BaseMagneticDipole, BaseDipoleCollection
+from geoana.kernels import wholespace_dipole_dyadic, wholespace_dipole_curl
+from geoana.kernels.parallel import _check_n_threads, _split_receivers
+
+
+def _sum_dipoles(kernel, xyz, location, moment, k, summed, block_size):
+    """Evaluate a wholespace dipole kernel for every dipole at every location.
+
+    The dipoles are processed in blocks, so that at most ``block_size`` values of each
+    component are computed at once, and the locations are split over the number of
+    threads set by :func:`geoana.kernels.set_num_threads`.
+
+    Returns
+    -------
+    (n_freq, ..., 3) or (n_freq, n_dipole, ..., 3) numpy.ndarray of complex
+        The kernel summed over the dipoles, or for each dipole if not `summed`.
+    """
+    xyz = check_xyz_dim(xyz)
+    loc_shape = xyz.shape[:-1]
+    xyz = xyz.reshape(-1, 3)
+    n_freq, n_loc, n_dipole = len(k), xyz.shape[0], location.shape[0]
+
+    if summed:
+        out = np.zeros((n_freq, n_loc, 3), dtype=complex)
+    else:
+        out = np.empty((n_freq, n_dipole, n_loc, 3), dtype=complex)
+    n_block = max(1, block_size // max(n_freq * n_loc, 1))
+    # the locations are split along the first axis of the output
+    _split_receivers(
+        _sum_dipole_block, _check_n_threads(None), kernel, xyz, location, moment, k[:, None, None],
+        summed, n_block, np.moveaxis(out, -2, 0)
+    )
+    if summed:
+        return out.reshape((n_freq, *loc_shape, 3))
+    return out.reshape((n_freq, n_dipole, *loc_shape, 3))
+
+
+def _sum_dipole_block(kernel, xyz, location, moment, k, summed, n_block, out):
+    # fill the (n_loc, n_freq, [n_dipole, ] 3) out for the locations xyz
+    out = np.moveaxis(out, 0, -2)
+    for start in range(0, location.shape[0], n_block):
+        src = slice(start, start + n_block)
+        dxyz = xyz - location[src, None, :]
+        m = moment[src, None, :]
+        f = kernel(
+            dxyz[..., 0], dxyz[..., 1], dxyz[..., 2], m[..., 0], m[..., 1], m[..., 2], k
+        )
+        for i in range(3):
+            if summed:
+                out[..., i] += f[i].sum(axis=1)
+            else:
+                out[:, src, :, i] = f[i]
 
 
 class ElectricDipoleWholeSpace(BaseFDEM, BaseElectricDipole):
@@ -181,25 +232,7 @@ class ElectricDipoleWholeSpace(BaseFDEM, BaseElectricDipole):
         >>> ax2.set_title('Imag component {} Hz'.format(frequency[f_ind]))
 
         """
-        dxyz = xyz - self.location
-        r = np.linalg.norm(dxyz, axis=-1)
-        k = self.wavenumber
-        for dim in range(r.ndim):
-            k = k[:, None]
-
-        kr = k * r
-        ikr = 1j * kr
-
-        front_term = (
-            (self.current * self.length) / (4 * np.pi * self.sigma * r**3) *
-            np.exp(-ikr)
-        )
-        symmetric_term = (
-            ((dxyz @ self.orientation) * (-kr**2 + 3*ikr + 3) / r**2)[..., None] * dxyz
-        )
-        oriented_term = (kr**2 - ikr - 1)[..., None] * self.orientation
-
-        return (front_term[..., None] * (symmetric_term + oriented_term)).squeeze()
+        return self.fields(xyz, which="E")["E"]
 
     def current_density(self, xyz):
         r"""Current density for the harmonic current dipole at a set of gridded locations.
@@ -366,19 +399,7 @@ class ElectricDipoleWholeSpace(BaseFDEM, BaseElectricDipole):
         >>> ax2.set_title('Imag component {} Hz'.format(frequency[f_ind]))
 
         """
-        dxyz = xyz - self.location
-        r = np.linalg.norm(dxyz, axis=-1)
-        k = self.wavenumber
-        for dim in range(r.ndim):
-            k = k[:, None]
-        kr = k * r
-        ikr = 1j*kr
-
-        front_term = (
-            self.current * self.length / (4 * np.pi * r**2) * (ikr + 1) *
-            np.exp(-ikr)
-        )
-        return (-front_term[..., None] * np.cross(dxyz, self.orientation) / r[..., None]).squeeze()
+        return self.fields(xyz, which="H")["H"]
 
     def magnetic_flux_density(self, xyz):
         r"""Magnetic flux density produced by the harmonic electric current dipole at a set of gridded locations.
@@ -463,6 +484,84 @@ class ElectricDipoleWholeSpace(BaseFDEM, BaseElectricDipole):
         """
         return self.mu * self.magnetic_field(xyz)
 
+    def fields(self, xyz, which=("E", "H", "J", "B")):
+        r"""Several fields of the harmonic current dipole at a set of gridded locations.
+
+        Evaluates the requested fields of :meth:`electric_field`,
+        :meth:`current_density`, :meth:`magnetic_field` and
+        :meth:`magnetic_flux_density` together, computing the distances to the
+        dipole and the :math:`e^{-ikr}` terms they share only once, which is
+        faster than calling each of the methods when more than one field is needed.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Gridded xyz locations
+        which : str or sequence of {"E", "H", "J", "B"}, optional
+            The fields to compute: the electric field ("E"), the magnetic field
+            ("H"), the current density ("J") and the magnetic flux density ("B").
+
+        Returns
+        -------
+        dict of (n_freq, ..., 3) numpy.array of complex
+            Each requested field at all frequencies for the gridded locations
+            provided, keyed by its name in `which`. Output arrays are squeezed when
+            n_freq and/or n_loc = 1.
+
+        Examples
+        --------
+        Compute the electric and magnetic fields of an x-oriented electric dipole
+        together.
+
+        >>> from geoana.em.fdem import ElectricDipoleWholeSpace
+        >>> import numpy as np
+        >>> frequency = np.logspace(1, 3, 3)
+        >>> simulation = ElectricDipoleWholeSpace(frequency, orientation=np.r_[1., 0., 0.])
+        >>> xyz = np.random.default_rng(0).uniform(-1, 1, size=(100, 3))
+        >>> fields = simulation.fields(xyz, which=("E", "H"))
+        >>> np.allclose(fields["E"], simulation.electric_field(xyz))
+        True
+        >>> fields["H"].shape
+        (3, 100, 3)
+        """
+        if isinstance(which, str):
+            which = (which, )
+        for name in which:
+            if name not in ("E", "H", "J", "B"):
+                raise ValueError(
+                    f"which must only contain 'E', 'H', 'J' or 'B', got {name!r}"
+                )
+
+        dxyz = xyz - self.location
+        r2 = np.sum(dxyz * dxyz, axis=-1)
+        r = np.sqrt(r2)
+        k = self.wavenumber
+        for dim in range(r.ndim):
+            k = k[:, None]
+        kr = k * r
+        ikr = 1j * kr
+        shared_term = self.current * self.length / (4 * np.pi * r2) * np.exp(-ikr)
+
+        fields = {}
+        if "E" in which or "J" in which:
+            kr2 = kr * kr
+            front_term = shared_term / (self.sigma * r)
+            symmetric_term = front_term * (dxyz @ self.orientation) * (-kr2 + 3*ikr + 3) / r2
+            oriented_term = front_term * (kr2 - ikr - 1)
+            e = symmetric_term[..., None] * dxyz + oriented_term[..., None] * self.orientation
+            if "E" in which:
+                fields["E"] = e.squeeze()
+            if "J" in which:
+                fields["J"] = (self.sigma * e).squeeze()
+        if "H" in which or "B" in which:
+            front_term = -shared_term * (ikr + 1) / r
+            h = front_term[..., None] * np.cross(dxyz, self.orientation)
+            if "H" in which:
+                fields["H"] = h.squeeze()
+            if "B" in which:
+                fields["B"] = (self.mu * h).squeeze()
+        return {name: fields[name] for name in which}
+
 
 class MagneticDipoleWholeSpace(BaseFDEM, BaseMagneticDipole):
     """
@@ -918,6 +1017,251 @@ class MagneticDipoleWholeSpace(BaseFDEM, BaseMagneticDipole):
         return self.mu * self.magnetic_field(xyz)
 
 
+class ElectricDipoleCollectionWholeSpace(BaseFDEM, BaseDipoleCollection):
+    r"""Class for the summed fields of many harmonic electric dipoles in a wholespace.
+
+    Each dipole :math:`j` located at :math:`\mathbf{r}_j` has a current dipole moment
+    :math:`\mathbf{p}_j = I ds \, \mathbf{\hat{u}}_j`, so that a grounded wire or a
+    loop can be modelled by many short segments. The fields of all of the dipoles
+    are evaluated in a single compiled pass, rather than by creating and calling an
+    :class:`ElectricDipoleWholeSpace` for each of them.
+
+    Parameters
+    ----------
+    frequency : float or (n_freq) numpy.ndarray
+        Frequency or frequencies in Hz.
+    location : (n_dipole, 3) array_like
+        Location of each dipole (m).
+    moment : (3) or (n_dipole, 3) array_like
+        Current dipole moment :math:`I ds \, \mathbf{\hat{u}}` of each dipole (A m).
+    """
+
+    _block_size = 2**18
+
+    def __init__(self, frequency, location, moment, **kwargs):
+        super().__init__(frequency=frequency, location=location, moment=moment, **kwargs)
+
+    def electric_field(self, xyz, summed=True):
+        r"""Electric field of the harmonic electric dipoles at a set of gridded locations.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Gridded xyz locations
+        summed : bool, optional
+            If ``True``, return the sum of the fields of all of the dipoles, otherwise
+            return the field of each dipole.
+
+        Returns
+        -------
+        (n_freq, ..., 3) or (n_freq, n_dipole, ..., 3) numpy.ndarray of complex
+            Electric field at all frequencies for the gridded locations provided.
+            Output array is squeezed when n_freq, n_dipole and/or n_loc = 1.
+
+        Examples
+        --------
+        Model a 100 m grounded wire along the x axis as 1000 short dipoles, and
+        compare it to a single dipole far from the wire.
+
+        >>> from geoana.em.fdem import ElectricDipoleCollectionWholeSpace, ElectricDipoleWholeSpace
+        >>> import numpy as np
+        >>> location = np.c_[np.linspace(-49.95, 49.95, 1000), np.zeros((1000, 2))]
+        >>> wire = ElectricDipoleCollectionWholeSpace(10., location, moment=[0.1, 0., 0.], sigma=0.01)
+        >>> dipole = ElectricDipoleWholeSpace(10., length=100., orientation="x", sigma=0.01)
+        >>> xyz = np.array([[0., 5000., 0.]])
+        >>> np.allclose(wire.electric_field(xyz), dipole.electric_field(xyz), rtol=1e-3)
+        True
+        """
+        out = _sum_dipoles(
+            wholespace_dipole_dyadic, xyz, self.location, self.moment, self.wavenumber,
+            summed, self._block_size
+        )
+        out /= self.sigma
+        return out.squeeze()
+
+    def current_density(self, xyz, summed=True):
+        r"""Current density of the harmonic electric dipoles at a set of gridded locations.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Gridded xyz locations
+        summed : bool, optional
+            If ``True``, return the sum of the current densities of all of the
+            dipoles, otherwise return the current density of each dipole.
+
+        Returns
+        -------
+        (n_freq, ..., 3) or (n_freq, n_dipole, ..., 3) numpy.ndarray of complex
+            Current density at all frequencies for the gridded locations provided.
+            Output array is squeezed when n_freq, n_dipole and/or n_loc = 1.
+        """
+        return self.sigma * self.electric_field(xyz, summed=summed)
+
+    def magnetic_field(self, xyz, summed=True):
+        r"""Magnetic field of the harmonic electric dipoles at a set of gridded locations.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Gridded xyz locations
+        summed : bool, optional
+            If ``True``, return the sum of the fields of all of the dipoles, otherwise
+            return the field of each dipole.
+
+        Returns
+        -------
+        (n_freq, ..., 3) or (n_freq, n_dipole, ..., 3) numpy.ndarray of complex
+            Magnetic field at all frequencies for the gridded locations provided.
+            Output array is squeezed when n_freq, n_dipole and/or n_loc = 1.
+        """
+        out = _sum_dipoles(
+            wholespace_dipole_curl, xyz, self.location, self.moment, self.wavenumber,
+            summed, self._block_size
+        )
+        out *= -1
+        return out.squeeze()
+
+    def magnetic_flux_density(self, xyz, summed=True):
+        r"""Magnetic flux density of the harmonic electric dipoles at a set of gridded locations.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Gridded xyz locations
+        summed : bool, optional
+            If ``True``, return the sum of the flux densities of all of the dipoles,
+            otherwise return the flux density of each dipole.
+
+        Returns
+        -------
+        (n_freq, ..., 3) or (n_freq, n_dipole, ..., 3) numpy.ndarray of complex
+            Magnetic flux density at all frequencies for the gridded locations
+            provided. Output array is squeezed when n_freq, n_dipole and/or n_loc = 1.
+        """
+        return self.mu * self.magnetic_field(xyz, summed=summed)
+
+
+class MagneticDipoleCollectionWholeSpace(BaseFDEM, BaseDipoleCollection):
+    r"""Class for the summed fields of many harmonic magnetic dipoles in a wholespace.
+
+    Each dipole :math:`j` located at :math:`\mathbf{r}_j` has a moment
+    :math:`\mathbf{m}_j = m \, \mathbf{\hat{u}}_j`, so that, for example, the
+    elements of a large loop can be modelled as many small dipoles. The fields of
+    all of the dipoles are evaluated in a single compiled pass, rather than by
+    creating and calling a :class:`MagneticDipoleWholeSpace` for each of them.
+
+    Parameters
+    ----------
+    frequency : float or (n_freq) numpy.ndarray
+        Frequency or frequencies in Hz.
+    location : (n_dipole, 3) array_like
+        Location of each dipole (m).
+    moment : (3) or (n_dipole, 3) array_like
+        Moment :math:`m \, \mathbf{\hat{u}}` of each dipole (A m\ :sup:`2`).
+    """
+
+    _block_size = 2**18
+
+    def __init__(self, frequency, location, moment, **kwargs):
+        super().__init__(frequency=frequency, location=location, moment=moment, **kwargs)
+
+    def electric_field(self, xyz, summed=True):
+        r"""Electric field of the harmonic magnetic dipoles at a set of gridded locations.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Gridded xyz locations
+        summed : bool, optional
+            If ``True``, return the sum of the fields of all of the dipoles, otherwise
+            return the field of each dipole.
+
+        Returns
+        -------
+        (n_freq, ..., 3) or (n_freq, n_dipole, ..., 3) numpy.ndarray of complex
+            Electric field at all frequencies for the gridded locations provided.
+            Output array is squeezed when n_freq, n_dipole and/or n_loc = 1.
+        """
+        out = _sum_dipoles(
+            wholespace_dipole_curl, xyz, self.location, self.moment, self.wavenumber,
+            summed, self._block_size
+        )
+        out *= (1j * self.omega * self.mu).reshape((-1, ) + (1, ) * (out.ndim - 1))
+        return out.squeeze()
+
+    def current_density(self, xyz, summed=True):
+        r"""Current density of the harmonic magnetic dipoles at a set of gridded locations.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Gridded xyz locations
+        summed : bool, optional
+            If ``True``, return the sum of the current densities of all of the
+            dipoles, otherwise return the current density of each dipole.
+
+        Returns
+        -------
+        (n_freq, ..., 3) or (n_freq, n_dipole, ..., 3) numpy.ndarray of complex
+            Current density at all frequencies for the gridded locations provided.
+            Output array is squeezed when n_freq, n_dipole and/or n_loc = 1.
+        """
+        return self.sigma * self.electric_field(xyz, summed=summed)
+
+    def magnetic_field(self, xyz, summed=True):
+        r"""Magnetic field of the harmonic magnetic dipoles at a set of gridded locations.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Gridded xyz locations
+        summed : bool, optional
+            If ``True``, return the sum of the fields of all of the dipoles, otherwise
+            return the field of each dipole.
+
+        Returns
+        -------
+        (n_freq, ..., 3) or (n_freq, n_dipole, ..., 3) numpy.ndarray of complex
+            Magnetic field at all frequencies for the gridded locations provided.
+            Output array is squeezed when n_freq, n_dipole and/or n_loc = 1.
+
+        Examples
+        --------
+        The field of two opposite dipoles at the same location cancels.
+
+        >>> from geoana.em.fdem import MagneticDipoleCollectionWholeSpace
+        >>> import numpy as np
+        >>> pair = MagneticDipoleCollectionWholeSpace(100., np.zeros((2, 3)), moment=[[0., 0., 1.], [0., 0., -1.]])
+        >>> np.allclose(pair.magnetic_field(np.array([[3., 4., 5.]])), 0.)
+        True
+        """
+        out = _sum_dipoles(
+            wholespace_dipole_dyadic, xyz, self.location, self.moment, self.wavenumber,
+            summed, self._block_size
+        )
+        return out.squeeze()
+
+    def magnetic_flux_density(self, xyz, summed=True):
+        r"""Magnetic flux density of the harmonic magnetic dipoles at a set of gridded locations.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Gridded xyz locations
+        summed : bool, optional
+            If ``True``, return the sum of the flux densities of all of the dipoles,
+            otherwise return the flux density of each dipole.
+
+        Returns
+        -------
+        (n_freq, ..., 3) or (n_freq, n_dipole, ..., 3) numpy.ndarray of complex
+            Magnetic flux density at all frequencies for the gridded locations
+            provided. Output array is squeezed when n_freq, n_dipole and/or n_loc = 1.
+        """
+        return self.mu * self.magnetic_field(xyz, summed=summed)
+
+
 class HarmonicPlaneWave(BaseFDEM):
     """
     Class for simulating the fields and densities for a harmonic planewave in a wholespace.
@@ -22,6 +22,9 @@ Simulation Classes
   PointCurrentWholeSpace
   PointCurrentHalfSpace
   DipoleHalfSpace
+  MagneticDipoleCollection
+  MagneticPrism
+  MagneticPrismCollection
 """
 
 from geoana.em.static.sphere import ElectrostaticSphere
@@ -40,4 +43,7 @@ from geoana.em.static.halfspace import (
     DipoleHalfSpace
 )
 
-from geoana.em.static.freespace import LineCurrentFreeSpace, MagneticPrism
+from geoana.em.static.freespace import (
+    LineCurrentFreeSpace, MagneticDipoleCollection, MagneticPrism,
+    MagneticPrismCollection
+)
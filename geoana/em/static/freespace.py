@@ -1,19 +1,10 @@
 import numpy as np
 from scipy.constants import mu_0
 
-from ..base import BaseLineCurrent
+from ..base import BaseDipoleCollection, BaseLineCurrent
 from geoana.utils import check_xyz_dim
-from geoana.shapes import BasePrism
-from geoana.kernels import (
-    prism_fz,
-    prism_fzz,
-    prism_fzx,
-    prism_fzy,
-    prism_fzzz,
-    prism_fxxy,
-    prism_fxxz,
-    prism_fxyz,
-)
+from geoana.shapes import BasePrism, BasePrismCollection
+from geoana.kernels import prism_fz, PointSourceTree
 
 
 class LineCurrentFreeSpace(BaseLineCurrent):
@@ -196,6 +187,136 @@ class LineCurrentFreeSpace(BaseLineCurrent):
         return mu_0 * self.magnetic_field(xyz)
 
 
+class MagneticDipoleCollection(BaseDipoleCollection):
+    """Class for magnetic field solutions for many magnetic dipoles.
+
+    The ``MagneticDipoleCollection`` class computes the summed magnetic potentials,
+    fields and flux densities of many static magnetic dipoles, such as the
+    equivalent dipoles of the cells of a large mesh. Rather than summing every
+    dipole at every location, which costs :math:`O(N M)` for N dipoles at M
+    locations, the dipoles are sorted into an octree, and distant groups of dipoles
+    are approximated by their multipole expansions (see
+    :class:`geoana.kernels.PointSourceTree`).
+
+    Parameters
+    ----------
+    location : (n_dipole, 3) array_like
+        Location of each dipole (m).
+    moment : (3,) or (n_dipole, 3) array_like
+        Moment of each dipole (:math:`A m^2`). A single (3) moment is used for all
+        dipoles.
+    theta : float, optional
+        Opening angle of the tree, which controls the accuracy of the sums. The
+        relative error of the contribution of a group of dipoles is of the order of
+        ``theta**2``; ``theta=0`` sums every dipole exactly.
+    """
+
+    def __init__(self, location, moment, theta=0.5, **kwargs):
+        self.theta = theta
+        super().__init__(location=location, moment=moment, **kwargs)
+
+    # the octree is rebuilt when the dipoles change
+
+    @BaseDipoleCollection.location.setter
+    def location(self, vec):
+        BaseDipoleCollection.location.fset(self, vec)
+        self._tree = None
+
+    @BaseDipoleCollection.moment.setter
+    def moment(self, vec):
+        BaseDipoleCollection.moment.fset(self, vec)
+        self._tree = None
+
+    @property
+    def theta(self):
+        """Opening angle of the octree.
+
+        A group of dipoles is approximated by its multipole expansion at a location
+        when the radius of the group is less than `theta` times its distance.
+
+        Returns
+        -------
+        float
+        """
+        return self._theta
+
+    @theta.setter
+    def theta(self, value):
+        try:
+            value = float(value)
+        except:
+            raise TypeError(f"theta must be a number, got {type(value)}")
+        if not value >= 0:
+            raise ValueError(f"theta must be non-negative, got {value}")
+
+        self._theta = value
+
+    @property
+    def tree(self):
+        """Octree of the dipoles, built when first needed.
+
+        Returns
+        -------
+        geoana.kernels.PointSourceTree
+        """
+        if self._tree is None:
+            self._tree = PointSourceTree(self.location, dipoles=self.moment)
+        return self._tree
+
+    def scalar_potential(self, xyz):
+        """
+        Magnetic scalar potential due to the dipoles. Defined such that
+        :math:`H = \\nabla \\phi`.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (...) numpy.ndarray
+            Magnetic scalar potential of the dipoles at location xyz in units :math:`A`.
+        """
+        xyz = check_xyz_dim(xyz)
+        phi = self.tree.evaluate(xyz.reshape(-1, 3), order=0, theta=self.theta)
+        return -1.0/(4 * np.pi) * phi.reshape(xyz.shape[:-1])
+
+    def magnetic_field(self, xyz):
+        """
+        Magnetic field due to the dipoles.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3) numpy.ndarray
+            Magnetic field of the dipoles at location xyz in units :math:`\\frac{A}{m}`.
+        """
+        xyz = check_xyz_dim(xyz)
+        g = self.tree.evaluate(xyz.reshape(-1, 3), order=1, theta=self.theta)
+        return -1.0/(4 * np.pi) * g.reshape(xyz.shape)
+
+    def magnetic_flux_density(self, xyz):
+        """
+        Magnetic flux density due to the dipoles.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3) numpy.ndarray
+            Magnetic flux density of the dipoles at location xyz in units :math:`T`.
+        """
+        return mu_0 * self.magnetic_field(xyz)
+
+
 class MagneticPrism(BasePrism):
     """Class for magnetic field solutions for a prism.
 
@@ -210,15 +331,26 @@ class MagneticPrism(BasePrism):
         (x, y, z) triplet of the maximum locations in each dimension
     magnetization : (3,) array_like, optional
         Magnetization of prism (:math:`\\frac{A}{m}`).
+    dtype : {numpy.float64, numpy.float32}, optional
+        Data type of the computed potentials, fields and gradients.
+    far_field_ratio : float, optional
+        Distance, in prism diagonals, beyond which the prism is approximated by
+        a point dipole, see :attr:`geoana.shapes.BasePrism.far_field_ratio`.
     """
 
-    def __init__(self, min_location, max_location, magnetization=None):
+    def __init__(
+        self, min_location, max_location, magnetization=None, dtype=np.float64,
+        far_field_ratio=None
+    ):
 
         if magnetization is None:
             magnetization = np.r_[0.0, 0.0, 1.0]
         self.magnetization = magnetization
 
-        super().__init__(min_location=min_location, max_location=max_location)
+        super().__init__(
+            min_location=min_location, max_location=max_location, dtype=dtype,
+            far_field_ratio=far_field_ratio
+        )
 
     @property
     def magnetization(self):
@@ -266,7 +398,8 @@ class MagneticPrism(BasePrism):
         gy = self._eval_def_int(prism_fz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=2)
         gz = self._eval_def_int(prism_fz, xyz[..., 0], xyz[..., 1], xyz[..., 2])
 
-        return -1.0/(4 * np.pi) * (gx * m_x + gy * m_y + gz * m_z)
+        val = -1.0/(4 * np.pi) * (gx * m_x + gy * m_y + gz * m_z)
+        return val.astype(self.dtype, copy=False)
 
     def magnetic_field(self, xyz):
         """
@@ -286,17 +419,10 @@ class MagneticPrism(BasePrism):
         xyz = check_xyz_dim(xyz)
         m_x, m_y, m_z = self.magnetization
 
-        # need to evaluate f node at each source locations
-        gxx = self._eval_def_int(prism_fzz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=1)
-        gxy = self._eval_def_int(prism_fzx, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=1)
-        gxz = self._eval_def_int(prism_fzx, xyz[..., 0], xyz[..., 1], xyz[..., 2])
-
-        gyy = self._eval_def_int(prism_fzz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=2)
-        gyz = self._eval_def_int(prism_fzy, xyz[..., 0], xyz[..., 1], xyz[..., 2])
-
-        # gzz = - gxx - gyy - 4 * np.pi * G * rho[in_cell]
-        # easiest to just calculate it using another integral
-        gzz = self._eval_def_int(prism_fzz, xyz[..., 0], xyz[..., 1], xyz[..., 2])
+        # evaluate all of the components in one pass over the prism's corners
+        gxx, gxy, gxz, gyy, gyz, gzz = self._eval_derivative_def_int(
+            2, xyz[..., 0], xyz[..., 1], xyz[..., 2]
+        )
 
         H = - 1.0/(4 * np.pi) * np.stack(
             (
@@ -306,7 +432,7 @@ class MagneticPrism(BasePrism):
             ),
             axis=-1
         )
-        return H
+        return H.astype(self.dtype, copy=False)
 
     def magnetic_flux_density(self, xyz):
         """
@@ -350,17 +476,10 @@ class MagneticPrism(BasePrism):
         xyz = check_xyz_dim(xyz)
         m_x, m_y, m_z = self.magnetization
 
-        # need to evaluate f node at each source locations
-        gxxx = self._eval_def_int(prism_fzzz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=1)
-        gxxy = self._eval_def_int(prism_fxxy, xyz[..., 0], xyz[..., 1], xyz[..., 2])
-        gxxz = self._eval_def_int(prism_fxxz, xyz[..., 0], xyz[..., 1], xyz[..., 2])
-        gyyx = self._eval_def_int(prism_fxxz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=1)
-        gxyz = self._eval_def_int(prism_fxyz, xyz[..., 0], xyz[..., 1], xyz[..., 2])
-        gzzx = self._eval_def_int(prism_fxxy, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=2)
-        gyyy = self._eval_def_int(prism_fzzz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=2)
-        gyyz = self._eval_def_int(prism_fxxy, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=1)
-        gzzy = self._eval_def_int(prism_fxxz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=2)
-        gzzz = self._eval_def_int(prism_fzzz, xyz[..., 0], xyz[..., 1], xyz[..., 2])
+        # evaluate all of the components in one pass over the prism's corners
+        (
+            gxxx, gxxy, gxxz, gyyx, gxyz, gzzx, gyyy, gyyz, gzzy, gzzz
+        ) = self._eval_derivative_def_int(3, xyz[..., 0], xyz[..., 1], xyz[..., 2])
 
         Hxx = gxxx * m_x + gxxy * m_y + gxxz * m_z
         Hxy = gxxy * m_x + gyyx * m_y + gxyz * m_z
@@ -374,4 +493,278 @@ class MagneticPrism(BasePrism):
         third = np.stack([Hxz, Hyz, Hzz], axis=-1)
 
         H_grad = - 1.0/(4 * np.pi) * np.stack((first, second, third), axis=-1)
-        return H_grad
+        return H_grad.astype(self.dtype, copy=False)
+
+
+# indices of the unique derivative tensor components in the full symmetric tensors
+_SECOND_ORDER_INDEX = np.array([[0, 1, 2], [1, 3, 4], [2, 4, 5]])
+_THIRD_ORDER_INDEX = np.array([
+    [[0, 1, 2], [1, 3, 4], [2, 4, 5]],
+    [[1, 3, 4], [3, 6, 7], [4, 7, 8]],
+    [[2, 4, 5], [4, 7, 8], [5, 8, 9]],
+])
+# axis of the field and field gradient components in the derivative tensors
+_FIELD_AXES = {"hx": (0, ), "hy": (1, ), "hz": (2, )}
+_GRADIENT_AXES = {
+    "hxx": (0, 0), "hxy": (0, 1), "hxz": (0, 2), "hyy": (1, 1), "hyz": (1, 2), "hzz": (2, 2)
+}
+
+
+class MagneticPrismCollection(BasePrismCollection):
+    """Class for magnetic field solutions for a collection of prisms.
+
+    The ``MagneticPrismCollection`` class is used to analytically compute the summed
+    magnetic potentials, fields, and gradients of many prisms with constant
+    magnetizations, such as the cells of a mesh, along with their sensitivity
+    matrices. The prisms are evaluated together in compiled loops, rather than one
+    :class:`MagneticPrism` at a time.
+
+    Parameters
+    ----------
+    min_location : (n_prism, 3) array_like
+        (x, y, z) triplets of the minimum locations of each prism
+    max_location : (n_prism, 3) array_like
+        (x, y, z) triplets of the maximum locations of each prism
+    magnetization : (3,) or (n_prism, 3) array_like, optional
+        Magnetization of each prism (:math:`\\frac{A}{m}`).
+    dtype : {numpy.float64, numpy.float32}, optional
+        Data type of the computed fields and sensitivity matrices. The kernels are
+        evaluated, and summed over the prisms, in double precision, so
+        ``numpy.float32`` mostly halves the memory of large sensitivity matrices.
+    far_field_ratio : float, optional
+        Distance, in prism diagonals, beyond which each prism is approximated by
+        a point dipole, see :attr:`geoana.shapes.BasePrismCollection.far_field_ratio`.
+    """
+
+    sensitivity_components = ("potential", ) + tuple(_FIELD_AXES) + tuple(_GRADIENT_AXES)
+
+    def __init__(
+        self, min_location, max_location, magnetization=None, dtype=np.float64,
+        far_field_ratio=None
+    ):
+
+        super().__init__(
+            min_location=min_location, max_location=max_location, dtype=dtype,
+            far_field_ratio=far_field_ratio
+        )
+
+        if magnetization is None:
+            magnetization = np.r_[0.0, 0.0, 1.0]
+        self.magnetization = magnetization
+
+    @property
+    def magnetization(self):
+        """ The magnetization of each prism.
+
+        Returns
+        -------
+        (n_prism, 3) numpy.ndarray
+            In :math:`\\frac{A}{m}`.
+        """
+        return self._magnetization
+
+    @magnetization.setter
+    def magnetization(self, vec):
+        try:
+            vec = np.asarray(vec, dtype=float)
+        except:
+            raise TypeError(f"magnetization must be array_like of float, got {type(vec)}")
+
+        if vec.shape == (3,):
+            vec = np.tile(vec, (self.n_prism, 1))
+        if vec.shape != (self.n_prism, 3):
+            raise ValueError(
+                f"magnetization must be array_like with shape (3,) or ({self.n_prism}, 3), "
+                f"got {vec.shape}"
+            )
+
+        self._magnetization = np.ascontiguousarray(vec)
+
+    @property
+    def moment(self):
+        """ The magnetic moment of each prism.
+
+        Returns
+        -------
+        (n_prism, 3) numpy.ndarray
+            In :math:`A m^2`.
+        """
+        return self.volume[:, None] * self.magnetization
+
+    def scalar_potential(self, xyz):
+        """
+        Magnetic scalar potential due to the collection of prisms. Defined such that
+        :math:`H = \\nabla \\phi`.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (...) numpy.ndarray
+            Magnetic scalar potential of the prisms at location xyz in units :math:`A`.
+        """
+        xyz = check_xyz_dim(xyz)
+        g = self._field_integrals(xyz, weights=self.magnetization)
+        return -1.0/(4 * np.pi) * np.einsum('...kk->...', g)
+
+    def magnetic_field(self, xyz):
+        """
+        Magnetic field due to the collection of prisms.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3) numpy.ndarray
+            Magnetic field of the prisms at location xyz in units :math:`\\frac{A}{m}`.
+        """
+        xyz = check_xyz_dim(xyz)
+        g = self._gradient_integrals(xyz, weights=self.magnetization)
+        return -1.0/(4 * np.pi) * np.einsum('...ckk->...c', g)
+
+    def magnetic_flux_density(self, xyz):
+        """
+        Magnetic flux density due to the collection of prisms.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3) numpy.ndarray
+            Magnetic flux density of the prisms at location xyz in units :math:`T`.
+        """
+        xyz = check_xyz_dim(xyz)
+        H = self.magnetic_field(xyz)
+        H += self._is_inside(xyz, self.magnetization)
+
+        return mu_0 * H
+
+    def magnetic_field_gradient(self, xyz):
+        """
+        Magnetic field gradient due to the collection of prisms.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3, 3) numpy.ndarray
+            Magnetic field gradient of the prisms at location xyz in units :math:`\\frac{A}{m^2}`.
+        """
+        xyz = check_xyz_dim(xyz)
+        g = self._third_order_integrals(xyz, weights=self.magnetization)
+        return -1.0/(4 * np.pi) * np.einsum('...abkk->...ab', g)
+
+    def scalar_potential_sensitivity(self, xyz):
+        """
+        Sensitivity of the magnetic scalar potential to the magnetization of each prism.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., n_prism, 3) numpy.ndarray
+            Sensitivity to each prism's (x, y, z) magnetization. Flattening the last two
+            axes gives the matrix that maps ``magnetization.reshape(-1)`` to the potential.
+        """
+        xyz = check_xyz_dim(xyz)
+        g = self._field_integrals(xyz)
+        return -1.0/(4 * np.pi) * np.moveaxis(g, -2, -1)
+
+    def magnetic_field_sensitivity(self, xyz):
+        """
+        Sensitivity of the magnetic field to the magnetization of each prism.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3, n_prism, 3) numpy.ndarray
+            Sensitivity of each field component to each prism's (x, y, z) magnetization.
+            Flattening the last two axes gives the matrix that maps
+            ``magnetization.reshape(-1)`` to the field.
+        """
+        xyz = check_xyz_dim(xyz)
+        g = self._gradient_integrals(xyz)
+        return -1.0/(4 * np.pi) * np.moveaxis(g, -2, -1)
+
+    def magnetic_field_gradient_sensitivity(self, xyz):
+        """
+        Sensitivity of the magnetic field gradient to the magnetization of each prism.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3, 3, n_prism, 3) numpy.ndarray
+            Sensitivity of each gradient component to each prism's (x, y, z)
+            magnetization. Flattening the last two axes gives the matrix that maps
+            ``magnetization.reshape(-1)`` to the gradient.
+        """
+        xyz = check_xyz_dim(xyz)
+        g = self._third_order_integrals(xyz)
+        return -1.0/(4 * np.pi) * np.moveaxis(g, -2, -1)
+
+    @property
+    def _n_sensitivity_columns(self):
+        return 3 * self.n_prism
+
+    def _sensitivity_block(self, xyz, components, out, n_threads):
+        # (n, n_comp, n_prism * 3) -> (n, n_comp, n_prism, 3) view
+        out = out.reshape(out.shape[:2] + (self.n_prism, 3))
+        gradient = third = None
+        for i, component in enumerate(components):
+            if component == "potential":
+                g = np.stack([
+                    self._eval_def_int(prism_fz, xyz, cycle=cycle, n_threads=n_threads)
+                    for cycle in (1, 2, 0)
+                ], axis=-2)
+            elif component in _FIELD_AXES:
+                if gradient is None:
+                    gradient = self._eval_derivative_def_int(2, xyz, n_threads=n_threads)
+                g = gradient[:, _SECOND_ORDER_INDEX[_FIELD_AXES[component]]]
+            else:
+                if third is None:
+                    third = self._eval_derivative_def_int(3, xyz, n_threads=n_threads)
+                g = third[:, _THIRD_ORDER_INDEX[_GRADIENT_AXES[component]]]
+            np.multiply(np.moveaxis(g, -2, -1), -1.0/(4 * np.pi), out=out[:, i])
+
+    # The integrals below are stacked with the magnetization component (k) as the
+    # second to last axis. The last axis is the prism axis if weights is None,
+    # otherwise it is the (summed) weight axis.
+
+    def _field_integrals(self, xyz, weights=None):
+        gx = self._eval_def_int(prism_fz, xyz, cycle=1, weights=weights)
+        gy = self._eval_def_int(prism_fz, xyz, cycle=2, weights=weights)
+        gz = self._eval_def_int(prism_fz, xyz, weights=weights)
+        return np.stack((gx, gy, gz), axis=-2)
+
+    def _gradient_integrals(self, xyz, weights=None):
+        g = self._eval_derivative_def_int(2, xyz, weights=weights)
+        # (xx, xy, xz, yy, yz, zz) -> symmetric (3, 3) tensor
+        return g[..., _SECOND_ORDER_INDEX, :]
+
+    def _third_order_integrals(self, xyz, weights=None):
+        g = self._eval_derivative_def_int(3, xyz, weights=weights)
+        # (xxx, xxy, xxz, xyy, xyz, xzz, yyy, yyz, yzz, zzz) -> symmetric (3, 3, 3) tensor
+        return g[..., _THIRD_ORDER_INDEX, :]
@@ -1,7 +1,7 @@
 import numpy as np
 
 from geoana.em.static import PointCurrentWholeSpace
-from geoana.utils import check_xyz_dim
+from geoana.utils import check_xyz_dim, check_out, Workspace
 
 __all__ = [
     "PointCurrentHalfSpace",
@@ -32,6 +32,7 @@ class PointCurrentHalfSpace:
         _image = PointCurrentWholeSpace(rho, current=1.0, location=None)
         self._primary = _primary
         self._image = _image
+        self._workspace = Workspace()
 
         self.current = current
         self.rho = rho
@@ -124,7 +125,7 @@ class PointCurrentHalfSpace:
         vec[-1] *= -1
         self._image.location = vec
 
-    def potential(self, xyz):
+    def potential(self, xyz, out=None):
         """Electric potential for a point current in a halfspace.
 
         This method computes the potential for the point current in a halfspace at
@@ -141,6 +142,9 @@ class PointCurrentHalfSpace:
         ----------
         xyz : (..., 3) numpy.ndarray
             Locations to evaluate at in units m.
+        out : (...) numpy.ndarray, optional
+            Array to write the result to. Repeated calls with the same shapes then
+            allocate no new arrays.
 
         Returns
         -------
@@ -183,15 +187,17 @@ class PointCurrentHalfSpace:
         """
 
         xyz = check_xyz_dim(xyz)
-        if np.any(xyz[..., -1] > 0):
+        if np.max(xyz[..., -1], initial=-np.inf) > 0:
             raise ValueError(
                 f"z value must be less than or equal to 0 in a halfspace, got {(xyz[..., -1])}"
             )
 
-        v = self._primary.potential(xyz) + self._image.potential(xyz)
+        image = None if out is None else self._workspace.empty("image", xyz.shape[:-1])
+        v = self._primary.potential(xyz, out=out)
+        v += self._image.potential(xyz, out=image)
         return v
 
-    def electric_field(self, xyz):
+    def electric_field(self, xyz, out=None):
         """Electric field for a point current in a halfspace.
 
         This method computes the electric field for the point current in a halfspace at
@@ -207,6 +213,9 @@ class PointCurrentHalfSpace:
         ----------
         xyz : (..., 3) numpy.ndarray
             Locations to evaluate at in units m.
+        out : (..., 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls with the same shapes then
+            allocate no new arrays.
 
         Returns
         -------
@@ -251,15 +260,17 @@ class PointCurrentHalfSpace:
         """
 
         xyz = check_xyz_dim(xyz)
-        if np.any(xyz[..., -1] > 0):
+        if np.max(xyz[..., -1], initial=-np.inf) > 0:
             raise ValueError(
                 f"z value must be less than or equal to 0 in a halfspace, got {(xyz[..., -1])}"
             )
 
-        e = self._primary.electric_field(xyz) + self._image.electric_field(xyz)
+        image = None if out is None else self._workspace.empty("image", xyz.shape)
+        e = self._primary.electric_field(xyz, out=out)
+        e += self._image.electric_field(xyz, out=image)
         return e
 
-    def current_density(self, xyz):
+    def current_density(self, xyz, out=None):
         """Current density for a point current in a halfspace.
 
        This method computes the current density for the point current in a halfspace at
@@ -276,6 +287,9 @@ class PointCurrentHalfSpace:
         ----------
         xyz : (..., 3) numpy.ndarray
             Locations to evaluate at in units m.
+        out : (..., 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls with the same shapes then
+            allocate no new arrays.
 
         Returns
         -------
@@ -317,7 +331,8 @@ class PointCurrentHalfSpace:
         >>> plt.show()
         """
 
-        j = self.electric_field(xyz) / self.rho
+        j = self.electric_field(xyz, out=out)
+        j /= self.rho
         return j
 
 
@@ -346,6 +361,7 @@ class DipoleHalfSpace:
         _b = PointCurrentHalfSpace(rho, current=1.0, location=location_b)
         self._a = _a
         self._b = _b
+        self._workspace = Workspace()
 
         self.current = current
         self.rho = rho
@@ -469,7 +485,29 @@ class DipoleHalfSpace:
         self._location_b = vec
         self._b.location = vec
 
-    def potential(self, xyz_m, xyz_n=None):
+    def _difference(self, func, xyz_m, xyz_n, out, component_shape):
+        # the difference of func, whose values have component_shape at each location,
+        # of the A and B electrodes at M, minus that at N. The electrodes'
+        # temporaries are only kept for reuse when the caller passes out.
+        ws = self._workspace
+
+        def scratch(name, shape):
+            return None if out is None else ws.empty(name, shape)
+
+        if xyz_n is None:
+            a_m = getattr(self._a, func)(xyz_m, out=out)
+            a_m -= getattr(self._b, func)(xyz_m, out=scratch("b_m", a_m.shape))
+            return a_m
+        shape_m = xyz_m.shape[:-1] + component_shape
+        shape_n = xyz_n.shape[:-1] + component_shape
+        shape = np.broadcast_shapes(xyz_m.shape[:-1], xyz_n.shape[:-1]) + component_shape
+        vm = getattr(self._a, func)(xyz_m, out=scratch("a_m", shape_m))
+        vm -= getattr(self._b, func)(xyz_m, out=scratch("b_m", shape_m))
+        vn = getattr(self._a, func)(xyz_n, out=scratch("a_n", shape_n))
+        vn -= getattr(self._b, func)(xyz_n, out=scratch("b_n", shape_n))
+        return np.subtract(vm, vn, out=check_out(out, shape))
+
+    def potential(self, xyz_m, xyz_n=None, out=None):
         """Electric potential for a dipole in a halfspace.
 
         This method computes the potential for a dipole in a halfspace at
@@ -483,6 +521,9 @@ class DipoleHalfSpace:
             Location of the M voltage electrode.
         xyz_n : (..., 3) numpy.ndarray, optional
             Location of the N voltage electrode.
+        out : (...) numpy.ndarray, optional
+            Array to write the result to. Repeated calls with the same shapes then
+            allocate no new arrays.
 
         Returns
         -------
@@ -535,28 +576,21 @@ class DipoleHalfSpace:
         """
 
         xyz_m = check_xyz_dim(xyz_m)
-        if np.any(xyz_m[..., -1] > 0):
+        if np.max(xyz_m[..., -1], initial=-np.inf) > 0:
             raise ValueError(
                 f"z value must be less than or equal to 0 in a halfspace, got {(xyz_m[..., -1])}"
             )
 
         if xyz_n is not None:
             xyz_n = check_xyz_dim(xyz_n)
-            if np.any(xyz_n[..., -1] > 0):
+            if np.max(xyz_n[..., -1], initial=-np.inf) > 0:
                 raise ValueError(
                     f"z value must be less than or equal to 0 in a halfspace, got {(xyz_n[..., -1])}"
                 )
 
-        vm = self._a.potential(xyz_m) - self._b.potential(xyz_m)
+        return self._difference("potential", xyz_m, xyz_n, out, ())
 
-        if xyz_n is not None:
-            vn = self._a.potential(xyz_n) - self._b.potential(xyz_n)
-            v = vm - vn
-            return v
-        else:
-            return vm
-
-    def electric_field(self, xyz_m, xyz_n=None):
+    def electric_field(self, xyz_m, xyz_n=None, out=None):
         """Electric field for a dipole source in a halfspace.
 
         This method computes the electric field for a dipole source in a halfspace at
@@ -574,6 +608,9 @@ class DipoleHalfSpace:
             Location of the M voltage electrode.
         xyz_n : (..., 3) numpy.ndarray, optional
             Location of the N voltage electrode.
+        out : (..., 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls with the same shapes then
+            allocate no new arrays.
 
         Returns
         -------
@@ -641,28 +678,21 @@ class DipoleHalfSpace:
         """
 
         xyz_m = check_xyz_dim(xyz_m)
-        if np.any(xyz_m[..., -1] > 0):
+        if np.max(xyz_m[..., -1], initial=-np.inf) > 0:
             raise ValueError(
                 f"z value must be less than or equal to 0 in a halfspace, got {(xyz_m[..., -1])}"
             )
 
         if xyz_n is not None:
             xyz_n = check_xyz_dim(xyz_n)
-            if np.any(xyz_n[..., -1] > 0):
+            if np.max(xyz_n[..., -1], initial=-np.inf) > 0:
                 raise ValueError(
                     f"z value must be less than or equal to 0 in a halfspace, got {(xyz_n[..., -1])}"
                 )
 
-        em = self._a.electric_field(xyz_m) - self._b.electric_field(xyz_m)
-
-        if xyz_n is not None:
-            en = self._a.electric_field(xyz_n) - self._b.electric_field(xyz_n)
-            e = em - en
-            return e
-        else:
-            return em
+        return self._difference("electric_field", xyz_m, xyz_n, out, (3, ))
 
-    def current_density(self, xyz_m, xyz_n=None):
+    def current_density(self, xyz_m, xyz_n=None, out=None):
         """Current density for a dipole source in a halfspace.
 
        This method computes the current density for a dipole source in a halfspace at
@@ -681,6 +711,9 @@ class DipoleHalfSpace:
             Location of the M voltage electrode.
         xyz_n : (..., 3) numpy.ndarray, optional
             Location of the N voltage electrode.
+        out : (..., 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls with the same shapes then
+            allocate no new arrays.
 
         Returns
         -------
@@ -745,6 +778,7 @@ class DipoleHalfSpace:
         >>> plt.show()
         """
 
-        j = self.electric_field(xyz_m, xyz_n=xyz_n) / self.rho
+        j = self.electric_field(xyz_m, xyz_n=xyz_n, out=out)
+        j /= self.rho
         return j
 
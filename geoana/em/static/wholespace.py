@@ -3,7 +3,7 @@ from scipy.special import ellipk, ellipe
 
 from ..base import BaseDipole, BaseMagneticDipole, BaseEM
 from ... import spatial
-from geoana.utils import check_xyz_dim
+from geoana.utils import check_xyz_dim, check_out, Workspace
 
 __all__ = [
     "MagneticDipoleWholeSpace", "CircularLoopWholeSpace",
@@ -11,6 +11,34 @@ __all__ = [
 ]
 
 
+def _scratch_workspace(workspace, out):
+    # Temporaries are kept in the instance's workspace for reuse only when the caller
+    # passes out; otherwise they are drawn from a new workspace freed after the call.
+    if out is None:
+        return Workspace()
+    return workspace
+
+
+def _distance(dxyz, out, work):
+    # the norm of the (..., 3) vectors dxyz, written into out, with the same operations
+    # as numpy.linalg.norm, using the scratch array work of dxyz's shape
+    np.multiply(dxyz, dxyz, out=work)
+    np.add.reduce(work, axis=-1, out=out)
+    return np.sqrt(out, out=out)
+
+
+def _cylindrical_result(func, xyz, out):
+    # evaluates the Cartesian func at the cylindrical locations xyz, returning its
+    # result in cylindrical coordinates, in out if given
+    xyz = spatial.cylindrical_2_cartesian(xyz)
+    result = spatial.cartesian_2_cylindrical(xyz, func(xyz))
+    if out is None:
+        return result
+    out = check_out(out, result.shape)
+    out[...] = result
+    return out
+
+
 class MagneticDipoleWholeSpace(BaseEM, BaseMagneticDipole):
     """Class for a static magnetic dipole in a wholespace.
 
@@ -119,7 +147,7 @@ class MagneticDipoleWholeSpace(BaseEM, BaseMagneticDipole):
 
         return a
 
-    def magnetic_flux_density(self, xyz, coordinates="cartesian"):
+    def magnetic_flux_density(self, xyz, coordinates="cartesian", out=None):
         r"""Compute magnetic flux density produced by the static magnetic dipole.
 
         This method computes the magnetic flux density produced by the static magnetic
@@ -149,6 +177,9 @@ class MagneticDipoleWholeSpace(BaseEM, BaseMagneticDipole):
             coordinate system that the location (xyz) are provided.
             The solution is also returned in this coordinate system.
             Default: `"cartesian"`
+        out : (n, 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls in Cartesian coordinates
+            with the same shapes then allocate no new arrays.
 
         Returns
         -------
@@ -203,25 +234,28 @@ class MagneticDipoleWholeSpace(BaseEM, BaseMagneticDipole):
         xyz = check_xyz_dim(xyz)
 
         if coordinates.lower() == "cylindrical":
-            xyz = spatial.cylindrical_2_cartesian(xyz)
+            return _cylindrical_result(self.magnetic_flux_density, xyz, out)
 
-        r_vec = xyz - self.location
-        r = np.linalg.norm(r_vec, axis=-1)[..., None]
+        ws = _scratch_workspace(self._workspace, out)
+        out = check_out(out, xyz.shape)
+        work = ws.empty("work", xyz.shape)
+        r_vec = np.subtract(xyz, self.location, out=ws.empty("r_vec", xyz.shape))
+        r = _distance(r_vec, out=ws.empty("r", xyz.shape[:-1]), work=work)
         m_vec = self.moment * self.orientation
 
-        m_dot_r = np.einsum('...i,i->...', r_vec, m_vec)[..., None]
-
-        b = (self.mu / (4 * np.pi)) * (
-            (3.0 * r_vec * m_dot_r / (r ** 5)) -
-            m_vec / (r ** 3)
+        m_dot_r = np.einsum(
+            '...i,i->...', r_vec, m_vec, out=ws.empty("m_dot_r", xyz.shape[:-1])
         )
 
-        if coordinates.lower() == "cylindrical":
-            b = spatial.cartesian_2_cylindrical(xyz, b)
+        # 3 r (m . r) / r**5 - m / r**3
+        np.multiply(3.0, r_vec, out=out)
+        out *= m_dot_r[..., None]
+        out /= np.power(r, 5, out=m_dot_r)[..., None]
+        out -= np.divide(m_vec, np.power(r, 3, out=r)[..., None], out=work)
+        out *= self.mu / (4 * np.pi)
+        return out
 
-        return b
-
-    def magnetic_field(self, xyz, coordinates="cartesian"):
+    def magnetic_field(self, xyz, coordinates="cartesian", out=None):
         r"""Compute the magnetic field produced by a static magnetic dipole.
 
         This method computes the magnetic field produced by the static magnetic dipole at
@@ -250,6 +284,9 @@ class MagneticDipoleWholeSpace(BaseEM, BaseMagneticDipole):
             coordinate system that the location (xyz) are provided.
             The solution is also returned in this coordinate system.
             Default: `"cartesian"`
+        out : (n, 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls in Cartesian coordinates
+            with the same shapes then allocate no new arrays.
 
         Returns
         -------
@@ -293,7 +330,9 @@ class MagneticDipoleWholeSpace(BaseEM, BaseMagneticDipole):
         >>> ax.set_title('Magnetic field at y=0')
 
         """
-        return self.magnetic_flux_density(xyz, coordinates=coordinates) / self.mu
+        out = self.magnetic_flux_density(xyz, coordinates=coordinates, out=out)
+        out /= self.mu
+        return out
 
 
 class MagneticPoleWholeSpace(BaseEM, BaseMagneticDipole):
@@ -303,7 +342,7 @@ class MagneticPoleWholeSpace(BaseEM, BaseMagneticDipole):
     fields and potentials within a wholespace due to a static magnetic pole.
     """
 
-    def magnetic_flux_density(self, xyz, coordinates="cartesian"):
+    def magnetic_flux_density(self, xyz, coordinates="cartesian", out=None):
         r"""Compute the magnetic flux density produced by the static magnetic pole.
 
         This method computes the magnetic flux density produced by the static magnetic pole
@@ -331,6 +370,9 @@ class MagneticPoleWholeSpace(BaseEM, BaseMagneticDipole):
             coordinate system that the location (xyz) are provided.
             The solution is also returned in this coordinate system.
             Default: `"cartesian"`
+        out : (n, 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls in Cartesian coordinates
+            with the same shapes then allocate no new arrays.
 
         Returns
         -------
@@ -350,19 +392,19 @@ class MagneticPoleWholeSpace(BaseEM, BaseMagneticDipole):
         xyz = check_xyz_dim(xyz)
 
         if coordinates.lower() == "cylindrical":
-            xyz = spatial.cylindrical_2_cartesian(xyz)
-
-        r = self.vector_distance(xyz)
-        dxyz = spatial.repeat_scalar(self.distance(xyz))
-
-        b = self.moment * self.mu / (4 * np.pi * (dxyz ** 3)) * r
+            return _cylindrical_result(self.magnetic_flux_density, xyz, out)
 
-        if coordinates.lower() == "cylindrical":
-            b = spatial.cartesian_2_cylindrical(xyz, b)
+        ws = _scratch_workspace(self._workspace, out)
+        out = check_out(out, xyz.shape)
+        r = np.subtract(xyz, self.location, out=ws.empty("r_vec", xyz.shape))
+        dxyz = _distance(r, out=ws.empty("r", xyz.shape[:-1]), work=out)
 
-        return b
+        np.power(dxyz, 3, out=dxyz)
+        dxyz *= 4 * np.pi
+        np.divide(self.moment * self.mu, dxyz, out=dxyz)
+        return np.multiply(dxyz[..., None], r, out=out)
 
-    def magnetic_field(self, xyz, coordinates="cartesian"):
+    def magnetic_field(self, xyz, coordinates="cartesian", out=None):
         r"""Compute the magnetic field produced by the static magnetic pole.
 
         This method computes the magnetic field produced by the static magnetic pole at
@@ -390,6 +432,9 @@ class MagneticPoleWholeSpace(BaseEM, BaseMagneticDipole):
             coordinate system that the location (xyz) are provided.
             The solution is also returned in this coordinate system.
             Default: `"cartesian"`
+        out : (n, 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls in Cartesian coordinates
+            with the same shapes then allocate no new arrays.
 
         Returns
         -------
@@ -398,7 +443,9 @@ class MagneticPoleWholeSpace(BaseEM, BaseMagneticDipole):
             coordinate system specified in units A/m.
 
         """
-        return self.magnetic_flux_density(xyz, coordinates=coordinates) / self.mu
+        out = self.magnetic_flux_density(xyz, coordinates=coordinates, out=out)
+        out /= self.mu
+        return out
 
 
 class CircularLoopWholeSpace(BaseEM, BaseDipole):
@@ -617,7 +664,7 @@ class CircularLoopWholeSpace(BaseEM, BaseDipole):
 
         return A
 
-    def magnetic_flux_density(self, xyz, coordinates="cartesian"):
+    def magnetic_flux_density(self, xyz, coordinates="cartesian", out=None):
         r"""Compute the magnetic flux density for the current loop in a wholespace.
 
         This method computes the magnetic flux density for the cirular current loop
@@ -639,6 +686,9 @@ class CircularLoopWholeSpace(BaseEM, BaseDipole):
             coordinate system that the location (xyz) are provided.
             The solution is also returned in this coordinate system.
             Default: `"cartesian"`
+        out : (n, 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls in Cartesian coordinates
+            with the same shapes then allocate no new arrays.
 
         Returns
         -------
@@ -691,59 +741,98 @@ class CircularLoopWholeSpace(BaseEM, BaseDipole):
                 f"system you provided, {coordinates}, is not yet supported."
             )
 
-        xyz = spatial.rotate_points_from_normals(
-            xyz, np.array(self.orientation),  # work around for a properties issue
-            np.r_[0., 0., 1.], x0=np.array(self.location)
-        )
         # rotate all the points such that the orientation is directly vertical
-
-        dxyz = self.vector_distance(xyz)
-        r = self.distance(xyz)
-
-        rho = np.linalg.norm(dxyz[:, :2], axis=-1)
-
-        B = np.zeros((len(rho), 3))
+        ws = _scratch_workspace(self._workspace, out)
+        shape = xyz.shape[:-1]
+        R = spatial.rotation_matrix_from_normals(
+            np.array(self.orientation), np.r_[0., 0., 1.]
+        )
+        dxyz = np.subtract(xyz, self.location, out=ws.empty("dxyz", xyz.shape))
+        dxyz = np.matmul(dxyz, R.T, out=ws.empty("dxyz_rotated", xyz.shape))
+        work = ws.empty("work", shape + (2, ))
+        np.multiply(dxyz[..., :2], dxyz[..., :2], out=work)
+        rho = np.add.reduce(work, axis=-1, out=ws.empty("rho", shape))
+        np.sqrt(rho, out=rho)
 
         # for On axis points
-        inds_axial = rho==0.0
-
-        B[inds_axial, -1] = self.mu * self.current * self.radius**2 / (
-            2 * (self.radius**2 + dxyz[inds_axial, 2]**2)**(1.5)
+        on_axis = np.equal(rho, 0.0, out=ws.empty("on_axis", shape, dtype=bool))
+        off_axis = np.logical_not(on_axis, out=ws.empty("off_axis", shape, dtype=bool))
+
+        B = ws.empty("B", xyz.shape)
+        tmp = ws.empty("tmp", shape)
+        np.square(dxyz[..., 2], out=tmp)
+        np.add(self.radius**2, tmp, out=tmp)
+        np.power(tmp, 1.5, out=tmp)
+        np.multiply(2, tmp, out=tmp)
+        np.divide(
+            self.mu * self.current * self.radius**2, tmp, out=B[..., 2], where=on_axis
         )
 
         # Off axis
-        alpha = rho[~inds_axial]/self.radius
-        beta = dxyz[~inds_axial, 2]/self.radius
-        gamma = dxyz[~inds_axial, 2]/rho[~inds_axial]
-
-        Q = ((1+alpha)**2 + beta**2)
-        k2 =  4 * alpha/Q
+        alpha = np.divide(rho, self.radius, out=ws.empty("alpha", shape))
+        beta = np.divide(dxyz[..., 2], self.radius, out=ws.empty("beta", shape))
+        gamma = np.divide(dxyz[..., 2], rho, out=ws.empty("gamma", shape), where=off_axis)
+
+        Q = np.add(1, alpha, out=ws.empty("Q", shape))
+        np.square(Q, out=Q)
+        Q += np.square(beta, out=tmp)
+        k2 = np.multiply(4, alpha, out=ws.empty("k2", shape))
+        k2 /= Q
+        E = ellipe(k2, out=ws.empty("E", shape))
+        K = ellipk(k2, out=k2)
+
+        # Q - 4 alpha
+        Q_4alpha = np.multiply(4, alpha, out=ws.empty("Q_4alpha", shape))
+        np.subtract(Q, Q_4alpha, out=Q_4alpha)
+
+        # 2 a pi sqrt(Q)
+        denom = np.sqrt(Q, out=Q)
+        np.multiply(2 * self.radius * np.pi, denom, out=denom)
+
+        np.square(alpha, out=alpha)
+        np.square(beta, out=beta)
+        paren = ws.empty("paren", shape)
 
         # axial part:
-        B[~inds_axial, -1] = self.mu * self.current / (2 * self.radius * np.pi * np.sqrt(Q)) * (
-            ellipe(k2)*(1 - alpha**2 - beta**2)/(Q  - 4 * alpha) + ellipk(k2)
-        )
+        np.subtract(1, alpha, out=paren)
+        paren -= beta
+        np.multiply(E, paren, out=paren)
+        paren /= Q_4alpha
+        paren += K
+        np.divide(self.mu * self.current, denom, out=tmp)
+        np.multiply(tmp, paren, out=B[..., 2], where=off_axis)
 
         # radial part:
-        B_rad = self.mu * self.current * gamma / (2 * self.radius * np.pi * np.sqrt(Q)) * (
-            ellipe(k2)*(1 + alpha**2 + beta**2)/(Q  - 4 * alpha) - ellipk(k2)
-        )
+        np.add(1, alpha, out=paren)
+        paren += beta
+        np.multiply(E, paren, out=paren)
+        paren /= Q_4alpha
+        paren -= K
+        np.multiply(self.mu * self.current, gamma, out=tmp)
+        tmp /= denom
+        tmp *= paren
 
         # convert radial component to x and y..
-        B[~inds_axial, 0] = B_rad * (dxyz[~inds_axial, 0]/rho[~inds_axial])
-        B[~inds_axial, 1] = B_rad * (dxyz[~inds_axial, 1]/rho[~inds_axial])
+        for i in range(2):
+            np.divide(dxyz[..., i], rho, out=paren, where=off_axis)
+            np.multiply(tmp, paren, out=B[..., i], where=off_axis)
+            np.copyto(B[..., i], 0.0, where=on_axis)
 
         # rotate the vectors to be aligned with the normal to the source
-        B = spatial.rotate_points_from_normals(
-           B, np.r_[0., 0., 1.], np.array(self.orientation),
+        R = spatial.rotation_matrix_from_normals(
+            np.r_[0., 0., 1.], np.array(self.orientation)
         )
-
         if coordinates.lower() == "cylindrical":
-            B = spatial.cartesian_2_cylindrical(xyz, B)
-
-        return B
-
-    def magnetic_field(self, xyz, coordinates="cartesian"):
+            B = spatial.cartesian_2_cylindrical(dxyz + self.location, B @ R.T)
+            if out is None:
+                return B
+            out = check_out(out, B.shape)
+            out[...] = B
+            return out
+        out = check_out(out, xyz.shape)
+        return np.matmul(B, R.T, out=out)
+
+    def magnetic_field(self, xyz, coordinates="cartesian", out=None):
         r"""Compute the magnetic field for the current loop in a wholespace.
 
         This method computes the magnetic field for the cirular current loop
@@ -765,6 +854,9 @@ class CircularLoopWholeSpace(BaseEM, BaseDipole):
             coordinate system that the location (xyz) are provided.
             The solution is also returned in this coordinate system.
             Default: `"cartesian"`
+        out : (n, 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls in Cartesian coordinates
+            with the same shapes then allocate no new arrays.
 
         Returns
         -------
@@ -807,7 +899,9 @@ class CircularLoopWholeSpace(BaseEM, BaseDipole):
         >>> ax.set_title('Magnetic field at y=0')
 
         """
-        return self.magnetic_flux_density(xyz, coordinates=coordinates) / self.mu
+        out = self.magnetic_flux_density(xyz, coordinates=coordinates, out=out)
+        out /= self.mu
+        return out
 
 
 class PointCurrentWholeSpace:
@@ -833,6 +927,7 @@ class PointCurrentWholeSpace:
         if location is None:
             location = np.r_[0, 0, 0]
         self.location = location
+        self._workspace = Workspace()
 
     @property
     def current(self):
@@ -905,7 +1000,7 @@ class PointCurrentWholeSpace:
 
         self._location = vec
 
-    def potential(self, xyz):
+    def potential(self, xyz, out=None):
         """Electric potential for a point current in a wholespace.
 
         This method computes the potential for the point current in a wholespace at
@@ -922,6 +1017,9 @@ class PointCurrentWholeSpace:
         ----------
         xyz : (..., 3) numpy.ndarray
             Locations to evaluate at in units m.
+        out : (...) numpy.ndarray, optional
+            Array to write the result to. Repeated calls with the same shapes then
+            allocate no new arrays.
 
         Returns
         -------
@@ -964,13 +1062,15 @@ class PointCurrentWholeSpace:
         """
 
         xyz = check_xyz_dim(xyz)
-        r_vec = xyz - self.location
-        r = np.linalg.norm(r_vec, axis=-1)
+        ws = _scratch_workspace(self._workspace, out)
+        out = check_out(out, xyz.shape[:-1])
+        r_vec = np.subtract(xyz, self.location, out=ws.empty("r_vec", xyz.shape))
+        r = _distance(r_vec, out=out, work=ws.empty("work", xyz.shape))
 
-        v = self.rho * self.current / (4 * np.pi * r)
-        return v
+        r *= 4 * np.pi
+        return np.divide(self.rho * self.current, r, out=out)
 
-    def electric_field(self, xyz):
+    def electric_field(self, xyz, out=None):
         """Electric field for a point current in a wholespace.
 
         This method computes the electric field for the point current in a wholespace at
@@ -986,6 +1086,9 @@ class PointCurrentWholeSpace:
         ----------
         xyz : (..., 3) numpy.ndarray
             Locations to evaluate at in units m.
+        out : (..., 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls with the same shapes then
+            allocate no new arrays.
 
         Returns
         -------
@@ -1030,13 +1133,18 @@ class PointCurrentWholeSpace:
         """
 
         xyz = check_xyz_dim(xyz)
-        r_vec = xyz - self.location
-        r = np.linalg.norm(r_vec, axis=-1)
-
-        e = self.rho * self.current * r_vec / (4 * np.pi * r[..., None] ** 3)
-        return e
-
-    def current_density(self, xyz):
+        ws = _scratch_workspace(self._workspace, out)
+        out = check_out(out, xyz.shape)
+        r_vec = np.subtract(xyz, self.location, out=ws.empty("r_vec", xyz.shape))
+        r = _distance(r_vec, out=ws.empty("r", xyz.shape[:-1]), work=out)
+
+        np.power(r, 3, out=r)
+        r *= 4 * np.pi
+        np.multiply(self.rho * self.current, r_vec, out=out)
+        out /= r[..., None]
+        return out
+
+    def current_density(self, xyz, out=None):
         """Current density for a point current in a wholespace.
 
         This method computes the curent density for the point current in a wholespace at
@@ -1053,6 +1161,9 @@ class PointCurrentWholeSpace:
         ----------
         xyz : (..., 3) numpy.ndarray
             Locations to evaluate at in units m.
+        out : (..., 3) numpy.ndarray, optional
+            Array to write the result to. Repeated calls with the same shapes then
+            allocate no new arrays.
 
         Returns
         -------
@@ -1094,5 +1205,6 @@ class PointCurrentWholeSpace:
         >>> plt.show()
         """
 
-        j = self.electric_field(xyz) / self.rho
+        j = self.electric_field(xyz, out=out)
+        j /= self.rho
         return j
@@ -15,6 +15,7 @@ Simulation Classes
   BaseTDEM
   ElectricDipoleWholeSpace
   VerticalMagneticDipoleHalfSpace
+  MagneticDipoleLayeredHalfSpace
   TransientPlaneWave
 
 Utility Functions
@@ -42,6 +43,8 @@ from geoana.em.tdem.wholespace import ElectricDipoleWholeSpace, TransientPlaneWa
 
 from geoana.em.tdem.halfspace import VerticalMagneticDipoleHalfSpace
 
+from geoana.em.tdem.layered import MagneticDipoleLayeredHalfSpace
+
 from geoana.em.tdem.simple_functions import (
     vertical_magnetic_field_horizontal_loop,
     vertical_magnetic_flux_horizontal_loop,
@@ -0,0 +1,491 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.constants import mu_0
+from scipy.interpolate import CubicSpline
+import libdlf
+
+from geoana.em.base import BaseMagneticDipole
+from geoana.em.tdem.base import BaseTDEM
+from geoana.em.fdem.layered import (
+    MagneticDipoleLayeredHalfSpace as _FDEMMagneticDipoleLayeredHalfSpace
+)
+
+
+@lru_cache(maxsize=None)
+def _get_fourier_filter(name):
+    """Load (and remember) a digital linear filter for the sine and cosine transforms.
+
+    Parameters
+    ----------
+    name : str
+        Name of a Fourier filter in ``libdlf.fourier``.
+
+    Returns
+    -------
+    base, sin, cos : numpy.ndarray
+        Read-only filter base and its sine and cosine weights.
+    """
+    base, f_sin, f_cos = (np.array(arr, dtype=float) for arr in getattr(libdlf.fourier, name)())
+    for arr in (base, f_sin, f_cos):
+        arr.flags.writeable = False
+    return base, f_sin, f_cos
+
+
+class MagneticDipoleLayeredHalfSpace(BaseTDEM, BaseMagneticDipole):
+    r"""Simulation class for a transient magnetic dipole over a layered halfspace.
+
+    This class is used to simulate the off-time fields produced by a magnetic dipole
+    source over a layered halfspace, for a step-off or an arbitrary piecewise linear
+    current waveform. The frequency-domain response of
+    :class:`geoana.em.fdem.MagneticDipoleLayeredHalfSpace` is transformed to the time
+    domain with digital linear sine and cosine filters.
+
+    Parameters
+    ----------
+    time : float or (n_time) numpy.ndarray
+        Off-time channels (s), measured from the end of the current waveform. All
+        times must be greater than 0.
+    thickness : None or (n_layer-1) numpy.ndarray
+        Layer thicknesses (m) from the top layer downwards. If ``None`` is entered, you are
+        defining a homogeneous halfspace. The bottom layer extends to infinity, thus
+        n_layer = n_thickness + 1.
+    sigma : float or (n_layer) numpy.ndarray
+        Electrical conductivities (S/m) for all layers.
+    mu : float or (n_layer) numpy.ndarray
+        Magnetic permeability (H/m) for all layers.
+    waveform : None or (n_node, 2) numpy.ndarray
+        Piecewise linear current waveform given as (time, current) nodes, with
+        increasing times that are less than or equal to 0. The current is held at its
+        first value before the first node, and is switched off instantly after the last
+        one (so waveforms that ramp off should end with 0 current). The default of
+        ``None`` is a step-off waveform.
+    fourier_filter : str, optional
+        Name of the ``libdlf.fourier`` digital linear filter used for the frequency
+        to time transforms. Default is ``"key_201_2012"``.
+    hankel_filter : str, optional
+        Name of the ``libdlf.hankel`` digital linear filter used for the frequency
+        domain responses. Default is ``"key_101_2009"``.
+
+    Notes
+    -----
+    For a step-off source, the magnetic field and its time derivative are obtained
+    from the frequency domain secondary field :math:`H(\omega)` with:
+
+    .. math::
+        h(t) = -\frac{2}{\pi}\int_0^\infty \frac{\textrm{Im}[H(\omega)]}{\omega}
+        \cos(\omega t) \, d\omega
+
+    .. math::
+        \frac{\partial h}{\partial t} = \frac{2}{\pi}\int_0^\infty
+        \textrm{Im}[H(\omega)] \sin(\omega t) \, d\omega
+
+    As the filter's abscissae are logarithmically spaced, the transforms are evaluated
+    with a lagged convolution at times spaced like the filter, covering all of the time
+    channels (and the delays to the waveform's nodes), and are interpolated onto the
+    required times with a cubic spline in :math:`\log t`. The frequency domain response is
+    therefore only evaluated at :math:`n_{filter} + n_{lag} - 1` frequencies, where
+    :math:`n_{lag}` is the number of filter spacings spanned by the times, instead of
+    :math:`n_{filter}` frequencies for every time channel. The Fourier filter is loaded
+    once, and the frequency domain simulation (with its cached Hankel filter and layer
+    properties) is reused until the layered model changes.
+
+    A piecewise linear waveform :math:`I(t)` is then convolved with the step-off
+    response :math:`h_{off}(t)`:
+
+    .. math::
+        h(t) = -\int I'(\tau) h_{off}(t - \tau) \, d\tau
+
+    which is integrated exactly over the cubic spline on each linear segment.
+    """
+
+    def __init__(
+        self, time, thickness, waveform=None, fourier_filter="key_201_2012",
+        hankel_filter="key_101_2009", **kwargs
+    ):
+
+        self.thickness = thickness
+        self.waveform = waveform
+        self.fourier_filter = fourier_filter
+        self.hankel_filter = hankel_filter
+        super().__init__(time=time, **kwargs)
+        self._check_is_valid_location()
+
+    def _check_is_valid_location(self):
+        if self.location[2] < 0.0:
+            raise ValueError("Source must be above the surface of the earth (i.e. z >= 0.0)")
+
+    @property
+    def time(self):
+        """Off-time channels (s) used for all computations
+
+        Returns
+        -------
+        numpy.ndarray
+            Times (s), measured from the end of the waveform, used for all computations
+        """
+        return self._time
+
+    @time.setter
+    def time(self, value):
+
+        BaseTDEM.time.fset(self, value)
+        if (self._time <= 0.0).any():
+            raise ValueError("All times must be greater than 0")
+
+    @property
+    def thickness(self):
+        """Thicknesses (m) for all layers from top to bottom
+
+        Returns
+        -------
+        numpy.ndarray
+            Thicknesses (m) for all layers from top to bottom
+        """
+        return self._thickness
+
+    @thickness.setter
+    def thickness(self, value):
+
+        # Ensure float or numpy array of float
+        try:
+            if value is None:
+                value = np.array([])
+            else:
+                value = np.atleast_1d(value).astype(float)
+        except:
+            raise TypeError(f"thickness are not a valid type")
+
+        # Enforce positivity and dimensions
+        if len(value) > 0 and np.any(value < 0):
+            raise ValueError("Thicknesses must be greater than 0")
+        if value.ndim > 1:
+            raise TypeError(f"Thicknesses must be ('*') array")
+
+        self._thickness = value
+        self._fdem = None
+
+    @property
+    def sigma(self):
+        """Electrical conductivity for all layers
+
+        Returns
+        -------
+        (n_layer) numpy.ndarray
+            Electrical conductivity (S/m) for all layers
+        """
+        return self._sigma
+
+    @sigma.setter
+    def sigma(self, value):
+
+        n_layer = len(self.thickness) + 1
+        try:
+            value = np.asarray(value, dtype=float)
+        except:
+            raise TypeError(f"sigma array is not a valid type")
+        if value.ndim == 0:
+            value = np.full(n_layer, value)
+
+        if value.shape != (n_layer, ):
+            raise TypeError(f"sigma must be a float or (n_layer) np.ndarray")
+        if (value <= 0.0).any():
+            raise ValueError("sigma must be greater than 0")
+
+        self._sigma = value
+        self._fdem = None
+
+    @property
+    def mu(self):
+        """Magnetic permeability for all layers
+
+        Returns
+        -------
+        (n_layer) numpy.ndarray
+            Magnetic permeability (H/m) for all layers
+        """
+        return self._mu
+
+    @mu.setter
+    def mu(self, value):
+
+        n_layer = len(self.thickness) + 1
+        try:
+            value = np.asarray(value, dtype=float)
+        except:
+            raise TypeError(f"mu array is not a valid type")
+        if value.ndim == 0:
+            value = np.full(n_layer, value)
+
+        if value.shape != (n_layer, ):
+            raise TypeError(f"mu must be a float or (n_layer) np.ndarray")
+        if (value < mu_0).any():
+            raise ValueError("mu must be >= mu_0")
+
+        self._mu = value
+        self._fdem = None
+
+    @property
+    def waveform(self):
+        """Piecewise linear current waveform
+
+        Returns
+        -------
+        None or (n_node, 2) numpy.ndarray
+            (time, current) nodes of the waveform, or ``None`` for a step-off.
+        """
+        return self._waveform
+
+    @waveform.setter
+    def waveform(self, value):
+
+        if value is not None:
+            try:
+                value = np.atleast_2d(np.asarray(value, dtype=float))
+            except:
+                raise TypeError(f"waveform must be an (n_node, 2) array_like")
+            if value.ndim != 2 or value.shape[1] != 2:
+                raise ValueError(
+                    f"waveform must be an (n_node, 2) array_like, got {value.shape}"
+                )
+            if (np.diff(value[:, 0]) < 0.0).any():
+                raise ValueError("waveform times must be increasing")
+            if value[-1, 0] > 0.0:
+                raise ValueError("waveform times must be less than or equal to 0")
+        self._waveform = value
+
+    @property
+    def fourier_filter(self):
+        """Name of the digital linear filter used for the frequency to time transforms
+
+        Returns
+        -------
+        str
+            Name of a Fourier filter in ``libdlf.fourier``
+        """
+        return self._fourier_filter
+
+    @fourier_filter.setter
+    def fourier_filter(self, value):
+
+        if not isinstance(value, str):
+            raise TypeError(f"fourier_filter must be a str, got {type(value)}")
+        if not callable(getattr(libdlf.fourier, value, None)) or value.startswith("_"):
+            raise ValueError(f"{value} is not a Fourier filter available in libdlf")
+
+        self._fourier_filter = value
+
+    @property
+    def hankel_filter(self):
+        """Name of the digital linear filter used for the Hankel transforms
+
+        Returns
+        -------
+        str
+            Name of a Hankel filter in ``libdlf.hankel``
+        """
+        return self._hankel_filter
+
+    @hankel_filter.setter
+    def hankel_filter(self, value):
+
+        if not isinstance(value, str):
+            raise TypeError(f"hankel_filter must be a str, got {type(value)}")
+        if not callable(getattr(libdlf.hankel, value, None)) or value.startswith("_"):
+            raise ValueError(f"{value} is not a Hankel filter available in libdlf")
+
+        self._hankel_filter = value
+        self._fdem = None
+
+    def _get_fdem_simulation(self, frequency):
+        """Frequency domain simulation of the same source and layered earth."""
+        sim = self._fdem
+        if sim is None:
+            sim = _FDEMMagneticDipoleLayeredHalfSpace(
+                frequency, self.thickness, sigma=self.sigma, mu=self.mu,
+                hankel_filter=self.hankel_filter, quasistatic=True,
+            )
+            self._fdem = sim
+        elif not np.array_equal(sim.frequency, frequency):
+            sim.frequency = frequency
+        sim.location = self.location
+        sim.orientation = self.orientation
+        sim.moment = self.moment
+        return sim
+
+    def _step_off_response(self, xyz, t_min, t_max):
+        """Step-off response and its time derivative at lagged times.
+
+        Parameters
+        ----------
+        xyz : (n_loc, 3) numpy.ndarray
+            Receiver locations.
+        t_min, t_max : float
+            Range of times the response is needed over.
+
+        Returns
+        -------
+        log_t : (n_lag) numpy.ndarray
+            Natural log of the lagged times.
+        h, dh_dt : (n_loc, 3, n_lag) numpy.ndarray
+            Step-off magnetic field and its time derivative at the lagged times.
+        """
+        base, f_sin, f_cos = _get_fourier_filter(self.fourier_filter)
+        n_filter = len(base)
+        d_log = np.log(base[1]/base[0])
+
+        n_lag = max(int(np.ceil(np.log(t_max/t_min)/d_log)) + 1, 4)
+        t_lag = t_min*np.exp(d_log*np.arange(n_lag))
+        # the frequencies needed by every lagged time
+        omega = base[0]/t_min*np.exp(d_log*np.arange(-(n_lag - 1), n_filter))
+
+        sim = self._get_fdem_simulation(omega/(2*np.pi))
+        h_freq = sim.magnetic_field(xyz, field="secondary")
+        h_freq = np.imag(h_freq).reshape((len(omega), len(xyz), 3))
+        h_freq = np.moveaxis(h_freq, 0, -1)
+
+        # window k holds the frequencies for the k-th largest lagged time
+        windows = np.lib.stride_tricks.sliding_window_view(h_freq/omega, n_filter, axis=-1)
+        h = -2/np.pi*(windows[..., ::-1, :]@f_cos)/t_lag
+        windows = np.lib.stride_tricks.sliding_window_view(h_freq, n_filter, axis=-1)
+        dh_dt = 2/np.pi*(windows[..., ::-1, :]@f_sin)/t_lag
+        return np.log(t_lag), h, dh_dt
+
+    def _time_response(self, xyz, derivative=False):
+        xyz = np.atleast_2d(xyz)
+        if (xyz[:, 2] < 0.0).any():
+            raise ValueError("Cannot compute fields below the surface")
+
+        times = self.time
+        waveform = self.waveform
+        if waveform is None:
+            waveform = np.array([[0.0, 1.0]])
+        # switch the current off after the last node
+        waveform = np.r_[waveform, [[waveform[-1, 0], 0.0]]]
+        tau, current = waveform.T
+
+        log_t, h, dh_dt = self._step_off_response(
+            xyz, times.min() - tau[-1], times.max() - tau[0]
+        )
+        h_off = CubicSpline(log_t, h, axis=-1)
+        dh_off = CubicSpline(log_t, dh_dt, axis=-1)
+        if not derivative:
+            # antiderivative of h_off(t) dt in terms of log(t)
+            int_h_off = CubicSpline(log_t, h*np.exp(log_t), axis=-1).antiderivative()
+
+        out = 0.0
+        for i in range(len(tau) - 1):
+            d_current = current[i+1] - current[i]
+            if d_current == 0.0:
+                continue
+            log_ta = np.log(times - tau[i])
+            log_tb = np.log(times - tau[i+1])
+            if tau[i+1] == tau[i]:
+                # instantaneous change of the current
+                if derivative:
+                    out = out - d_current*dh_off(log_tb)
+                else:
+                    out = out - d_current*h_off(log_tb)
+            else:
+                slope = d_current/(tau[i+1] - tau[i])
+                if derivative:
+                    out = out - slope*(h_off(log_ta) - h_off(log_tb))
+                else:
+                    out = out - slope*(int_h_off(log_ta) - int_h_off(log_tb))
+        out = out*np.ones((len(xyz), 3, len(times)))
+        return np.moveaxis(out, -1, 0).squeeze()
+
+    def magnetic_field(self, xyz):
+        """Off-time magnetic field produced by the magnetic dipole over a layered halfspace.
+
+        Parameters
+        ----------
+        xyz : (n_loc, 3) numpy.ndarray
+            Receiver locations. The z component cannot be below the surface (z >= 0.0).
+
+        Returns
+        -------
+        (n_time, n_loc, 3) numpy.ndarray
+            Magnetic field at all times for the locations provided. Output array is
+            squeezed when n_time and/or n_loc = 1.
+
+        Examples
+        --------
+        Here, we define a z-oriented magnetic dipole at the surface of a three layered
+        earth and plot the vertical magnetic field 50 m away, for a step-off and for a
+        1 ms linear ramp-off waveform.
+
+        >>> from geoana.em.tdem import MagneticDipoleLayeredHalfSpace
+        >>> import numpy as np
+        >>> import matplotlib.pyplot as plt
+
+        >>> times = np.logspace(-5, -2, 31)
+        >>> thickness = np.r_[10., 20.]
+        >>> sigma = np.r_[0.01, 0.5, 0.01]
+        >>> step_off = MagneticDipoleLayeredHalfSpace(
+        >>>     times, thickness, sigma=sigma, orientation='Z'
+        >>> )
+        >>> ramp_off = MagneticDipoleLayeredHalfSpace(
+        >>>     times, thickness, sigma=sigma, orientation='Z',
+        >>>     waveform=np.c_[[-1E-3, 0.], [1., 0.]],
+        >>> )
+        >>> xyz = np.c_[50., 0., 0.]
+        >>> h_step = step_off.magnetic_field(xyz)
+        >>> h_ramp = ramp_off.magnetic_field(xyz)
+
+        >>> plt.loglog(times, np.abs(h_step[:, 2]), label='step-off')
+        >>> plt.loglog(times, np.abs(h_ramp[:, 2]), label='ramp-off')
+        >>> plt.xlabel('time (s)')
+        >>> plt.ylabel('|H$_z$| (A/m)')
+        >>> plt.legend()
+        >>> plt.show()
+        """
+        return self._time_response(xyz)
+
+    def magnetic_field_time_derivative(self, xyz):
+        """Off-time time derivative of the magnetic field.
+
+        Parameters
+        ----------
+        xyz : (n_loc, 3) numpy.ndarray
+            Receiver locations. The z component cannot be below the surface (z >= 0.0).
+
+        Returns
+        -------
+        (n_time, n_loc, 3) numpy.ndarray
+            Time derivative of the magnetic field at all times for the locations
+            provided. Output array is squeezed when n_time and/or n_loc = 1.
+        """
+        return self._time_response(xyz, derivative=True)
+
+    def magnetic_flux_density(self, xyz):
+        """Off-time magnetic flux density at receivers in the air.
+
+        Parameters
+        ----------
+        xyz : (n_loc, 3) numpy.ndarray
+            Receiver locations. The z component cannot be below the surface (z >= 0.0).
+
+        Returns
+        -------
+        (n_time, n_loc, 3) numpy.ndarray
+            Magnetic flux density at all times for the locations provided. Output
+            array is squeezed when n_time and/or n_loc = 1.
+        """
+        return mu_0*self.magnetic_field(xyz)
+
+    def magnetic_flux_time_derivative(self, xyz):
+        """Off-time time derivative of the magnetic flux density at receivers in the air.
+
+        Parameters
+        ----------
+        xyz : (n_loc, 3) numpy.ndarray
+            Receiver locations. The z component cannot be below the surface (z >= 0.0).
+
+        Returns
+        -------
+        (n_time, n_loc, 3) numpy.ndarray
+            Time derivative of the magnetic flux density at all times for the locations
+            provided. Output array is squeezed when n_time and/or n_loc = 1.
+        """
+        return mu_0*self.magnetic_field_time_derivative(xyz)
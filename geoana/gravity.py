@@ -14,14 +14,21 @@ Simulation Classes
 
   PointMass
   Sphere
+  PointMassCollection
   Prism
+  PrismCollection
 """
 
 import numpy as np
 from scipy.constants import G
 from geoana.utils import check_xyz_dim
-from geoana.shapes import BasePrism
-from geoana.kernels import prism_f, prism_fz, prism_fzx, prism_fzy, prism_fzz
+from geoana.shapes import BasePrism, BasePrismCollection
+from geoana.kernels import prism_f, prism_fz, PointSourceTree
+
+# cycle of prism_fz that gives each component of the field
+_FIELD_CYCLE = {"gx": 1, "gy": 2, "gz": 0}
+# component of the order 2 derivative integrals for each component of the gradient
+_GRADIENT_INDEX = {"gxx": 0, "gxy": 1, "gxz": 2, "gyy": 3, "gyz": 4, "gzz": 5}
 
 
 class PointMass:
@@ -559,6 +566,185 @@ class Sphere(PointMass):
         return g_tens
 
 
+class PointMassCollection:
+    """Class for gravitational solutions for many point masses.
+
+    The ``PointMassCollection`` class computes the summed gravitational potentials
+    and fields of many point masses, such as the equivalent point masses of the
+    cells of a large mesh. Rather than summing every mass at every location, which
+    costs :math:`O(N M)` for N masses at M locations, the masses are sorted into an
+    octree, and distant groups of masses are approximated by their multipole
+    expansions (see :class:`geoana.kernels.PointSourceTree`).
+
+    Parameters
+    ----------
+    mass : float or (n_mass,) array_like
+        Mass of each point particle (kg).
+    location : (n_mass, 3) array_like
+        Location of each point mass in 3D space (m).
+    theta : float, optional
+        Opening angle of the tree, which controls the accuracy of the sums. The
+        relative error of the contribution of a group of masses is of the order of
+        ``theta**3``; ``theta=0`` sums every mass exactly.
+
+    Examples
+    --------
+    Compare the field of 10000 point masses with their exact sum.
+
+    >>> import numpy as np
+    >>> from geoana.gravity import PointMass, PointMassCollection
+    >>> rng = np.random.default_rng(0)
+    >>> location = rng.uniform(-50., 50., size=(10000, 3)) - np.r_[0., 0., 100.]
+    >>> masses = PointMassCollection(mass=1e6, location=location, theta=0.3)
+    >>> xyz = np.c_[np.linspace(-200., 200., 41), np.zeros(41), np.zeros(41)]
+    >>> g = masses.gravitational_field(xyz)
+    >>> g_exact = sum(PointMass(1e6, loc).gravitational_field(xyz) for loc in location)
+    >>> np.allclose(g, g_exact, rtol=1e-4)
+    True
+    """
+
+    def __init__(self, mass, location, theta=0.5):
+        self.location = location
+        self.mass = mass
+        self.theta = theta
+
+    @property
+    def n_mass(self):
+        """Number of point masses.
+
+        Returns
+        -------
+        int
+        """
+        return self._location.shape[0]
+
+    @property
+    def mass(self):
+        """Mass of each point particle in kilograms.
+
+        Returns
+        -------
+        (n_mass,) numpy.ndarray
+        """
+        return self._mass
+
+    @mass.setter
+    def mass(self, value):
+        try:
+            value = np.asarray(value, dtype=float)
+        except:
+            raise TypeError(f"mass must be a number or array_like, got {type(value)}")
+        if value.ndim == 0:
+            value = np.full(self.n_mass, value)
+        if value.shape != (self.n_mass, ):
+            raise ValueError(
+                f"mass must be a float or have shape ({self.n_mass},), got {value.shape}"
+            )
+
+        self._mass = value
+        self._tree = None
+
+    @property
+    def location(self):
+        """Location of each point mass in meters.
+
+        Returns
+        -------
+        (n_mass, 3) numpy.ndarray
+        """
+        return self._location
+
+    @location.setter
+    def location(self, vec):
+        try:
+            vec = np.asarray(vec, dtype=float)
+        except:
+            raise TypeError(f"location must be array_like of float, got {type(vec)}")
+        if vec.ndim != 2 or vec.shape[1] != 3:
+            raise ValueError(
+                f"location must be array_like with shape (n_mass, 3), got {vec.shape}"
+            )
+        if hasattr(self, "_mass") and vec.shape[0] != self.n_mass:
+            raise ValueError(
+                f"location must have {self.n_mass} rows to match mass, got {vec.shape[0]}"
+            )
+
+        self._location = vec
+        self._tree = None
+
+    @property
+    def theta(self):
+        """Opening angle of the octree.
+
+        A group of masses is approximated by its multipole expansion at a location
+        when the radius of the group is less than `theta` times its distance.
+
+        Returns
+        -------
+        float
+        """
+        return self._theta
+
+    @theta.setter
+    def theta(self, value):
+        try:
+            value = float(value)
+        except:
+            raise TypeError(f"theta must be a number, got {type(value)}")
+        if not value >= 0:
+            raise ValueError(f"theta must be non-negative, got {value}")
+
+        self._theta = value
+
+    @property
+    def tree(self):
+        """Octree of the point masses, built when first needed.
+
+        Returns
+        -------
+        geoana.kernels.PointSourceTree
+        """
+        if self._tree is None:
+            self._tree = PointSourceTree(self.location, charges=self.mass)
+        return self._tree
+
+    def gravitational_potential(self, xyz):
+        """
+        Gravitational potential due to the point masses.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., ) numpy.ndarray
+            Gravitational potential at observation locations xyz in units :math:`\\frac{m^2}{s^2}`.
+        """
+        xyz = check_xyz_dim(xyz)
+        u = self.tree.evaluate(xyz.reshape(-1, 3), order=0, theta=self.theta)
+        return G * u.reshape(xyz.shape[:-1])
+
+    def gravitational_field(self, xyz):
+        """
+        Gravitational field due to the point masses.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3) numpy.ndarray
+            Gravitational field at observation locations xyz in units :math:`\\frac{m}{s^2}`.
+        """
+        xyz = check_xyz_dim(xyz)
+        g = self.tree.evaluate(xyz.reshape(-1, 3), order=1, theta=self.theta)
+        return G * g.reshape(xyz.shape)
+
+
 class Prism(BasePrism):
     """Class for gravitational solutions for a prism.
 
@@ -573,11 +759,22 @@ class Prism(BasePrism):
         (x, y, z) triplet of the maximum locations in each dimension
     rho : float, optional
         Density of prism (:math:`\\frac{kg}{m^3}`).
+    dtype : {numpy.float64, numpy.float32}, optional
+        Data type of the computed potentials, fields and gradients.
+    far_field_ratio : float, optional
+        Distance, in prism diagonals, beyond which the prism is approximated by
+        a point mass, see :attr:`geoana.shapes.BasePrism.far_field_ratio`.
     """
 
-    def __init__(self, min_location, max_location, rho=1.0):
+    def __init__(
+        self, min_location, max_location, rho=1.0, dtype=np.float64,
+        far_field_ratio=None
+    ):
         self.rho = rho
-        super().__init__(min_location=min_location, max_location=max_location)
+        super().__init__(
+            min_location=min_location, max_location=max_location, dtype=dtype,
+            far_field_ratio=far_field_ratio
+        )
 
     @property
     def rho(self):
@@ -627,7 +824,8 @@ class Prism(BasePrism):
         """
         xyz = check_xyz_dim(xyz)
         # need to evaluate f node at each source locations
-        return - G * self.rho * self._eval_def_int(prism_f, xyz[..., 0], xyz[..., 1], xyz[..., 2])
+        val = self._eval_def_int(prism_f, xyz[..., 0], xyz[..., 1], xyz[..., 2])
+        return (- G * self.rho * val).astype(self.dtype, copy=False)
 
     def gravitational_field(self, xyz):
         """
@@ -649,7 +847,8 @@ class Prism(BasePrism):
         gx = self._eval_def_int(prism_fz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=1)
         gy = self._eval_def_int(prism_fz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=2)
         gz = self._eval_def_int(prism_fz, xyz[..., 0], xyz[..., 1], xyz[..., 2])
-        return - G * self.rho * np.stack((gx, gy, gz), axis=-1)
+        g = - G * self.rho * np.stack((gx, gy, gz), axis=-1)
+        return g.astype(self.dtype, copy=False)
 
     def gravitational_gradient(self, xyz):
         """
@@ -667,20 +866,253 @@ class Prism(BasePrism):
         """
         xyz = check_xyz_dim(xyz)
 
-        # need to evaluate f node at each source locations
-        gxx = self._eval_def_int(prism_fzz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=1)
-        gxy = self._eval_def_int(prism_fzx, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=1)
-        gxz = self._eval_def_int(prism_fzx, xyz[..., 0], xyz[..., 1], xyz[..., 2])
-
-        gyy = self._eval_def_int(prism_fzz, xyz[..., 0], xyz[..., 1], xyz[..., 2], cycle=2)
-        gyz = self._eval_def_int(prism_fzy, xyz[..., 0], xyz[..., 1], xyz[..., 2])
-
-        # gzz = - gxx - gyy - 4 * np.pi * G * rho[in_cell]
-        # easiest to just calculate it using another integral
-        gzz = self._eval_def_int(prism_fzz, xyz[..., 0], xyz[..., 1], xyz[..., 2])
+        # evaluate all of the components in one pass over the prism's corners
+        # (gzz = - gxx - gyy - 4 * np.pi * G * rho[in_cell], but it is just as cheap
+        # to integrate it directly)
+        gxx, gxy, gxz, gyy, gyz, gzz = self._eval_derivative_def_int(
+            2, xyz[..., 0], xyz[..., 1], xyz[..., 2]
+        )
 
         first = np.stack([gxx, gxy, gxz], axis=-1)
         second = np.stack([gxy, gyy, gyz], axis=-1)
         third = np.stack([gxz, gyz, gzz], axis=-1)
 
-        return - G * self.rho * np.stack([first, second, third], axis=-1)
+        g = - G * self.rho * np.stack([first, second, third], axis=-1)
+        return g.astype(self.dtype, copy=False)
+
+
+class PrismCollection(BasePrismCollection):
+    """Class for gravitational solutions for a collection of prisms.
+
+    The ``PrismCollection`` class is used to analytically compute the summed
+    gravitational potentials, fields, and gradients of many prisms with constant
+    densities, such as the cells of a mesh, along with their sensitivity matrices.
+    The prisms are evaluated together in compiled loops, rather than one
+    :class:`Prism` at a time.
+
+    Parameters
+    ----------
+    min_location : (n_prism, 3) array_like
+        (x, y, z) triplets of the minimum locations of each prism
+    max_location : (n_prism, 3) array_like
+        (x, y, z) triplets of the maximum locations of each prism
+    rho : float or (n_prism,) array_like, optional
+        Density of each prism (:math:`\\frac{kg}{m^3}`).
+    dtype : {numpy.float64, numpy.float32}, optional
+        Data type of the computed fields and sensitivity matrices. The kernels are
+        evaluated, and summed over the prisms, in double precision, so
+        ``numpy.float32`` mostly halves the memory of large sensitivity matrices.
+    far_field_ratio : float, optional
+        Distance, in prism diagonals, beyond which each prism is approximated by
+        a point mass, see :attr:`geoana.shapes.BasePrismCollection.far_field_ratio`.
+
+    Examples
+    --------
+    Compute the vertical gravitational field of a block discretized into 1000
+    cells, and the matrix that maps the cell densities to it.
+
+    >>> import numpy as np
+    >>> from geoana.gravity import PrismCollection
+    >>> nodes = np.linspace(-50., 50., 11)
+    >>> x, y, z = np.meshgrid(nodes[:-1], nodes[:-1], nodes[:-1] - 100., indexing='ij')
+    >>> min_location = np.c_[x.ravel(), y.ravel(), z.ravel()]
+    >>> prisms = PrismCollection(min_location, min_location + 10., rho=200.)
+    >>> xyz = np.c_[np.linspace(-200., 200., 41), np.zeros(41), np.zeros(41)]
+    >>> g_z = prisms.gravitational_field(xyz)[:, 2]
+    >>> G_z = prisms.gravitational_field_sensitivity(xyz)[:, 2]
+    >>> np.allclose(G_z @ prisms.rho, g_z)
+    True
+
+    The same matrix can be assembled by blocks of locations, possibly into a file.
+
+    >>> G_z = prisms.build_sensitivity(xyz, "gz", block_size=10)
+    >>> np.allclose(G_z @ prisms.rho, g_z)
+    True
+    """
+
+    sensitivity_components = ("potential", "gx", "gy", "gz") + tuple(_GRADIENT_INDEX)
+
+    def __init__(
+        self, min_location, max_location, rho=1.0, dtype=np.float64,
+        far_field_ratio=None
+    ):
+        super().__init__(
+            min_location=min_location, max_location=max_location, dtype=dtype,
+            far_field_ratio=far_field_ratio
+        )
+        self.rho = rho
+
+    @property
+    def rho(self):
+        """ The density of each prism.
+
+        Returns
+        -------
+        density : (n_prism,) numpy.ndarray
+            In :math:`\\frac{kg}{m^3}`.
+        """
+        return self._rho
+
+    @rho.setter
+    def rho(self, value):
+        try:
+            value = np.asarray(value, dtype=float)
+        except:
+            raise TypeError(f"rho must be a number or array_like, got {type(value)}")
+        if value.ndim == 0:
+            value = np.full(self.n_prism, value)
+        if value.shape != (self.n_prism, ):
+            raise ValueError(
+                f"rho must be a float or have shape ({self.n_prism},), got {value.shape}"
+            )
+
+        self._rho = value
+
+    @property
+    def mass(self):
+        """ The mass of each prism
+
+        Returns
+        -------
+        mass : (n_prism,) numpy.ndarray
+            In :math:`kg`.
+        """
+        return self.volume * self.rho
+
+    def gravitational_potential(self, xyz):
+        """
+        Gravitational potential due to the collection of prisms.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., ) numpy.ndarray
+            Gravitational potential of the prisms at location xyz in units :math:`\\frac{m^2}{s^2}`.
+        """
+        xyz = check_xyz_dim(xyz)
+        return - G * self._eval_def_int(prism_f, xyz, weights=self.rho)
+
+    def gravitational_field(self, xyz):
+        """
+        Gravitational field due to the collection of prisms.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3) numpy.ndarray
+            Gravitational field of the prisms at location xyz in units :math:`\\frac{m}{s^2}`.
+        """
+        xyz = check_xyz_dim(xyz)
+        gx = self._eval_def_int(prism_fz, xyz, cycle=1, weights=self.rho)
+        gy = self._eval_def_int(prism_fz, xyz, cycle=2, weights=self.rho)
+        gz = self._eval_def_int(prism_fz, xyz, weights=self.rho)
+        return - G * np.stack((gx, gy, gz), axis=-1)
+
+    def gravitational_gradient(self, xyz):
+        """
+        Gravitational gradient due to the collection of prisms.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3, 3) numpy.ndarray
+            Gravitational gradient of the prisms at location xyz in units :math:`\\frac{1}{s^2}`.
+        """
+        xyz = check_xyz_dim(xyz)
+        return - G * self._gradient_integrals(xyz, weights=self.rho)
+
+    def gravitational_potential_sensitivity(self, xyz):
+        """
+        Sensitivity of the gravitational potential to the density of each prism.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., n_prism) numpy.ndarray
+            Matrix that maps the densities to the gravitational potential at location
+            xyz, so that ``sensitivity @ rho`` gives the potential.
+        """
+        xyz = check_xyz_dim(xyz)
+        return - G * self._eval_def_int(prism_f, xyz)
+
+    def gravitational_field_sensitivity(self, xyz):
+        """
+        Sensitivity of the gravitational field to the density of each prism.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3, n_prism) numpy.ndarray
+            Matrix that maps the densities to each component of the gravitational field
+            at location xyz, so that ``sensitivity @ rho`` gives the field.
+        """
+        xyz = check_xyz_dim(xyz)
+        gx = self._eval_def_int(prism_fz, xyz, cycle=1)
+        gy = self._eval_def_int(prism_fz, xyz, cycle=2)
+        gz = self._eval_def_int(prism_fz, xyz)
+        return - G * np.stack((gx, gy, gz), axis=-2)
+
+    def gravitational_gradient_sensitivity(self, xyz):
+        """
+        Sensitivity of the gravitational gradient to the density of each prism.
+
+        Parameters
+        ----------
+        xyz : (..., 3) numpy.ndarray
+            Observation locations in units m.
+
+        Returns
+        -------
+        (..., 3, 3, n_prism) numpy.ndarray
+            Matrix that maps the densities to each component of the gravitational
+            gradient at location xyz, so that ``sensitivity @ rho`` gives the gradient.
+        """
+        xyz = check_xyz_dim(xyz)
+        return - G * self._gradient_integrals(xyz)
+
+    def _gradient_integrals(self, xyz, weights=None):
+        # trailing axis is the prism axis when there are no weights
+        g = self._eval_derivative_def_int(2, xyz, weights=weights)
+        if weights is not None:
+            g = g[..., None]
+        # (xx, xy, xz, yy, yz, zz) -> symmetric (3, 3) tensor
+        g = g[..., [[0, 1, 2], [1, 3, 4], [2, 4, 5]], :]
+        if weights is not None:
+            g = g[..., 0]
+        return g
+
+    def _sensitivity_block(self, xyz, components, out, n_threads):
+        gradient = None
+        for i, component in enumerate(components):
+            if component == "potential":
+                val = self._eval_def_int(prism_f, xyz, n_threads=n_threads)
+            elif component in _FIELD_CYCLE:
+                val = self._eval_def_int(
+                    prism_fz, xyz, cycle=_FIELD_CYCLE[component], n_threads=n_threads
+                )
+            else:
+                if gradient is None:
+                    # every component of the gradient in one pass over the prisms
+                    gradient = self._eval_derivative_def_int(2, xyz, n_threads=n_threads)
+                val = gradient[:, _GRADIENT_INDEX[component]]
+            np.multiply(val, -G, out=out[:, i])
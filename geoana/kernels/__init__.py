@@ -1,6 +1,14 @@
 """This module contains kernals for (semi-)analytic geophysical responses
 """
-from geoana.kernels.tranverse_electric_reflections import rTE_forward, rTE_gradient
+from geoana.kernels.parallel import get_num_threads, set_num_threads
+from geoana.kernels.tranverse_electric_reflections import (
+    rTE_forward, rTE_gradient, rTE_forward_batch, rTE_gradient_batch
+)
+from geoana.kernels.wholespace_dipole import (
+    wholespace_dipole_dyadic,
+    wholespace_dipole_curl,
+)
+from geoana.kernels.point_source_tree import PointSourceTree
 from geoana.kernels.potential_field_prism import (
     prism_f,
     prism_fz,
@@ -11,4 +19,8 @@ from geoana.kernels.potential_field_prism import (
     prism_fxxy,
     prism_fxxz,
     prism_fxyz,
+    prism_definite_integrals,
+    prism_tensor_definite_integrals,
+    prism_derivative_integrals,
+    prism_tensor_derivative_integrals,
 )
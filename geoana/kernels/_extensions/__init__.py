@@ -1,6 +1,6 @@
 try:
-    # register numba jitable versions of the prism functions
-    # if numba is available (and this module is installed).
+    # register numba jitable versions of the prism functions, and of the other
+    # compiled kernels, if numba is available (and this module is installed).
     from numba.extending import (
         overload,
         get_cython_function_address
@@ -33,8 +33,8 @@ try:
 
     def _numba_register_prism_func(prism_func):
         module = 'geoana.kernels._extensions.potential_field_prism'
-        name = prism_func.__name__
-
+        # the double precision kernel behind each ufunc is exported as <name>_double
+        name = prism_func.__name__ + '_double'
         func_address = get_cython_function_address(module, name)
         func_type = ctypes.CFUNCTYPE(ctypes.c_double, ctypes.c_double, ctypes.c_double, ctypes.c_double)
         c_func = func_type(func_address)
@@ -50,5 +50,154 @@ try:
     for func in funcs:
         _numba_register_prism_func(func)
 
+    # numba versions of the other compiled kernels, calling their C entry points
+    import numpy as np
+    from numba.extending import register_jitable
+
+    from .rTE import rTE_forward, rTE_gradient
+    from .wholespace_dipole import wholespace_dipole_dyadic, wholespace_dipole_curl
+    from .okada import okada_point_displacement
+
+    def _c_func(module, name, restype, *argtypes):
+        func_address = get_cython_function_address(
+            'geoana.kernels._extensions.' + module, name
+        )
+        return ctypes.CFUNCTYPE(restype, *argtypes)(func_address)
+
+    _ptr = ctypes.c_void_p
+    _size = ctypes.c_ssize_t
+    _double = ctypes.c_double
+
+    c_rTE = _c_func('rTE', '_rTE', None, *[_ptr] * 6, *[_size] * 4)
+    c_rTEgrad = _c_func('rTE', '_rTEgrad', None, *[_ptr] * 8, *[_size] * 4)
+
+    @register_jitable
+    def _rTE_arguments(frequencies, lamb, sigma, mu, thicknesses):
+        # Sigma and mu must be fortran contiguous, the others just contiguous
+        frequencies = np.ascontiguousarray(frequencies.astype(np.float64))
+        lamb = np.ascontiguousarray(lamb.astype(np.float64))
+        sigma = np.asfortranarray(sigma.astype(np.complex128))
+        mu = np.asfortranarray(mu.astype(np.float64))
+        thicknesses = np.ascontiguousarray(thicknesses.astype(np.float64))
+        if frequencies.shape[0] != sigma.shape[1]:
+            raise ValueError(
+                "sigma array's last dimension must be the same as the frequency arrays first."
+            )
+        if sigma.shape[0] != thicknesses.shape[0] + 1:
+            raise ValueError(
+                "sigma array's first dimension must match thickness array length+1."
+            )
+        if mu.shape != sigma.shape:
+            raise ValueError("mu array must match sigma array shape.")
+        return frequencies, lamb, sigma, mu, thicknesses
+
+    def _is_array(*args):
+        return all(isinstance(arg, types.Array) for arg in args)
+
+    def _is_thread_count(n_threads):
+        # like _check_n_threads, only integer thread counts (or None) are accepted
+        return n_threads is None or isinstance(
+            n_threads, (types.Omitted, types.NoneType, types.Integer)
+        )
+
+    @register_jitable
+    def _jit_n_threads(n_threads):
+        if n_threads is None:
+            return 1
+        if n_threads < 1:
+            raise ValueError("n_threads must be a positive integer")
+        return n_threads
+
+    # The compiled kernels split their loops over threads, which defaults to a
+    # single thread from nopython mode, where the calling loop is usually the
+    # one that is parallelized.
+    @overload(rTE_forward)
+    def numba_rTE_forward(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
+        if _is_array(frequencies, lamb, sigma, mu, thicknesses) and _is_thread_count(n_threads):
+            def f(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
+                frequencies, lamb, sigma, mu, thicknesses = _rTE_arguments(
+                    frequencies, lamb, sigma, mu, thicknesses
+                )
+                n_thread = _jit_n_threads(n_threads)
+                n_frequency = frequencies.shape[0]
+                n_filter = lamb.shape[0]
+                n_layers = sigma.shape[0]
+                # transposed to fortran order
+                out = np.empty((n_filter, n_frequency), dtype=np.complex128)
+                c_rTE(
+                    out.ctypes, frequencies.ctypes, lamb.ctypes, sigma.ctypes,
+                    mu.ctypes, thicknesses.ctypes,
+                    n_frequency, n_filter, n_layers, n_thread
+                )
+                return out.T
+            return f
+
+    @overload(rTE_gradient)
+    def numba_rTE_gradient(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
+        if _is_array(frequencies, lamb, sigma, mu, thicknesses) and _is_thread_count(n_threads):
+            def f(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
+                frequencies, lamb, sigma, mu, thicknesses = _rTE_arguments(
+                    frequencies, lamb, sigma, mu, thicknesses
+                )
+                n_thread = _jit_n_threads(n_threads)
+                n_frequency = frequencies.shape[0]
+                n_filter = lamb.shape[0]
+                n_layers = sigma.shape[0]
+                # transposed to fortran order
+                gsig = np.empty((n_filter, n_frequency, n_layers), dtype=np.complex128)
+                gh = np.empty((n_filter, n_frequency, n_layers - 1), dtype=np.complex128)
+                gmu = np.empty((n_filter, n_frequency, n_layers), dtype=np.complex128)
+                c_rTEgrad(
+                    gsig.ctypes, gmu.ctypes, gh.ctypes, frequencies.ctypes,
+                    lamb.ctypes, sigma.ctypes, mu.ctypes, thicknesses.ctypes,
+                    n_frequency, n_filter, n_layers, n_thread
+                )
+                return gsig.T, gh.T, gmu.T
+            return f
+
+    def _numba_register_dipole_func(dipole_func):
+        c_func = _c_func(
+            'wholespace_dipole', '_' + dipole_func.__name__, None, _ptr, *[_double] * 8
+        )
+
+        @overload(dipole_func)
+        def numba_func(x, y, z, ox, oy, oz, k):
+            if all(isinstance(v, types.Float) for v in (x, y, z, ox, oy, oz)):
+                if isinstance(k, types.Number):
+                    def f(x, y, z, ox, oy, oz, k):
+                        k = complex(k)
+                        out = np.empty(3, dtype=np.complex128)
+                        c_func(out.ctypes, x, y, z, ox, oy, oz, k.real, k.imag)
+                        return out[0], out[1], out[2]
+                    return f
+    for func in [wholespace_dipole_dyadic, wholespace_dipole_curl]:
+        _numba_register_dipole_func(func)
+
+    c_okada_point = _c_func('okada', '_okada_point', ctypes.c_int, _ptr, *[_double] * 14)
+
+    @overload(okada_point_displacement)
+    def numba_okada_point_displacement(
+        x, y, x0, y0, cos_strike, sin_strike, alpha, dip, al1, al2, aw1, aw2,
+        disl1, disl2
+    ):
+        args = (
+            x, y, x0, y0, cos_strike, sin_strike, alpha, dip, al1, al2, aw1, aw2,
+            disl1, disl2
+        )
+        if all(isinstance(v, types.Float) for v in args):
+            def f(
+                x, y, x0, y0, cos_strike, sin_strike, alpha, dip, al1, al2, aw1, aw2,
+                disl1, disl2
+            ):
+                u = np.empty(3, dtype=np.float64)
+                err = c_okada_point(
+                    u.ctypes, x, y, x0, y0, cos_strike, sin_strike, alpha, dip, al1,
+                    al2, aw1, aw2, disl1, disl2
+                )
+                if err != 0:
+                    return np.nan, np.nan, np.nan
+                return u[0], u[1], u[2]
+            return f
+
 except ImportError as err:
     pass
\ No newline at end of file
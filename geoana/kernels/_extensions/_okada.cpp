@@ -0,0 +1,350 @@
+#include <cmath>
+#include <atomic>
+#include <algorithm>
+#include <vector>
+#include "_okada.h"
+#include "_parallel.h"
+
+namespace {
+    const double F0 = 0.0;
+    const double F1 = 1.0;
+    const double F2 = 2.0;
+    const double PI2 = 6.283185307179586;
+    const double EPS = 1.0E-6;
+
+    struct Fault {
+        double x0, y0, ct, st;
+        double alp3, sd, cd, cdcd, sdcd;
+        double al[2], aw[2];
+        double disl1, disl2;
+        // scale of the (xi, et, q) coordinates over the whole grid for each
+        // corner, ordered as (aw1, al1), (aw1, al2), (aw2, al1), (aw2, al2)
+        double dc_max[4];
+    };
+
+    // zero a coordinate that is negligible relative to the grid (dccon2)
+    inline double snap(double v, double dc_max){
+        if (std::fabs(v/dc_max) < EPS || std::fabs(v) < EPS){
+            return F0;
+        }
+        return v;
+    }
+
+    inline void to_fault(const Fault &f, double x, double y, double &X, double &Y){
+        X = f.ct * (-f.x0 + x) - f.st * (-f.y0 + y);
+        Y = f.ct * (-f.y0 + y) + f.st * (-f.x0 + x);
+    }
+
+    // Surface displacement (ux, uy, uz) at a single point in fault coordinates.
+    // This follows the NumPy implementation operation by operation, including
+    // the coordinates that stay zeroed once they are snapped in a corner: et
+    // for both al corners of an aw corner, and q for all of the corners.
+    int dc3d3_point(const Fault &f, double X, double Y, double *u){
+        double p = Y * f.cd;
+        double q = Y * f.sd;
+
+        bool jxi = ((X - f.al[0]) * (X - f.al[1])) <= F0;
+        bool jet = ((p - f.aw[0]) * (p - f.aw[1])) <= F0;
+
+        double ux = F0, uy = F0, uz = F0;
+        double et, xi, dc_max;
+        double r, y, d, tt, x11, ret, ale, y11, rd, rd2, xx;
+        double ai1, ai2, ai3, ai4, qx, qy;
+        double du2x, du2y, du2z, dubx, duby, dubz, dux, duy, duz, c;
+
+        for(int k=0, corner=0; k<2; ++k){
+            et = p - f.aw[k];
+            for(int j=0; j<2; ++j, ++corner){
+                xi = X - f.al[j];
+
+                // dccon2: station geometry constants for a finite source
+                dc_max = f.dc_max[corner];
+                xi = snap(xi, dc_max);
+                et = snap(et, dc_max);
+                q = snap(q, dc_max);
+
+                r = std::sqrt(xi*xi + et*et + q*q);
+                if (r == F0){
+                    return funcs::OKADA_ZERO_DISTANCE;
+                }
+
+                y = et * f.cd + q * f.sd;
+                d = et * f.sd - q * f.cd;
+                tt = (q == F0) ? F0 : std::atan(xi * et / (q * r));
+
+                if (xi < F0 && q == F0 && et == F0){
+                    x11 = F0;
+                }else{
+                    x11 = F1/(r*(r + xi));
+                }
+
+                ret = r + et;
+                if (ret < 1e-14){
+                    return funcs::OKADA_SINGULAR_ETA;
+                }
+                if (et < F0 && q == F0 && xi == F0){
+                    ale = -std::log(r - et);
+                    y11 = F0;
+                }else{
+                    ale = std::log(ret);
+                    y11 = F1/(r*ret);
+                }
+
+                if (q == F0 && ((jxi && et == F0) || (jet && xi == F0))){
+                    return funcs::OKADA_SINGULAR_EDGE;
+                }
+
+                // ub: part B of the displacement due to a buried fault in a
+                // semi-infinite medium
+                rd = r + d;
+                if (rd < 1e-14){
+                    return funcs::OKADA_SINGULAR_DEPTH;
+                }
+
+                if (f.cd != F0){
+                    if (xi == F0){
+                        ai4 = F0;
+                    }else{
+                        xx = std::sqrt(xi*xi + q*q);
+                        ai4 = F1/f.cdcd * (xi/rd*f.sdcd + F2*std::atan(
+                            (et*(xx + q*f.cd) + xx*(r + xx)*f.sd) / (xi*(r + xx)*f.cd)
+                        ));
+                    }
+                    ai3 = (y*f.cd/rd - ale + f.sd*std::log(rd)) / f.cdcd;
+                }else{
+                    rd2 = rd*rd;
+                    ai3 = (et/rd + y*q/rd2 - ale) / F2;
+                    ai4 = xi*y/rd2/F2;
+                }
+
+                ai1 = -xi/rd*f.cd - ai4*f.sd;
+                ai2 = std::log(rd) + ai3*f.sd;
+                qx = q*x11;
+                qy = q*y11;
+
+                // strike-slip contribution
+                dubx = F0;
+                duby = F0;
+                dubz = F0;
+                if (f.disl1 != F0){
+                    du2x = -xi*qy - tt - f.alp3*ai1*f.sd;
+                    du2y = -q/r + f.alp3*y/rd*f.sd;
+                    du2z = q*qy - f.alp3*ai2*f.sd;
+                    c = f.disl1 / PI2;
+                    dubx = du2x * c;
+                    duby = du2y * c;
+                    dubz = du2z * c;
+                }
+
+                // dip-slip contribution
+                if (f.disl2 != F0){
+                    du2x = -q/r + f.alp3*ai3*f.sdcd;
+                    du2y = -et*qx - tt - f.alp3*xi/rd*f.sdcd;
+                    du2z = q*qx + f.alp3*ai4*f.sdcd;
+                    c = f.disl2 / PI2;
+                    dubx = dubx + du2x * c;
+                    duby = duby + du2y * c;
+                    dubz = dubz + du2z * c;
+                }
+
+                dux = dubx;
+                duy = duby*f.cd - dubz*f.sd;
+                duz = duby*f.sd + dubz*f.cd;
+                if (j + k != 1){
+                    ux = dux + ux;
+                    uy = duy + uy;
+                    uz = duz + uz;
+                }else{
+                    ux = -dux + ux;
+                    uy = -duy + uy;
+                    uz = -duz + uz;
+                }
+            }
+        }
+        u[0] = ux;
+        u[1] = uy;
+        u[2] = uz;
+        return funcs::OKADA_OK;
+    }
+
+    void set_fault(
+        Fault &f, double x0, double y0, double ct, double st, double alpha,
+        double sd, double cd, double al1, double al2, double aw1, double aw2,
+        double disl1, double disl2
+    ){
+        f.x0 = x0;
+        f.y0 = y0;
+        f.ct = ct;
+        f.st = st;
+        f.alp3 = (F1 - alpha) / alpha;
+        f.sd = sd;
+        f.cd = cd;
+        f.cdcd = f.cd * f.cd;
+        f.sdcd = f.sd * f.cd;
+        f.al[0] = al1;
+        f.al[1] = al2;
+        f.aw[0] = aw1;
+        f.aw[1] = aw2;
+        f.disl1 = disl1;
+        f.disl2 = disl2;
+    }
+
+    // The NumPy implementation snaps the coordinates relative to their largest
+    // magnitude over the whole grid. The extremes of X and Y are enough to find
+    // it, as every coordinate is a monotonic function of one of them, which
+    // keeps the main loop point-wise.
+    void grid_scales(Fault &f, const double *x, const double *y, std::size_t n){
+        double X, Y;
+        double X_min = INFINITY, X_max = -INFINITY;
+        double Y_min = INFINITY, Y_max = -INFINITY;
+        for(std::size_t i=0; i<n; ++i){
+            to_fault(f, x[i], y[i], X, Y);
+            X_min = std::min(X_min, X);
+            X_max = std::max(X_max, X);
+            Y_min = std::min(Y_min, Y);
+            Y_max = std::max(Y_max, Y);
+        }
+        double p_min = Y_min * f.cd, p_max = Y_max * f.cd;
+        double q_max = std::max(std::fabs(Y_min * f.sd), std::fabs(Y_max * f.sd));
+        double xi_max, et_max, dc_max;
+        for(int k=0, corner=0; k<2; ++k){
+            et_max = std::max(std::fabs(p_min - f.aw[k]), std::fabs(p_max - f.aw[k]));
+            for(int j=0; j<2; ++j, ++corner){
+                xi_max = std::max(std::fabs(X_min - f.al[j]), std::fabs(X_max - f.al[j]));
+                dc_max = std::max(xi_max, std::max(et_max, q_max));
+                f.dc_max[corner] = dc_max;
+                // et and q stay snapped, so if their largest value is snapped
+                // they are all zero in the next corners
+                et_max = snap(et_max, dc_max);
+                q_max = snap(q_max, dc_max);
+            }
+        }
+    }
+}
+
+int funcs::okada_dc3d3(
+    double *u,
+    const double *x,
+    const double *y,
+    std::size_t n,
+    std::size_t n_patch,
+    const double *x0,
+    const double *y0,
+    const double *cos_strike,
+    const double *sin_strike,
+    double alpha,
+    const double *sd,
+    const double *cd,
+    const double *al1,
+    const double *al2,
+    const double *aw1,
+    const double *aw2,
+    const double *disl1,
+    const double *disl2,
+    const double *dc_max,
+    bool sum_patches,
+    std::size_t n_threads
+){
+    std::vector<Fault> faults(n_patch);
+    for(std::size_t i_patch=0; i_patch<n_patch; ++i_patch){
+        set_fault(
+            faults[i_patch], x0[i_patch], y0[i_patch], cos_strike[i_patch],
+            sin_strike[i_patch], alpha, sd[i_patch], cd[i_patch], al1[i_patch],
+            al2[i_patch], aw1[i_patch], aw2[i_patch], disl1[i_patch], disl2[i_patch]
+        );
+    }
+    Fault *fp = faults.data();
+    if (dc_max != nullptr){
+        for(std::size_t i_patch=0; i_patch<n_patch; ++i_patch){
+            std::copy(dc_max + 4*i_patch, dc_max + 4*i_patch + 4, fp[i_patch].dc_max);
+        }
+    }else{
+        parallel_for(n_patch, n_threads, [=](std::size_t start, std::size_t stop){
+            for(std::size_t i_patch=start; i_patch<stop; ++i_patch){
+                grid_scales(fp[i_patch], x, y, n);
+            }
+        });
+    }
+
+    std::atomic<int> error(OKADA_OK);
+    parallel_for(n, n_threads, [=, &error](std::size_t start, std::size_t stop){
+        double X, Y, v[3], ux, uy, uz;
+        double *ui;
+        int err;
+        for(std::size_t i=start; i<stop; ++i){
+            ui = sum_patches ? u + 3*i : u + 3*n_patch*i;
+            ui[0] = F0;
+            ui[1] = F0;
+            ui[2] = F0;
+            for(std::size_t i_patch=0; i_patch<n_patch; ++i_patch){
+                const Fault &f = fp[i_patch];
+                to_fault(f, x[i], y[i], X, Y);
+                err = dc3d3_point(f, X, Y, v);
+                if (err != OKADA_OK){
+                    int expected = OKADA_OK;
+                    error.compare_exchange_strong(expected, err);
+                    return;
+                }
+                ux = f.ct*v[0] + f.st*v[1];
+                uy = -f.st*v[0] + f.ct*v[1];
+                uz = v[2];
+                if (sum_patches){
+                    ui[0] += ux;
+                    ui[1] += uy;
+                    ui[2] += uz;
+                }else{
+                    ui[3*i_patch] = ux;
+                    ui[3*i_patch + 1] = uy;
+                    ui[3*i_patch + 2] = uz;
+                }
+            }
+        }
+    });
+    return error.load();
+}
+
+int funcs::okada_point(
+    double *u,
+    double x,
+    double y,
+    double x0,
+    double y0,
+    double cos_strike,
+    double sin_strike,
+    double alpha,
+    double dip,
+    double al1,
+    double al2,
+    double aw1,
+    double aw2,
+    double disl1,
+    double disl2
+){
+    // dccon0: fault dip constants
+    const double pl8 = 0.017453292519943;
+    double sd = std::sin(dip*pl8);
+    double cd = std::cos(dip*pl8);
+    if (std::fabs(cd) < EPS){
+        cd = F0;
+        if (sd > F0) sd = F1;
+        if (sd < F0) sd = -F1;
+    }
+
+    Fault f;
+    set_fault(
+        f, x0, y0, cos_strike, sin_strike, alpha, sd, cd, al1, al2, aw1, aw2,
+        disl1, disl2
+    );
+    grid_scales(f, &x, &y, 1);
+
+    double X, Y, v[3];
+    to_fault(f, x, y, X, Y);
+    int err = dc3d3_point(f, X, Y, v);
+    if (err != OKADA_OK){
+        return err;
+    }
+    u[0] = f.ct*v[0] + f.st*v[1];
+    u[1] = -f.st*v[0] + f.ct*v[1];
+    u[2] = v[2];
+    return OKADA_OK;
+}
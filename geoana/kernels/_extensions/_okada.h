@@ -0,0 +1,68 @@
+#ifndef __OKADA_H
+#define __OKADA_H
+
+#include <cstddef>
+
+namespace funcs {
+    // error codes returned by okada_dc3d3, matching the singularities
+    // detected by the NumPy implementation
+    enum OkadaError {
+        OKADA_OK = 0,
+        OKADA_ZERO_DISTANCE = 1,
+        OKADA_SINGULAR_ETA = 2,
+        OKADA_SINGULAR_EDGE = 3,
+        OKADA_SINGULAR_DEPTH = 4
+    };
+
+    // Surface displacement of n_patch rectangular faults at n locations,
+    // either summed over the patches into u (n, 3), or for each patch
+    // separately into u (n, n_patch, 3). Coordinates are snapped to zero
+    // relative to the scales dc_max (n_patch, 4) of each patch's corners, or,
+    // if dc_max is null, relative to their largest values over the locations.
+    int okada_dc3d3(
+        double *u,
+        const double *x,
+        const double *y,
+        std::size_t n,
+        std::size_t n_patch,
+        const double *x0,
+        const double *y0,
+        const double *cos_strike,
+        const double *sin_strike,
+        double alpha,
+        const double *sd,
+        const double *cd,
+        const double *al1,
+        const double *al2,
+        const double *aw1,
+        const double *aw2,
+        const double *disl1,
+        const double *disl2,
+        const double *dc_max,
+        bool sum_patches,
+        std::size_t n_threads
+    );
+
+    // Surface displacement u (3) of a single fault at a single location, with
+    // its dip given in degrees. Coordinates are snapped to zero relative to
+    // this location only.
+    int okada_point(
+        double *u,
+        double x,
+        double y,
+        double x0,
+        double y0,
+        double cos_strike,
+        double sin_strike,
+        double alpha,
+        double dip,
+        double al1,
+        double al2,
+        double aw1,
+        double aw2,
+        double disl1,
+        double disl2
+    );
+}
+
+#endif
@@ -0,0 +1,43 @@
+#ifndef __PARALLEL_H
+#define __PARALLEL_H
+
+#include <cstddef>
+#include <vector>
+#include <thread>
+#include <algorithm>
+
+namespace {
+    // Split the index range [0, n) into contiguous blocks and call
+    // func(start, stop) on each block from its own thread. Every output
+    // element is computed by exactly the same code as in the serial loop,
+    // so the results do not depend on the number of threads used.
+    template<typename F>
+    void parallel_for(std::size_t n, std::size_t n_threads, F func){
+        if (n_threads <= 1 || n <= 1){
+            func(0, n);
+            return;
+        }
+        n_threads = std::min(n_threads, n);
+        std::size_t chunk = n / n_threads;
+        std::size_t remainder = n % n_threads;
+
+        std::vector<std::thread> workers;
+        workers.reserve(n_threads - 1);
+        std::size_t start = 0, stop;
+        for(std::size_t i_thread=0; i_thread<n_threads; ++i_thread){
+            stop = start + chunk + (i_thread < remainder ? 1 : 0);
+            if (i_thread == n_threads - 1){
+                // the calling thread does the last block itself
+                func(start, stop);
+            }else{
+                workers.emplace_back(func, start, stop);
+            }
+            start = stop;
+        }
+        for(auto &worker : workers){
+            worker.join();
+        }
+    }
+}
+
+#endif
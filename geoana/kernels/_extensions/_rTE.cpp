@@ -1,10 +1,11 @@
 #define _USE_MATH_DEFINES
 #include <cmath>
 #include "_rTE.h"
+#include "_parallel.h"
 #include <complex>
 #include <vector>
 
-void funcs::rTE(
+static void rTE_block(
     complex_t * TE,
     double * frequencies,
     double * lambdas,
@@ -12,8 +13,9 @@ void funcs::rTE(
     double * mus,
     double * h,
     size_t n_frequency,
-    size_t n_filter,
-    size_t n_layers
+    size_t n_layers,
+    size_t i_filt_start,
+    size_t i_filt_end
 ){
     double mu_0 = 4.0E-7*M_PI;
     complex_t j(0.0, 1.0);
@@ -23,7 +25,7 @@ void funcs::rTE(
     double *mui;
     double omega, mu_c, l2;
 
-    for(size_t i_filt=0, i=0; i_filt<n_filter; ++i_filt){
+    for(size_t i_filt=i_filt_start, i=i_filt_start*n_frequency; i_filt<i_filt_end; ++i_filt){
         l2 = lambdas[i_filt] * lambdas[i_filt];
         for(size_t i_freq=0; i_freq<n_frequency; ++i_freq, ++i){
             sigi = sigmas + i_freq*n_layers;
@@ -48,7 +50,27 @@ void funcs::rTE(
     }
 }
 
-void funcs::rTEgrad(
+void funcs::rTE(
+    complex_t * TE,
+    double * frequencies,
+    double * lambdas,
+    complex_t * sigmas,
+    double * mus,
+    double * h,
+    size_t n_frequency,
+    size_t n_filter,
+    size_t n_layers,
+    size_t n_threads
+){
+    parallel_for(n_filter, n_threads, [=](size_t start, size_t stop){
+        rTE_block(
+            TE, frequencies, lambdas, sigmas, mus, h,
+            n_frequency, n_layers, start, stop
+        );
+    });
+}
+
+static void rTEgrad_block(
     complex_t * TE_dsigma,
     complex_t * TE_dmu,
     complex_t * TE_dh,
@@ -58,8 +80,9 @@ void funcs::rTEgrad(
     double * mus,
     double * h,
     size_t n_frequency,
-    size_t n_filter,
-    size_t n_layers
+    size_t n_layers,
+    size_t i_filt_start,
+    size_t i_filt_end
 ){
     double mu_0 = 4.0E-7*M_PI;
     complex_t j(0.0, 1.0);
@@ -79,7 +102,7 @@ void funcs::rTEgrad(
     complex_t gyh0, bot, gy, gtanh, Y0;
     complex_t gu, gmu, gk2;
 
-    for(size_t i_filt=0, i=0; i_filt<n_filter; ++i_filt){
+    for(size_t i_filt=i_filt_start, i=i_filt_start*n_frequency; i_filt<i_filt_end; ++i_filt){
         l2 = lambdas[i_filt] * lambdas[i_filt];
         for(size_t i_freq=0; i_freq<n_frequency; ++i_freq, ++i){
             sigi = sigmas + i_freq*n_layers;
@@ -143,3 +166,104 @@ void funcs::rTEgrad(
         }
     }
 }
+
+void funcs::rTEgrad(
+    complex_t * TE_dsigma,
+    complex_t * TE_dmu,
+    complex_t * TE_dh,
+    double * frequencies,
+    double * lambdas,
+    complex_t * sigmas,
+    double * mus,
+    double * h,
+    size_t n_frequency,
+    size_t n_filter,
+    size_t n_layers,
+    size_t n_threads
+){
+    // the intermediate vectors are allocated inside rTEgrad_block,
+    // so each thread works on its own copy of them.
+    parallel_for(n_filter, n_threads, [=](size_t start, size_t stop){
+        rTEgrad_block(
+            TE_dsigma, TE_dmu, TE_dh, frequencies, lambdas, sigmas, mus, h,
+            n_frequency, n_layers, start, stop
+        );
+    });
+}
+
+void funcs::rTE_batch(
+    complex_t * TE,
+    double * frequencies,
+    double * lambdas,
+    complex_t * sigmas,
+    double * mus,
+    double * h,
+    size_t n_model,
+    size_t n_frequency,
+    size_t n_filter,
+    size_t n_layers,
+    size_t n_threads
+){
+    if (n_model == 0 || n_filter == 0){
+        return;
+    }
+    size_t model_size = n_frequency*n_layers;
+    // work over the flattened (model, filter) space so that threads are
+    // balanced whether there are many models or many filters.
+    parallel_for(n_model*n_filter, n_threads, [=](size_t start, size_t stop){
+        for(size_t i_model=start/n_filter; i_model*n_filter<stop; ++i_model){
+            size_t offset = i_model*n_filter;
+            rTE_block(
+                TE + i_model*n_frequency*n_filter,
+                frequencies,
+                lambdas + offset,
+                sigmas + i_model*model_size,
+                mus + i_model*model_size,
+                (h == NULL)? NULL : h + i_model*(n_layers-1),
+                n_frequency, n_layers,
+                std::max(start, offset) - offset,
+                std::min(stop, offset + n_filter) - offset
+            );
+        }
+    });
+}
+
+void funcs::rTEgrad_batch(
+    complex_t * TE_dsigma,
+    complex_t * TE_dmu,
+    complex_t * TE_dh,
+    double * frequencies,
+    double * lambdas,
+    complex_t * sigmas,
+    double * mus,
+    double * h,
+    size_t n_model,
+    size_t n_frequency,
+    size_t n_filter,
+    size_t n_layers,
+    size_t n_threads
+){
+    if (n_model == 0 || n_filter == 0){
+        return;
+    }
+    size_t model_size = n_frequency*n_layers;
+    size_t out_size = n_frequency*n_filter;
+    parallel_for(n_model*n_filter, n_threads, [=](size_t start, size_t stop){
+        for(size_t i_model=start/n_filter; i_model*n_filter<stop; ++i_model){
+            size_t offset = i_model*n_filter;
+            rTEgrad_block(
+                TE_dsigma + i_model*n_layers*out_size,
+                TE_dmu + i_model*n_layers*out_size,
+                (TE_dh == NULL)? NULL : TE_dh + i_model*(n_layers-1)*out_size,
+                frequencies,
+                lambdas + offset,
+                sigmas + i_model*model_size,
+                mus + i_model*model_size,
+                (h == NULL)? NULL : h + i_model*(n_layers-1),
+                n_frequency, n_layers,
+                std::max(start, offset) - offset,
+                std::min(stop, offset + n_filter) - offset
+            );
+        }
+    });
+}
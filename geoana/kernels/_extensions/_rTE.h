@@ -18,7 +18,8 @@ namespace funcs {
         double *depths,
         size_t n_frequency,
         size_t n_filter,
-        size_t n_layers
+        size_t n_layers,
+        size_t n_threads
     );
 
     void rTEgrad(
@@ -32,7 +33,38 @@ namespace funcs {
         double * h,
         size_t n_frequency,
         size_t n_filter,
-        size_t n_layers
+        size_t n_layers,
+        size_t n_threads
+    );
+
+    void rTE_batch(
+        complex_t *TE,
+        double *frequencies,
+        double *lambdas,
+        complex_t *sigmas,
+        double *mus,
+        double *depths,
+        size_t n_model,
+        size_t n_frequency,
+        size_t n_filter,
+        size_t n_layers,
+        size_t n_threads
+    );
+
+    void rTEgrad_batch(
+        complex_t * TE_dsigma,
+        complex_t * TE_dmu,
+        complex_t * TE_dh,
+        double * frequencies,
+        double * lambdas,
+        complex_t * sigmas,
+        double * mus,
+        double * h,
+        size_t n_model,
+        size_t n_frequency,
+        size_t n_filter,
+        size_t n_layers,
+        size_t n_threads
     );
 }
 
@@ -0,0 +1,260 @@
+# distutils: language=c++
+# cython: language_level=3
+import numpy as np
+cimport numpy as np
+cimport cython
+from libc.math cimport NAN
+from libcpp cimport bool
+
+from geoana.kernels.parallel import _check_n_threads
+
+ctypedef np.float64_t REAL_t
+ctypedef np.intp_t SIZE_t
+
+cdef extern from "_okada.h" namespace "funcs":
+    int okada_dc3d3(
+        double *u,
+        const double *x,
+        const double *y,
+        SIZE_t n,
+        SIZE_t n_patch,
+        const double *x0,
+        const double *y0,
+        const double *cos_strike,
+        const double *sin_strike,
+        double alpha,
+        const double *sd,
+        const double *cd,
+        const double *al1,
+        const double *al2,
+        const double *aw1,
+        const double *aw2,
+        const double *disl1,
+        const double *disl2,
+        const double *dc_max,
+        bool sum_patches,
+        SIZE_t n_threads
+    ) nogil
+
+    int okada_point(
+        double *u,
+        double x,
+        double y,
+        double x0,
+        double y0,
+        double cos_strike,
+        double sin_strike,
+        double alpha,
+        double dip,
+        double al1,
+        double al2,
+        double aw1,
+        double aw2,
+        double disl1,
+        double disl2
+    ) nogil
+
+_ERRORS = {
+    1: "singularity error: a location coincides with a corner of the fault",
+    2: "singularity error: a location lies on the extension of a fault edge",
+    3: "singular problems: a location lies on an edge of the fault",
+    4: "singularity error: a location lies above the extension of the fault plane",
+}
+
+
+def okada_surface_displacement(
+    x, y, center, strike_vector, alpha, dip, al1, al2, aw1, aw2, disl1, disl2,
+    sum_patches=True, dc_max=None, n_threads=None
+):
+    """Surface displacement of rectangular faults in an elastic halfspace.
+
+    Evaluates Okada's (1985) ``dc3d3`` solution point by point, with a constant
+    amount of working memory per point, splitting the locations over several
+    threads if requested. It gives the same values as the NumPy implementation in
+    :class:`geoana.earthquake.oksar.Oksar` to round-off.
+
+    The fault parameters can either be scalars, for a single fault, or arrays
+    describing many fault patches, which are all evaluated in the same pass over
+    the locations.
+
+    Parameters
+    ----------
+    x, y : (n) numpy.ndarray
+        Easting and northing of the locations.
+    center : (2) or (n_patch, 2) array_like
+        Easting and northing of the center of each fault patch.
+    strike_vector : (2) or (n_patch, 2) array_like
+        Cosine and sine of the angle that rotates the locations into each patch's
+        coordinate system.
+    alpha : float
+        Medium constant, :math:`(\\lambda + \\mu) / (\\lambda + 2\\mu)`.
+    dip : float or (n_patch) array_like
+        Dip angle of each patch in degrees.
+    al1, al2 : float or (n_patch) array_like
+        Extent of each patch along strike.
+    aw1, aw2 : float or (n_patch) array_like
+        Extent of each patch down dip.
+    disl1, disl2 : float or (n_patch) array_like
+        Strike-slip and dip-slip dislocations of each patch.
+    sum_patches : bool, optional
+        Whether to sum the displacements of the patches, or return the displacement
+        of each patch.
+    dc_max : (n_patch, 4) array_like, optional
+        Scales of the fault coordinates of each patch for its four corners
+        (see :func:`geoana.earthquake.oksar._snapping_scales`); coordinates that
+        are negligible relative to them are snapped to zero. By default, the scales
+        are the largest coordinates over the locations `x`, `y`.
+    n_threads : int, optional
+        Number of threads to split the locations over. Defaults to the value set
+        by :func:`geoana.kernels.set_num_threads`. The result is identical for any
+        number of threads.
+
+    Returns
+    -------
+    (n, 3) or (n, n_patch, 3) numpy.ndarray
+        Easting, northing and vertical displacement at each location, summed over
+        the patches if `sum_patches` is ``True``.
+    """
+    n_threads = _check_n_threads(n_threads)
+
+    x = np.require(x, dtype=np.float64, requirements="C")
+    y = np.require(y, dtype=np.float64, requirements="C")
+    if x.ndim != 1 or x.shape != y.shape:
+        raise ValueError(
+            f"x and y must be 1D arrays of the same length, got {x.shape} and {y.shape}"
+        )
+    center = np.atleast_2d(np.asarray(center, dtype=np.float64))
+    strike_vector = np.atleast_2d(np.asarray(strike_vector, dtype=np.float64))
+    if center.ndim != 2 or center.shape[1] != 2:
+        raise ValueError(f"center must have shape (2,) or (n_patch, 2), got {center.shape}")
+    if strike_vector.ndim != 2 or strike_vector.shape[1] != 2:
+        raise ValueError(
+            f"strike_vector must have shape (2,) or (n_patch, 2), got {strike_vector.shape}"
+        )
+    try:
+        params = np.broadcast_arrays(
+            center[:, 0], center[:, 1], strike_vector[:, 0], strike_vector[:, 1],
+            *(np.atleast_1d(np.asarray(v, dtype=np.float64))
+              for v in (dip, al1, al2, aw1, aw2, disl1, disl2))
+        )
+    except ValueError:
+        raise ValueError("the fault parameters must all have the same number of patches")
+    params = [np.require(p, dtype=np.float64, requirements="C") for p in params]
+    x0, y0, cos_strike, sin_strike, dip, al1, al2, aw1, aw2, disl1, disl2 = params
+    if x0.ndim != 1:
+        raise ValueError("the fault parameters must be scalars or 1D arrays")
+    if dc_max is not None:
+        dc_max = np.require(dc_max, dtype=np.float64, requirements="C")
+        if dc_max.shape != (x0.shape[0], 4):
+            raise ValueError(
+                f"dc_max must have shape ({x0.shape[0]}, 4), got {dc_max.shape}"
+            )
+
+    # dccon0: medium and fault dip constants
+    EPS = 1.0E-6
+    pl8 = 0.017453292519943
+    sd = np.sin(dip*pl8)
+    cd = np.cos(dip*pl8)
+    vertical = np.abs(cd) < EPS
+    cd[vertical] = 0.0
+    sd[vertical & (sd > 0.0)] = 1.0
+    sd[vertical & (sd < 0.0)] = -1.0
+
+    cdef:
+        const REAL_t[:] x_v = x
+        const REAL_t[:] y_v = y
+        SIZE_t n = x.shape[0]
+        SIZE_t n_patch = x0.shape[0]
+        SIZE_t n_thread = n_threads
+        bool c_sum = sum_patches
+        double c_alpha = alpha
+        int err = 0
+        const REAL_t[::1] x0_v = x0, y0_v = y0, cos_v = cos_strike, sin_v = sin_strike
+        const REAL_t[::1] sd_v = sd, cd_v = cd
+        const REAL_t[::1] al1_v = al1, al2_v = al2, aw1_v = aw1, aw2_v = aw2
+        const REAL_t[::1] disl1_v = disl1, disl2_v = disl2
+        const REAL_t[:, ::1] dc_max_v = dc_max
+        const double *dc_max_p = NULL
+        REAL_t[::1] out_v
+
+    if sum_patches:
+        out = np.zeros((n, 3), dtype=np.float64)
+    else:
+        out = np.zeros((n, n_patch, 3), dtype=np.float64)
+    if n == 0 or n_patch == 0:
+        return out
+    out_v = out.reshape(-1)
+    if dc_max is not None:
+        dc_max_p = &dc_max_v[0, 0]
+
+    with nogil:
+        err = okada_dc3d3(
+            &out_v[0], &x_v[0], &y_v[0], n, n_patch, &x0_v[0], &y0_v[0],
+            &cos_v[0], &sin_v[0], c_alpha, &sd_v[0], &cd_v[0], &al1_v[0], &al2_v[0],
+            &aw1_v[0], &aw2_v[0], &disl1_v[0], &disl2_v[0], dc_max_p, c_sum, n_thread
+        )
+    if err != 0:
+        raise ValueError(_ERRORS[err])
+
+    return out
+
+
+cdef api int _okada_point(
+    double *u, double x, double y, double x0, double y0, double cos_strike,
+    double sin_strike, double alpha, double dip, double al1, double al2, double aw1,
+    double aw2, double disl1, double disl2
+) noexcept nogil:
+    return okada_point(
+        u, x, y, x0, y0, cos_strike, sin_strike, alpha, dip, al1, al2, aw1, aw2,
+        disl1, disl2
+    )
+
+
+@cython.ufunc
+cdef (double, double, double) okada_point_displacement(
+    double x, double y, double x0, double y0, double cos_strike, double sin_strike,
+    double alpha, double dip, double al1, double al2, double aw1, double aw2,
+    double disl1, double disl2
+) noexcept nogil:
+    """Surface displacement of a rectangular fault at a single location.
+
+    This is the point-wise version of :func:`okada_surface_displacement`, as a
+    ufunc of scalar parameters, which can also be called from numba's nopython
+    mode. Coordinates are snapped to zero relative to the location itself
+    instead of a whole grid of locations, so it can differ from
+    :func:`okada_surface_displacement` to round-off very close to the edges of
+    the fault.
+
+    Parameters
+    ----------
+    x, y : float
+        Easting and northing of the location.
+    x0, y0 : float
+        Easting and northing of the center of the fault.
+    cos_strike, sin_strike : float
+        Cosine and sine of the angle that rotates the location into the fault's
+        coordinate system.
+    alpha : float
+        Medium constant, :math:`(\\lambda + \\mu) / (\\lambda + 2\\mu)`.
+    dip : float
+        Dip angle of the fault in degrees.
+    al1, al2 : float
+        Extent of the fault along strike.
+    aw1, aw2 : float
+        Extent of the fault down dip.
+    disl1, disl2 : float
+        Strike-slip and dip-slip dislocations.
+
+    Returns
+    -------
+    ux, uy, uz : float
+        Easting, northing and vertical displacement, ``nan`` if the location is
+        at a singularity of the solution.
+    """
+    cdef double u[3]
+    if okada_point(
+        u, x, y, x0, y0, cos_strike, sin_strike, alpha, dip, al1, al2, aw1, aw2,
+        disl1, disl2
+    ) != 0:
+        return NAN, NAN, NAN
+    return u[0], u[1], u[2]
@@ -0,0 +1,129 @@
+# cython: language_level=3
+cimport cython
+from libc.math cimport sqrt
+
+# a depth first traversal holds at most 7 siblings of each node on its path to the
+# root, and the tree has at most 22 levels
+cdef enum:
+    _STACK_SIZE = 256
+
+
+@cython.cdivision
+cdef inline void _multipole(
+    int order, const double *m, double x, double y, double z, double *out
+) noexcept nogil:
+    # add the potential, or its gradient, of the multipole expansion with moments
+    # (M0, M1x, M1y, M1z, Qxx, Qxy, Qxz, Qyy, Qyz, Qzz) at the offset (x, y, z)
+    cdef:
+        double ir2 = 1.0 / (x * x + y * y + z * z)
+        double ir = sqrt(ir2)
+        double ir3 = ir * ir2
+        double ir5 = ir3 * ir2
+        double m1r = m[1] * x + m[2] * y + m[3] * z
+        double qx = m[4] * x + m[5] * y + m[6] * z
+        double qy = m[5] * x + m[7] * y + m[8] * z
+        double qz = m[6] * x + m[8] * y + m[9] * z
+        double rqr = x * qx + y * qy + z * qz
+        double trace = m[4] + m[7] + m[9]
+        double c
+    if order == 0:
+        out[0] += m[0] * ir + m1r * ir3 + 0.5 * (3 * rqr * ir5 - trace * ir3)
+    else:
+        c = -m[0] * ir3 - 3 * m1r * ir5 - 7.5 * rqr * ir5 * ir2 + 1.5 * trace * ir5
+        out[0] += c * x + m[1] * ir3 + 3 * qx * ir5
+        out[1] += c * y + m[2] * ir3 + 3 * qy * ir5
+        out[2] += c * z + m[3] * ir3 + 3 * qz * ir5
+
+
+@cython.cdivision
+cdef inline void _direct(
+    int order, double q, const double *p, double x, double y, double z, double *out
+) noexcept nogil:
+    # add the potential, or its gradient, of a source with charge q and dipole p (if
+    # not NULL) at the offset (x, y, z), unless it is at the offset's origin
+    cdef:
+        double r2 = x * x + y * y + z * z
+        double ir2, ir, ir3, pr = 0.0
+    if r2 == 0.0:
+        return
+    ir2 = 1.0 / r2
+    ir = sqrt(ir2)
+    ir3 = ir * ir2
+    if p != NULL:
+        pr = p[0] * x + p[1] * y + p[2] * z
+    if order == 0:
+        out[0] += q * ir + pr * ir3
+    else:
+        out[0] += -q * x * ir3 - 3 * pr * x * ir3 * ir2
+        out[1] += -q * y * ir3 - 3 * pr * y * ir3 * ir2
+        out[2] += -q * z * ir3 - 3 * pr * z * ir3 * ir2
+        if p != NULL:
+            out[0] += p[0] * ir3
+            out[1] += p[1] * ir3
+            out[2] += p[2] * ir3
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _tree_sum(
+    int order,
+    const double[:, :] xyz,
+    double theta,
+    const double[:, ::1] center,
+    const double[::1] radius,
+    const double[:, ::1] moments,
+    const Py_ssize_t[::1] first_child,
+    const Py_ssize_t[::1] n_child,
+    const Py_ssize_t[::1] start,
+    const Py_ssize_t[::1] stop,
+    const double[:, ::1] locations,
+    const double[::1] charges,
+    const double[:, ::1] dipoles,
+    double[:, :] out,
+):
+    """Fill out[i] with the potential (order 0), or its gradient (order 1), of the
+    sources in the tree at xyz[i], traversing the tree depth first for each receiver
+    (see geoana.kernels.point_source_tree.PointSourceTree)."""
+    cdef:
+        Py_ssize_t stack[_STACK_SIZE]
+        Py_ssize_t n_stack, node, i, j, k
+        Py_ssize_t n_rx = xyz.shape[0], n_node = center.shape[0]
+        bint has_charges = charges is not None
+        bint has_dipoles = dipoles is not None
+        double theta2 = theta * theta
+        double x, y, z, q
+        double acc[3]
+        const double *p = NULL
+
+    with nogil:
+        for i in range(n_rx):
+            acc[0] = acc[1] = acc[2] = 0.0
+            n_stack = 0
+            if n_node > 0:
+                stack[0] = 0
+                n_stack = 1
+            while n_stack > 0:
+                n_stack -= 1
+                node = stack[n_stack]
+                x = xyz[i, 0] - center[node, 0]
+                y = xyz[i, 1] - center[node, 1]
+                z = xyz[i, 2] - center[node, 2]
+                if radius[node] * radius[node] < theta2 * (x * x + y * y + z * z):
+                    _multipole(order, &moments[node, 0], x, y, z, acc)
+                elif n_child[node] == 0:
+                    q = 0.0
+                    for j in range(start[node], stop[node]):
+                        if has_charges:
+                            q = charges[j]
+                        if has_dipoles:
+                            p = &dipoles[j, 0]
+                        _direct(
+                            order, q, p, xyz[i, 0] - locations[j, 0],
+                            xyz[i, 1] - locations[j, 1], xyz[i, 2] - locations[j, 2], acc
+                        )
+                else:
+                    for k in range(n_child[node]):
+                        stack[n_stack] = first_child[node] + k
+                        n_stack += 1
+            for k in range(out.shape[1]):
+                out[i, k] = acc[k]
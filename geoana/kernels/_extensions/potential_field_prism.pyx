@@ -1,23 +1,19 @@
 cimport cython
+import numpy as np
 
 from libc.math cimport sqrt, log, atan
 
-@cython.cdivision
-@cython.ufunc
-cdef api double prism_f(double x, double y, double z) nogil:
-    """Evaluates the indefinite volume integral for the 1/r kernel.
+# The ufuncs have float and double loops, but the kernels are always evaluated in
+# double precision. The double precision prism_*_double kernels are exported as
+# C entry points for other compiled modules (e.g. through numba's
+# get_cython_function_address).
+ctypedef fused real:
+    float
+    double
 
-    This is used to evaluate the gravitational potential of dense prisms.
 
-    Parameters
-    ----------
-    x, y, z : (...) numpy.ndarray
-        The nodal locations to evaluate the function at
-
-    Returns
-    -------
-    (...) numpy.ndarray
-    """
+@cython.cdivision
+cdef api double prism_f_double(double x, double y, double z) noexcept nogil:
     cdef:
         double v = 0.0
         double r, temp
@@ -40,12 +36,12 @@ cdef api double prism_f(double x, double y, double z) nogil:
         v += 0.5 * z * z * atan(x * y / (z * r))
     return v
 
-@cython.cdivision
+
 @cython.ufunc
-cdef api double prism_fz(double x, double y, double z) nogil:
-    """Evaluates the indefinite volume integral for the d/dz * 1/r kernel.
+cdef real prism_f(real x, real y, real z) nogil:
+    """Evaluates the indefinite volume integral for the 1/r kernel.
 
-    This is used to evaluate the gravitational field of dense prisms.
+    This is used to evaluate the gravitational potential of dense prisms.
 
     Parameters
     ----------
@@ -55,11 +51,12 @@ cdef api double prism_fz(double x, double y, double z) nogil:
     Returns
     -------
     (...) numpy.ndarray
-
-    Notes
-    -----
-    Can be used to compute other components by cycling the inputs
     """
+    return <real> prism_f_double(x, y, z)
+
+
+@cython.cdivision
+cdef api double prism_fz_double(double x, double y, double z) noexcept nogil:
     cdef:
         double v = 0.0
         double r, temp
@@ -79,11 +76,10 @@ cdef api double prism_fz(double x, double y, double z) nogil:
 
 
 @cython.ufunc
-@cython.cdivision
-cdef api double prism_fzz(double x, double y, double z) nogil:
-    """Evaluates the indefinite volume integral for the d**2/dz**2 * 1/r kernel.
+cdef real prism_fz(real x, real y, real z) nogil:
+    """Evaluates the indefinite volume integral for the d/dz * 1/r kernel.
 
-    This is used to evaluate the gravitational gradient of dense prisms.
+    This is used to evaluate the gravitational field of dense prisms.
 
     Parameters
     ----------
@@ -98,6 +94,11 @@ cdef api double prism_fzz(double x, double y, double z) nogil:
     -----
     Can be used to compute other components by cycling the inputs
     """
+    return <real> prism_fz_double(x, y, z)
+
+
+@cython.cdivision
+cdef api double prism_fzz_double(double x, double y, double z) noexcept nogil:
     cdef:
         double v = 0.0
         double r
@@ -109,9 +110,8 @@ cdef api double prism_fzz(double x, double y, double z) nogil:
 
 
 @cython.ufunc
-@cython.cdivision
-cdef api double prism_fzx(double x, double y, double z) nogil:
-    """Evaluates the indefinite volume integral for the d**2/(dz*dx) * 1/r kernel.
+cdef real prism_fzz(real x, real y, real z) nogil:
+    """Evaluates the indefinite volume integral for the d**2/dz**2 * 1/r kernel.
 
     This is used to evaluate the gravitational gradient of dense prisms.
 
@@ -128,6 +128,11 @@ cdef api double prism_fzx(double x, double y, double z) nogil:
     -----
     Can be used to compute other components by cycling the inputs
     """
+    return <real> prism_fzz_double(x, y, z)
+
+
+@cython.cdivision
+cdef api double prism_fzx_double(double x, double y, double z) noexcept nogil:
     cdef:
         double v = 0.0
         double r
@@ -142,9 +147,8 @@ cdef api double prism_fzx(double x, double y, double z) nogil:
 
 
 @cython.ufunc
-@cython.cdivision
-cdef api double prism_fzy(double x, double y, double z) nogil:
-    """Evaluates the indefinite volume integral for the d**2/(dz*dy) * 1/r kernel.
+cdef real prism_fzx(real x, real y, real z) nogil:
+    """Evaluates the indefinite volume integral for the d**2/(dz*dx) * 1/r kernel.
 
     This is used to evaluate the gravitational gradient of dense prisms.
 
@@ -161,6 +165,11 @@ cdef api double prism_fzy(double x, double y, double z) nogil:
     -----
     Can be used to compute other components by cycling the inputs
     """
+    return <real> prism_fzx_double(x, y, z)
+
+
+@cython.cdivision
+cdef api double prism_fzy_double(double x, double y, double z) noexcept nogil:
     cdef:
         double v = 0.0
         double r, temp
@@ -175,11 +184,10 @@ cdef api double prism_fzy(double x, double y, double z) nogil:
 
 
 @cython.ufunc
-@cython.cdivision
-cdef api double prism_fzzz(double x, double y, double z) nogil:
-    """Evaluates the indefinite volume integral for the d**3/(dz**3) * 1/r kernel.
+cdef real prism_fzy(real x, real y, real z) nogil:
+    """Evaluates the indefinite volume integral for the d**2/(dz*dy) * 1/r kernel.
 
-    This is used to evaluate the magnetic gradient of susceptible prisms.
+    This is used to evaluate the gravitational gradient of dense prisms.
 
     Parameters
     ----------
@@ -194,6 +202,11 @@ cdef api double prism_fzzz(double x, double y, double z) nogil:
     -----
     Can be used to compute other components by cycling the inputs
     """
+    return <real> prism_fzy_double(x, y, z)
+
+
+@cython.cdivision
+cdef api double prism_fzzz_double(double x, double y, double z) noexcept nogil:
     cdef:
         double v = 0.0
         double r, v1, v2
@@ -210,9 +223,8 @@ cdef api double prism_fzzz(double x, double y, double z) nogil:
 
 
 @cython.ufunc
-@cython.cdivision
-cdef api double prism_fxxy(double x, double y, double z) nogil:
-    """Evaluates the indefinite volume integral for the d**3/(dx**2 * dy) * 1/r kernel.
+cdef real prism_fzzz(real x, real y, real z) nogil:
+    """Evaluates the indefinite volume integral for the d**3/(dz**3) * 1/r kernel.
 
     This is used to evaluate the magnetic gradient of susceptible prisms.
 
@@ -229,6 +241,11 @@ cdef api double prism_fxxy(double x, double y, double z) nogil:
     -----
     Can be used to compute other components by cycling the inputs
     """
+    return <real> prism_fzzz_double(x, y, z)
+
+
+@cython.cdivision
+cdef api double prism_fxxy_double(double x, double y, double z) noexcept nogil:
     cdef:
         double v = 0.0
         double r
@@ -240,9 +257,8 @@ cdef api double prism_fxxy(double x, double y, double z) nogil:
 
 
 @cython.ufunc
-@cython.cdivision
-cdef api double prism_fxxz(double x, double y, double z) nogil:
-    """Evaluates the indefinite volume integral for the d**3/(dx**2 * dz) * 1/r kernel.
+cdef real prism_fxxy(real x, real y, real z) nogil:
+    """Evaluates the indefinite volume integral for the d**3/(dx**2 * dy) * 1/r kernel.
 
     This is used to evaluate the magnetic gradient of susceptible prisms.
 
@@ -259,6 +275,11 @@ cdef api double prism_fxxz(double x, double y, double z) nogil:
     -----
     Can be used to compute other components by cycling the inputs
     """
+    return <real> prism_fxxy_double(x, y, z)
+
+
+@cython.cdivision
+cdef api double prism_fxxz_double(double x, double y, double z) noexcept nogil:
     cdef:
         double v = 0.0
         double r
@@ -270,9 +291,8 @@ cdef api double prism_fxxz(double x, double y, double z) nogil:
 
 
 @cython.ufunc
-@cython.cdivision
-cdef api double prism_fxyz(double x, double y, double z) nogil:
-    """Evaluates the indefinite volume integral for the d**3/(dx * dy * dz) * 1/r kernel.
+cdef real prism_fxxz(real x, real y, real z) nogil:
+    """Evaluates the indefinite volume integral for the d**3/(dx**2 * dz) * 1/r kernel.
 
     This is used to evaluate the magnetic gradient of susceptible prisms.
 
@@ -289,10 +309,749 @@ cdef api double prism_fxyz(double x, double y, double z) nogil:
     -----
     Can be used to compute other components by cycling the inputs
     """
+    return <real> prism_fxxz_double(x, y, z)
+
+
+@cython.cdivision
+cdef api double prism_fxyz_double(double x, double y, double z) noexcept nogil:
     cdef:
         double v = 0.0
         double r
     r = sqrt(x * x + y * y + z * z)
     if r != 0.0:
         v = 1.0/r
-    return v
\ No newline at end of file
+    return v
+
+
+@cython.ufunc
+cdef real prism_fxyz(real x, real y, real z) nogil:
+    """Evaluates the indefinite volume integral for the d**3/(dx * dy * dz) * 1/r kernel.
+
+    This is used to evaluate the magnetic gradient of susceptible prisms.
+
+    Parameters
+    ----------
+    x, y, z : (...) numpy.ndarray
+        The nodal locations to evaluate the function at
+
+    Returns
+    -------
+    (...) numpy.ndarray
+
+    Notes
+    -----
+    Can be used to compute other components by cycling the inputs
+    """
+    return <real> prism_fxyz_double(x, y, z)
+
+
+_KERNEL_IDS = {
+    'prism_f': 0,
+    'prism_fz': 1,
+    'prism_fzz': 2,
+    'prism_fzx': 3,
+    'prism_fzy': 4,
+    'prism_fzzz': 5,
+    'prism_fxxy': 6,
+    'prism_fxxz': 7,
+    'prism_fxyz': 8,
+}
+
+
+cdef inline double _eval_kernel(int kernel, double x, double y, double z) noexcept nogil:
+    if kernel == 0:
+        return prism_f_double(x, y, z)
+    elif kernel == 1:
+        return prism_fz_double(x, y, z)
+    elif kernel == 2:
+        return prism_fzz_double(x, y, z)
+    elif kernel == 3:
+        return prism_fzx_double(x, y, z)
+    elif kernel == 4:
+        return prism_fzy_double(x, y, z)
+    elif kernel == 5:
+        return prism_fzzz_double(x, y, z)
+    elif kernel == 6:
+        return prism_fxxy_double(x, y, z)
+    elif kernel == 7:
+        return prism_fxxz_double(x, y, z)
+    return prism_fxyz_double(x, y, z)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline double _eval_def_int(
+    int kernel, int a, int b, int c, double *d_min, double *d_max
+) noexcept nogil:
+    # d_min and d_max hold the (cycled by a, b, c) offsets to the prism's faces
+    cdef:
+        double v000, v001, v010, v011, v100, v101, v110, v111
+    v000 = _eval_kernel(kernel, d_min[a], d_min[b], d_min[c])
+    v001 = _eval_kernel(kernel, d_min[a], d_min[b], d_max[c])
+    v010 = _eval_kernel(kernel, d_min[a], d_max[b], d_min[c])
+    v011 = _eval_kernel(kernel, d_min[a], d_max[b], d_max[c])
+    v100 = _eval_kernel(kernel, d_max[a], d_min[b], d_min[c])
+    v101 = _eval_kernel(kernel, d_max[a], d_min[b], d_max[c])
+    v110 = _eval_kernel(kernel, d_max[a], d_max[b], d_min[c])
+    v111 = _eval_kernel(kernel, d_max[a], d_max[b], d_max[c])
+    return (v111 - v110 - v101 + v100 - v011 + v010 + v001 - v000)
+
+
+@cython.cdivision
+cdef inline double _point_kernel(int kernel, double x, double y, double z) noexcept nogil:
+    # the derivative of 1/r matching each kernel, at the offset (x, y, z) from a
+    # point source to the location
+    cdef:
+        double r2 = x * x + y * y + z * z
+        double r = sqrt(r2)
+        double r3 = r2 * r
+        double r5 = r3 * r2
+        double r7 = r5 * r2
+    if kernel == 0:
+        return 1.0 / r
+    elif kernel == 1:
+        return -z / r3
+    elif kernel == 2:
+        return (3.0 * z * z - r2) / r5
+    elif kernel == 3:
+        return 3.0 * z * x / r5
+    elif kernel == 4:
+        return 3.0 * z * y / r5
+    elif kernel == 5:
+        return -15.0 * z * z * z / r7 + 9.0 * z / r5
+    elif kernel == 6:
+        return -15.0 * x * x * y / r7 + 3.0 * y / r5
+    elif kernel == 7:
+        return -15.0 * x * x * z / r7 + 3.0 * z / r5
+    return -15.0 * x * y * z / r7
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline bint _is_far(
+    double *d_min, double *d_max, double far_ratio2, double *s, double *volume
+) noexcept nogil:
+    # whether the prism is more than sqrt(far_ratio2) diagonals away from the
+    # location, in which case s is set to the offset from its center to the
+    # location and volume to its volume
+    cdef:
+        double dist2 = 0.0, size2 = 0.0, h
+        int k
+    for k in range(3):
+        s[k] = -0.5 * (d_min[k] + d_max[k])
+        h = d_max[k] - d_min[k]
+        dist2 += s[k] * s[k]
+        size2 += h * h
+    # (written so that an infinite ratio and an empty prism are never far)
+    if not dist2 > far_ratio2 * size2:
+        return False
+    volume[0] = (d_max[0] - d_min[0]) * (d_max[1] - d_min[1]) * (d_max[2] - d_min[2])
+    return True
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline double _eval_def_int_far(
+    int kernel, int a, int b, int c, double *d_min, double *d_max, double far_ratio2
+) noexcept nogil:
+    # the definite integral, or the point source approximation of it far from the prism
+    cdef double s[3]
+    cdef double volume
+    if _is_far(d_min, d_max, far_ratio2, s, &volume):
+        return -volume * _point_kernel(kernel, s[a], s[b], s[c])
+    return _eval_def_int(kernel, a, b, c, d_min, d_max)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _prism_def_int_matrix(
+    str kernel_name,
+    const double[:, :] xyz,
+    const double[:, :] min_location,
+    const double[:, :] max_location,
+    int cycle,
+    double far_ratio,
+    real[:, :] out,
+):
+    """Fill out[i, j] with the definite integral of a kernel over prism j at receiver i.
+
+    Prisms more than far_ratio diagonals away from a receiver are approximated by
+    points at their centers. The integrals are always computed in double precision,
+    and out may be float or double."""
+    cdef:
+        int kernel = _KERNEL_IDS[kernel_name]
+        int a = cycle % 3, b = (cycle + 1) % 3, c = (cycle + 2) % 3
+        Py_ssize_t i, j, k
+        Py_ssize_t n_rx = xyz.shape[0], n_prism = min_location.shape[0]
+        double d_min[3]
+        double d_max[3]
+        double far_ratio2 = far_ratio * far_ratio
+
+    with nogil:
+        for i in range(n_rx):
+            for j in range(n_prism):
+                for k in range(3):
+                    d_min[k] = min_location[j, k] - xyz[i, k]
+                    d_max[k] = max_location[j, k] - xyz[i, k]
+                out[i, j] = _eval_def_int_far(kernel, a, b, c, d_min, d_max, far_ratio2)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _prism_def_int_sum(
+    str kernel_name,
+    const double[:, :] xyz,
+    const double[:, :] min_location,
+    const double[:, :] max_location,
+    int cycle,
+    double far_ratio,
+    const double[:, :] weights,
+    real[:, :] out,
+):
+    """Fill out[i, w] with the sum over prisms j of weights[j, w] times the definite
+    integral of a kernel over prism j at receiver i (see _prism_def_int_matrix)."""
+    cdef:
+        int kernel = _KERNEL_IDS[kernel_name]
+        int a = cycle % 3, b = (cycle + 1) % 3, c = (cycle + 2) % 3
+        Py_ssize_t i, j, k, w
+        Py_ssize_t n_rx = xyz.shape[0], n_prism = min_location.shape[0]
+        Py_ssize_t n_w = weights.shape[1]
+        double d_min[3]
+        double d_max[3]
+        double val
+        double far_ratio2 = far_ratio * far_ratio
+        double[::1] acc = np.empty(n_w)
+
+    with nogil:
+        for i in range(n_rx):
+            acc[:] = 0.0
+            for j in range(n_prism):
+                for k in range(3):
+                    d_min[k] = min_location[j, k] - xyz[i, k]
+                    d_max[k] = max_location[j, k] - xyz[i, k]
+                val = _eval_def_int_far(kernel, a, b, c, d_min, d_max, far_ratio2)
+                for w in range(n_w):
+                    acc[w] += weights[j, w] * val
+            for w in range(n_w):
+                out[i, w] = <real> acc[w]
+
+
+cdef void _difference_nodes(
+    double *nodes, Py_ssize_t nx, Py_ssize_t ny, Py_ssize_t nz
+) noexcept nogil:
+    # differences the (nx, ny, nz) node values along each axis (in place), leaving
+    # the cell (i, j, k) integral at node (i, j, k).
+    cdef:
+        Py_ssize_t i, j, k, n
+
+    for k in range(nz):
+        for j in range(ny):
+            n = nx * (j + ny * k)
+            for i in range(nx - 1):
+                nodes[n + i] = nodes[n + i + 1] - nodes[n + i]
+    for k in range(nz):
+        for j in range(ny - 1):
+            n = nx * (j + ny * k)
+            for i in range(nx - 1):
+                nodes[n + i] = nodes[n + nx + i] - nodes[n + i]
+    for k in range(nz - 1):
+        for j in range(ny - 1):
+            n = nx * (j + ny * k)
+            for i in range(nx - 1):
+                nodes[n + i] = nodes[n + nx * ny + i] - nodes[n + i]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _tensor_cell_integrals(
+    int kernel, int a, int b, int c,
+    const double[:] x_nodes, const double[:] y_nodes, const double[:] z_nodes,
+    double x, double y, double z, double[::1] nodes,
+) noexcept nogil:
+    # evaluates the kernel once at every node of the tensor grid, then differences
+    # the node values along each axis.
+    cdef:
+        Py_ssize_t nx = x_nodes.shape[0], ny = y_nodes.shape[0], nz = z_nodes.shape[0]
+        Py_ssize_t i, j, k, n
+        double d[3]
+
+    for k in range(nz):
+        d[2] = z_nodes[k] - z
+        for j in range(ny):
+            d[1] = y_nodes[j] - y
+            n = nx * (j + ny * k)
+            for i in range(nx):
+                d[0] = x_nodes[i] - x
+                nodes[n + i] = _eval_kernel(kernel, d[a], d[b], d[c])
+
+    _difference_nodes(&nodes[0], nx, ny, nz)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _prism_tensor_def_int_matrix(
+    str kernel_name,
+    const double[:, :] xyz,
+    const double[:] x_nodes,
+    const double[:] y_nodes,
+    const double[:] z_nodes,
+    int cycle,
+    real[:, :] out,
+):
+    """Fill out[i, j] with the definite integral of a kernel over cell j of a tensor
+    grid (x fastest) at receiver i."""
+    cdef:
+        int kernel = _KERNEL_IDS[kernel_name]
+        int a = cycle % 3, b = (cycle + 1) % 3, c = (cycle + 2) % 3
+        Py_ssize_t nx = x_nodes.shape[0], ny = y_nodes.shape[0], nz = z_nodes.shape[0]
+        Py_ssize_t i, ic, jc, kc, n, m
+        double[::1] nodes = np.empty(nx * ny * nz)
+
+    with nogil:
+        for i in range(xyz.shape[0]):
+            _tensor_cell_integrals(
+                kernel, a, b, c, x_nodes, y_nodes, z_nodes,
+                xyz[i, 0], xyz[i, 1], xyz[i, 2], nodes
+            )
+            m = 0
+            for kc in range(nz - 1):
+                for jc in range(ny - 1):
+                    n = nx * (jc + ny * kc)
+                    for ic in range(nx - 1):
+                        out[i, m] = nodes[n + ic]
+                        m += 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _prism_tensor_def_int_sum(
+    str kernel_name,
+    const double[:, :] xyz,
+    const double[:] x_nodes,
+    const double[:] y_nodes,
+    const double[:] z_nodes,
+    int cycle,
+    const double[:, :] weights,
+    real[:, :] out,
+):
+    """Fill out[i, w] with the sum over the cells j of a tensor grid (x fastest) of
+    weights[j, w] times the definite integral of a kernel over cell j at receiver i."""
+    cdef:
+        int kernel = _KERNEL_IDS[kernel_name]
+        int a = cycle % 3, b = (cycle + 1) % 3, c = (cycle + 2) % 3
+        Py_ssize_t nx = x_nodes.shape[0], ny = y_nodes.shape[0], nz = z_nodes.shape[0]
+        Py_ssize_t n_w = weights.shape[1]
+        Py_ssize_t i, ic, jc, kc, n, m, w
+        double[::1] nodes = np.empty(nx * ny * nz)
+        double val
+        double[::1] acc = np.empty(n_w)
+
+    with nogil:
+        for i in range(xyz.shape[0]):
+            _tensor_cell_integrals(
+                kernel, a, b, c, x_nodes, y_nodes, z_nodes,
+                xyz[i, 0], xyz[i, 1], xyz[i, 2], nodes
+            )
+            acc[:] = 0.0
+            m = 0
+            for kc in range(nz - 1):
+                for jc in range(ny - 1):
+                    n = nx * (jc + ny * kc)
+                    for ic in range(nx - 1):
+                        val = nodes[n + ic]
+                        for w in range(n_w):
+                            acc[w] += weights[m, w] * val
+                        m += 1
+            for w in range(n_w):
+                out[i, w] = <real> acc[w]
+
+
+# Fused kernels that evaluate every component of the second (or third) derivative
+# tensor of 1/r at once, sharing r and the other common terms. The components are
+# ordered as (xx, xy, xz, yy, yz, zz) and (xxx, xxy, xxz, xyy, xyz, xzz, yyy, yyz,
+# yzz, zzz), and each equals the corresponding (cycled) prism_f* kernel above.
+
+cdef inline double _neg_log_plus_r(double a, double r) noexcept nogil:
+    cdef double v = a + r
+    if v == 0.0:
+        if a < 0:
+            v = log(-2 * a)
+    else:
+        v = -log(v)
+    return v
+
+
+@cython.cdivision
+cdef inline void _prism_f2(double x, double y, double z, double *v) noexcept nogil:
+    cdef:
+        double r = sqrt(x * x + y * y + z * z)
+
+    # xx = fzz(y, z, x), yy = fzz(z, x, y), zz = fzz(x, y, z)
+    v[0] = atan(y * z / (x * r)) if x != 0.0 else 0.0
+    v[3] = atan(z * x / (y * r)) if y != 0.0 else 0.0
+    v[5] = atan(x * y / (z * r)) if z != 0.0 else 0.0
+    # xy = fzx(y, z, x), xz = fzx(x, y, z), yz = fzy(x, y, z)
+    v[1] = _neg_log_plus_r(z, r)
+    v[2] = _neg_log_plus_r(y, r)
+    v[4] = _neg_log_plus_r(x, r)
+
+
+@cython.cdivision
+cdef inline void _prism_f3(double x, double y, double z, double *v) noexcept nogil:
+    cdef:
+        double xx = x * x, yy = y * y, zz = z * z
+        double xy = xx + yy, xz = xx + zz, yz = yy + zz
+        double r = sqrt(xx + yy + zz)
+        double inv_r = 0.0
+    if r != 0.0:
+        inv_r = 1.0 / r
+
+    # xxx = fzzz(y, z, x), yyy = fzzz(z, x, y), zzz = fzzz(x, y, z)
+    v[0] = ((1.0 / xy if xy != 0.0 else 0.0) + (1.0 / xz if xz != 0.0 else 0.0)) * y * z * inv_r
+    v[6] = ((1.0 / yz if yz != 0.0 else 0.0) + (1.0 / xy if xy != 0.0 else 0.0)) * z * x * inv_r
+    v[9] = ((1.0 / xz if xz != 0.0 else 0.0) + (1.0 / yz if yz != 0.0 else 0.0)) * x * y * inv_r
+    # xxy = fxxy(x, y, z), xxz = fxxz(x, y, z)
+    v[1] = - x * z / (xy * r) if x != 0.0 else 0.0
+    v[2] = - x * y / (xz * r) if x != 0.0 else 0.0
+    # xyy = fxxz(y, z, x), yyz = fxxy(y, z, x)
+    v[3] = - y * z / (xy * r) if y != 0.0 else 0.0
+    v[7] = - y * x / (yz * r) if y != 0.0 else 0.0
+    # xzz = fxxy(z, x, y), yzz = fxxz(z, x, y)
+    v[5] = - z * y / (xz * r) if z != 0.0 else 0.0
+    v[8] = - z * x / (yz * r) if z != 0.0 else 0.0
+    # xyz = fxyz(x, y, z)
+    v[4] = inv_r
+
+
+cdef inline void _eval_derivatives(
+    int order, double x, double y, double z, double *v
+) noexcept nogil:
+    if order == 2:
+        _prism_f2(x, y, z, v)
+    else:
+        _prism_f3(x, y, z, v)
+
+
+@cython.cdivision
+cdef inline void _prism_f2_def_int(double *d_min, double *d_max, double *out) noexcept nogil:
+    # The definite integral of the second derivatives. The three log components are
+    # summed over the corners as the log of a ratio of products, so only 3 logs are
+    # needed per prism (rather than 3 per corner), unless a log's argument is 0.
+    cdef:
+        double x, y, z, r, sign
+        double num[3]
+        double den[3]
+        int i, j, k, m
+        bint positive = True
+
+    for m in range(6):
+        out[m] = 0.0
+    for m in range(3):
+        num[m] = 1.0
+        den[m] = 1.0
+    for i in range(2):
+        x = d_max[0] if i else d_min[0]
+        for j in range(2):
+            y = d_max[1] if j else d_min[1]
+            for k in range(2):
+                z = d_max[2] if k else d_min[2]
+                sign = 1.0 if (i + j + k) % 2 == 1 else -1.0
+                r = sqrt(x * x + y * y + z * z)
+                if x != 0.0:
+                    out[0] += sign * atan(y * z / (x * r))
+                if y != 0.0:
+                    out[3] += sign * atan(z * x / (y * r))
+                if z != 0.0:
+                    out[5] += sign * atan(x * y / (z * r))
+                positive = positive and (z + r > 0.0) and (y + r > 0.0) and (x + r > 0.0)
+                if sign > 0:
+                    num[0] *= z + r
+                    num[1] *= y + r
+                    num[2] *= x + r
+                else:
+                    den[0] *= z + r
+                    den[1] *= y + r
+                    den[2] *= x + r
+    if positive:
+        # corner (1, 1, 1) has a positive sign, and the log terms are negated.
+        out[1] = -log(num[0] / den[0])
+        out[2] = -log(num[1] / den[1])
+        out[4] = -log(num[2] / den[2])
+    else:
+        out[1] = 0.0
+        out[2] = 0.0
+        out[4] = 0.0
+        for i in range(2):
+            x = d_max[0] if i else d_min[0]
+            for j in range(2):
+                y = d_max[1] if j else d_min[1]
+                for k in range(2):
+                    z = d_max[2] if k else d_min[2]
+                    sign = 1.0 if (i + j + k) % 2 == 1 else -1.0
+                    r = sqrt(x * x + y * y + z * z)
+                    out[1] += sign * _neg_log_plus_r(z, r)
+                    out[2] += sign * _neg_log_plus_r(y, r)
+                    out[4] += sign * _neg_log_plus_r(x, r)
+
+
+@cython.cdivision
+cdef inline void _point_derivatives(
+    int order, double x, double y, double z, double *out
+) noexcept nogil:
+    # every component of the order 2 or 3 derivative tensor of 1/r at (x, y, z),
+    # ordered as in _eval_derivatives
+    cdef:
+        double r2 = x * x + y * y + z * z
+        double r = sqrt(r2)
+        double r5 = r2 * r2 * r
+        double r7 = r5 * r2
+    if order == 2:
+        out[0] = (3.0 * x * x - r2) / r5
+        out[1] = 3.0 * x * y / r5
+        out[2] = 3.0 * x * z / r5
+        out[3] = (3.0 * y * y - r2) / r5
+        out[4] = 3.0 * y * z / r5
+        out[5] = (3.0 * z * z - r2) / r5
+        return
+    out[0] = -15.0 * x * x * x / r7 + 9.0 * x / r5
+    out[1] = -15.0 * x * x * y / r7 + 3.0 * y / r5
+    out[2] = -15.0 * x * x * z / r7 + 3.0 * z / r5
+    out[3] = -15.0 * x * y * y / r7 + 3.0 * x / r5
+    out[4] = -15.0 * x * y * z / r7
+    out[5] = -15.0 * x * z * z / r7 + 3.0 * x / r5
+    out[6] = -15.0 * y * y * y / r7 + 9.0 * y / r5
+    out[7] = -15.0 * y * y * z / r7 + 3.0 * z / r5
+    out[8] = -15.0 * y * z * z / r7 + 3.0 * y / r5
+    out[9] = -15.0 * z * z * z / r7 + 9.0 * z / r5
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void _eval_derivative_def_int_far(
+    int order, int n_comp, double *d_min, double *d_max, double far_ratio2, double *out
+) noexcept nogil:
+    # the definite integrals, or the point source approximation of them far from the prism
+    cdef double s[3]
+    cdef double volume
+    cdef int m
+    if _is_far(d_min, d_max, far_ratio2, s, &volume):
+        _point_derivatives(order, s[0], s[1], s[2], out)
+        for m in range(n_comp):
+            out[m] = -volume * out[m]
+        return
+    _eval_derivative_def_int(order, n_comp, d_min, d_max, out)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline void _eval_derivative_def_int(
+    int order, int n_comp, double *d_min, double *d_max, double *out
+) noexcept nogil:
+    cdef:
+        double v000[10]
+        double v001[10]
+        double v010[10]
+        double v011[10]
+        double v100[10]
+        double v101[10]
+        double v110[10]
+        double v111[10]
+        int m
+    if order == 2:
+        _prism_f2_def_int(d_min, d_max, out)
+        return
+    _eval_derivatives(order, d_min[0], d_min[1], d_min[2], v000)
+    _eval_derivatives(order, d_min[0], d_min[1], d_max[2], v001)
+    _eval_derivatives(order, d_min[0], d_max[1], d_min[2], v010)
+    _eval_derivatives(order, d_min[0], d_max[1], d_max[2], v011)
+    _eval_derivatives(order, d_max[0], d_min[1], d_min[2], v100)
+    _eval_derivatives(order, d_max[0], d_min[1], d_max[2], v101)
+    _eval_derivatives(order, d_max[0], d_max[1], d_min[2], v110)
+    _eval_derivatives(order, d_max[0], d_max[1], d_max[2], v111)
+    for m in range(n_comp):
+        out[m] = (
+            v111[m] - v110[m] - v101[m] + v100[m]
+            - v011[m] + v010[m] + v001[m] - v000[m]
+        )
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _prism_derivative_def_int_matrix(
+    int order,
+    const double[:, :] xyz,
+    const double[:, :] min_location,
+    const double[:, :] max_location,
+    double far_ratio,
+    real[:, :, :] out,
+):
+    """Fill out[i, m, j] with the definite integral of derivative component m over
+    prism j at receiver i, approximating prisms more than far_ratio diagonals away
+    from the receiver by points."""
+    cdef:
+        int n_comp = 6 if order == 2 else 10
+        Py_ssize_t i, j, k, m
+        Py_ssize_t n_rx = xyz.shape[0], n_prism = min_location.shape[0]
+        double d_min[3]
+        double d_max[3]
+        double val[10]
+        double far_ratio2 = far_ratio * far_ratio
+
+    with nogil:
+        for i in range(n_rx):
+            for j in range(n_prism):
+                for k in range(3):
+                    d_min[k] = min_location[j, k] - xyz[i, k]
+                    d_max[k] = max_location[j, k] - xyz[i, k]
+                _eval_derivative_def_int_far(order, n_comp, d_min, d_max, far_ratio2, val)
+                for m in range(n_comp):
+                    out[i, m, j] = val[m]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _prism_derivative_def_int_sum(
+    int order,
+    const double[:, :] xyz,
+    const double[:, :] min_location,
+    const double[:, :] max_location,
+    double far_ratio,
+    const double[:, :] weights,
+    real[:, :, :] out,
+):
+    """Fill out[i, m, w] with the sum over prisms j of weights[j, w] times the definite
+    integral of derivative component m over prism j at receiver i (see
+    _prism_derivative_def_int_matrix)."""
+    cdef:
+        int n_comp = 6 if order == 2 else 10
+        Py_ssize_t i, j, k, m, w
+        Py_ssize_t n_rx = xyz.shape[0], n_prism = min_location.shape[0]
+        Py_ssize_t n_w = weights.shape[1]
+        double d_min[3]
+        double d_max[3]
+        double val[10]
+        double far_ratio2 = far_ratio * far_ratio
+        double[:, ::1] acc = np.empty((n_comp, n_w))
+
+    with nogil:
+        for i in range(n_rx):
+            acc[:, :] = 0.0
+            for j in range(n_prism):
+                for k in range(3):
+                    d_min[k] = min_location[j, k] - xyz[i, k]
+                    d_max[k] = max_location[j, k] - xyz[i, k]
+                _eval_derivative_def_int_far(order, n_comp, d_min, d_max, far_ratio2, val)
+                for m in range(n_comp):
+                    for w in range(n_w):
+                        acc[m, w] += weights[j, w] * val[m]
+            for m in range(n_comp):
+                for w in range(n_w):
+                    out[i, m, w] = <real> acc[m, w]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void _tensor_derivative_cell_integrals(
+    int order, int n_comp,
+    const double[:] x_nodes, const double[:] y_nodes, const double[:] z_nodes,
+    double x, double y, double z, double[:, ::1] nodes,
+) noexcept nogil:
+    # evaluates every derivative component once at each node of the tensor grid,
+    # then differences each component's node values along each axis.
+    cdef:
+        Py_ssize_t nx = x_nodes.shape[0], ny = y_nodes.shape[0], nz = z_nodes.shape[0]
+        Py_ssize_t i, j, k, n, m
+        double dx, dy, dz
+        double val[10]
+
+    for k in range(nz):
+        dz = z_nodes[k] - z
+        for j in range(ny):
+            dy = y_nodes[j] - y
+            n = nx * (j + ny * k)
+            for i in range(nx):
+                dx = x_nodes[i] - x
+                _eval_derivatives(order, dx, dy, dz, val)
+                for m in range(n_comp):
+                    nodes[m, n + i] = val[m]
+
+    for m in range(n_comp):
+        _difference_nodes(&nodes[m, 0], nx, ny, nz)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _prism_tensor_derivative_def_int_matrix(
+    int order,
+    const double[:, :] xyz,
+    const double[:] x_nodes,
+    const double[:] y_nodes,
+    const double[:] z_nodes,
+    real[:, :, :] out,
+):
+    """Fill out[i, m, j] with the definite integral of derivative component m over
+    cell j of a tensor grid (x fastest) at receiver i."""
+    cdef:
+        int n_comp = 6 if order == 2 else 10
+        Py_ssize_t nx = x_nodes.shape[0], ny = y_nodes.shape[0], nz = z_nodes.shape[0]
+        Py_ssize_t i, ic, jc, kc, n, m, c
+        double[:, ::1] nodes = np.empty((n_comp, nx * ny * nz))
+
+    with nogil:
+        for i in range(xyz.shape[0]):
+            _tensor_derivative_cell_integrals(
+                order, n_comp, x_nodes, y_nodes, z_nodes,
+                xyz[i, 0], xyz[i, 1], xyz[i, 2], nodes
+            )
+            for c in range(n_comp):
+                m = 0
+                for kc in range(nz - 1):
+                    for jc in range(ny - 1):
+                        n = nx * (jc + ny * kc)
+                        for ic in range(nx - 1):
+                            out[i, c, m] = nodes[c, n + ic]
+                            m += 1
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _prism_tensor_derivative_def_int_sum(
+    int order,
+    const double[:, :] xyz,
+    const double[:] x_nodes,
+    const double[:] y_nodes,
+    const double[:] z_nodes,
+    const double[:, :] weights,
+    real[:, :, :] out,
+):
+    """Fill out[i, m, w] with the sum over the cells j of a tensor grid (x fastest) of
+    weights[j, w] times the definite integral of derivative component m over cell j
+    at receiver i."""
+    cdef:
+        int n_comp = 6 if order == 2 else 10
+        Py_ssize_t nx = x_nodes.shape[0], ny = y_nodes.shape[0], nz = z_nodes.shape[0]
+        Py_ssize_t n_w = weights.shape[1]
+        Py_ssize_t i, ic, jc, kc, n, m, c, w
+        double[:, ::1] nodes = np.empty((n_comp, nx * ny * nz))
+        double val
+        double[::1] acc = np.empty(n_w)
+
+    with nogil:
+        for i in range(xyz.shape[0]):
+            _tensor_derivative_cell_integrals(
+                order, n_comp, x_nodes, y_nodes, z_nodes,
+                xyz[i, 0], xyz[i, 1], xyz[i, 2], nodes
+            )
+            for c in range(n_comp):
+                acc[:] = 0.0
+                m = 0
+                for kc in range(nz - 1):
+                    for jc in range(ny - 1):
+                        n = nx * (jc + ny * kc)
+                        for ic in range(nx - 1):
+                            val = nodes[c, n + ic]
+                            for w in range(n_w):
+                                acc[w] += weights[m, w] * val
+                            m += 1
+                for w in range(n_w):
+                    out[i, c, w] = <real> acc[w]
@@ -6,6 +6,8 @@ cimport cython
 from libcpp.complex cimport complex, sqrt, exp
 from libcpp cimport bool
 
+from geoana.kernels.parallel import _check_n_threads
+
 ctypedef np.float64_t REAL_t
 ctypedef np.intp_t SIZE_t
 ctypedef np.complex128_t COMPLEX_t
@@ -21,7 +23,8 @@ cdef extern from "_rTE.h" namespace "funcs":
         double *thicks,
         SIZE_t n_frequency,
         SIZE_t n_filter,
-        SIZE_t n_layers
+        SIZE_t n_layers,
+        SIZE_t n_threads
         ) nogil
 
     void rTEgrad(
@@ -35,10 +38,62 @@ cdef extern from "_rTE.h" namespace "funcs":
         double * h,
         SIZE_t n_frequency,
         SIZE_t n_filter,
-        SIZE_t n_layers
+        SIZE_t n_layers,
+        SIZE_t n_threads
     ) nogil
 
-def rTE_forward(frequencies, lamb, sigma, mu, thicknesses):
+    void rTE_batch(
+        complex_t *TE,
+        double *frequencies,
+        double *lambdas,
+        complex_t *sigmas,
+        double *mus,
+        double *thicks,
+        SIZE_t n_model,
+        SIZE_t n_frequency,
+        SIZE_t n_filter,
+        SIZE_t n_layers,
+        SIZE_t n_threads
+    ) nogil
+
+    void rTEgrad_batch(
+        complex_t * TE_dsigma,
+        complex_t * TE_dmu,
+        complex_t * TE_dh,
+        double * frequencies,
+        double * lambdas,
+        complex_t * sigmas,
+        double * mus,
+        double * h,
+        SIZE_t n_model,
+        SIZE_t n_frequency,
+        SIZE_t n_filter,
+        SIZE_t n_layers,
+        SIZE_t n_threads
+    ) nogil
+
+# C entry points of the kernels for numba (see the overloads in __init__.py),
+# with the complex arrays as pointers to (real, imag) pairs of doubles.
+cdef api void _rTE(
+    double *TE, double *frequencies, double *lambdas, double *sigmas, double *mus,
+    double *thicks, SIZE_t n_frequency, SIZE_t n_filter, SIZE_t n_layers,
+    SIZE_t n_threads
+) noexcept nogil:
+    rTE(<complex_t *> TE, frequencies, lambdas, <complex_t *> sigmas, mus, thicks,
+        n_frequency, n_filter, n_layers, n_threads)
+
+
+cdef api void _rTEgrad(
+    double *TE_dsigma, double *TE_dmu, double *TE_dh, double *frequencies,
+    double *lambdas, double *sigmas, double *mus, double *h, SIZE_t n_frequency,
+    SIZE_t n_filter, SIZE_t n_layers, SIZE_t n_threads
+) noexcept nogil:
+    rTEgrad(<complex_t *> TE_dsigma, <complex_t *> TE_dmu, <complex_t *> TE_dh,
+            frequencies, lambdas, <complex_t *> sigmas, mus, h,
+            n_frequency, n_filter, n_layers, n_threads)
+
+
+def rTE_forward(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
     """Compute reflection coefficients for Transverse Electric (TE) mode.
 
     The first layer is considered to be the top most layer. The last
@@ -57,12 +112,18 @@ def rTE_forward(frequencies, lamb, sigma, mu, thicknesses):
         Magnetic permeability (H/m), shape = (n_layer, n_frequency).
     thicknesses: float, numpy.ndarray
         Thickness (m) of each layer, shape = (n_layer-1,).
+    n_threads : int, optional
+        Number of threads to split the filters over. Defaults to the value set
+        by :func:`geoana.kernels.set_num_threads`. The result is identical
+        for any number of threads.
 
     Returns
     -------
     rTE: complex numpy.ndarray
         Reflection coefficients, shape = (n_frequency, n_filter)
     """
+    n_threads = _check_n_threads(n_threads)
+
     # Sigma and mu must be fortran contiguous
     sigma = np.require(sigma, dtype=np.complex128, requirements="F")
     mu = np.require(mu, dtype=np.float64, requirements="F")
@@ -87,14 +148,15 @@ def rTE_forward(frequencies, lamb, sigma, mu, thicknesses):
         )
 
     cdef:
-        REAL_t[:] f = frequencies
-        REAL_t[:] lam = lamb
-        COMPLEX_t[:, :] sig = sigma
-        REAL_t[:, :] c_mu = mu
-        REAL_t[:] hs = thicknesses
+        const REAL_t[:] f = frequencies
+        const REAL_t[:] lam = lamb
+        const COMPLEX_t[:, :] sig = sigma
+        const REAL_t[:, :] c_mu = mu
+        const REAL_t[:] hs = thicknesses
 
     cdef:
         SIZE_t n_frequency, n_filter, n_layers
+        SIZE_t n_thread = n_threads
 
 
     n_frequency = f.shape[0]
@@ -109,14 +171,16 @@ def rTE_forward(frequencies, lamb, sigma, mu, thicknesses):
         complex_t *sig_p = <complex_t *> &sig[0, 0]
         REAL_t *h_p = NULL
     if n_layers > 1:
-        h_p = &hs[0]
+        h_p = <REAL_t *> &hs[0]
 
-    rTE(out_p, &f[0], &lam[0], sig_p, &c_mu[0, 0], h_p,
-          n_frequency, n_filter, n_layers)
+    with nogil:
+        rTE(out_p, <REAL_t *> &f[0], <REAL_t *> &lam[0], sig_p,
+              <REAL_t *> &c_mu[0, 0], h_p,
+              n_frequency, n_filter, n_layers, n_thread)
 
     return np.array(out)
 
-def rTE_gradient(frequencies, lamb, sigma, mu, thicknesses):
+def rTE_gradient(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
     """Compute reflection coefficients for Transverse Electric (TE) mode.
 
     The first layer is considered to be the top most layer. The last
@@ -135,6 +199,10 @@ def rTE_gradient(frequencies, lamb, sigma, mu, thicknesses):
         Magnetic permeability (H/m), shape = (n_layer, n_frequency).
     thicknesses: float, numpy.ndarray
         Thickness (m) of each layer, shape = (n_layer-1,).
+    n_threads : int, optional
+        Number of threads to split the filters over. Defaults to the value set
+        by :func:`geoana.kernels.set_num_threads`. The result is identical
+        for any number of threads.
 
     Returns
     -------
@@ -148,6 +216,8 @@ def rTE_gradient(frequencies, lamb, sigma, mu, thicknesses):
         Reflection coefficients gradient w.r.t. magnetic permeability
         shape = (n_layer, n_frequency, n_filter)
     """
+    n_threads = _check_n_threads(n_threads)
+
     # Require that they are all the same ordering as sigma
     sigma = np.require(sigma, dtype=np.complex128, requirements="F")
     mu = np.require(mu, dtype=np.float64, requirements="F")
@@ -170,14 +240,15 @@ def rTE_gradient(frequencies, lamb, sigma, mu, thicknesses):
         )
 
     cdef:
-        REAL_t[:] f = frequencies
-        REAL_t[:] lam = lamb
-        COMPLEX_t[:, :] sig = sigma
-        REAL_t[:, :] c_mu = mu
-        REAL_t[:] hs = thicknesses
+        const REAL_t[:] f = frequencies
+        const REAL_t[:] lam = lamb
+        const COMPLEX_t[:, :] sig = sigma
+        const REAL_t[:, :] c_mu = mu
+        const REAL_t[:] hs = thicknesses
 
     cdef:
         SIZE_t n_frequency, n_filter, n_layers
+        SIZE_t n_thread = n_threads
 
 
     n_frequency = f.shape[0]
@@ -196,10 +267,214 @@ def rTE_gradient(frequencies, lamb, sigma, mu, thicknesses):
         complex_t *gh_p = NULL
         REAL_t *h_p = NULL
     if n_layers > 1:
-        h_p = &hs[0]
+        h_p = <REAL_t *> &hs[0]
         gh_p = <complex_t *> &gh[0, 0, 0]
 
-    rTEgrad(gsig_p, gmu_p, gh_p, &f[0], &lam[0], sig_p, &c_mu[0, 0], h_p,
-          n_frequency, n_filter, n_layers)
+    with nogil:
+        rTEgrad(gsig_p, gmu_p, gh_p, <REAL_t *> &f[0], <REAL_t *> &lam[0], sig_p,
+              <REAL_t *> &c_mu[0, 0], h_p,
+              n_frequency, n_filter, n_layers, n_thread)
 
     return np.array(gsig), np.array(gh), np.array(gmu)
+
+
+def _prepare_batch_arguments(frequencies, lamb, sigma, mu, thicknesses):
+    """Convert and check the stacked arguments of the batched kernels.
+
+    The physical properties are returned with their model axis moved last
+    and in fortran order, so that each model's (n_layer, n_frequency) block
+    is contiguous and laid out the same as for the single model kernels.
+    """
+    frequencies = np.require(frequencies, dtype=np.float64, requirements="C")
+    sigma = np.asarray(sigma)
+    mu = np.asarray(mu)
+    lamb = np.asarray(lamb, dtype=np.float64)
+    thicknesses = np.asarray(thicknesses, dtype=np.float64)
+
+    # Dimension checking
+    if sigma.ndim != 3:
+        raise ValueError(
+            f"sigma must be a (n_model, n_layer, n_frequency) array. Got {sigma.shape}"
+        )
+    n_model, n_layers, n_frequency = sigma.shape
+    if lamb.ndim == 1:
+        lamb = np.broadcast_to(lamb, (n_model, lamb.shape[0]))
+    if thicknesses.ndim == 1:
+        thicknesses = np.broadcast_to(thicknesses, (n_model, thicknesses.shape[0]))
+
+    if frequencies.ndim != 1 or frequencies.shape[0] != n_frequency:
+        raise ValueError(
+            f"sigma array's last dimension must be the same as the frequency arrays first. Got {sigma.shape} and {frequencies.shape}"
+        )
+    if lamb.ndim != 2 or lamb.shape[0] != n_model:
+        raise ValueError(
+            f"lamb must be a (n_filter,) or (n_model, n_filter) array. Got {lamb.shape} for {n_model} models"
+        )
+    if thicknesses.shape != (n_model, n_layers-1):
+        raise ValueError(
+            f"thicknesses must be a (n_layer-1,) or (n_model, n_layer-1) array. Got {thicknesses.shape} for {n_model} models with {n_layers} layers"
+        )
+    if mu.shape != sigma.shape:
+        raise ValueError(
+            f"mu array must match sigma array shape. Got {mu.shape} and {sigma.shape}"
+        )
+
+    sigma = np.require(np.moveaxis(sigma, 0, -1), dtype=np.complex128, requirements="F")
+    mu = np.require(np.moveaxis(mu, 0, -1), dtype=np.float64, requirements="F")
+    lamb = np.require(lamb, dtype=np.float64, requirements="C")
+    thicknesses = np.require(thicknesses, dtype=np.float64, requirements="C")
+    return frequencies, lamb, sigma, mu, thicknesses
+
+
+def rTE_forward_batch(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
+    """Compute TE reflection coefficients for many layered models at once.
+
+    This is the batched version of :func:`rTE_forward`. Each model has its
+    own physical properties, layer thicknesses and spatial wavenumbers,
+    while all models share the same frequencies and number of layers.
+
+    Parameters
+    ----------
+    frequencies : float, numpy.ndarray
+        Frequency (Hz); shape = (n_frequency, ).
+    lamb : float, numpy.ndarray
+        Spatial wavenumber (1/m), shape = (n_model, n_filter) or (n_filter, ),
+        if it is shared by all models.
+    sigma: complex, numpy.ndarray
+        Conductivity (S/m), shape = (n_model, n_layer, n_frequency).
+    mu: complex, numpy.ndarray
+        Magnetic permeability (H/m), shape = (n_model, n_layer, n_frequency).
+    thicknesses: float, numpy.ndarray
+        Thickness (m) of each layer, shape = (n_model, n_layer-1) or
+        (n_layer-1, ), if it is shared by all models.
+    n_threads : int, optional
+        Number of threads to split the models and filters over. Defaults to
+        the value set by :func:`geoana.kernels.set_num_threads`.
+
+    Returns
+    -------
+    rTE: complex numpy.ndarray
+        Reflection coefficients, shape = (n_model, n_frequency, n_filter)
+    """
+    n_threads = _check_n_threads(n_threads)
+    frequencies, lamb, sigma, mu, thicknesses = _prepare_batch_arguments(
+        frequencies, lamb, sigma, mu, thicknesses
+    )
+
+    cdef:
+        SIZE_t n_model = sigma.shape[2]
+        SIZE_t n_frequency = sigma.shape[1]
+        SIZE_t n_layers = sigma.shape[0]
+        SIZE_t n_filter = lamb.shape[1]
+        SIZE_t n_thread = n_threads
+
+    # (n_frequency, n_filter) blocks for each model stored one after another.
+    out = np.empty((n_frequency, n_filter, n_model), dtype=np.complex128, order="F")
+    if out.size == 0:
+        return np.moveaxis(out, -1, 0)
+
+    cdef:
+        const REAL_t[:] f = frequencies
+        const REAL_t[:, ::1] lam = lamb
+        const COMPLEX_t[::1, :, :] sig = sigma
+        const REAL_t[::1, :, :] c_mu = mu
+        const REAL_t[:, ::1] hs = thicknesses
+        COMPLEX_t[::1, :, :] c_out = out
+
+    cdef:
+        complex_t *out_p = <complex_t *> &c_out[0, 0, 0]
+        complex_t *sig_p = <complex_t *> &sig[0, 0, 0]
+        REAL_t *h_p = NULL
+    if n_layers > 1:
+        h_p = <REAL_t *> &hs[0, 0]
+
+    with nogil:
+        rTE_batch(out_p, <REAL_t *> &f[0], <REAL_t *> &lam[0, 0], sig_p,
+                  <REAL_t *> &c_mu[0, 0, 0], h_p,
+                  n_model, n_frequency, n_filter, n_layers, n_thread)
+
+    return np.moveaxis(out, -1, 0)
+
+
+def rTE_gradient_batch(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
+    """Compute TE reflection coefficient gradients for many layered models at once.
+
+    This is the batched version of :func:`rTE_gradient`. Each model has its
+    own physical properties, layer thicknesses and spatial wavenumbers,
+    while all models share the same frequencies and number of layers.
+
+    Parameters
+    ----------
+    frequencies : float, numpy.ndarray
+        Frequency (Hz); shape = (n_frequency, ).
+    lamb : float, numpy.ndarray
+        Spatial wavenumber (1/m), shape = (n_model, n_filter) or (n_filter, ),
+        if it is shared by all models.
+    sigma: complex, numpy.ndarray
+        Conductivity (S/m), shape = (n_model, n_layer, n_frequency).
+    mu: complex, numpy.ndarray
+        Magnetic permeability (H/m), shape = (n_model, n_layer, n_frequency).
+    thicknesses: float, numpy.ndarray
+        Thickness (m) of each layer, shape = (n_model, n_layer-1) or
+        (n_layer-1, ), if it is shared by all models.
+    n_threads : int, optional
+        Number of threads to split the models and filters over. Defaults to
+        the value set by :func:`geoana.kernels.set_num_threads`.
+
+    Returns
+    -------
+    rTE_dsigma: complex numpy.ndarray
+        Reflection coefficients gradient w.r.t. conductivity
+        shape = (n_model, n_layer, n_frequency, n_filter)
+    rTE_dh: complex numpy.ndarray
+        Reflection coefficients gradient w.r.t. thicknesses
+        shape = (n_model, n_layer-1, n_frequency, n_filter)
+    rTE_dmu: complex numpy.ndarray
+        Reflection coefficients gradient w.r.t. magnetic permeability
+        shape = (n_model, n_layer, n_frequency, n_filter)
+    """
+    n_threads = _check_n_threads(n_threads)
+    frequencies, lamb, sigma, mu, thicknesses = _prepare_batch_arguments(
+        frequencies, lamb, sigma, mu, thicknesses
+    )
+
+    cdef:
+        SIZE_t n_model = sigma.shape[2]
+        SIZE_t n_frequency = sigma.shape[1]
+        SIZE_t n_layers = sigma.shape[0]
+        SIZE_t n_filter = lamb.shape[1]
+        SIZE_t n_thread = n_threads
+
+    gsig = np.empty((n_layers, n_frequency, n_filter, n_model), dtype=np.complex128, order="F")
+    gh = np.empty((n_layers-1, n_frequency, n_filter, n_model), dtype=np.complex128, order="F")
+    gmu = np.empty((n_layers, n_frequency, n_filter, n_model), dtype=np.complex128, order="F")
+    if gsig.size == 0:
+        return np.moveaxis(gsig, -1, 0), np.moveaxis(gh, -1, 0), np.moveaxis(gmu, -1, 0)
+
+    cdef:
+        const REAL_t[:] f = frequencies
+        const REAL_t[:, ::1] lam = lamb
+        const COMPLEX_t[::1, :, :] sig = sigma
+        const REAL_t[::1, :, :] c_mu = mu
+        const REAL_t[:, ::1] hs = thicknesses
+        COMPLEX_t[::1, :, :, :] c_gsig = gsig
+        COMPLEX_t[::1, :, :, :] c_gmu = gmu
+        COMPLEX_t[::1, :, :, :] c_gh
+
+    cdef:
+        complex_t *sig_p = <complex_t *> &sig[0, 0, 0]
+        complex_t *gsig_p = <complex_t *> &c_gsig[0, 0, 0, 0]
+        complex_t *gmu_p = <complex_t *> &c_gmu[0, 0, 0, 0]
+        complex_t *gh_p = NULL
+        REAL_t *h_p = NULL
+    if n_layers > 1:
+        c_gh = gh
+        h_p = <REAL_t *> &hs[0, 0]
+        gh_p = <complex_t *> &c_gh[0, 0, 0, 0]
+
+    with nogil:
+        rTEgrad_batch(gsig_p, gmu_p, gh_p, <REAL_t *> &f[0], <REAL_t *> &lam[0, 0], sig_p,
+                      <REAL_t *> &c_mu[0, 0, 0], h_p,
+                      n_model, n_frequency, n_filter, n_layers, n_thread)
+
+    return np.moveaxis(gsig, -1, 0), np.moveaxis(gh, -1, 0), np.moveaxis(gmu, -1, 0)
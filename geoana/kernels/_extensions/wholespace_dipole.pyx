@@ -0,0 +1,112 @@
+# cython: language_level=3
+cimport cython
+from libc.math cimport sqrt, exp, cos, sin, M_PI
+
+
+cdef inline double complex _exp_ikr(double k_re, double k_im, double r) noexcept nogil:
+    # exp(-i k r)
+    cdef double a = exp(k_im * r)
+    return a * cos(k_re * r) - 1j * (a * sin(k_re * r))
+
+
+cdef api void _wholespace_dipole_dyadic(
+    double complex *out, double x, double y, double z, double ox, double oy,
+    double oz, double k_re, double k_im
+) noexcept nogil:
+    cdef:
+        double r2 = x * x + y * y + z * z
+        double r = sqrt(r2)
+        double complex kr = (k_re + 1j * k_im) * r
+        double complex ikr = 1j * kr
+        double complex front = _exp_ikr(k_re, k_im, r) / (4 * M_PI * r2 * r)
+        double complex symmetric = (
+            front * (x * ox + y * oy + z * oz) * (-kr * kr + 3 * ikr + 3) / r2
+        )
+        double complex oriented = front * (kr * kr - ikr - 1)
+    out[0] = symmetric * x + oriented * ox
+    out[1] = symmetric * y + oriented * oy
+    out[2] = symmetric * z + oriented * oz
+
+
+cdef api void _wholespace_dipole_curl(
+    double complex *out, double x, double y, double z, double ox, double oy,
+    double oz, double k_re, double k_im
+) noexcept nogil:
+    cdef:
+        double r2 = x * x + y * y + z * z
+        double r = sqrt(r2)
+        double complex ikr = 1j * (k_re + 1j * k_im) * r
+        double complex front = (ikr + 1) * _exp_ikr(k_re, k_im, r) / (4 * M_PI * r2 * r)
+    out[0] = front * (y * oz - z * oy)
+    out[1] = front * (z * ox - x * oz)
+    out[2] = front * (x * oy - y * ox)
+
+
+@cython.ufunc
+cdef (double complex, double complex, double complex) wholespace_dipole_dyadic(
+    double x, double y, double z, double ox, double oy, double oz, double complex k
+) noexcept nogil:
+    """Field of a unit dipole in a wholespace along its dyadic Green's function.
+
+    Evaluates
+
+    .. math::
+
+        \\frac{e^{-ikr}}{4\\pi r^3} \\left[
+        \\frac{(\\mathbf{r} \\cdot \\hat{o})(-k^2 r^2 + 3ikr + 3)}{r^2} \\mathbf{r}
+        + (k^2 r^2 - ikr - 1) \\hat{o} \\right],
+
+    which gives the electric field of an electric dipole, when scaled by
+    :math:`I ds / \\sigma`, and the magnetic field of a magnetic dipole, when
+    scaled by :math:`m`.
+
+    Parameters
+    ----------
+    x, y, z : float
+        Location relative to the dipole.
+    ox, oy, oz : float
+        Orientation of the dipole.
+    k : complex
+        Wavenumber.
+
+    Returns
+    -------
+    fx, fy, fz : complex
+    """
+    cdef double complex out[3]
+    _wholespace_dipole_dyadic(out, x, y, z, ox, oy, oz, k.real, k.imag)
+    return out[0], out[1], out[2]
+
+
+@cython.ufunc
+cdef (double complex, double complex, double complex) wholespace_dipole_curl(
+    double x, double y, double z, double ox, double oy, double oz, double complex k
+) noexcept nogil:
+    """Field of a unit dipole in a wholespace along the curl of its vector potential.
+
+    Evaluates
+
+    .. math::
+
+        \\frac{(ikr + 1) e^{-ikr}}{4\\pi r^3} (\\mathbf{r} \\times \\hat{o}),
+
+    which gives the magnetic field of an electric dipole, when scaled by
+    :math:`-I ds`, and the electric field of a magnetic dipole, when scaled by
+    :math:`i \\omega \\mu m`.
+
+    Parameters
+    ----------
+    x, y, z : float
+        Location relative to the dipole.
+    ox, oy, oz : float
+        Orientation of the dipole.
+    k : complex
+        Wavenumber.
+
+    Returns
+    -------
+    fx, fy, fz : complex
+    """
+    cdef double complex out[3]
+    _wholespace_dipole_curl(out, x, y, z, ox, oy, oz, k.real, k.imag)
+    return out[0], out[1], out[2]
@@ -0,0 +1,83 @@
+"""Thread count control for the compiled kernels.
+
+The compiled kernels split their work over several threads (with the GIL
+released) when asked to. The number of threads can be passed directly to
+each kernel with its ``n_threads`` argument, or set once for the whole
+module using :func:`set_num_threads`. By default everything runs on a single
+thread.
+"""
+import numbers
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+_n_threads = 1
+
+
+def get_num_threads():
+    """Get the default number of threads used by the compiled kernels.
+
+    Returns
+    -------
+    int
+    """
+    return _n_threads
+
+
+def set_num_threads(n_threads):
+    """Set the default number of threads used by the compiled kernels.
+
+    Parameters
+    ----------
+    n_threads : int or None
+        Number of threads to use. If ``None``, the number of cpus available on
+        the machine is used.
+    """
+    global _n_threads
+    if n_threads is None:
+        n_threads = os.cpu_count() or 1
+    _n_threads = _check_n_threads(n_threads)
+
+
+def _check_n_threads(n_threads):
+    """Resolve and validate a thread count passed to a kernel.
+
+    Parameters
+    ----------
+    n_threads : int or None
+        Requested number of threads. ``None`` returns the module default.
+
+    Returns
+    -------
+    int
+    """
+    if n_threads is None:
+        return _n_threads
+    if isinstance(n_threads, (bool, np.bool_)) or not isinstance(n_threads, numbers.Real):
+        raise TypeError(f"n_threads must be an integer, got {type(n_threads)}")
+    if not isinstance(n_threads, numbers.Integral) or n_threads < 1:
+        raise ValueError(f"n_threads must be a positive integer, got {n_threads}")
+    return int(n_threads)
+
+
+def _split_receivers(func, n_threads, arg, xyz, *args):
+    """Call ``func(arg, xyz, *args)``, whose last argument is its (n_loc, ...) output,
+    on contiguous blocks of the locations in n_threads threads.
+
+    The compiled loops release the GIL, and every location is computed
+    independently, so the result is identical for any number of threads.
+    """
+    *args, out = args
+    n_threads = min(n_threads, xyz.shape[0])
+    if n_threads <= 1:
+        func(arg, xyz, *args, out)
+        return
+    bounds = np.linspace(0, xyz.shape[0], n_threads + 1).astype(int)
+    with ThreadPoolExecutor(n_threads) as pool:
+        futures = [
+            pool.submit(func, arg, xyz[start:stop], *args, out[start:stop])
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        for future in futures:
+            future.result()
@@ -0,0 +1,368 @@
+import numpy as np
+
+from geoana.kernels.parallel import _check_n_threads, _split_receivers
+
+# deepest level of the octree, whose cells are those of the 2**21 per axis grid the
+# Morton codes are computed on
+_MAX_LEVEL = 21
+
+# maximum number of (receiver, source) pairs evaluated at once by the NumPy fallback
+_CHUNK_SIZE = 2**18
+
+
+def _spread_bits(v):
+    # insert two zero bits after each of the lowest 21 bits of the uint64 array v
+    v = v & 0x1fffff
+    v = (v | v << 32) & 0x1f00000000ffff
+    v = (v | v << 16) & 0x1f0000ff0000ff
+    v = (v | v << 8) & 0x100f00f00f00f00f
+    v = (v | v << 4) & 0x10c30c30c30c30c3
+    v = (v | v << 2) & 0x1249249249249249
+    return v
+
+
+def _ranges(starts, counts):
+    # concatenation of arange(start, start + count) for every start and count
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(np.sum(counts))
+
+
+def _multipole_sum(order, moments, R):
+    """the (..., 1) potential, or (..., 3) gradient, of the multipole expansions with
+    the (..., 10) moments at the (..., 3) offsets R from their centers"""
+    x, y, z = np.moveaxis(R, -1, 0)
+    m0, m1x, m1y, m1z, qxx, qxy, qxz, qyy, qyz, qzz = np.moveaxis(moments, -1, 0)
+    ir2 = 1 / (x * x + y * y + z * z)
+    ir = np.sqrt(ir2)
+    ir3 = ir * ir2
+    ir5 = ir3 * ir2
+    m1r = m1x * x + m1y * y + m1z * z
+    qx = qxx * x + qxy * y + qxz * z
+    qy = qxy * x + qyy * y + qyz * z
+    qz = qxz * x + qyz * y + qzz * z
+    rqr = x * qx + y * qy + z * qz
+    trace = qxx + qyy + qzz
+    if order == 0:
+        return (m0 * ir + m1r * ir3 + 0.5 * (3 * rqr * ir5 - trace * ir3))[..., None]
+    ir7 = ir5 * ir2
+    c = -m0 * ir3 - 3 * m1r * ir5 - 7.5 * rqr * ir7 + 1.5 * trace * ir5
+    return np.stack([
+        c * x + m1x * ir3 + 3 * qx * ir5,
+        c * y + m1y * ir3 + 3 * qy * ir5,
+        c * z + m1z * ir3 + 3 * qz * ir5,
+    ], axis=-1)
+
+
+def _direct_sum(order, R, charges, dipoles):
+    """the (n, 1) potential, or (n, 3) gradient, of the point sources at the (n, 3)
+    offsets R to the locations, ignoring the sources at a location"""
+    r2 = np.sum(R * R, axis=-1)
+    at_source = r2 == 0
+    r2[at_source] = np.inf
+    ir2 = 1 / r2
+    ir = np.sqrt(ir2)
+    ir3 = ir * ir2
+    if order == 0:
+        val = np.zeros_like(ir)
+        if charges is not None:
+            val += charges * ir
+        if dipoles is not None:
+            val += np.sum(dipoles * R, axis=-1) * ir3
+        return val[:, None]
+    val = np.zeros_like(R)
+    if charges is not None:
+        val -= (charges * ir3)[:, None] * R
+    if dipoles is not None:
+        pr = np.sum(dipoles * R, axis=-1)
+        val += dipoles * ir3[:, None] - (3 * pr * ir3 * ir2)[:, None] * R
+    return val
+
+
+def _tree_sum_numpy(
+    order, xyz, theta, center, radius, moments, first_child, n_child, start, stop,
+    locations, charges, dipoles, out
+):
+    # traverses the tree for every receiver at once, one level at a time, with the
+    # (receiver, node) pairs that still need to be visited
+    n_rx, n_out = out.shape
+    out[:] = 0.0
+    if center.shape[0] == 0:
+        return
+    rx = np.arange(n_rx)
+    node = np.zeros(n_rx, dtype=np.intp)
+    while rx.size:
+        R = xyz[rx] - center[node]
+        far = radius[node] * radius[node] < theta * theta * np.sum(R * R, axis=-1)
+        val = _multipole_sum(order, moments[node[far]], R[far])
+        for i in range(n_out):
+            out[:, i] += np.bincount(rx[far], weights=val[:, i], minlength=n_rx)
+
+        is_leaf = ~far & (n_child[node] == 0)
+        leaf_rx, leaf_node = rx[is_leaf], node[is_leaf]
+        counts = stop[leaf_node] - start[leaf_node]
+        bounds = np.searchsorted(np.cumsum(counts), np.arange(0, counts.sum(), _CHUNK_SIZE))
+        for i, j in zip(bounds, np.r_[bounds[1:], len(counts)]):
+            pair_rx = np.repeat(leaf_rx[i:j], counts[i:j])
+            source = _ranges(start[leaf_node[i:j]], counts[i:j])
+            val = _direct_sum(
+                order, xyz[pair_rx] - locations[source],
+                None if charges is None else charges[source],
+                None if dipoles is None else dipoles[source],
+            )
+            for k in range(n_out):
+                out[:, k] += np.bincount(pair_rx, weights=val[:, k], minlength=n_rx)
+
+        split = ~far & (n_child[node] > 0)
+        counts = n_child[node[split]]
+        rx = np.repeat(rx[split], counts)
+        node = _ranges(first_child[node[split]], counts)
+
+
+try:
+    from geoana.kernels._extensions.point_source_tree import _tree_sum
+except ImportError:
+    _tree_sum = _tree_sum_numpy
+
+
+class PointSourceTree:
+    """Octree of point sources, for fast summation of their potentials and fields.
+
+    The potential of many point sources, with charges :math:`q_j` (e.g. masses)
+    and dipole moments :math:`\\mathbf{p}_j` at locations :math:`\\mathbf{s}_j`,
+
+    .. math::
+
+        \\phi(\\mathbf{x}) = \\sum_j \\frac{q_j}{|\\mathbf{x} - \\mathbf{s}_j|}
+        + \\frac{\\mathbf{p}_j \\cdot (\\mathbf{x} - \\mathbf{s}_j)}
+        {|\\mathbf{x} - \\mathbf{s}_j|^3},
+
+    and its gradient, cost :math:`O(N M)` to sum directly for N sources at M
+    locations. The sources are sorted into an octree once, with the multipole
+    moments (up to the quadrupole) of the sources in each cell about its center.
+    Each location then walks down the tree (Barnes-Hut), using the multipole
+    expansion of every cell that is far enough away, and summing the sources of
+    the nearby leaf cells exactly, which costs :math:`O(M \\log N)`.
+
+    Parameters
+    ----------
+    locations : (n_source, 3) array_like
+        Location of each source.
+    charges : None or (n_source) array_like, optional
+        Charge :math:`q` of each source.
+    dipoles : None or (n_source, 3) array_like, optional
+        Dipole moment :math:`\\mathbf{p}` of each source.
+    leaf_size : int, optional
+        Maximum number of sources in a leaf of the tree, except for sources that
+        share a cell of the finest level of the tree.
+    """
+
+    def __init__(self, locations, charges=None, dipoles=None, leaf_size=32):
+        locations = np.asarray(locations, dtype=float)
+        if locations.ndim != 2 or locations.shape[1] != 3:
+            raise ValueError(
+                f"locations must have shape (n_source, 3), got {locations.shape}"
+            )
+        n_source = locations.shape[0]
+        if charges is None and dipoles is None:
+            raise ValueError("one of charges or dipoles must be given")
+        if charges is not None:
+            charges = np.asarray(charges, dtype=float)
+            if charges.shape != (n_source, ):
+                raise ValueError(
+                    f"charges must have shape ({n_source},), got {charges.shape}"
+                )
+        if dipoles is not None:
+            dipoles = np.asarray(dipoles, dtype=float)
+            if dipoles.shape != (n_source, 3):
+                raise ValueError(
+                    f"dipoles must have shape ({n_source}, 3), got {dipoles.shape}"
+                )
+        try:
+            leaf_size = int(leaf_size)
+        except (TypeError, ValueError):
+            raise TypeError(f"leaf_size must be an integer, got {type(leaf_size)}")
+        if leaf_size < 1:
+            raise ValueError(f"leaf_size must be positive, got {leaf_size}")
+        self._leaf_size = leaf_size
+        self._build(locations, charges, dipoles)
+
+    @property
+    def n_source(self):
+        """Number of sources in the tree.
+
+        Returns
+        -------
+        int
+        """
+        return self._locations.shape[0]
+
+    @property
+    def n_node(self):
+        """Number of cells of the tree.
+
+        Returns
+        -------
+        int
+        """
+        return self._center.shape[0]
+
+    @property
+    def leaf_size(self):
+        """Maximum number of sources in a leaf of the tree.
+
+        Returns
+        -------
+        int
+        """
+        return self._leaf_size
+
+    def _build(self, locations, charges, dipoles):
+        n_source = locations.shape[0]
+        if n_source:
+            lo = locations.min(axis=0)
+            width = np.max(locations.max(axis=0) - lo)
+        else:
+            lo, width = np.zeros(3), 0.0
+        if not width > 0:
+            width = 1.0
+        n_cell = 2**_MAX_LEVEL
+        ijk = ((locations - lo) * (n_cell / width)).astype(np.int64)
+        ijk = np.minimum(ijk, n_cell - 1).astype(np.uint64)
+        code = (
+            (_spread_bits(ijk[:, 0]) << 2) | (_spread_bits(ijk[:, 1]) << 1)
+            | _spread_bits(ijk[:, 2])
+        )
+        sort = np.argsort(code, kind='stable')
+        code, ijk = code[sort], ijk[sort]
+        self._locations = np.ascontiguousarray(locations[sort])
+        self._charges = None if charges is None else np.ascontiguousarray(charges[sort])
+        self._dipoles = None if dipoles is None else np.ascontiguousarray(dipoles[sort])
+
+        # nodes are numbered level by level, with the children of a node contiguous
+        levels = []
+        start = np.zeros(1 if n_source else 0, dtype=np.intp)
+        stop = np.full(1 if n_source else 0, n_source, dtype=np.intp)
+        cell = np.zeros((len(start), 3), dtype=np.uint64)
+        n_nodes = len(start)
+        for level in range(_MAX_LEVEL + 1):
+            no_child = np.zeros(len(start), dtype=np.intp)
+            levels.append([start, stop, cell, no_child, no_child])
+            if level == _MAX_LEVEL:
+                break
+            split = np.flatnonzero(stop - start > self.leaf_size)
+            if len(split) == 0:
+                break
+            # sources are sorted by cell, so the children of a node are the runs of
+            # equal cells at the next level within it
+            index = _ranges(start[split], stop[split] - start[split])
+            prefix = code[index] >> (3 * (_MAX_LEVEL - level - 1))
+            first = np.r_[True, (prefix[1:] != prefix[:-1]) | (index[1:] != index[:-1] + 1)]
+            child_start = index[first]
+            child_stop = np.r_[index[np.flatnonzero(first)[1:] - 1] + 1, index[-1] + 1]
+            parent = split[np.searchsorted(start[split], child_start, side='right') - 1]
+
+            n_child = np.bincount(parent, minlength=len(start))
+            first_child = n_nodes + np.cumsum(n_child) - n_child
+            levels[-1][3] = n_child
+            levels[-1][4] = np.where(n_child > 0, first_child, 0)
+            n_nodes += len(child_start)
+            start, stop = child_start, child_stop
+            cell = ijk[start] >> (_MAX_LEVEL - level - 1)
+
+        center, radius, moments = [], [], []
+        for level, (start, stop, cell, *_) in enumerate(levels):
+            size = width / 2**level
+            c = lo + (cell + 0.5) * size
+            r, m = self._cell_moments(c, start, stop)
+            center.append(c)
+            radius.append(r)
+            moments.append(m)
+
+        self._center = np.ascontiguousarray(np.concatenate(center).reshape(-1, 3))
+        self._radius = np.ascontiguousarray(np.concatenate(radius))
+        self._moments = np.ascontiguousarray(np.concatenate(moments).reshape(-1, 10))
+        self._start = np.concatenate([lvl[0] for lvl in levels]).astype(np.intp)
+        self._stop = np.concatenate([lvl[1] for lvl in levels]).astype(np.intp)
+        self._n_child = np.concatenate([lvl[3] for lvl in levels]).astype(np.intp)
+        self._first_child = np.concatenate([lvl[4] for lvl in levels]).astype(np.intp)
+
+    def _cell_moments(self, center, start, stop):
+        # radius and (M0, M1x, M1y, M1z, Qxx, Qxy, Qxz, Qyy, Qyz, Qzz) moments about
+        # their centers of the cells holding the sources [start, stop)
+        counts = stop - start
+        if len(counts) == 0:
+            return np.zeros(0), np.zeros((0, 10))
+        index = _ranges(start, counts)
+        offsets = np.cumsum(counts) - counts
+        d = self._locations[index] - np.repeat(center, counts, axis=0)
+        radius = np.maximum.reduceat(np.sqrt(np.sum(d * d, axis=-1)), offsets)
+
+        moments = np.zeros((len(counts), 10))
+        pairs = [(0, 0), (0, 1), (0, 2), (1, 1), (1, 2), (2, 2)]
+        if self._charges is not None:
+            q = self._charges[index]
+            moments[:, 0] = np.add.reduceat(q, offsets)
+            for i in range(3):
+                moments[:, 1 + i] = np.add.reduceat(q * d[:, i], offsets)
+            for m, (i, j) in enumerate(pairs):
+                moments[:, 4 + m] = np.add.reduceat(q * d[:, i] * d[:, j], offsets)
+        if self._dipoles is not None:
+            p = self._dipoles[index]
+            for i in range(3):
+                moments[:, 1 + i] += np.add.reduceat(p[:, i], offsets)
+            for m, (i, j) in enumerate(pairs):
+                moments[:, 4 + m] += np.add.reduceat(
+                    p[:, i] * d[:, j] + p[:, j] * d[:, i], offsets
+                )
+        return radius, moments
+
+    def evaluate(self, xyz, order=0, theta=0.5, n_threads=None):
+        """Sum the potential, or its gradient, of the sources at many locations.
+
+        A cell of the tree is approximated by its multipole expansion at a location
+        when the radius of the sources in it, about its center, is less than
+        `theta` times the distance from its center to the location. The sources of
+        every other leaf of the tree are summed exactly. As the expansion includes
+        the quadrupole moments, the error of each cell's contribution is of the
+        order of :math:`\\theta^3` relative to the (absolute) sum of its charges'
+        contributions, and :math:`\\theta^2` for its dipoles. ``theta=0`` sums every
+        source exactly.
+
+        Parameters
+        ----------
+        xyz : (n_loc, 3) array_like
+            Locations to evaluate at. Sources at a location are left out of its sum.
+        order : {0, 1}, optional
+            Whether to sum the potential (0), or its gradient (1).
+        theta : float, optional
+            Opening angle of the cells, which controls the accuracy.
+        n_threads : int, optional
+            Number of threads to split the locations over. Defaults to the value set
+            by :func:`geoana.kernels.set_num_threads`. The result is identical for any
+            number of threads.
+
+        Returns
+        -------
+        (n_loc) or (n_loc, 3) numpy.ndarray
+            The potential, or its gradient, at each location.
+        """
+        n_threads = _check_n_threads(n_threads)
+        xyz = np.ascontiguousarray(xyz, dtype=float)
+        if xyz.ndim != 2 or xyz.shape[1] != 3:
+            raise ValueError(f"xyz must have shape (n_loc, 3), got {xyz.shape}")
+        if order not in (0, 1):
+            raise ValueError(f"order must be 0 or 1, got {order}")
+        try:
+            theta = float(theta)
+        except (TypeError, ValueError):
+            raise TypeError(f"theta must be a number, got {type(theta)}")
+        if not theta >= 0:
+            raise ValueError(f"theta must be non-negative, got {theta}")
+
+        out = np.empty((xyz.shape[0], 1 if order == 0 else 3))
+        _split_receivers(
+            _tree_sum, n_threads, order, xyz, theta, self._center, self._radius,
+            self._moments, self._first_child, self._n_child, self._start, self._stop,
+            self._locations, self._charges, self._dipoles, out
+        )
+        return out[:, 0] if order == 0 else out
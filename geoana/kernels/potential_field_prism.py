@@ -1,5 +1,7 @@
 import numpy as np
 
+from geoana.kernels.parallel import _check_n_threads, _split_receivers
+
 
 def _prism_f(x, y, z):
     """
@@ -291,6 +293,210 @@ def _prism_fxyz(x, y, z):
     return out
 
 
+_KERNELS = {
+    'prism_f': _prism_f,
+    'prism_fz': _prism_fz,
+    'prism_fzz': _prism_fzz,
+    'prism_fzx': _prism_fzx,
+    'prism_fzy': _prism_fzy,
+    'prism_fzzz': _prism_fzzz,
+    'prism_fxxy': _prism_fxxy,
+    'prism_fxxz': _prism_fxxz,
+    'prism_fxyz': _prism_fxyz,
+}
+
+# maximum number of (receiver, prism) pairs evaluated at once by the NumPy fallbacks
+_CHUNK_SIZE = 2**18
+
+
+def _receiver_chunks(n_rx, n_prism):
+    n_chunk = max(_CHUNK_SIZE // max(n_prism, 1), 1)
+    for start in range(0, n_rx, n_chunk):
+        yield slice(start, min(start + n_chunk, n_rx))
+
+
+# the derivative of 1/r (as indices of the axes) that each kernel integrates
+_POINT_DERIVATIVES = {
+    'prism_f': (),
+    'prism_fz': (2, ),
+    'prism_fzz': (2, 2),
+    'prism_fzx': (2, 0),
+    'prism_fzy': (2, 1),
+    'prism_fzzz': (2, 2, 2),
+    'prism_fxxy': (0, 0, 1),
+    'prism_fxxz': (0, 0, 2),
+    'prism_fxyz': (0, 1, 2),
+}
+
+
+def _point_kernel(kernel_name, x, y, z):
+    """the derivative of 1/r matching a kernel at the offsets (x, y, z) from a point
+    source to the locations"""
+    xyz = (x, y, z)
+    r2 = x * x + y * y + z * z
+    r = np.sqrt(r2)
+    index = _POINT_DERIVATIVES[kernel_name]
+    if len(index) == 0:
+        return 1 / r
+    if len(index) == 1:
+        return -xyz[index[0]] / (r2 * r)
+    if len(index) == 2:
+        i, j = index
+        return (3 * xyz[i] * xyz[j] - (i == j) * r2) / (r2 * r2 * r)
+    i, j, k = index
+    return (
+        -15 * xyz[i] * xyz[j] * xyz[k] / r2
+        + 3 * ((i == j) * xyz[k] + (i == k) * xyz[j] + (j == k) * xyz[i])
+    ) / (r2 * r2 * r)
+
+
+def _def_int_corners(func, d_min, d_max, cycle):
+    # definite integral from the (..., 3) offsets to the minimum and maximum corners
+    x_min, y_min, z_min = np.moveaxis(d_min, -1, 0)
+    x_max, y_max, z_max = np.moveaxis(d_max, -1, 0)
+
+    for i in range(cycle):
+        x_min, y_min, z_min = y_min, z_min, x_min
+        x_max, y_max, z_max = y_max, z_max, x_max
+
+    v000 = func(x_min, y_min, z_min)
+    v001 = func(x_min, y_min, z_max)
+    v010 = func(x_min, y_max, z_min)
+    v011 = func(x_min, y_max, z_max)
+    v100 = func(x_max, y_min, z_min)
+    v101 = func(x_max, y_min, z_max)
+    v110 = func(x_max, y_max, z_min)
+    v111 = func(x_max, y_max, z_max)
+
+    return (v111 - v110 - v101 + v100 - v011 + v010 + v001 - v000)
+
+
+def _eval_def_int_chunk(
+    kernel_name, xyz, min_location, max_location, cycle, far_ratio=np.inf
+):
+    func = _KERNELS[kernel_name]
+    d_min = min_location - xyz[:, None, :]
+    d_max = max_location - xyz[:, None, :]
+
+    # (receiver, prism) pairs more than far_ratio prism diagonals apart
+    offset = -0.5 * (d_min + d_max)
+    size = d_max - d_min
+    far = np.sum(offset * offset, axis=-1) > far_ratio**2 * np.sum(size * size, axis=-1)
+    if not np.any(far):
+        return _def_int_corners(func, d_min, d_max, cycle)
+
+    out = np.empty(d_min.shape[:-1])
+    volume = np.prod(size[far], axis=-1)
+    offset = np.roll(offset[far], -cycle, axis=-1)
+    out[far] = -volume * _point_kernel(kernel_name, *np.moveaxis(offset, -1, 0))
+    near = ~far
+    out[near] = _def_int_corners(func, d_min[near], d_max[near], cycle)
+    return out
+
+
+def _prism_def_int_matrix(
+    kernel_name, xyz, min_location, max_location, cycle, far_ratio, out
+):
+    for chunk in _receiver_chunks(xyz.shape[0], min_location.shape[0]):
+        out[chunk] = _eval_def_int_chunk(
+            kernel_name, xyz[chunk], min_location, max_location, cycle, far_ratio
+        )
+
+
+def _prism_def_int_sum(
+    kernel_name, xyz, min_location, max_location, cycle, far_ratio, weights, out
+):
+    for chunk in _receiver_chunks(xyz.shape[0], min_location.shape[0]):
+        out[chunk] = _eval_def_int_chunk(
+            kernel_name, xyz[chunk], min_location, max_location, cycle, far_ratio
+        ) @ weights
+
+
+def _tensor_def_int_chunk(kernel_name, xyz, x_nodes, y_nodes, z_nodes, cycle):
+    func = _KERNELS[kernel_name]
+    # offsets to every node, with shape (n_chunk, n_x, n_y, n_z)
+    x = (x_nodes - xyz[:, 0:1])[:, :, None, None]
+    y = (y_nodes - xyz[:, 1:2])[:, None, :, None]
+    z = (z_nodes - xyz[:, 2:3])[:, None, None, :]
+    x, y, z = np.broadcast_arrays(x, y, z)
+
+    for i in range(cycle):
+        x, y, z = y, z, x
+
+    val = np.diff(np.diff(np.diff(func(x, y, z), axis=1), axis=2), axis=3)
+    # cells ordered with x fastest
+    return val.transpose(0, 3, 2, 1).reshape(xyz.shape[0], -1)
+
+
+def _prism_tensor_def_int_matrix(kernel_name, xyz, x_nodes, y_nodes, z_nodes, cycle, out):
+    n_nodes = len(x_nodes) * len(y_nodes) * len(z_nodes)
+    for chunk in _receiver_chunks(xyz.shape[0], n_nodes):
+        out[chunk] = _tensor_def_int_chunk(
+            kernel_name, xyz[chunk], x_nodes, y_nodes, z_nodes, cycle
+        )
+
+
+def _prism_tensor_def_int_sum(
+    kernel_name, xyz, x_nodes, y_nodes, z_nodes, cycle, weights, out
+):
+    n_nodes = len(x_nodes) * len(y_nodes) * len(z_nodes)
+    for chunk in _receiver_chunks(xyz.shape[0], n_nodes):
+        out[chunk] = _tensor_def_int_chunk(
+            kernel_name, xyz[chunk], x_nodes, y_nodes, z_nodes, cycle
+        ) @ weights
+
+
+# (kernel, cycle) pairs giving each component of the second and third derivative
+# tensors, ordered as (xx, xy, xz, yy, yz, zz) and (xxx, xxy, xxz, xyy, xyz, xzz, yyy,
+# yyz, yzz, zzz).
+_DERIVATIVE_COMPONENTS = {
+    2: [
+        ('prism_fzz', 1), ('prism_fzx', 1), ('prism_fzx', 0),
+        ('prism_fzz', 2), ('prism_fzy', 0), ('prism_fzz', 0),
+    ],
+    3: [
+        ('prism_fzzz', 1), ('prism_fxxy', 0), ('prism_fxxz', 0), ('prism_fxxz', 1),
+        ('prism_fxyz', 0), ('prism_fxxy', 2), ('prism_fzzz', 2), ('prism_fxxy', 1),
+        ('prism_fxxz', 2), ('prism_fzzz', 0),
+    ],
+}
+
+
+def _prism_derivative_def_int_matrix(
+    order, xyz, min_location, max_location, far_ratio, out
+):
+    for m, (kernel_name, cycle) in enumerate(_DERIVATIVE_COMPONENTS[order]):
+        _prism_def_int_matrix(
+            kernel_name, xyz, min_location, max_location, cycle, far_ratio, out[:, m]
+        )
+
+
+def _prism_derivative_def_int_sum(
+    order, xyz, min_location, max_location, far_ratio, weights, out
+):
+    for m, (kernel_name, cycle) in enumerate(_DERIVATIVE_COMPONENTS[order]):
+        _prism_def_int_sum(
+            kernel_name, xyz, min_location, max_location, cycle, far_ratio, weights,
+            out[:, m]
+        )
+
+
+def _prism_tensor_derivative_def_int_matrix(order, xyz, x_nodes, y_nodes, z_nodes, out):
+    for m, (kernel_name, cycle) in enumerate(_DERIVATIVE_COMPONENTS[order]):
+        _prism_tensor_def_int_matrix(
+            kernel_name, xyz, x_nodes, y_nodes, z_nodes, cycle, out[:, m]
+        )
+
+
+def _prism_tensor_derivative_def_int_sum(
+    order, xyz, x_nodes, y_nodes, z_nodes, weights, out
+):
+    for m, (kernel_name, cycle) in enumerate(_DERIVATIVE_COMPONENTS[order]):
+        _prism_tensor_def_int_sum(
+            kernel_name, xyz, x_nodes, y_nodes, z_nodes, cycle, weights, out[:, m]
+        )
+
+
 try:
     from geoana.kernels._extensions.potential_field_prism import (
         prism_f,
@@ -302,6 +508,14 @@ try:
         prism_fxxy,
         prism_fxxz,
         prism_fxyz,
+        _prism_def_int_matrix,
+        _prism_def_int_sum,
+        _prism_tensor_def_int_matrix,
+        _prism_tensor_def_int_sum,
+        _prism_derivative_def_int_matrix,
+        _prism_derivative_def_int_sum,
+        _prism_tensor_derivative_def_int_matrix,
+        _prism_tensor_derivative_def_int_sum,
     )
 except ImportError:
     # Store the above as the kernels
@@ -314,3 +528,382 @@ except ImportError:
     prism_fxxy = _prism_fxxy
     prism_fxxz = _prism_fxxz
     prism_fxyz = _prism_fxyz
+
+
+# the name of each kernel, for both its compiled and numpy versions
+_KERNEL_NAMES = {
+    **{func: name for name, func in _KERNELS.items()},
+    **dict(zip(
+        (
+            prism_f, prism_fz, prism_fzz, prism_fzx, prism_fzy, prism_fzzz, prism_fxxy,
+            prism_fxxz, prism_fxyz,
+        ),
+        _KERNELS,
+    )),
+}
+
+
+def _is_kernel(func):
+    # whether func is one of the prism kernels
+    try:
+        return func in _KERNEL_NAMES
+    except TypeError:
+        return False
+
+
+def _check_kernel(kernel):
+    if isinstance(kernel, str):
+        if kernel not in _KERNELS:
+            raise ValueError(f"{kernel} is not a prism kernel")
+        return kernel
+    if not _is_kernel(kernel):
+        raise ValueError(f"{kernel!r} is not a prism kernel")
+    return _KERNEL_NAMES[kernel]
+
+
+def _check_xyz(xyz):
+    xyz = np.ascontiguousarray(xyz, dtype=float)
+    if xyz.ndim != 2 or xyz.shape[1] != 3:
+        raise ValueError(f"xyz must have shape (n_loc, 3), got {xyz.shape}")
+    return xyz
+
+
+def _check_prisms(xyz, min_location, max_location):
+    xyz = _check_xyz(xyz)
+    min_location = np.ascontiguousarray(min_location, dtype=float)
+    max_location = np.ascontiguousarray(max_location, dtype=float)
+    if min_location.ndim != 2 or min_location.shape[1] != 3:
+        raise ValueError(
+            f"min_location must have shape (n_prism, 3), got {min_location.shape}"
+        )
+    if max_location.shape != min_location.shape:
+        raise ValueError(
+            "min_location and max_location must have the same shape, got "
+            f"{min_location.shape} and {max_location.shape}"
+        )
+    return xyz, min_location, max_location
+
+
+def _check_tensor_nodes(xyz, x_nodes, y_nodes, z_nodes):
+    xyz = _check_xyz(xyz)
+    nodes = []
+    for name, vec in zip("xyz", (x_nodes, y_nodes, z_nodes)):
+        vec = np.ascontiguousarray(vec, dtype=float)
+        if vec.ndim != 1 or len(vec) < 2:
+            raise ValueError(f"{name}_nodes must be a 1D array with at least 2 nodes")
+        if np.any(np.diff(vec) <= 0):
+            raise ValueError(f"{name}_nodes must be strictly increasing")
+        nodes.append(vec)
+    return (xyz, *nodes)
+
+
+def _check_weights(weights, n_prism):
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim == 0 or weights.shape[0] != n_prism or weights.ndim > 2:
+        raise ValueError(
+            f"weights must have shape ({n_prism}) or ({n_prism}, n_weight), got {weights.shape}"
+        )
+    return weights, np.ascontiguousarray(weights.reshape(n_prism, -1))
+
+
+def _check_dtype(dtype):
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"dtype must be float32 or float64, got {dtype}")
+    return dtype
+
+
+def _check_far_field_ratio(far_field_ratio):
+    if far_field_ratio is None:
+        return np.inf
+    try:
+        far_field_ratio = float(far_field_ratio)
+    except (TypeError, ValueError):
+        raise TypeError(
+            f"far_field_ratio must be None or a number, got {type(far_field_ratio)}"
+        )
+    if not far_field_ratio > 0:
+        raise ValueError(f"far_field_ratio must be positive, got {far_field_ratio}")
+    return far_field_ratio
+
+
+def _check_order(order):
+    if order not in _DERIVATIVE_COMPONENTS:
+        raise ValueError(f"order must be 2 or 3, got {order}")
+    return order, len(_DERIVATIVE_COMPONENTS[order])
+
+
+def prism_definite_integrals(
+    kernel, xyz, min_location, max_location, weights=None, cycle=0, dtype=np.float64,
+    n_threads=None, far_field_ratio=None
+):
+    """Evaluate the definite integral of a prism kernel for many prisms and locations.
+
+    The kernel is evaluated at the 8 corners of every prism, relative to every
+    location, in a single compiled loop (when the compiled extensions are available).
+    The integrals are either returned for every (location, prism) pair, or summed
+    over the prisms with weights without forming the full matrix.
+
+    Parameters
+    ----------
+    kernel : callable or str
+        One of the ``prism_f*`` kernels (or its name), e.g. :func:`prism_fz`.
+    xyz : (n_loc, 3) numpy.ndarray
+        Locations to evaluate the integrals at.
+    min_location, max_location : (n_prism, 3) numpy.ndarray
+        Minimum and maximum corners of each prism.
+    weights : None or (n_prism) or (n_prism, n_weight) numpy.ndarray, optional
+        Weights used to sum the integrals over the prisms, such as their densities.
+    cycle : int, optional
+        Number of times to cycle the (x, y, z) offsets before evaluating the kernel,
+        which is how the other components are computed from a kernel (see the
+        individual kernels).
+    dtype : {numpy.float64, numpy.float32}, optional
+        Data type of the returned array. The kernels are always evaluated, and the
+        weighted sums accumulated, in double precision; ``numpy.float32`` halves the
+        memory of the result, which matters for large sensitivity matrices.
+    n_threads : int, optional
+        Number of threads to split the locations over. Defaults to the value set
+        by :func:`geoana.kernels.set_num_threads`. The result is identical for any
+        number of threads.
+    far_field_ratio : float, optional
+        Approximate the integral over a prism by the kernel's derivative of
+        :math:`1/r` at its center times its volume when the prism is more than
+        `far_field_ratio` times its diagonal away from a location (see
+        :attr:`geoana.shapes.BasePrism.far_field_ratio` for the error bound). By
+        default every integral is evaluated exactly.
+
+    Returns
+    -------
+    numpy.ndarray
+        If `weights` is ``None``, the (n_loc, n_prism) definite integrals. Otherwise
+        the (n_loc) or (n_loc, n_weight) weighted sums over the prisms.
+    """
+    kernel_name = _check_kernel(kernel)
+    dtype = _check_dtype(dtype)
+    n_threads = _check_n_threads(n_threads)
+    far_ratio = _check_far_field_ratio(far_field_ratio)
+    xyz, min_location, max_location = _check_prisms(xyz, min_location, max_location)
+    n_rx, n_prism = xyz.shape[0], min_location.shape[0]
+
+    if weights is None:
+        out = np.empty((n_rx, n_prism), dtype=dtype)
+        _split_receivers(
+            _prism_def_int_matrix, n_threads, kernel_name, xyz, min_location,
+            max_location, cycle, far_ratio, out
+        )
+        return out
+
+    weights, weights_2d = _check_weights(weights, n_prism)
+    out = np.empty((n_rx, weights_2d.shape[1]), dtype=dtype)
+    _split_receivers(
+        _prism_def_int_sum, n_threads, kernel_name, xyz, min_location, max_location,
+        cycle, far_ratio, weights_2d, out
+    )
+    return out.reshape((n_rx, ) + weights.shape[1:])
+
+
+def prism_tensor_definite_integrals(
+    kernel, xyz, x_nodes, y_nodes, z_nodes, weights=None, cycle=0, dtype=np.float64,
+    n_threads=None
+):
+    """Evaluate the definite integral of a prism kernel for every cell of a tensor grid.
+
+    Neighbouring cells of a tensor grid share their corners, so instead of evaluating
+    the kernel at the 8 corners of every cell (as :func:`prism_definite_integrals`
+    does), it is evaluated once at each node of the grid for every location. The
+    definite integral over each cell is then formed by differencing the node values
+    along each axis, which needs roughly 8 times fewer kernel evaluations.
+
+    Parameters
+    ----------
+    kernel : callable or str
+        One of the ``prism_f*`` kernels (or its name), e.g. :func:`prism_fz`.
+    xyz : (n_loc, 3) numpy.ndarray
+        Locations to evaluate the integrals at.
+    x_nodes, y_nodes, z_nodes : (n_x + 1), (n_y + 1), (n_z + 1) numpy.ndarray
+        Increasing node locations of the grid along each axis.
+    weights : None or (n_cell) or (n_cell, n_weight) numpy.ndarray, optional
+        Weights used to sum the integrals over the cells, such as their densities.
+    cycle : int, optional
+        Number of times to cycle the (x, y, z) offsets before evaluating the kernel.
+    dtype : {numpy.float64, numpy.float32}, optional
+        Data type of the returned array. The kernels are always evaluated, and the
+        weighted sums accumulated, in double precision; ``numpy.float32`` halves the
+        memory of the result, which matters for large sensitivity matrices.
+    n_threads : int, optional
+        Number of threads to split the locations over. Defaults to the value set
+        by :func:`geoana.kernels.set_num_threads`. The result is identical for any
+        number of threads.
+
+    Returns
+    -------
+    numpy.ndarray
+        If `weights` is ``None``, the (n_loc, n_cell) definite integrals. Otherwise
+        the (n_loc) or (n_loc, n_weight) weighted sums over the cells.
+
+    Notes
+    -----
+    The n_cell = n_x * n_y * n_z cells are ordered with x changing fastest, then y,
+    then z, which is the ordering used by ``discretize.TensorMesh``.
+    """
+    kernel_name = _check_kernel(kernel)
+    dtype = _check_dtype(dtype)
+    n_threads = _check_n_threads(n_threads)
+    xyz, x_nodes, y_nodes, z_nodes = _check_tensor_nodes(xyz, x_nodes, y_nodes, z_nodes)
+    n_rx = xyz.shape[0]
+    n_cell = (len(x_nodes) - 1) * (len(y_nodes) - 1) * (len(z_nodes) - 1)
+
+    if weights is None:
+        out = np.empty((n_rx, n_cell), dtype=dtype)
+        _split_receivers(
+            _prism_tensor_def_int_matrix, n_threads, kernel_name, xyz, x_nodes, y_nodes,
+            z_nodes, cycle, out
+        )
+        return out
+
+    weights, weights_2d = _check_weights(weights, n_cell)
+    out = np.empty((n_rx, weights_2d.shape[1]), dtype=dtype)
+    _split_receivers(
+        _prism_tensor_def_int_sum, n_threads, kernel_name, xyz, x_nodes, y_nodes, z_nodes,
+        cycle, weights_2d, out
+    )
+    return out.reshape((n_rx, ) + weights.shape[1:])
+
+
+def prism_derivative_integrals(
+    order, xyz, min_location, max_location, weights=None, dtype=np.float64,
+    n_threads=None, far_field_ratio=None
+):
+    """Evaluate every component of a derivative tensor of 1/r integrated over many prisms.
+
+    All of the components of the second (or third) order derivative tensor of
+    :math:`1/r` are computed together from a single pass over each prism's 8 corners,
+    sharing the distances, logarithms and arctangents between the components (when
+    the compiled extensions are available). This is the integral used for the
+    gravitational gradient and magnetic field (``order=2``), and the magnetic field
+    gradient (``order=3``) of prisms.
+
+    Parameters
+    ----------
+    order : {2, 3}
+        Order of the derivatives.
+    xyz : (n_loc, 3) numpy.ndarray
+        Locations to evaluate the integrals at.
+    min_location, max_location : (n_prism, 3) numpy.ndarray
+        Minimum and maximum corners of each prism.
+    weights : None or (n_prism) or (n_prism, n_weight) numpy.ndarray, optional
+        Weights used to sum the integrals over the prisms.
+    dtype : {numpy.float64, numpy.float32}, optional
+        Data type of the returned array. The kernels are always evaluated, and the
+        weighted sums accumulated, in double precision; ``numpy.float32`` halves the
+        memory of the result, which matters for large sensitivity matrices.
+    n_threads : int, optional
+        Number of threads to split the locations over. Defaults to the value set
+        by :func:`geoana.kernels.set_num_threads`. The result is identical for any
+        number of threads.
+    far_field_ratio : float, optional
+        Approximate the integral over a prism by the kernel's derivative of
+        :math:`1/r` at its center times its volume when the prism is more than
+        `far_field_ratio` times its diagonal away from a location (see
+        :attr:`geoana.shapes.BasePrism.far_field_ratio` for the error bound). By
+        default every integral is evaluated exactly.
+
+    Returns
+    -------
+    numpy.ndarray
+        If `weights` is ``None``, the (n_loc, n_comp, n_prism) definite integrals.
+        Otherwise the (n_loc, n_comp) or (n_loc, n_comp, n_weight) weighted sums over
+        the prisms.
+
+    Notes
+    -----
+    The n_comp = 6 second order components are ordered as (xx, xy, xz, yy, yz, zz),
+    and the n_comp = 10 third order components as (xxx, xxy, xxz, xyy, xyz, xzz, yyy,
+    yyz, yzz, zzz). Each component is the definite integral of one of the (cycled)
+    ``prism_f*`` kernels.
+    """
+    order, n_comp = _check_order(order)
+    dtype = _check_dtype(dtype)
+    n_threads = _check_n_threads(n_threads)
+    far_ratio = _check_far_field_ratio(far_field_ratio)
+    xyz, min_location, max_location = _check_prisms(xyz, min_location, max_location)
+    n_rx, n_prism = xyz.shape[0], min_location.shape[0]
+
+    if weights is None:
+        out = np.empty((n_rx, n_comp, n_prism), dtype=dtype)
+        _split_receivers(
+            _prism_derivative_def_int_matrix, n_threads, order, xyz, min_location,
+            max_location, far_ratio, out
+        )
+        return out
+
+    weights, weights_2d = _check_weights(weights, n_prism)
+    out = np.empty((n_rx, n_comp, weights_2d.shape[1]), dtype=dtype)
+    _split_receivers(
+        _prism_derivative_def_int_sum, n_threads, order, xyz, min_location, max_location,
+        far_ratio, weights_2d, out
+    )
+    return out.reshape((n_rx, n_comp) + weights.shape[1:])
+
+
+def prism_tensor_derivative_integrals(
+    order, xyz, x_nodes, y_nodes, z_nodes, weights=None, dtype=np.float64,
+    n_threads=None
+):
+    """Evaluate every component of a derivative tensor of 1/r integrated over tensor cells.
+
+    This combines :func:`prism_derivative_integrals` and
+    :func:`prism_tensor_definite_integrals`: all of the derivative components are
+    evaluated together once at each node of the grid, then differenced into the
+    integrals over each cell.
+
+    Parameters
+    ----------
+    order : {2, 3}
+        Order of the derivatives.
+    xyz : (n_loc, 3) numpy.ndarray
+        Locations to evaluate the integrals at.
+    x_nodes, y_nodes, z_nodes : (n_x + 1), (n_y + 1), (n_z + 1) numpy.ndarray
+        Increasing node locations of the grid along each axis.
+    weights : None or (n_cell) or (n_cell, n_weight) numpy.ndarray, optional
+        Weights used to sum the integrals over the cells.
+    dtype : {numpy.float64, numpy.float32}, optional
+        Data type of the returned array. The kernels are always evaluated, and the
+        weighted sums accumulated, in double precision; ``numpy.float32`` halves the
+        memory of the result, which matters for large sensitivity matrices.
+    n_threads : int, optional
+        Number of threads to split the locations over. Defaults to the value set
+        by :func:`geoana.kernels.set_num_threads`. The result is identical for any
+        number of threads.
+
+    Returns
+    -------
+    numpy.ndarray
+        If `weights` is ``None``, the (n_loc, n_comp, n_cell) definite integrals.
+        Otherwise the (n_loc, n_comp) or (n_loc, n_comp, n_weight) weighted sums over
+        the cells, with the components ordered as in :func:`prism_derivative_integrals`
+        and the cells ordered with x changing fastest.
+    """
+    order, n_comp = _check_order(order)
+    dtype = _check_dtype(dtype)
+    n_threads = _check_n_threads(n_threads)
+    xyz, x_nodes, y_nodes, z_nodes = _check_tensor_nodes(xyz, x_nodes, y_nodes, z_nodes)
+    n_rx = xyz.shape[0]
+    n_cell = (len(x_nodes) - 1) * (len(y_nodes) - 1) * (len(z_nodes) - 1)
+
+    if weights is None:
+        out = np.empty((n_rx, n_comp, n_cell), dtype=dtype)
+        _split_receivers(
+            _prism_tensor_derivative_def_int_matrix, n_threads, order, xyz, x_nodes,
+            y_nodes, z_nodes, out
+        )
+        return out
+
+    weights, weights_2d = _check_weights(weights, n_cell)
+    out = np.empty((n_rx, n_comp, weights_2d.shape[1]), dtype=dtype)
+    _split_receivers(
+        _prism_tensor_derivative_def_int_sum, n_threads, order, xyz, x_nodes, y_nodes,
+        z_nodes, weights_2d, out
+    )
+    return out.reshape((n_rx, n_comp) + weights.shape[1:])
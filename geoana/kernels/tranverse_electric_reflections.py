@@ -1,7 +1,7 @@
 import numpy as np
 from scipy.constants import mu_0
 
-def _rTE_forward(frequencies, lamb, sigma, mu, thicknesses):
+def _rTE_forward(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
     """Compute reflection coefficients for Transverse Electric (TE) mode.
 
     The first layer is considered to be the top most layer. The last
@@ -20,6 +20,9 @@ def _rTE_forward(frequencies, lamb, sigma, mu, thicknesses):
         Magnetic permeability (H/m), shape = (n_layer, n_frequency).
     thicknesses: float, numpy.ndarray
         Thickness (m) of each layer, shape = (n_layer-1,).
+    n_threads : int, optional
+        Unused by the NumPy implementation, it is only accepted to match the
+        signature of the compiled kernel.
 
     Returns
     -------
@@ -44,7 +47,7 @@ def _rTE_forward(frequencies, lamb, sigma, mu, thicknesses):
 
     return TE
 
-def _rTE_gradient(frequencies, lamb, sigma, mu, thicknesses):
+def _rTE_gradient(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
     """Compute reflection coefficients for Transverse Electric (TE) mode.
 
     The first layer is considered to be the top most layer. The last
@@ -63,6 +66,9 @@ def _rTE_gradient(frequencies, lamb, sigma, mu, thicknesses):
         Magnetic permeability (H/m), shape = (n_layer, n_frequency).
     thicknesses: float, numpy.ndarray
         Thickness (m) of each layer, shape = (n_layer-1,).
+    n_threads : int, optional
+        Unused by the NumPy implementation, it is only accepted to match the
+        signature of the compiled kernel.
 
     Returns
     -------
@@ -127,9 +133,98 @@ def _rTE_gradient(frequencies, lamb, sigma, mu, thicknesses):
     return rTE_dsigma, rTE_dh, rTE_dmu
 
 
+def _broadcast_batch_arguments(lamb, sigma, thicknesses):
+    n_model, n_layer, _ = np.shape(sigma)
+    lamb = np.asarray(lamb, dtype=float)
+    if lamb.ndim == 1:
+        lamb = np.broadcast_to(lamb, (n_model, lamb.shape[0]))
+    thicknesses = np.asarray(thicknesses, dtype=float)
+    if thicknesses.ndim == 1:
+        thicknesses = np.broadcast_to(thicknesses, (n_model, n_layer-1))
+    return lamb, thicknesses
+
+
+def _rTE_forward_batch(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
+    """Compute TE reflection coefficients for many layered models at once.
+
+    Parameters
+    ----------
+    frequencies : float, numpy.ndarray
+        Frequency (Hz); shape = (n_frequency, ).
+    lamb : float, numpy.ndarray
+        Spatial wavenumber (1/m), shape = (n_model, n_filter) or (n_filter, ),
+        if it is shared by all models.
+    sigma: complex, numpy.ndarray
+        Conductivity (S/m), shape = (n_model, n_layer, n_frequency).
+    mu: complex, numpy.ndarray
+        Magnetic permeability (H/m), shape = (n_model, n_layer, n_frequency).
+    thicknesses: float, numpy.ndarray
+        Thickness (m) of each layer, shape = (n_model, n_layer-1) or
+        (n_layer-1, ), if it is shared by all models.
+    n_threads : int, optional
+        Unused by the NumPy implementation, it is only accepted to match the
+        signature of the compiled kernel.
+
+    Returns
+    -------
+    rTE: complex numpy.ndarray
+        Reflection coefficients, shape = (n_model, n_frequency, n_filter)
+    """
+    lamb, thicknesses = _broadcast_batch_arguments(lamb, sigma, thicknesses)
+    return np.stack([
+        _rTE_forward(frequencies, lamb[i], sigma[i], mu[i], thicknesses[i])
+        for i in range(len(sigma))
+    ])
+
+
+def _rTE_gradient_batch(frequencies, lamb, sigma, mu, thicknesses, n_threads=None):
+    """Compute TE reflection coefficient gradients for many layered models at once.
+
+    Parameters
+    ----------
+    frequencies : float, numpy.ndarray
+        Frequency (Hz); shape = (n_frequency, ).
+    lamb : float, numpy.ndarray
+        Spatial wavenumber (1/m), shape = (n_model, n_filter) or (n_filter, ),
+        if it is shared by all models.
+    sigma: complex, numpy.ndarray
+        Conductivity (S/m), shape = (n_model, n_layer, n_frequency).
+    mu: complex, numpy.ndarray
+        Magnetic permeability (H/m), shape = (n_model, n_layer, n_frequency).
+    thicknesses: float, numpy.ndarray
+        Thickness (m) of each layer, shape = (n_model, n_layer-1) or
+        (n_layer-1, ), if it is shared by all models.
+    n_threads : int, optional
+        Unused by the NumPy implementation, it is only accepted to match the
+        signature of the compiled kernel.
+
+    Returns
+    -------
+    rTE_dsigma: complex numpy.ndarray
+        Reflection coefficients gradient w.r.t. conductivity
+        shape = (n_model, n_layer, n_frequency, n_filter)
+    rTE_dh: complex numpy.ndarray
+        Reflection coefficients gradient w.r.t. thicknesses
+        shape = (n_model, n_layer-1, n_frequency, n_filter)
+    rTE_dmu: complex numpy.ndarray
+        Reflection coefficients gradient w.r.t. magnetic permeability
+        shape = (n_model, n_layer, n_frequency, n_filter)
+    """
+    lamb, thicknesses = _broadcast_batch_arguments(lamb, sigma, thicknesses)
+    grads = [
+        _rTE_gradient(frequencies, lamb[i], sigma[i], mu[i], thicknesses[i])
+        for i in range(len(sigma))
+    ]
+    return tuple(np.stack(g) for g in zip(*grads))
+
+
 try:
-    from geoana.kernels._extensions.rTE import rTE_forward, rTE_gradient
+    from geoana.kernels._extensions.rTE import (
+        rTE_forward, rTE_gradient, rTE_forward_batch, rTE_gradient_batch
+    )
 except ImportError:
     # Store the above as the kernels
     rTE_forward = _rTE_forward
     rTE_gradient = _rTE_gradient
+    rTE_forward_batch = _rTE_forward_batch
+    rTE_gradient_batch = _rTE_gradient_batch
@@ -0,0 +1,73 @@
+import numpy as np
+
+
+def _wholespace_dipole_dyadic(x, y, z, ox, oy, oz, k):
+    """
+    Evaluates the field of a unit dipole in a wholespace along its dyadic Green's function.
+
+    Scaled by :math:`I ds / \\sigma` this is the electric field of an electric
+    dipole, and scaled by :math:`m` the magnetic field of a magnetic dipole.
+
+    Parameters
+    ----------
+    x, y, z : (...) numpy.ndarray
+        The locations relative to the dipole.
+    ox, oy, oz : (...) numpy.ndarray
+        The orientation of the dipole.
+    k : (...) numpy.ndarray of complex
+        The wavenumber.
+
+    Returns
+    -------
+    fx, fy, fz : (...) numpy.ndarray of complex
+    """
+    x, y, z, ox, oy, oz = (np.asarray(v, dtype=float) for v in (x, y, z, ox, oy, oz))
+    k = np.asarray(k, dtype=complex)
+    r2 = x * x + y * y + z * z
+    r = np.sqrt(r2)
+    kr = k * r
+    ikr = 1j * kr
+    front = np.exp(-ikr) / (4 * np.pi * r2 * r)
+    symmetric = front * (x * ox + y * oy + z * oz) * (-kr * kr + 3 * ikr + 3) / r2
+    oriented = front * (kr * kr - ikr - 1)
+    return symmetric * x + oriented * ox, symmetric * y + oriented * oy, symmetric * z + oriented * oz
+
+
+def _wholespace_dipole_curl(x, y, z, ox, oy, oz, k):
+    """
+    Evaluates the field of a unit dipole in a wholespace along the curl of its vector potential.
+
+    Scaled by :math:`-I ds` this is the magnetic field of an electric dipole,
+    and scaled by :math:`i \\omega \\mu m` the electric field of a magnetic dipole.
+
+    Parameters
+    ----------
+    x, y, z : (...) numpy.ndarray
+        The locations relative to the dipole.
+    ox, oy, oz : (...) numpy.ndarray
+        The orientation of the dipole.
+    k : (...) numpy.ndarray of complex
+        The wavenumber.
+
+    Returns
+    -------
+    fx, fy, fz : (...) numpy.ndarray of complex
+    """
+    x, y, z, ox, oy, oz = (np.asarray(v, dtype=float) for v in (x, y, z, ox, oy, oz))
+    k = np.asarray(k, dtype=complex)
+    r2 = x * x + y * y + z * z
+    r = np.sqrt(r2)
+    ikr = 1j * k * r
+    front = (ikr + 1) * np.exp(-ikr) / (4 * np.pi * r2 * r)
+    return front * (y * oz - z * oy), front * (z * ox - x * oz), front * (x * oy - y * ox)
+
+
+try:
+    from geoana.kernels._extensions.wholespace_dipole import (
+        wholespace_dipole_dyadic,
+        wholespace_dipole_curl,
+    )
+except ImportError:
+    # Store the above as the kernels
+    wholespace_dipole_dyadic = _wholespace_dipole_dyadic
+    wholespace_dipole_curl = _wholespace_dipole_curl
@@ -13,9 +13,21 @@ Shape Classes
   :toctree: generated/
 
   BasePrism
+  BasePrismCollection
 """
+import os
+from time import perf_counter
+
 import numpy as np
 
+from geoana.kernels import (
+    prism_definite_integrals,
+    prism_tensor_definite_integrals,
+    prism_derivative_integrals,
+    prism_tensor_derivative_integrals,
+)
+from geoana.kernels.potential_field_prism import _is_kernel
+
 
 class BasePrism:
     """Class for basic geometry of a prism.
@@ -29,14 +41,23 @@ class BasePrism:
         Minimum location triple of the axis aligned prism
     max_location : (3,) numpy.ndarray of float
         Maximum location triple of the axis aligned prism
+    dtype : {numpy.float64, numpy.float32}, optional
+        Data type of the computed fields.
+    far_field_ratio : float, optional
+        Distance, in prism diagonals, beyond which the prism is approximated by a
+        point source, see :attr:`far_field_ratio`.
     """
 
-    def __init__(self, min_location, max_location, **kwargs):
+    def __init__(
+        self, min_location, max_location, dtype=np.float64, far_field_ratio=None, **kwargs
+    ):
         super().__init__(**kwargs)
         self.min_location = min_location
         self.max_location = max_location
         if np.any(self.max_location <= self.min_location):
             raise ValueError("Max location must be strictly greater than the minimum location")
+        self.dtype = dtype
+        self.far_field_ratio = far_field_ratio
 
     @property
     def min_location(self):
@@ -92,6 +113,77 @@ class BasePrism:
 
         self._max_location = vec
 
+    @property
+    def dtype(self):
+        """Data type of the computed fields.
+
+        The kernels are always evaluated in double precision. Choosing
+        ``numpy.float32`` halves the memory of the results.
+
+        Returns
+        -------
+        numpy.dtype
+            Either ``numpy.float64`` or ``numpy.float32``.
+        """
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, value):
+        try:
+            value = np.dtype(value)
+        except TypeError:
+            raise TypeError(f"dtype must be a numpy float dtype, got {type(value)}")
+        if value not in (np.float32, np.float64):
+            raise ValueError(f"dtype must be float32 or float64, got {value}")
+        self._dtype = value
+
+    @property
+    def far_field_ratio(self):
+        """Distance, in prism diagonals, beyond which the prism is treated as a point.
+
+        Locations that are more than ``far_field_ratio`` times the length of the
+        prism's diagonal away from its center are evaluated from a point source at
+        the center, with the same mass (a point mass) or moment (a point dipole), in
+        place of the exact integral over the prism. The point source is much cheaper
+        to evaluate, and it does not suffer from the cancellation of the 8 corner
+        values of the exact integral far from the prism.
+
+        Each quantity is the volume integral of an n-th derivative of :math:`1/r`,
+        with n = 0 for the gravitational potential, 1 for the gravitational field
+        and magnetic potential, 2 for the gravity gradient and magnetic field, and 3
+        for the magnetic field gradient. To leading order in the ratio
+        :math:`\\eta` = ``far_field_ratio``, the error of each of its components is
+        bounded by
+
+        .. math::
+
+            \\frac{(n + 1)(n + 2)}{24 \\eta^2}
+
+        relative to :math:`n! V / r^{n + 1}`, the largest value of the integral at
+        distance :math:`r` (scaled by the density or magnetization). For example,
+        a ratio of 10 keeps the gravitational field within 0.25 %, and a ratio of
+        50 within 0.01 %, of this.
+
+        Returns
+        -------
+        None or float
+            ``None`` (default) always evaluates the exact integrals.
+        """
+        return self._far_field_ratio
+
+    @far_field_ratio.setter
+    def far_field_ratio(self, value):
+        if value is not None:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise TypeError(
+                    f"far_field_ratio must be None or a number, got {type(value)}"
+                )
+            if not value > 0:
+                raise ValueError(f"far_field_ratio must be positive, got {value}")
+        self._far_field_ratio = value
+
     @property
     def volume(self):
         """ The volume of the prism
@@ -113,6 +205,34 @@ class BasePrism:
         return 0.5 * (self.min_location + self.max_location)
 
     def _eval_def_int(self, func, x, y, z, cycle=0):
+        """evaluate a definite integral (func) over the prism at x, y, z locations
+
+        For the prism kernels of :mod:`geoana.kernels`, the 8 corners are evaluated in
+        a single pass over the locations, which is split over the threads set by
+        :func:`geoana.kernels.set_num_threads`. Any other func is evaluated at each
+        corner in turn, without the far field approximation."""
+        if not _is_kernel(func):
+            return self._sum_corners(func, x, y, z, cycle=cycle)
+        x, y, z = np.broadcast_arrays(x, y, z)
+        xyz = np.stack((x, y, z), axis=-1).reshape(-1, 3)
+        val = prism_definite_integrals(
+            func, xyz, self.min_location[None, :], self.max_location[None, :], cycle=cycle,
+            far_field_ratio=self.far_field_ratio
+        )
+        return val[:, 0].reshape(x.shape)
+
+    def _eval_derivative_def_int(self, order, x, y, z):
+        """evaluate the definite integrals of every component of the order 2 or 3
+        derivative tensor of 1/r over the prism at x, y, z locations in one pass"""
+        x, y, z = np.broadcast_arrays(x, y, z)
+        xyz = np.stack((x, y, z), axis=-1).reshape(-1, 3)
+        val = prism_derivative_integrals(
+            order, xyz, self.min_location[None, :], self.max_location[None, :],
+            far_field_ratio=self.far_field_ratio
+        )
+        return [v.reshape(x.shape) for v in val[..., 0].T]
+
+    def _sum_corners(self, func, x, y, z, cycle=0):
         "evaluate a definite integral (func) over the prism at x, y, z locations"
 
         x_min, y_min, z_min = self.min_location
@@ -141,3 +261,439 @@ class BasePrism:
 
         val = (v111 - v110 - v101 + v100 - v011 + v010 + v001 - v000)
         return val
+
+
+class BasePrismCollection:
+    """Class for basic geometry of a collection of prisms.
+
+    The ``BasePrismCollection`` class is used to define and validate the geometry
+    of many axis aligned prisms in three dimensions, such as the cells of a mesh,
+    whose responses are evaluated together.
+
+    Parameters
+    ----------
+    min_location : (n_prism, 3) numpy.ndarray of float
+        Minimum location triple of each axis aligned prism
+    max_location : (n_prism, 3) numpy.ndarray of float
+        Maximum location triple of each axis aligned prism
+    dtype : {numpy.float64, numpy.float32}, optional
+        Data type of the computed fields and sensitivity matrices.
+    far_field_ratio : float, optional
+        Distance, in prism diagonals, beyond which each prism is approximated by a
+        point source, see :attr:`far_field_ratio`.
+    """
+
+    def __init__(
+        self, min_location, max_location, dtype=np.float64, far_field_ratio=None, **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.dtype = dtype
+        self.far_field_ratio = far_field_ratio
+        self.min_location = min_location
+        self.max_location = max_location
+        if self.max_location.shape != self.min_location.shape:
+            raise ValueError(
+                "min_location and max_location must have the same shape, got "
+                f"{self.min_location.shape} and {self.max_location.shape}"
+            )
+        if np.any(self.max_location <= self.min_location):
+            raise ValueError("Max location must be strictly greater than the minimum location")
+
+    @classmethod
+    def from_tensor_nodes(cls, x_nodes, y_nodes, z_nodes, active_cells=None, **kwargs):
+        """Create a collection from the cells of a tensor grid.
+
+        Prisms created this way share their corners with their neighbours, which is
+        used to evaluate each kernel once per grid node (rather than at the 8 corners
+        of every prism) for each location.
+
+        Parameters
+        ----------
+        x_nodes, y_nodes, z_nodes : (n_x + 1), (n_y + 1), (n_z + 1) array_like
+            Increasing node locations of the grid along each axis, for example
+            ``mesh.nodes_x`` of a ``discretize.TensorMesh``.
+        active_cells : None or (n_x * n_y * n_z) array_like of bool, optional
+            Which cells of the grid are part of the collection, ordered with x changing
+            fastest (as in ``discretize``). Defaults to all cells.
+        **kwargs
+            Other arguments of the collection, such as its physical properties.
+
+        Returns
+        -------
+        BasePrismCollection
+        """
+        nodes = [np.asarray(vec, dtype=float) for vec in (x_nodes, y_nodes, z_nodes)]
+        for vec in nodes:
+            if vec.ndim != 1 or len(vec) < 2 or np.any(np.diff(vec) <= 0):
+                raise ValueError(
+                    "tensor nodes must be strictly increasing 1D arrays with at least 2 nodes"
+                )
+        x_nodes, y_nodes, z_nodes = nodes
+        shape = (len(x_nodes) - 1, len(y_nodes) - 1, len(z_nodes) - 1)
+
+        grids = np.meshgrid(x_nodes, y_nodes, z_nodes, indexing='ij')
+        min_location = np.stack([g[:-1, :-1, :-1].ravel('F') for g in grids], axis=-1)
+        max_location = np.stack([g[1:, 1:, 1:].ravel('F') for g in grids], axis=-1)
+
+        if active_cells is not None:
+            active_cells = np.asarray(active_cells, dtype=bool)
+            if active_cells.shape != (np.prod(shape), ):
+                raise ValueError(
+                    f"active_cells must have shape ({np.prod(shape)},), got {active_cells.shape}"
+                )
+            min_location = min_location[active_cells]
+            max_location = max_location[active_cells]
+
+        obj = cls(min_location, max_location, **kwargs)
+        obj._tensor_nodes = (x_nodes, y_nodes, z_nodes)
+        obj._active_cells = active_cells
+        return obj
+
+    @property
+    def min_location(self):
+        """Minimum location of each prism.
+
+        Returns
+        -------
+        (n_prism, 3) numpy.ndarray of float
+            Minimum location of each prism in meters.
+        """
+        return self._min_location
+
+    @min_location.setter
+    def min_location(self, vec):
+
+        try:
+            vec = np.asarray(vec, dtype=float)
+        except:
+            raise TypeError(f"location must be array_like of float, got {type(vec)}")
+
+        vec = np.atleast_2d(vec)
+        if vec.ndim != 2 or vec.shape[1] != 3:
+            raise ValueError(
+                f"location must be array_like with shape (n_prism, 3), got {vec.shape}"
+            )
+
+        self._min_location = np.ascontiguousarray(vec)
+        self._tensor_nodes = None
+
+    @property
+    def max_location(self):
+        """Maximum location of each prism.
+
+        Returns
+        -------
+        (n_prism, 3) numpy.ndarray of float
+            Maximum location of each prism in meters.
+        """
+        return self._max_location
+
+    @max_location.setter
+    def max_location(self, vec):
+
+        try:
+            vec = np.asarray(vec, dtype=float)
+        except:
+            raise TypeError(f"location must be array_like of float, got {type(vec)}")
+
+        vec = np.atleast_2d(vec)
+        if vec.ndim != 2 or vec.shape[1] != 3:
+            raise ValueError(
+                f"location must be array_like with shape (n_prism, 3), got {vec.shape}"
+            )
+
+        self._max_location = np.ascontiguousarray(vec)
+        self._tensor_nodes = None
+
+    @property
+    def dtype(self):
+        """Data type of the computed fields and sensitivity matrices.
+
+        The kernels are always evaluated in double precision. Choosing
+        ``numpy.float32`` halves the memory of the results, and of
+        sensitivity matrices in particular, while the sums over the prisms are still
+        accumulated in double precision.
+
+        Returns
+        -------
+        numpy.dtype
+            Either ``numpy.float64`` or ``numpy.float32``.
+        """
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, value):
+        try:
+            value = np.dtype(value)
+        except TypeError:
+            raise TypeError(f"dtype must be a numpy float dtype, got {type(value)}")
+        if value not in (np.float32, np.float64):
+            raise ValueError(f"dtype must be float32 or float64, got {value}")
+        self._dtype = value
+
+    @property
+    def far_field_ratio(self):
+        """Distance, in prism diagonals, beyond which each prism is treated as a point.
+
+        This is decided for every pair of location and prism, so that the distant
+        cells of a mesh are evaluated as point sources while the nearby ones are
+        integrated exactly. The error bound of each prism's contribution is given
+        in :attr:`BasePrism.far_field_ratio`. Collections created with
+        :meth:`from_tensor_nodes` evaluate the prisms one by one, instead of
+        sharing the nodes of the grid, while this is set.
+
+        Returns
+        -------
+        None or float
+            ``None`` (default) always evaluates the exact integrals.
+        """
+        return self._far_field_ratio
+
+    far_field_ratio = far_field_ratio.setter(BasePrism.far_field_ratio.fset)
+
+    @property
+    def n_prism(self):
+        """ The number of prisms in the collection
+
+        Returns
+        -------
+        int
+        """
+        return self.min_location.shape[0]
+
+    @property
+    def volume(self):
+        """ The volume of each prism
+
+        Returns
+        -------
+        (n_prism,) numpy.ndarray of float
+        """
+        return np.prod(self.max_location - self.min_location, axis=-1)
+
+    @property
+    def location(self):
+        """ The center of each prism
+
+        Returns
+        -------
+        (n_prism, 3) numpy.ndarray of float
+        """
+        return 0.5 * (self.min_location + self.max_location)
+
+    #: Names of the data components that :meth:`build_sensitivity` can assemble.
+    sensitivity_components = ()
+
+    @property
+    def _n_sensitivity_columns(self):
+        "number of model parameters, i.e. columns of the sensitivity matrix"
+        return self.n_prism
+
+    def _sensitivity_block(self, xyz, components, out, n_threads):
+        """write the sensitivities of the components at the (n, 3) xyz locations into
+        the C contiguous (n, n_comp, n_col) array out"""
+        raise NotImplementedError(
+            f"{type(self).__name__} does not implement build_sensitivity"
+        )
+
+    def build_sensitivity(
+        self, xyz, components, out=None, block_size=None, n_threads=None, verbose=False
+    ):
+        """Assemble the sensitivity matrix of the collection block by block.
+
+        The rows of the matrix are computed for a block of locations at a time, with
+        each block split over `n_threads` threads, and every entry is written to `out`
+        exactly once. The matrix can therefore be stored in a memory-mapped ``.npy``
+        file or a ``zarr`` array when it is larger than the available memory, with at
+        most one block of it held in memory and without evaluating any kernel twice.
+
+        The columns of the matrix are the model parameters of the collection: the
+        density of each prism for gravity, and the three components of the
+        magnetization of each prism, ordered as ``magnetization.reshape(-1)``, for
+        magnetics.
+
+        Parameters
+        ----------
+        xyz : (n_loc, 3) array_like
+            Observation locations.
+        components : str or list of str
+            Data components to assemble, from :attr:`sensitivity_components`.
+        out : None, str, os.PathLike or array_like, optional
+            Where to store the (n_loc * n_comp, n_col) matrix. A path ending in
+            ``.npy`` creates a memory-mapped ``.npy`` file, and one ending in ``.zarr``
+            a ``zarr`` array chunked by block (which requires ``zarr``). Any other
+            array of that shape which supports assigning slices of rows, such as a
+            ``numpy.memmap``, is filled in place. By default, a new array is allocated.
+        block_size : int, optional
+            Number of locations per block. Defaults to blocks of about 64 MiB.
+        n_threads : int, optional
+            Number of threads to split each block over, defaults to the value set by
+            :func:`geoana.kernels.set_num_threads`.
+        verbose : bool, optional
+            Print the time taken to build the matrix and its throughput.
+
+        Returns
+        -------
+        (n_loc * n_comp, n_col) numpy.ndarray or array_like
+            The sensitivity matrix in the `dtype` of the collection (or `out`), with
+            the rows ordered by location and then by component.
+        """
+        if isinstance(components, str):
+            components = [components]
+        components = list(components)
+        for component in components:
+            if component not in self.sensitivity_components:
+                raise ValueError(
+                    f"component must be one of {self.sensitivity_components}, "
+                    f"got {component!r}"
+                )
+        xyz = np.asarray(xyz, dtype=float)
+        if xyz.ndim != 2 or xyz.shape[1] != 3:
+            raise ValueError(f"xyz must have shape (n_loc, 3), got {xyz.shape}")
+
+        n_loc = xyz.shape[0]
+        n_comp = len(components)
+        n_col = self._n_sensitivity_columns
+        shape = (n_loc * n_comp, n_col)
+        if block_size is None:
+            block_size = max(2**23 // max(n_comp * n_col, 1), 1)
+        block_size = int(block_size)
+        if block_size < 1:
+            raise ValueError(f"block_size must be a positive integer, got {block_size}")
+        out = self._sensitivity_output(out, shape, block_size * n_comp)
+
+        # fill ndarrays (and memmaps) in place, other stores through a buffer
+        direct = isinstance(out, np.ndarray) and out.flags.c_contiguous
+        start_time = perf_counter()
+        for start in range(0, n_loc, block_size):
+            stop = min(start + block_size, n_loc)
+            rows = slice(start * n_comp, stop * n_comp)
+            if direct:
+                block = out[rows].reshape(stop - start, n_comp, n_col)
+            else:
+                block = np.empty((stop - start, n_comp, n_col), dtype=self.dtype)
+            self._sensitivity_block(xyz[start:stop], components, block, n_threads)
+            if not direct:
+                out[rows] = block.reshape(-1, n_col)
+        if isinstance(out, np.memmap):
+            out.flush()
+
+        if verbose:
+            elapsed = perf_counter() - start_time
+            n_bytes = shape[0] * shape[1] * np.dtype(self.dtype).itemsize
+            rate = shape[0] * shape[1] / elapsed if elapsed > 0 else np.inf
+            print(
+                f"built a {shape[0]} x {shape[1]} sensitivity matrix "
+                f"({n_bytes / 2**20:.1f} MiB) in {elapsed:.2f} s, "
+                f"{rate:.3g} entries/s"
+            )
+        return out
+
+    def _sensitivity_output(self, out, shape, chunk_rows):
+        "create or check the array that build_sensitivity writes into"
+        if out is None:
+            return np.empty(shape, dtype=self.dtype)
+        if isinstance(out, (str, os.PathLike)):
+            path = os.fspath(out)
+            if path.endswith(".npy"):
+                return np.lib.format.open_memmap(
+                    path, mode="w+", dtype=self.dtype, shape=shape
+                )
+            if path.endswith(".zarr"):
+                try:
+                    import zarr
+                except ImportError:
+                    raise ImportError("writing to a .zarr store requires zarr")
+                return zarr.open_array(
+                    path, mode="w", shape=shape, dtype=self.dtype,
+                    chunks=(max(min(chunk_rows, shape[0]), 1), shape[1])
+                )
+            raise ValueError(f"out must be a path ending in .npy or .zarr, got {path}")
+        if tuple(out.shape) != shape:
+            raise ValueError(f"out must have shape {shape}, got {tuple(out.shape)}")
+        return out
+
+    def _is_inside(self, xyz, values):
+        "sum values (n_prism, ...) of the prisms that contain each of the xyz locations"
+        shape = xyz.shape[:-1]
+        xyz = xyz.reshape(-1, 3)
+        out = np.zeros((xyz.shape[0], ) + values.shape[1:])
+        n_chunk = max(2**18 // self.n_prism, 1)
+        for start in range(0, xyz.shape[0], n_chunk):
+            points = xyz[start:start + n_chunk, None, :]
+            is_inside = (
+                np.all(points >= self.min_location, axis=-1)
+                & np.all(points <= self.max_location, axis=-1)
+            )
+            out[start:start + n_chunk] = np.tensordot(is_inside, values, axes=1)
+        return out.reshape(shape + values.shape[1:])
+
+    def _eval_def_int(self, func, xyz, cycle=0, weights=None, n_threads=None):
+        """evaluate a definite integral (func) over every prism at the xyz locations
+
+        Returns the (..., n_prism) integrals if weights is None, otherwise their
+        weighted sums over the prisms with shape (...) + weights.shape[1:].
+        """
+        shape = xyz.shape[:-1]
+        if self._use_tensor_nodes:
+            val = self._eval_tensor_def_int(
+                func, xyz.reshape(-1, 3), cycle, weights, n_threads=n_threads
+            )
+        else:
+            val = prism_definite_integrals(
+                func, xyz.reshape(-1, 3), self.min_location, self.max_location,
+                weights=weights, cycle=cycle, dtype=self.dtype, n_threads=n_threads,
+                far_field_ratio=self.far_field_ratio
+            )
+        return val.reshape(shape + val.shape[1:])
+
+    def _eval_derivative_def_int(self, order, xyz, weights=None, n_threads=None):
+        """evaluate the definite integrals of every component of the order 2 or 3
+        derivative tensor of 1/r over every prism at the xyz locations in one pass
+
+        Returns the (..., n_comp, n_prism) integrals if weights is None, otherwise their
+        weighted sums over the prisms with shape (..., n_comp) + weights.shape[1:].
+        """
+        shape = xyz.shape[:-1]
+        xyz = xyz.reshape(-1, 3)
+        if self._use_tensor_nodes:
+            active = self._active_cells
+            if weights is not None and active is not None:
+                weights = self._full_weights(weights)
+            val = prism_tensor_derivative_integrals(
+                order, xyz, *self._tensor_nodes, weights=weights, dtype=self.dtype,
+                n_threads=n_threads
+            )
+            if weights is None and active is not None:
+                val = val[..., active]
+        else:
+            val = prism_derivative_integrals(
+                order, xyz, self.min_location, self.max_location, weights=weights,
+                dtype=self.dtype, n_threads=n_threads, far_field_ratio=self.far_field_ratio
+            )
+        return val.reshape(shape + val.shape[1:])
+
+    @property
+    def _use_tensor_nodes(self):
+        # the shared nodes are always integrated exactly
+        return self._tensor_nodes is not None and self.far_field_ratio is None
+
+    def _full_weights(self, weights):
+        "scatter weights of the active cells into the full tensor grid"
+        weights = np.asarray(weights)
+        full = np.zeros((len(self._active_cells), ) + weights.shape[1:])
+        full[self._active_cells] = weights
+        return full
+
+    def _eval_tensor_def_int(self, func, xyz, cycle, weights, n_threads=None):
+        "evaluate the definite integrals using the shared nodes of the tensor grid"
+        active = self._active_cells
+        if weights is not None and active is not None:
+            weights = self._full_weights(weights)
+        val = prism_tensor_definite_integrals(
+            func, xyz, *self._tensor_nodes, weights=weights, cycle=cycle, dtype=self.dtype,
+            n_threads=n_threads
+        )
+        if weights is None and active is not None:
+            val = val[:, active]
+        return val
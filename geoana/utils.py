@@ -13,8 +13,12 @@ commonly used within the code base.
   mkvc
   ndgrid
   check_xyz_dim
+  check_out
+  Workspace
 
 """
+import threading
+
 import numpy as np
 
 
@@ -182,6 +186,97 @@ def check_xyz_dim(xyz, dim=3, dtype=float):
     return xyz
 
 
+def check_out(out, shape, dtype=float):
+    """ Checks an array to write a result into, or creates one
+
+    Parameters
+    ----------
+    out : None or numpy.ndarray
+        The array to check. A new array is created if it is ``None``.
+    shape : tuple of int
+        The expected shape of the array
+    dtype : DataType, optional
+        The expected data type of the array
+
+    Returns
+    -------
+    out : numpy.ndarray of `dtype`
+        The validated, or new, array
+    """
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if not isinstance(out, np.ndarray):
+        raise TypeError(f"out must be a numpy.ndarray, got {type(out)}")
+    if out.shape != tuple(shape):
+        raise ValueError(f"out must have shape {tuple(shape)}, got {out.shape}")
+    if out.dtype != np.dtype(dtype):
+        raise ValueError(f"out must have dtype {np.dtype(dtype)}, got {out.dtype}")
+    return out
+
+
+class Workspace:
+    """ Scratch arrays that are reused between calls
+
+    Repeatedly evaluating a field with the same shapes would otherwise allocate
+    the same temporary arrays on every call. A ``Workspace`` keeps each named
+    array, and only allocates it again when it is requested with a different
+    shape or data type. Each thread gets its own arrays, so an object owning a
+    workspace can be evaluated from several threads at once.
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> from geoana.utils import Workspace
+    >>> workspace = Workspace()
+    >>> r = workspace.empty("r", (100, ))
+    >>> r is workspace.empty("r", (100, ))
+    True
+    >>> r is workspace.empty("r", (200, ))
+    False
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def empty(self, name, shape, dtype=float):
+        """ An uninitialized scratch array
+
+        Parameters
+        ----------
+        name : str
+            Name of the array. Arrays that are used at the same time must have
+            different names.
+        shape : tuple of int
+            Shape of the array
+        dtype : DataType, optional
+            Data type of the array
+
+        Returns
+        -------
+        numpy.ndarray
+            The array, whose contents are left over from its previous use.
+        """
+        arrays = getattr(self._local, "arrays", None)
+        if arrays is None:
+            arrays = self._local.arrays = {}
+        shape = tuple(shape)
+        arr = arrays.get(name)
+        if arr is None or arr.shape != shape or arr.dtype != np.dtype(dtype):
+            arr = arrays[name] = np.empty(shape, dtype=dtype)
+        return arr
+
+    def clear(self):
+        """ Release the scratch arrays of the calling thread """
+        self._local.arrays = {}
+
+    def __getstate__(self):
+        # scratch arrays are not worth copying or pickling
+        return {}
+
+    def __setstate__(self, state):
+        self._local = threading.local()
+
+
 def requires(modules):
     """Decorate a function with soft dependencies.
 
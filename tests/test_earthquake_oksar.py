@@ -1,4 +1,6 @@
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from geoana.earthquake import oksar
 import numpy as np
@@ -26,5 +28,294 @@ class TestOksar(unittest.TestCase):
         np.testing.assert_allclose(true, LOS, rtol=1E-5)
 
 
+def test_los_vectors():
+    # the geometry of the Dinar interferogram, without downloading it
+    eq = oksar.EarthquakeInterferogram(
+        np.zeros(4), 'Dinar', [706216.0606, 4269238.9999], 35, (2, 2), [80., 80.],
+        [741140, 4230327], 23, 192, 788792, 'test', local_earth_radius=6386232
+    )
+    # compare against fortran code.
+    true = np.array([0.427051, -0.090772, 0.899660])
+    los = eq.get_LOS_vector(np.array([706216.0606, 4269238.9999, 0]))
+    np.testing.assert_allclose(los, true, rtol=1E-5)
+
+    rng = np.random.default_rng(0)
+    locations = np.c_[rng.uniform(7e5, 7.8e5, 50), rng.uniform(4.18e6, 4.27e6, 50)]
+    los = eq.get_LOS_vector(locations)
+    assert los.shape == (50, 3)
+    np.testing.assert_allclose(np.linalg.norm(los, axis=1), 1.)
+    for loc, v in zip(locations[:5], los[:5]):
+        np.testing.assert_allclose(eq.get_LOS_vector(loc), v, rtol=1E-14)
+    # lists of locations keep their (3, n) layout
+    np.testing.assert_equal(eq.get_LOS_vector(list(locations)), los.T)
+
+    cached = eq.get_LOS_vector(locations, cache=True)
+    np.testing.assert_equal(cached, los)
+    assert eq.get_LOS_vector(locations, cache=True) is cached
+    assert eq.get_LOS_vector(locations[::-1], cache=True) is not cached
+    eq.get_LOS_vector(locations, cache=True)
+    eq.satellite_azimuth = 190
+    assert not np.allclose(eq.get_LOS_vector(locations, cache=True), cached)
+
+    with pytest.raises(ValueError):
+        eq.get_LOS_vector(np.ones((3, 3, 2)))
+
+
+def _interferogram(data, shape=(12, 9)):
+    return oksar.EarthquakeInterferogram(
+        data, 'test', [7e5, 4.2e6], 35, shape, [80., 60.], [7.1e5, 4.19e6], 23, 192,
+        788792, 'test', scaling=0.5
+    )
+
+
+def test_interferogram_from_file(tmp_path):
+    rng = np.random.default_rng(0)
+    shape = (12, 9)
+    data = rng.normal(size=shape[0] * shape[1]).astype(np.float32)
+    data[::7] = 0.
+    filename = tmp_path / "test.r4"
+    data.tofile(filename)
+
+    mapped = oksar.EarthquakeInterferogram.from_file(
+        filename, 'test', [7e5, 4.2e6], 35, shape, [80., 60.], [7.1e5, 4.19e6], 23,
+        192, 788792, 'test', scaling=0.5
+    )
+    assert isinstance(mapped.data, np.memmap)
+    assert mapped.data.dtype == np.float32
+
+    full = _interferogram(data.astype(np.float64), shape)
+    x, y, d = mapped._get_plot_data()
+    x_test, y_test, d_test = full._get_plot_data()
+    np.testing.assert_allclose(x, x_test)
+    np.testing.assert_allclose(y, y_test)
+    np.testing.assert_equal(d, d_test)
+    assert d.shape == (shape[1], shape[0])
+    np.testing.assert_allclose(x[[0, -1]], [7e5, 7e5 + 80. * shape[0]])
+    np.testing.assert_allclose(y[[0, -1]], [4.2e6 - 60. * shape[1], 4.2e6])
+
+    # windows and decimation select the matching pixels and cell edges
+    window = ((2, 11), (1, 8))
+    x_w, y_w, d_w = mapped._get_plot_data(window=window, decimate=3)
+    np.testing.assert_equal(d_w, d_test[::-1][1:8:3, 2:11:3][::-1])
+    np.testing.assert_allclose(x_w, 7e5 + 80. * np.r_[2, 5, 8, 11])
+    np.testing.assert_allclose(y_w, 4.2e6 - 60. * np.r_[8, 7, 4, 1])
+
+    with pytest.raises(ValueError):
+        mapped._get_plot_data(decimate=0)
+    with pytest.raises(ValueError):
+        mapped._get_plot_data(window=((3, 3), (0, 9)))
+    with pytest.raises(ValueError):
+        oksar.EarthquakeInterferogram.from_file(
+            filename, 'test', [7e5, 4.2e6], 35, (12, 10), [80., 60.],
+            [7.1e5, 4.19e6], 23, 192, 788792, 'test'
+        )
+
+
+def _numpy_displacement(fwd, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(oksar, "okada_surface_displacement", None)
+        return fwd.displacement_vector
+
+
+@pytest.mark.parametrize("dip", [50., 90., 10.])
+@pytest.mark.parametrize("rake", [90., 0., -135.])
+def test_compiled_displacement(dip, rake, monkeypatch):
+    if oksar.okada_surface_displacement is None:
+        pytest.skip("compiled extensions are not available")
+    fwd = oksar.Oksar(
+        [0., 0.], [2e4, 0.], [0., 2e4], [9e3, 1.1e4], 0.,
+        depth_bottom=8e3, strike=329.6, dip=dip, rake=rake, slip=0.5, length=6e3,
+        shape=(41, 33)
+    )
+    u_numpy = _numpy_displacement(fwd, monkeypatch)
+    u = fwd.displacement_vector
+    assert u.shape == (41 * 33, 3)
+    np.testing.assert_allclose(u, u_numpy, rtol=1E-12, atol=1E-12 * np.abs(u_numpy).max())
+
+    # a buried fault
+    fwd.depth_top = 2e3
+    np.testing.assert_allclose(
+        fwd.displacement_vector, _numpy_displacement(fwd, monkeypatch),
+        rtol=1E-12, atol=1E-12 * np.abs(u_numpy).max()
+    )
+
+    # identical for any number of threads
+    grid = fwd.simulation_grid
+    args = (
+        grid[:, 0], grid[:, 1], fwd.center, (0.6, 0.8), 0.5, -dip, -3e3, 3e3, 1e3, 1e4,
+        0.1, 0.4
+    )
+    np.testing.assert_array_equal(
+        oksar.okada_surface_displacement(*args, n_threads=1),
+        oksar.okada_surface_displacement(*args, n_threads=3),
+    )
+
+    # the scales of the grid's corners are those of the whole grid
+    params = dict(zip(
+        ["center", "strike_vector", "alpha", "dip", "al1", "al2", "aw1", "aw2"], args[2:10]
+    ))
+    corners = grid[[0, 40, 41 * 32, 41 * 33 - 1]]
+    dc_max = oksar._snapping_scales(corners[:, 0], corners[:, 1], params)
+    np.testing.assert_array_equal(
+        dc_max, oksar._snapping_scales(grid[:, 0], grid[:, 1], params)
+    )
+    np.testing.assert_array_equal(
+        oksar.okada_surface_displacement(*args, dc_max=dc_max),
+        oksar.okada_surface_displacement(*args),
+    )
+    with pytest.raises(ValueError):
+        oksar.okada_surface_displacement(*args, dc_max=dc_max[:, :2])
+
+
+def test_compiled_singularity():
+    if oksar.okada_surface_displacement is None:
+        pytest.skip("compiled extensions are not available")
+    # a location on the surface trace of a fault that breaks the surface
+    with pytest.raises(ValueError):
+        oksar.okada_surface_displacement(
+            np.r_[0.], np.r_[0.], (0., 0.), (1., 0.), 0.5, -50., -1e3, 1e3, 0., 1e4,
+            0.1, 0.4
+        )
+
+
+def test_compiled_point_displacement():
+    if oksar.okada_point_displacement is None:
+        pytest.skip("compiled extensions are not available")
+    rng = np.random.default_rng(0)
+    x = rng.uniform(-1e4, 1e4, 200)
+    y = rng.uniform(-1e4, 1e4, 200)
+    fault = (3e3, -2e3, 0.6, 0.8, 0.5, -50., -3e3, 3e3, 1e3, 1e4, 0.1, 0.4)
+    u = np.stack(oksar.okada_point_displacement(x, y, *fault), axis=-1)
+    u_test = oksar.okada_surface_displacement(x, y, fault[:2], fault[2:4], *fault[4:])
+    np.testing.assert_allclose(u, u_test, rtol=1E-12, atol=1E-12 * np.abs(u_test).max())
+
+    # singular locations are nan
+    u = oksar.okada_point_displacement(0., 0., 0., 0., 1., 0., 0.5, -50., -1e3, 1e3, 0., 1e4, 0.1, 0.4)
+    assert np.all(np.isnan(u))
+
+    try:
+        from numba import njit
+    except ImportError:
+        return
+
+    okada_point_displacement = oksar.okada_point_displacement
+
+    @njit
+    def jitted_sum(x, y, fault):
+        out = np.zeros(3)
+        for i in range(x.shape[0]):
+            ux, uy, uz = okada_point_displacement(x[i], y[i], *fault)
+            out[0] += ux
+            out[1] += uy
+            out[2] += uz
+        return out
+
+    u = np.stack(oksar.okada_point_displacement(x, y, *fault), axis=-1)
+    np.testing.assert_allclose(jitted_sum(x, y, fault), u.sum(axis=0), rtol=1E-13)
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_displacement_tiles(compiled, monkeypatch, tmp_path):
+    if compiled and oksar.okada_surface_displacement is None:
+        pytest.skip("compiled extensions are not available")
+    if not compiled:
+        monkeypatch.setattr(oksar, "okada_surface_displacement", None)
+    fwd = oksar.Oksar(
+        [0., 0.], [2e4, 0.], [0., 2e4], [9e3, 1.1e4], 0.,
+        depth_bottom=8e3, strike=329.6, dip=50., rake=-90., slip=0.5, length=6e3,
+        shape=(41, 33)
+    )
+    u_test = fwd.displacement_vector
+
+    tiles = list(fwd.displacement_tiles(tile_size=100))
+    assert len(tiles) == 14
+    for tile, u in tiles:
+        np.testing.assert_array_equal(u, u_test[tile])
+
+    out = np.lib.format.open_memmap(tmp_path / "u.npy", mode="w+", shape=u_test.shape)
+    assert fwd.compute_displacement(out=out, tile_size=256) is out
+    np.testing.assert_array_equal(out, u_test)
+
+    with ThreadPoolExecutor(2) as executor:
+        u = fwd.compute_displacement(tile_size=100, executor=executor)
+        np.testing.assert_array_equal(u, u_test)
+        tiles = fwd.displacement_tiles(tile_size=100, executor=executor, max_pending=2)
+        for tile, u in tiles:
+            np.testing.assert_array_equal(u, u_test[tile])
+
+    with pytest.raises(ValueError):
+        fwd.compute_displacement(out=np.empty((10, 3)))
+    with pytest.raises(ValueError):
+        next(fwd.displacement_tiles(tile_size=0))
+
+
+@pytest.mark.parametrize("compiled", [True, False])
+def test_patches(compiled, monkeypatch):
+    if compiled and oksar.okada_surface_displacement is None:
+        pytest.skip("compiled extensions are not available")
+    if not compiled:
+        monkeypatch.setattr(oksar, "okada_surface_displacement", None)
+
+    rng = np.random.default_rng(0)
+    n_patch = 5
+    domain = dict(O=[0., 0.], U=[2e4, 0.], V=[0., 2e4], shape=(23, 19))
+    geometry = dict(
+        center=rng.uniform(8e3, 1.2e4, size=(n_patch, 2)),
+        depth_top=rng.uniform(0, 2e3, size=n_patch),
+        depth_bottom=rng.uniform(3e3, 6e3, size=n_patch),
+        strike=rng.uniform(0, 360, size=n_patch),
+        dip=rng.uniform(20, 90, size=n_patch),
+        rake=rng.uniform(-180, 180, size=n_patch),
+        slip=rng.uniform(0.1, 1, size=n_patch),
+        length=3e3,
+    )
+    patches = oksar.OksarPatches(**domain, **geometry)
+    assert patches.n_patch == n_patch
+    np.testing.assert_equal(patches.length, np.full(n_patch, 3e3))
+
+    singles = [
+        oksar.Oksar(
+            **domain, **{
+                key: value if np.isscalar(value) else value[i]
+                for key, value in geometry.items()
+            }
+        ).displacement_vector
+        for i in range(n_patch)
+    ]
+    u_test = sum(singles)
+    atol = 1E-12 * np.abs(u_test).max()
+
+    u = patches.displacement_vector
+    np.testing.assert_allclose(u, u_test, rtol=1E-12, atol=atol)
+    np.testing.assert_array_equal(patches.compute_displacement(tile_size=100), u)
+
+    # the corner terms cancel, so scaling the slip is only exact to round-off of
+    # the largest displacement
+    u, G = patches.displacement(return_greens_function=True)
+    assert G.shape == (23 * 19, n_patch, 3)
+    atol = 1E-9 * np.abs(u_test).max()
+    np.testing.assert_allclose(u, u_test, rtol=1E-8, atol=atol)
+    for i in range(n_patch):
+        np.testing.assert_allclose(
+            G[:, i] * geometry["slip"][i], singles[i], rtol=1E-8, atol=atol
+        )
+
+
+def test_patches_errors():
+    patches = oksar.OksarPatches(
+        [0., 0.], [2e4, 0.], [0., 2e4], [[1e4, 1e4], [1.2e4, 1e4]], 0.
+    )
+    with pytest.raises(ValueError):
+        patches.dip = [10., 20., 30.]
+    with pytest.raises(ValueError):
+        patches.dip = [10., 100.]
+    with pytest.raises(TypeError):
+        patches.slip = "abc"
+    with pytest.raises(ValueError):
+        patches.depth_bottom = [-1., 1e4]
+    with pytest.raises(ValueError):
+        patches.center = [1., 2., 3.]
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -40,3 +40,114 @@ def test_base_fdem():
 
 
 
+
+
+@pytest.mark.parametrize("method", ["electric_field", "magnetic_field", "vector_potential"])
+def test_chunked_evaluation(method, tmp_path):
+    sim = fdem.MagneticDipoleWholeSpace(np.logspace(1, 4, 7), orientation="z")
+    xyz = np.random.default_rng(0).uniform(-5, 5, size=(6, 5, 3))
+    expected = getattr(sim, method)(xyz)
+
+    blocks = list(sim.iter_chunks(method, xyz, frequency_chunk=3, location_chunk=8))
+    assert len(blocks) == 3 * 4
+    assert all(v.shape[0] <= 3 and v.shape[1] <= 8 for _, _, v in blocks)
+
+    out = sim.evaluate_chunked(method, xyz, frequency_chunk=3, location_chunk=8)
+    np.testing.assert_allclose(out, expected)
+
+    mm = np.lib.format.open_memmap(
+        tmp_path / "out.npy", mode="w+", dtype=complex, shape=(7, 6, 5, 3)
+    )
+    assert sim.evaluate_chunked(method, xyz, out=mm, frequency_chunk=2) is mm
+    np.testing.assert_allclose(mm, expected)
+
+
+def test_chunked_dipole_collection():
+    rng = np.random.default_rng(0)
+    sim = fdem.ElectricDipoleCollectionWholeSpace(
+        np.logspace(1, 4, 7), rng.uniform(-1, 1, size=(4, 3)), rng.normal(size=(4, 3))
+    )
+    xyz = rng.uniform(-5, 5, size=(13, 3))
+    np.testing.assert_allclose(
+        sim.evaluate_chunked("electric_field", xyz, frequency_chunk=2, location_chunk=5),
+        sim.electric_field(xyz)
+    )
+    # the per-dipole fields do not have the locations as their second axis
+    for location_chunk in [None, 5, 1]:
+        with pytest.raises(ValueError):
+            sim.evaluate_chunked(
+                "electric_field", xyz, location_chunk=location_chunk, summed=False
+            )
+
+
+def test_chunked_evaluation_errors():
+    sim = fdem.ElectricDipoleWholeSpace(np.logspace(1, 4, 7))
+    xyz = np.zeros((5, 3)) + 1.0
+    with pytest.raises(TypeError):
+        list(sim.iter_chunks(sim.electric_field, xyz))
+    with pytest.raises(ValueError):
+        list(sim.iter_chunks("not_a_field", xyz))
+    with pytest.raises(ValueError):
+        list(sim.iter_chunks("electric_field", xyz, frequency_chunk=0))
+    with pytest.raises(TypeError):
+        list(sim.iter_chunks("electric_field", xyz, location_chunk="a"))
+    with pytest.raises(TypeError):
+        list(sim.iter_chunks("electric_field", xyz, location_chunk=True))
+    with pytest.raises(ValueError):
+        list(sim.iter_chunks("electric_field", xyz, frequency_chunk=2.5))
+    with pytest.raises(ValueError):
+        sim.evaluate_chunked("electric_field", xyz, out=np.empty((7, 4, 3), dtype=complex))
+    with pytest.raises(ValueError):
+        sim.evaluate_chunked(
+            "electric_field", xyz, out=np.empty((7, 3, 5), dtype=complex).transpose(0, 2, 1)
+        )
+
+
+def test_derived_cache():
+    sim = fdem.ElectricDipoleWholeSpace(np.logspace(1, 4, 3), sigma=1.0)
+    # callers get copies that they may modify without changing the cache
+    k = sim.wavenumber
+    k *= 2
+    np.testing.assert_equal(sim.wavenumber, k / 2)
+    # the stored frequencies can only be changed by setting them again
+    with pytest.raises(ValueError):
+        sim.frequency[0] = 100.0
+
+    def check(sim):
+        np.testing.assert_equal(
+            sim.wavenumber,
+            fdem.wavenumber(
+                sim.frequency, sim.sigma, mu=sim.mu, epsilon=sim.epsilon,
+                quasistatic=sim.quasistatic
+            )
+        )
+        np.testing.assert_equal(
+            sim.skin_depth,
+            fdem.skin_depth(
+                sim.frequency, sim.sigma, mu=sim.mu, epsilon=sim.epsilon,
+                quasistatic=sim.quasistatic
+            )
+        )
+        np.testing.assert_equal(
+            sim.sigma_hat,
+            fdem.sigma_hat(
+                sim.frequency, sim.sigma, epsilon=sim.epsilon,
+                quasistatic=sim.quasistatic
+            )
+        )
+        np.testing.assert_equal(sim.wavenumber_squared, sim.wavenumber**2)
+        np.testing.assert_equal(sim.omega, fdem.omega(sim.frequency))
+
+    check(sim)
+    for name, value in [
+        ("frequency", [5.0, 50.0]), ("sigma", 0.1), ("mu", 2 * mu_0),
+        ("epsilon", 3 * epsilon_0), ("quasistatic", True),
+    ]:
+        setattr(sim, name, value)
+        check(sim)
+
+    sim.quasistatic = 0
+    assert sim.quasistatic is False
+    check(sim)
+    with pytest.raises(TypeError):
+        sim.quasistatic = np.array([True, False])
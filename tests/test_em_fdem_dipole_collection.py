@@ -0,0 +1,76 @@
+import pytest
+import numpy as np
+
+from geoana.em import fdem
+
+
+@pytest.fixture
+def dipoles():
+    rng = np.random.default_rng(0)
+    location = rng.uniform(-5, 5, size=(20, 3))
+    moment = rng.normal(size=(20, 3))
+    xyz = rng.uniform(10, 20, size=(4, 6, 3))
+    return location, moment, xyz
+
+
+@pytest.mark.parametrize(
+    "single, collection",
+    [
+        (fdem.ElectricDipoleWholeSpace, fdem.ElectricDipoleCollectionWholeSpace),
+        (fdem.MagneticDipoleWholeSpace, fdem.MagneticDipoleCollectionWholeSpace),
+    ],
+)
+@pytest.mark.parametrize(
+    "method", ["electric_field", "current_density", "magnetic_field", "magnetic_flux_density"]
+)
+def test_collection_matches_dipoles(single, collection, method, dipoles):
+    location, moment, xyz = dipoles
+    frequency = np.logspace(1, 3, 3)
+    sim = collection(frequency, location, moment, sigma=0.1)
+    # a small block size exercises the blocking over the dipoles
+    sim._block_size = 100
+
+    fields = []
+    for loc, m in zip(location, moment):
+        amplitude = np.linalg.norm(m)
+        if single is fdem.ElectricDipoleWholeSpace:
+            kwargs = dict(length=amplitude)
+        else:
+            kwargs = dict(moment=amplitude)
+        dipole = single(
+            frequency, location=loc, orientation=m / amplitude, sigma=0.1, **kwargs
+        )
+        fields.append(getattr(dipole, method)(xyz))
+    fields = np.stack(fields, axis=1)
+
+    np.testing.assert_allclose(getattr(sim, method)(xyz, summed=False), fields, rtol=1e-10)
+    np.testing.assert_allclose(getattr(sim, method)(xyz), fields.sum(axis=1), rtol=1e-10)
+
+
+def test_collection_errors(dipoles):
+    location, moment, _ = dipoles
+    sim = fdem.MagneticDipoleCollectionWholeSpace(10., location, [0., 0., 1.])
+    assert sim.n_dipole == 20
+    np.testing.assert_equal(sim.moment, np.tile([0., 0., 1.], (20, 1)))
+    with pytest.raises(TypeError):
+        sim.moment = "a"
+    with pytest.raises(ValueError):
+        sim.moment = moment[:5]
+    with pytest.raises(ValueError):
+        sim.location = location[:5]
+    with pytest.raises(ValueError):
+        sim.location = location[0]
+
+
+def test_collection_threads(dipoles):
+    from geoana.kernels import get_num_threads, set_num_threads
+
+    location, moment, xyz = dipoles
+    sim = fdem.ElectricDipoleCollectionWholeSpace(np.logspace(1, 3, 3), location, moment)
+    expected = sim.magnetic_field(xyz)
+    n_threads = get_num_threads()
+    try:
+        set_num_threads(3)
+        np.testing.assert_equal(sim.magnetic_field(xyz), expected)
+    finally:
+        set_num_threads(n_threads)
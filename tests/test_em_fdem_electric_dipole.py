@@ -4,6 +4,14 @@ import numpy as np
 
 from scipy.constants import mu_0, epsilon_0
 from geoana.em import fdem
+from geoana import kernels
+from geoana.kernels.wholespace_dipole import (
+    _wholespace_dipole_dyadic, _wholespace_dipole_curl
+)
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 import discretize
 
 # from SimPEG.EM import FDEM
@@ -345,5 +353,78 @@ class TestFDEMdipole(unittest.TestCase):
 #         assert(all(h_passed))
 
 
+@pytest.mark.parametrize(
+    "dyadic, curl", [
+        (kernels.wholespace_dipole_dyadic, kernels.wholespace_dipole_curl),
+        (_wholespace_dipole_dyadic, _wholespace_dipole_curl),
+    ]
+)
+def test_wholespace_dipole_kernels(dyadic, curl):
+    frequencies = np.r_[10., 1e3, 1e5]
+    kwargs = dict(
+        frequency=frequencies, location=[0.5, 0.2, -0.1], orientation=[0.6, 0., 0.8],
+        sigma=0.1
+    )
+    edws = fdem.ElectricDipoleWholeSpace(current=2., length=3., **kwargs)
+    mdws = fdem.MagneticDipoleWholeSpace(moment=2., **kwargs)
+    xyz = np.random.default_rng(0).normal(size=(20, 3)) * 10
+    dxyz = (xyz - edws.location).T
+    k = edws.wavenumber[:, None]
+
+    g = np.stack(dyadic(*dxyz, 0.6, 0., 0.8, k), axis=-1)
+    c = np.stack(curl(*dxyz, 0.6, 0., 0.8, k), axis=-1)
+    np.testing.assert_allclose(6 / 0.1 * g, edws.electric_field(xyz), rtol=1E-13)
+    np.testing.assert_allclose(-6 * c, edws.magnetic_field(xyz), rtol=1E-13)
+    np.testing.assert_allclose(2 * g, mdws.magnetic_field(xyz), rtol=1E-13)
+    np.testing.assert_allclose(
+        2j * mdws.omega[:, None, None] * mdws.mu * c, mdws.electric_field(xyz), rtol=1E-13
+    )
+
+
+@pytest.mark.skipif(
+    njit is None or kernels.wholespace_dipole_dyadic is _wholespace_dipole_dyadic,
+    reason="requires numba and the compiled kernels"
+)
+@pytest.mark.parametrize("function", [
+    kernels.wholespace_dipole_dyadic, kernels.wholespace_dipole_curl
+])
+def test_wholespace_dipole_numba_jitting_nopython(function):
+    xyz = np.random.default_rng(0).normal(size=(10, 3))
+
+    @njit
+    def jitted_func(xyz, k):
+        out = np.empty((xyz.shape[0], 3), dtype=np.complex128)
+        for i in range(xyz.shape[0]):
+            out[i] = function(xyz[i, 0], xyz[i, 1], xyz[i, 2], 0., 0.6, 0.8, k)
+        return out
+
+    for k in [0.3 - 0.2j, 0.5]:
+        np.testing.assert_equal(
+            jitted_func(xyz, k), np.stack(function(*xyz.T, 0., 0.6, 0.8, k), axis=-1)
+        )
+
+
+def test_electric_dipole_fields():
+    edws = fdem.ElectricDipoleWholeSpace(
+        frequency=np.r_[10., 1e3, 1e5], location=[0.5, 0.2, -0.1],
+        orientation=[0.6, 0., 0.8], sigma=0.1, current=2., length=3.
+    )
+    xyz = np.random.default_rng(0).normal(size=(4, 5, 3)) * 10
+
+    fields = edws.fields(xyz)
+    assert list(fields) == ["E", "H", "J", "B"]
+    np.testing.assert_allclose(fields["E"], edws.electric_field(xyz), rtol=1E-14)
+    np.testing.assert_allclose(fields["J"], edws.current_density(xyz), rtol=1E-14)
+    np.testing.assert_allclose(fields["H"], edws.magnetic_field(xyz), rtol=1E-14)
+    np.testing.assert_allclose(fields["B"], edws.magnetic_flux_density(xyz), rtol=1E-14)
+
+    fields = edws.fields(xyz[0, 0], which=("B", "E"))
+    assert list(fields) == ["B", "E"]
+    assert fields["E"].shape == (3, 3)
+    assert list(edws.fields(xyz, which="J")) == ["J"]
+    with pytest.raises(ValueError):
+        edws.fields(xyz, which=("E", "A"))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -6,13 +6,20 @@ from scipy.constants import mu_0, epsilon_0
 import libdlf
 from geoana.em.fdem import MagneticDipoleHalfSpace, MagneticDipoleLayeredHalfSpace
 from geoana.kernels.tranverse_electric_reflections import (
-    rTE_forward, rTE_gradient, _rTE_forward, _rTE_gradient
+    rTE_forward, rTE_gradient, _rTE_forward, _rTE_gradient,
+    rTE_forward_batch, rTE_gradient_batch, _rTE_forward_batch, _rTE_gradient_batch,
 )
+from geoana.kernels import get_num_threads, set_num_threads
 import discretize
 from scipy.special import iv, kv
 from geoana.em.fdem.base import sigma_hat
 
 from discretize.tests import check_derivative
+try:
+    from numba import njit
+    from numba.core.errors import TypingError
+except ImportError:
+    njit = None
 
 
 class TestHalfSpace:
@@ -279,6 +286,147 @@ class TestLayeredHalfspace(unittest.TestCase):
             assert_allclose(em_layer_sec, em_half_sec, rtol=1e-05, atol=1e-08)
 
 
+class TestLayeredCache:
+    frequencies = np.logspace(1, 4, 3)
+    thickness = np.r_[5., 10.]
+    xyz = np.c_[np.linspace(5, 50, 10), np.linspace(-5, 5, 10), np.full(10, 2.0)]
+
+    def get_sim(self, **kwargs):
+        return MagneticDipoleLayeredHalfSpace(
+            self.frequencies, self.thickness, sigma=np.r_[0.1, 1.0, 0.01],
+            orientation='Z', **kwargs
+        )
+
+    def test_repeated_calls(self):
+        sim = self.get_sim()
+        h1 = sim.magnetic_field(self.xyz)
+        assert sim._model_cache is not None
+        assert len(sim._geometry_cache) == 1
+
+        h2 = sim.magnetic_field(self.xyz)
+        np.testing.assert_equal(h1, h2)
+        assert len(sim._geometry_cache) == 1
+
+        # only the heights change, the lambdas are reused
+        xyz = self.xyz.copy()
+        xyz[:, 2] = 10.0
+        h3 = sim.magnetic_field(xyz)
+        assert len(sim._geometry_cache) == 1
+        np.testing.assert_equal(h3, self.get_sim().magnetic_field(xyz))
+
+    def test_bounded(self):
+        sim = self.get_sim()
+        for i in range(sim._max_cached_geometries + 3):
+            sim.magnetic_field(self.xyz + np.r_[i, 0, 0])
+        assert len(sim._geometry_cache) == sim._max_cached_geometries
+
+    def test_invalidation(self):
+        sim = self.get_sim()
+        sim.magnetic_field(self.xyz)
+
+        sim.sigma = np.r_[1.0, 0.1, 0.01]
+        assert sim._model_cache is None
+        np.testing.assert_equal(
+            sim.magnetic_field(self.xyz),
+            MagneticDipoleLayeredHalfSpace(
+                self.frequencies, self.thickness, sigma=np.r_[1.0, 0.1, 0.01], orientation='Z'
+            ).magnetic_field(self.xyz)
+        )
+
+        sim.frequency = np.r_[100.0, 1000.0]
+        assert sim._model_cache is None
+        sim.thickness = np.r_[2.0, 2.0]
+        assert sim._model_cache is None
+        sim.epsilon = epsilon_0
+        assert sim._model_cache is None
+        sim.mu = mu_0
+        assert sim._model_cache is None
+
+        # the model arrays can only be changed through their setters
+        for name in ["frequency", "thickness", "sigma", "mu", "epsilon"]:
+            with pytest.raises(ValueError):
+                getattr(sim, name)[0] = 1.0
+
+        sim = self.get_sim()
+        sim.magnetic_field(self.xyz)
+        sim.quasistatic = True
+        h_qs = sim.magnetic_field(self.xyz)
+        np.testing.assert_equal(h_qs, self.get_sim(quasistatic=True).magnetic_field(self.xyz))
+
+    def test_unique_offsets(self):
+        sim = self.get_sim()
+        # symmetric grid has many receivers at the same horizontal offset
+        x = np.linspace(-20, 20, 8)
+        X, Y = np.meshgrid(x, x)
+        xyz = np.c_[X.ravel(), Y.ravel(), np.linspace(0, 5, X.size)]
+        h = sim.magnetic_field(xyz)
+
+        lambd, i_unique, i_inverse, _, _ = sim._get_hankel_lambda(
+            np.linalg.norm(xyz[:, :2], axis=-1)
+        )
+        assert len(i_unique) < len(xyz)
+        np.testing.assert_equal(lambd[i_unique][i_inverse], lambd)
+
+        for i in [0, 9, 27, 63]:
+            assert_allclose(h[:, i], sim.magnetic_field(xyz[i:i+1]), rtol=1E-12)
+
+    def test_spline(self):
+        sim = self.get_sim()
+        x = np.linspace(-100, 100, 21)
+        X, Y = np.meshgrid(x, x + 0.5)
+        xyz = np.c_[X.ravel(), Y.ravel(), np.full(X.size, 1.0)]
+        h = sim.magnetic_field(xyz, field="total")
+        h_spline = sim.magnetic_field(xyz, field="total", hankel_method="spline")
+        assert_allclose(h_spline, h, rtol=1E-6, atol=1E-6*np.abs(h).max())
+
+        with pytest.raises(ValueError):
+            sim.magnetic_field(xyz, hankel_method="fft")
+
+    def test_lagged(self):
+        x = np.linspace(2, 500, 301)
+        for orientation in ['X', 'Y', 'Z', np.r_[1., 2., 3.]]:
+            sim = MagneticDipoleLayeredHalfSpace(
+                self.frequencies, self.thickness, sigma=np.r_[0.1, 1.0, 0.01],
+                orientation=orientation, location=np.r_[0., 0., 10.]
+            )
+            # profile at fixed height, and a second line at another height
+            xyz = np.r_[
+                np.c_[x, 0.5*x, np.full_like(x, 10.0)],
+                np.c_[-x, 0.2*x, np.full_like(x, 20.0)],
+            ]
+            h = sim.magnetic_field(xyz, field="total")
+            h_lagged = sim.magnetic_field(xyz, field="total", hankel_method="lagged")
+            assert_allclose(h_lagged, h, rtol=1E-4, atol=1E-4*np.abs(h).max())
+
+        # a single receiver
+        xyz = np.c_[20., 10., 10.]
+        assert_allclose(
+            sim.magnetic_field(xyz, hankel_method="lagged"), sim.magnetic_field(xyz),
+            rtol=1E-4
+        )
+
+    def test_chunked(self):
+        sigma = np.outer([0.1, 1.0, 0.01], [1.0, 2.0, 3.0])
+        sim = self.get_sim()
+        sim.sigma = sigma
+        h = sim.evaluate_chunked("magnetic_field", self.xyz, frequency_chunk=1)
+        np.testing.assert_allclose(h, sim.magnetic_field(self.xyz))
+        # the blocks did not modify the model of the simulation
+        np.testing.assert_equal(sim.sigma, sigma)
+
+    def test_hankel_filter(self):
+        sim_101 = self.get_sim()
+        sim_201 = self.get_sim(hankel_filter="key_201_2012")
+        assert_allclose(
+            sim_101.magnetic_field(self.xyz), sim_201.magnetic_field(self.xyz), rtol=1E-4
+        )
+
+        with pytest.raises(TypeError):
+            sim_101.hankel_filter = 101
+        with pytest.raises(ValueError):
+            sim_101.hankel_filter = "not_a_filter"
+
+
 class TestrTEGradient(unittest.TestCase):
     def test_rTE_jacobian(self):
         """Test to make sure numpy and compiled give same results"""
@@ -361,6 +509,47 @@ class TestCompiledVsNumpy(unittest.TestCase):
     def test_assert_using_compiled(self):
         assert rTE_forward is not _rTE_forward
 
+    def test_rTE_threaded(self):
+        n_layer = 4
+        n_frequency = 3
+        frequencies = np.logspace(1, 4, n_frequency)
+        thicknesses = np.r_[2.0, 5.0, 10.0]
+        lamb = np.logspace(-5, 0, 301)
+        sigma = np.logspace(-2, 0, n_layer*n_frequency).reshape(n_layer, n_frequency)
+        mu = mu_0 * np.ones((n_layer, n_frequency))
+
+        serial = rTE_forward(frequencies, lamb, sigma, mu, thicknesses, n_threads=1)
+        threaded = rTE_forward(frequencies, lamb, sigma, mu, thicknesses, n_threads=4)
+        np.testing.assert_equal(serial, threaded)
+
+        serial = rTE_gradient(frequencies, lamb, sigma, mu, thicknesses, n_threads=1)
+        threaded = rTE_gradient(frequencies, lamb, sigma, mu, thicknesses, n_threads=4)
+        for g_serial, g_threaded in zip(serial, threaded):
+            np.testing.assert_equal(g_serial, g_threaded)
+
+    def test_n_threads_errors(self):
+        args = (np.r_[10.0], np.r_[1.0], np.ones((1, 1)), mu_0*np.ones((1, 1)), np.array([]))
+        with pytest.raises(ValueError):
+            rTE_forward(*args, n_threads=0)
+        with pytest.raises(ValueError):
+            rTE_forward(*args, n_threads=1.5)
+        with pytest.raises(ValueError):
+            rTE_forward(*args, n_threads=2.0)
+        with pytest.raises(TypeError):
+            rTE_forward(*args, n_threads="two")
+        with pytest.raises(TypeError):
+            rTE_forward(*args, n_threads=True)
+
+    def test_set_num_threads(self):
+        default = get_num_threads()
+        try:
+            set_num_threads(2)
+            assert get_num_threads() == 2
+            with pytest.raises(ValueError):
+                set_num_threads(-1)
+        finally:
+            set_num_threads(default)
+
     def test_rTE(self):
         assert_allclose(self.rTE1, self.rTE2, atol=1E-15)
 
@@ -383,6 +572,114 @@ class TestCompiledVsNumpy(unittest.TestCase):
         assert_allclose(self.rTE1_dmu[non_zeros2], self.rTE2_dmu[non_zeros2])
 
 
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        n_model = 6
+        n_layer = 4
+        n_frequency = 3
+        n_lambda = 17
+        self.frequencies = np.logspace(1, 4, n_frequency)
+        rng = np.random.default_rng(42)
+        self.lamb = np.logspace(-4, 0, n_lambda) * rng.uniform(0.5, 2, size=(n_model, 1))
+        self.sigma = rng.uniform(1E-3, 1, size=(n_model, n_layer, n_frequency))
+        self.mu = mu_0 * rng.uniform(1, 1.1, size=(n_model, n_layer, n_frequency))
+        self.thicknesses = rng.uniform(1, 20, size=(n_model, n_layer-1))
+
+    def test_forward_matches_single(self):
+        args = (self.frequencies, self.lamb, self.sigma, self.mu, self.thicknesses)
+        out = rTE_forward_batch(*args)
+        assert out.shape == (6, 3, 17)
+        for i in range(len(self.sigma)):
+            single = rTE_forward(
+                self.frequencies, self.lamb[i], self.sigma[i], self.mu[i], self.thicknesses[i]
+            )
+            np.testing.assert_equal(out[i], single)
+        assert_allclose(out, _rTE_forward_batch(*args), atol=1E-15)
+        np.testing.assert_equal(out, rTE_forward_batch(*args, n_threads=4))
+
+    def test_gradient_matches_single(self):
+        args = (self.frequencies, self.lamb, self.sigma, self.mu, self.thicknesses)
+        out = rTE_gradient_batch(*args)
+        for i in range(len(self.sigma)):
+            single = rTE_gradient(
+                self.frequencies, self.lamb[i], self.sigma[i], self.mu[i], self.thicknesses[i]
+            )
+            for g_batch, g_single in zip(out, single):
+                np.testing.assert_equal(g_batch[i], g_single)
+        for g_compiled, g_numpy in zip(out, _rTE_gradient_batch(*args)):
+            assert_allclose(g_compiled, g_numpy)
+        for g_serial, g_threaded in zip(out, rTE_gradient_batch(*args, n_threads=3)):
+            np.testing.assert_equal(g_serial, g_threaded)
+
+    def test_shared_arguments(self):
+        lamb = self.lamb[0]
+        thick = self.thicknesses[0]
+        out = rTE_forward_batch(self.frequencies, lamb, self.sigma, self.mu, thick)
+        for i in range(len(self.sigma)):
+            single = rTE_forward(self.frequencies, lamb, self.sigma[i], self.mu[i], thick)
+            np.testing.assert_equal(out[i], single)
+
+        # halfspace models have no thicknesses
+        out = rTE_forward_batch(self.frequencies, lamb, self.sigma[:, :1], self.mu[:, :1], [])
+        single = rTE_forward(self.frequencies, lamb, self.sigma[1, :1], self.mu[1, :1], [])
+        np.testing.assert_equal(out[1], single)
+        g_sig, g_h, g_mu = rTE_gradient_batch(self.frequencies, lamb, self.sigma[:, :1], self.mu[:, :1], [])
+        assert g_h.shape == (6, 0, 3, 17)
+
+    def test_errors(self):
+        with pytest.raises(ValueError):
+            rTE_forward_batch(self.frequencies, self.lamb, self.sigma[0], self.mu[0], self.thicknesses[0])
+        with pytest.raises(ValueError):
+            rTE_forward_batch(self.frequencies[:2], self.lamb, self.sigma, self.mu, self.thicknesses)
+        with pytest.raises(ValueError):
+            rTE_forward_batch(self.frequencies, self.lamb[:2], self.sigma, self.mu, self.thicknesses)
+        with pytest.raises(ValueError):
+            rTE_forward_batch(self.frequencies, self.lamb, self.sigma, self.mu, self.thicknesses[:, :2])
+        with pytest.raises(ValueError):
+            rTE_forward_batch(self.frequencies, self.lamb, self.sigma, self.mu[:, :2], self.thicknesses)
+
+
+@pytest.mark.skipif(
+    njit is None or rTE_forward is _rTE_forward, reason="requires numba and the compiled kernels"
+)
+@pytest.mark.parametrize("n_layer", [1, 3])
+def test_rTE_numba_jitting_nopython(n_layer):
+    rng = np.random.default_rng(0)
+    frequencies = np.logspace(1, 5, 4)
+    lamb = np.logspace(-3, 0, 20)
+    sigma = rng.uniform(0.01, 1, (n_layer, 4)).astype(complex)
+    mu = np.full((n_layer, 4), mu_0)
+    thicknesses = np.full(n_layer - 1, 10.)
+
+    @njit
+    def jitted_forward(frequencies, lamb, sigma, mu, thicknesses):
+        return rTE_forward(frequencies, lamb, sigma, mu, thicknesses)
+
+    @njit
+    def jitted_gradient(frequencies, lamb, sigma, mu, thicknesses):
+        return rTE_gradient(frequencies, lamb, sigma, mu, thicknesses, 2)
+
+    args = (frequencies, lamb, sigma, mu, thicknesses)
+    np.testing.assert_equal(jitted_forward(*args), rTE_forward(*args))
+    for g_jit, g in zip(jitted_gradient(*args), rTE_gradient(*args)):
+        np.testing.assert_equal(g_jit, g)
+
+    with pytest.raises(ValueError):
+        jitted_forward(frequencies[:2], lamb, sigma, mu, thicknesses)
+
+    @njit
+    def jitted_threads(frequencies, lamb, sigma, mu, thicknesses, n_threads):
+        return rTE_forward(frequencies, lamb, sigma, mu, thicknesses, n_threads=n_threads)
+
+    np.testing.assert_equal(jitted_threads(*args, 3), rTE_forward(*args))
+    for n_threads in [0, -1]:
+        with pytest.raises(ValueError):
+            jitted_threads(*args, n_threads)
+    for n_threads in [2.0, True]:
+        with pytest.raises(TypingError):
+            jitted_threads(*args, n_threads)
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -7,6 +7,7 @@ from scipy.special import ellipk, ellipe
 
 from geoana.em import static, fdem
 from geoana import spatial
+from geoana.utils import Workspace
 
 TOL = 0.1
 
@@ -1613,3 +1614,139 @@ class TestDipoleHalfSpace:
         with pytest.raises(ValueError):
             dhs.current_density(xyz1, xyz4)
 
+
+
+class TestMagneticDipoleCollection:
+
+    def setup_method(self):
+        rng = np.random.default_rng(0)
+        self.location = rng.normal(scale=10.0, size=(500, 3))
+        self.moment = rng.normal(size=(500, 3))
+        self.xyz = rng.normal(scale=20.0, size=(40, 3))
+        self.h_test = 0.0
+        for loc, m in zip(self.location, self.moment):
+            dipole = static.MagneticDipoleWholeSpace(
+                location=loc, moment=np.linalg.norm(m),
+                orientation=m / np.linalg.norm(m)
+            )
+            self.h_test = self.h_test + dipole.magnetic_field(self.xyz)
+
+    def test_errors(self):
+        mdc = static.MagneticDipoleCollection(self.location, np.r_[0., 0., 1.])
+        assert mdc.moment.shape == (500, 3)
+        with pytest.raises(TypeError):
+            mdc.moment = "string"
+        with pytest.raises(ValueError):
+            mdc.moment = np.ones((2, 3))
+        with pytest.raises(ValueError):
+            mdc.location = self.location[:10]
+        with pytest.raises(ValueError):
+            mdc.theta = -1.0
+
+    def test_update(self):
+        mdc = static.MagneticDipoleCollection(self.location, np.r_[0., 0., 1.], theta=0.0)
+        mdc.magnetic_field(self.xyz)
+        # setting the dipoles rebuilds the tree
+        mdc.moment = self.moment
+        np.testing.assert_allclose(mdc.magnetic_field(self.xyz), self.h_test)
+        mdc.location = self.location + [1.0, 0.0, 0.0]
+        np.testing.assert_allclose(
+            mdc.magnetic_field(self.xyz + [1.0, 0.0, 0.0]), self.h_test
+        )
+
+    def test_exact(self):
+        mdc = static.MagneticDipoleCollection(self.location, self.moment, theta=0.0)
+        np.testing.assert_allclose(mdc.magnetic_field(self.xyz), self.h_test)
+        np.testing.assert_allclose(
+            mdc.magnetic_flux_density(self.xyz), mu_0 * self.h_test
+        )
+
+        # the field is the gradient of the scalar potential
+        dx = 1E-4
+        phi_x = (
+            mdc.scalar_potential(self.xyz + [dx, 0, 0])
+            - mdc.scalar_potential(self.xyz - [dx, 0, 0])
+        ) / (2 * dx)
+        np.testing.assert_allclose(
+            phi_x, self.h_test[:, 0], rtol=0, atol=1E-6 * np.abs(self.h_test).max()
+        )
+
+    def test_approximate(self):
+        mdc = static.MagneticDipoleCollection(self.location, self.moment, theta=0.3)
+        np.testing.assert_allclose(
+            mdc.magnetic_field(self.xyz), self.h_test,
+            rtol=0, atol=0.3**2 * np.abs(self.h_test).max()
+        )
+
+
+def _n_scratch_arrays(obj):
+    # the number of scratch arrays held by the workspaces of obj and its children
+    n = 0
+    for value in vars(obj).values():
+        if isinstance(value, Workspace):
+            n += len(getattr(value._local, "arrays", {}))
+        elif hasattr(value, "_workspace"):
+            n += _n_scratch_arrays(value)
+    return n
+
+
+@pytest.mark.parametrize(
+    "simulation, methods",
+    [
+        (
+            static.MagneticDipoleWholeSpace(orientation="z"),
+            ["magnetic_flux_density", "magnetic_field"],
+        ),
+        (static.MagneticPoleWholeSpace(), ["magnetic_flux_density", "magnetic_field"]),
+        (
+            static.CircularLoopWholeSpace(radius=2.0, orientation=[1, 1, 1]),
+            ["magnetic_flux_density", "magnetic_field"],
+        ),
+        (
+            static.PointCurrentWholeSpace(rho=2.0),
+            ["potential", "electric_field", "current_density"],
+        ),
+        (
+            static.PointCurrentHalfSpace(rho=2.0),
+            ["potential", "electric_field", "current_density"],
+        ),
+        (
+            static.DipoleHalfSpace(
+                rho=2.0, location_a=[-1, 0, 0], location_b=[1, 0, 0]
+            ),
+            ["potential", "electric_field", "current_density"],
+        ),
+    ],
+)
+def test_out_argument(simulation, methods):
+    xyz = np.random.default_rng(0).uniform(-10, 10, size=(40, 3))
+    xyz[:, -1] = -np.abs(xyz[:, -1])
+    # without out, no scratch arrays are kept alive between calls
+    for name in methods:
+        getattr(simulation, name)(xyz)
+    assert _n_scratch_arrays(simulation) == 0
+    for name in methods:
+        func = getattr(simulation, name)
+        expected = func(xyz)
+        out = np.empty_like(expected)
+        assert func(xyz, out=out) is out
+        np.testing.assert_equal(out, expected)
+        # workspace arrays are reused between calls of the same size
+        np.testing.assert_equal(func(xyz[:20], out=out[:20]), expected[:20])
+        np.testing.assert_equal(func(xyz), expected)
+        with pytest.raises(ValueError):
+            func(xyz, out=np.empty(out.shape + (1, )))
+
+
+def test_dipole_halfspace_out_broadcast():
+    # the M and N electrodes may have different numbers of dimensions
+    dhs = static.DipoleHalfSpace(rho=2.0, location_a=[-1, 0, 0], location_b=[1, 0, 0])
+    rng = np.random.default_rng(0)
+    xyz_m = rng.uniform(-10, 0, size=(5, 3))
+    xyz_n = rng.uniform(-10, 0, size=(1, 5, 3))
+    for name in ["potential", "electric_field", "current_density"]:
+        func = getattr(dhs, name)
+        expected = func(xyz_m, xyz_n)
+        out = np.empty_like(expected)
+        assert func(xyz_m, xyz_n, out=out) is out
+        np.testing.assert_equal(out, expected)
@@ -0,0 +1,125 @@
+import numpy as np
+import numpy.testing as npt
+import pytest
+from scipy.constants import mu_0
+from scipy.integrate import quad
+
+from geoana.em.tdem import (
+    MagneticDipoleLayeredHalfSpace,
+    magnetic_field_vertical_magnetic_dipole,
+    magnetic_field_time_deriv_magnetic_dipole,
+)
+
+
+def test_errors():
+    sim = MagneticDipoleLayeredHalfSpace(1E-3, np.r_[10.])
+
+    with pytest.raises(ValueError):
+        sim.time = np.r_[0., 1E-3]
+    with pytest.raises(TypeError):
+        sim.sigma = np.r_[0.1, 0.1, 0.1]
+    with pytest.raises(ValueError):
+        sim.sigma = -1.
+    with pytest.raises(ValueError):
+        sim.mu = 0.5 * mu_0
+    with pytest.raises(ValueError):
+        sim.waveform = np.ones((3, 3))
+    with pytest.raises(ValueError):
+        sim.waveform = [[0., 1.], [-1E-3, 0.]]
+    with pytest.raises(ValueError):
+        sim.waveform = [[-1E-3, 1.], [1E-3, 0.]]
+    with pytest.raises(TypeError):
+        sim.fourier_filter = 1
+    with pytest.raises(ValueError):
+        sim.fourier_filter = "not_a_filter"
+    with pytest.raises(ValueError):
+        sim.hankel_filter = "not_a_filter"
+    with pytest.raises(ValueError):
+        sim.magnetic_field(np.c_[10., 0., -1.])
+    with pytest.raises(ValueError):
+        MagneticDipoleLayeredHalfSpace(1E-3, np.r_[10.], location=np.r_[0., 0., -1.])
+
+
+def test_halfspace_step_off():
+    times = np.logspace(-5, -2, 16)
+    sigma = 0.01
+    xyz = np.c_[[50., 100.], [0., 20.], [0., 0.]]
+
+    sim = MagneticDipoleLayeredHalfSpace(times, None, sigma=sigma, orientation="Z")
+    h_test = magnetic_field_vertical_magnetic_dipole(times, xyz[:, :2], sigma)
+    dh_test = magnetic_field_time_deriv_magnetic_dipole(times, xyz[:, :2], sigma)
+
+    h = sim.magnetic_field(xyz)
+    dh = sim.magnetic_field_time_derivative(xyz)
+    npt.assert_allclose(h, h_test, rtol=1E-4, atol=1E-4 * np.abs(h_test).max())
+    npt.assert_allclose(dh, dh_test, rtol=1E-4, atol=1E-4 * np.abs(dh_test).max())
+
+    npt.assert_equal(sim.magnetic_flux_density(xyz), mu_0 * h)
+    npt.assert_equal(sim.magnetic_flux_time_derivative(xyz), mu_0 * dh)
+
+    # an equivalent step-off waveform gives the same answer (up to interpolation)
+    sim.waveform = [[-1E-3, 1.], [0., 1.]]
+    npt.assert_allclose(sim.magnetic_field(xyz), h, rtol=1E-4, atol=1E-5 * np.abs(h).max())
+
+    # thin layers of the same conductivity are still a halfspace
+    layered = MagneticDipoleLayeredHalfSpace(
+        times, np.r_[10., 20.], sigma=sigma, orientation="Z"
+    )
+    npt.assert_allclose(
+        layered.magnetic_field(xyz), h, rtol=1E-6, atol=1E-5 * np.abs(h).max()
+    )
+
+
+def test_waveform_convolution():
+    times = np.logspace(-4, -2, 9)
+    thickness = np.r_[10., 20.]
+    kwargs = dict(sigma=np.r_[0.01, 0.5, 0.01], orientation="Z")
+    xyz = np.c_[50., 0., 0.]
+    waveform = np.array([[-2E-3, 0.], [-1E-3, 1.], [-5E-4, 1.], [0., 0.]])
+
+    sim = MagneticDipoleLayeredHalfSpace(times, thickness, waveform=waveform, **kwargs)
+    h = sim.magnetic_field(xyz)[:, 2]
+
+    # numerically convolve a densely sampled step-off response with the waveform
+    t_step = np.logspace(-6, -1, 2001)
+    step = MagneticDipoleLayeredHalfSpace(t_step, thickness, **kwargs)
+    h_step = step.magnetic_field(xyz)[:, 2]
+
+    def step_off(t):
+        return np.interp(np.log(t), np.log(t_step), h_step)
+
+    h_test = []
+    for t in times:
+        h_t = 0.0
+        for (ta, ia), (tb, ib) in zip(waveform[:-1], waveform[1:]):
+            slope = (ib - ia) / (tb - ta)
+            if slope != 0.0:
+                h_t -= slope * quad(lambda tau: step_off(t - tau), ta, tb, limit=200)[0]
+        h_test.append(h_t)
+    npt.assert_allclose(h, h_test, rtol=1E-4)
+
+    # time derivative against finite differences of the field
+    dh = sim.magnetic_field_time_derivative(xyz)[:, 2]
+    eps = 1E-4
+    sim.time = times * (1 + eps)
+    h_plus = sim.magnetic_field(xyz)[:, 2]
+    sim.time = times * (1 - eps)
+    h_minus = sim.magnetic_field(xyz)[:, 2]
+    dh_test = (h_plus - h_minus) / (2 * eps * times)
+    npt.assert_allclose(dh[:-1], dh_test[:-1], rtol=1E-3)
+
+
+def test_invalidation():
+    times = np.logspace(-5, -3, 5)
+    xyz = np.c_[50., 0., 0.]
+    sim = MagneticDipoleLayeredHalfSpace(times, np.r_[10.], sigma=0.01, orientation="Z")
+    h1 = sim.magnetic_field(xyz)
+    npt.assert_equal(sim.magnetic_field(xyz), h1)
+
+    sim.sigma = np.r_[0.01, 1.0]
+    h2 = sim.magnetic_field(xyz)
+    test = MagneticDipoleLayeredHalfSpace(
+        times, np.r_[10.], sigma=np.r_[0.01, 1.0], orientation="Z"
+    )
+    npt.assert_equal(h2, test.magnetic_field(xyz))
+    assert np.abs(h2 - h1).max() > 0
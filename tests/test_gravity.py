@@ -275,3 +275,75 @@ class TestSphere:
         g_tens = s.gravitational_gradient(xyz)
         np.testing.assert_allclose(g_tens_test, g_tens, atol=1E-9)
 
+
+
+class TestPointMassCollection:
+
+    def setup_method(self):
+        rng = np.random.default_rng(0)
+        self.location = rng.normal(scale=10.0, size=(2000, 3))
+        self.mass = rng.uniform(1.0, 2.0, 2000)
+        self.xyz = rng.normal(scale=20.0, size=(50, 3))
+        self.u_test = sum(
+            U_from_PointMass(self.xyz, loc, m) for loc, m in zip(self.location, self.mass)
+        )
+        self.g_test = sum(
+            g_from_PointMass(self.xyz, loc, m) for loc, m in zip(self.location, self.mass)
+        )
+
+    def test_errors(self):
+        pmc = gravity.PointMassCollection(mass=1.0, location=self.location)
+        with pytest.raises(TypeError):
+            pmc.mass = "string"
+        with pytest.raises(ValueError):
+            pmc.mass = [1.0, 2.0]
+        with pytest.raises(ValueError):
+            pmc.location = [0, 1, 2]
+        with pytest.raises(ValueError):
+            pmc.location = self.location[:10]
+        with pytest.raises(TypeError):
+            pmc.theta = "string"
+        with pytest.raises(ValueError):
+            pmc.theta = -1.0
+
+    def test_exact(self):
+        pmc = gravity.PointMassCollection(
+            mass=self.mass, location=self.location, theta=0.0
+        )
+        np.testing.assert_allclose(pmc.gravitational_potential(self.xyz), self.u_test)
+        np.testing.assert_allclose(pmc.gravitational_field(self.xyz), self.g_test)
+
+        # the tree is rebuilt for new masses
+        pmc.mass = 2 * self.mass
+        np.testing.assert_allclose(pmc.gravitational_potential(self.xyz), 2 * self.u_test)
+
+    @pytest.mark.parametrize("theta", [0.3, 0.6])
+    def test_approximate(self, theta):
+        pmc = gravity.PointMassCollection(
+            mass=self.mass, location=self.location, theta=theta
+        )
+        u = pmc.gravitational_potential(self.xyz.reshape(5, 10, 3))
+        g = pmc.gravitational_field(self.xyz)
+        assert u.shape == (5, 10)
+        np.testing.assert_allclose(u.reshape(-1), self.u_test, rtol=theta**3)
+        np.testing.assert_allclose(
+            g, self.g_test, rtol=0, atol=theta**3 * np.abs(self.g_test).max()
+        )
+
+    @pytest.mark.parametrize("order", [0, 1])
+    def test_tree_compiled_vs_numpy(self, order):
+        from geoana.kernels import point_source_tree as pst
+
+        rng = np.random.default_rng(1)
+        tree = pst.PointSourceTree(
+            self.location, charges=self.mass, dipoles=rng.normal(size=(2000, 3)),
+            leaf_size=8
+        )
+        out = np.empty((len(self.xyz), 1 if order == 0 else 3))
+        pst._tree_sum_numpy(
+            order, self.xyz, 0.5, tree._center, tree._radius, tree._moments,
+            tree._first_child, tree._n_child, tree._start, tree._stop,
+            tree._locations, tree._charges, tree._dipoles, out
+        )
+        v = tree.evaluate(self.xyz, order=order, theta=0.5, n_threads=2)
+        np.testing.assert_allclose(out.reshape(v.shape), v, rtol=1E-10)
@@ -1,11 +1,16 @@
+import math
+
 import numpy as np
 from numpy.testing import assert_allclose
+from scipy.constants import G
 from discretize.tests import check_derivative
 import pytest
 
 import geoana.kernels.potential_field_prism as pf
 import geoana.gravity as grav
-from geoana.em.static import MagneticPrism, MagneticDipoleWholeSpace
+from geoana.em.static import (
+    MagneticPrism, MagneticPrismCollection, MagneticDipoleWholeSpace
+)
 try:
     from numba import njit
 except ImportError:
@@ -73,6 +78,25 @@ class TestCompiledVsNumpy():
         assert_allclose(v0, v1)
 
 
+@pytest.mark.parametrize('kernel', list(pf._KERNELS))
+def test_exported_c_kernels(kernel):
+    # the double precision kernels behind the ufuncs are available to other
+    # compiled code
+    from geoana.kernels._extensions import potential_field_prism
+
+    assert kernel + '_double' in potential_field_prism.__pyx_capi__
+    assert getattr(pf, kernel).__name__ == kernel
+
+
+@pytest.mark.parametrize('kernel', list(pf._KERNELS))
+def test_float32_kernels(kernel):
+    x, y, z = np.random.default_rng(0).uniform(-5, 5, size=(3, 20))
+    v64 = getattr(pf, kernel)(x, y, z)
+    v32 = getattr(pf, kernel)(x.astype(np.float32), y.astype(np.float32), z.astype(np.float32))
+    assert v32.dtype == np.float32
+    assert_allclose(v32, v64, rtol=1E-5, atol=1E-5 * np.abs(v64).max())
+
+
 class TestGravityPrismDerivatives():
     xyz = np.mgrid[-100:100:26j, -100:100:26j, -100:100:26j]
     x = xyz[0].ravel()
@@ -288,6 +312,450 @@ def test_grav_init_and_errors():
         prism.rho = 'abc'
 
 
+def test_custom_kernel():
+    # integrands other than the prism kernels are summed over the corners in numpy
+    prism = grav.Prism([-1, -2, -3], [2, 1, 0])
+    x, y, z = np.random.default_rng(0).uniform(-5, 5, size=(3, 4, 5))
+    for cycle in range(3):
+        v = prism._eval_def_int(pf.prism_fz, x, y, z, cycle=cycle)
+        assert_allclose(
+            prism._eval_def_int(pf._prism_fz, x, y, z, cycle=cycle), v,
+            rtol=1E-10, atol=1E-10 * np.abs(v).max()
+        )
+        assert_allclose(
+            prism._eval_def_int(lambda a, b, c: 2 * pf.prism_fz(a, b, c), x, y, z, cycle=cycle),
+            2 * v, rtol=1E-10, atol=1E-10 * np.abs(v).max()
+        )
+
+    with pytest.raises(ValueError):
+        pf.prism_definite_integrals(
+            lambda a, b, c: a, np.zeros((1, 3)), np.ones((1, 3)), 2 * np.ones((1, 3))
+        )
+
+
+class TestPrismCollection():
+    rng = np.random.default_rng(42)
+    min_location = rng.uniform(-20, 20, size=(12, 3))
+    max_location = min_location + rng.uniform(1, 5, size=(12, 3))
+    rho = rng.uniform(-1, 1, size=12)
+    magnetization = rng.normal(size=(12, 3))
+    xyz = rng.uniform(-40, 40, size=(5, 4, 3))
+    tensor_nodes = (
+        np.cumsum(rng.uniform(1, 5, size=7)) - 10,
+        np.cumsum(rng.uniform(1, 5, size=6)) - 10,
+        -np.cumsum(rng.uniform(1, 5, size=5))[::-1],
+    )
+
+    @pytest.mark.parametrize('cycle', [0, 1, 2])
+    @pytest.mark.parametrize('kernel', list(pf._KERNELS))
+    def test_compiled_vs_numpy(self, kernel, cycle):
+        xyz = self.xyz.reshape(-1, 3)
+        v0 = pf._eval_def_int_chunk(kernel, xyz, self.min_location, self.max_location, cycle)
+        v1 = pf.prism_definite_integrals(
+            kernel, xyz, self.min_location, self.max_location, cycle=cycle
+        )
+        assert_allclose(v0, v1, rtol=1E-10, atol=1E-10 * np.abs(v0).max())
+
+        weights = self.magnetization
+        v1 = pf.prism_definite_integrals(
+            kernel, xyz, self.min_location, self.max_location, weights=weights, cycle=cycle
+        )
+        assert_allclose(v0 @ weights, v1, rtol=1E-10, atol=1E-10 * np.abs(v1).max())
+
+    @pytest.mark.parametrize(
+        'method', ['gravitational_potential', 'gravitational_field', 'gravitational_gradient']
+    )
+    def test_gravity(self, method):
+        prisms = grav.PrismCollection(self.min_location, self.max_location, rho=self.rho)
+        v_test = sum(
+            getattr(grav.Prism(p0, p1, rho=rho), method)(self.xyz)
+            for p0, p1, rho in zip(self.min_location, self.max_location, self.rho)
+        )
+        v = getattr(prisms, method)(self.xyz)
+        assert_allclose(v, v_test, atol=1E-12 * np.abs(v_test).max())
+
+        sens = getattr(prisms, method + '_sensitivity')(self.xyz)
+        assert sens.shape == v_test.shape + (12, )
+        assert_allclose(sens @ self.rho, v_test, atol=1E-12 * np.abs(v_test).max())
+
+    @pytest.mark.parametrize(
+        'method', [
+            'scalar_potential', 'magnetic_field', 'magnetic_flux_density',
+            'magnetic_field_gradient'
+        ]
+    )
+    def test_magnetic(self, method):
+        prisms = MagneticPrismCollection(
+            self.min_location, self.max_location, magnetization=self.magnetization
+        )
+        xyz = self.xyz.copy()
+        # include a location inside of a prism
+        xyz[0, 0] = prisms.location[0]
+        v_test = sum(
+            getattr(MagneticPrism(p0, p1, magnetization=m), method)(xyz)
+            for p0, p1, m in zip(self.min_location, self.max_location, self.magnetization)
+        )
+        v = getattr(prisms, method)(xyz)
+        assert_allclose(v, v_test, atol=1E-12 * np.abs(v_test).max())
+
+        if hasattr(prisms, method + '_sensitivity'):
+            sens = getattr(prisms, method + '_sensitivity')(xyz)
+            assert sens.shape == v_test.shape + (12, 3)
+            sens = sens.reshape(v_test.shape + (-1, ))
+            assert_allclose(
+                sens @ self.magnetization.reshape(-1), v_test,
+                atol=1E-12 * np.abs(v_test).max()
+            )
+
+    @pytest.mark.parametrize('cycle', [0, 1, 2])
+    @pytest.mark.parametrize('kernel', list(pf._KERNELS))
+    def test_tensor_compiled_vs_numpy(self, kernel, cycle):
+        xyz = self.xyz.reshape(-1, 3)
+        nodes = self.tensor_nodes
+        v0 = pf._tensor_def_int_chunk(kernel, xyz, *nodes, cycle)
+        v1 = pf.prism_tensor_definite_integrals(kernel, xyz, *nodes, cycle=cycle)
+        assert_allclose(v0, v1, rtol=1E-10, atol=1E-10 * np.abs(v0).max())
+
+        prisms = grav.PrismCollection.from_tensor_nodes(*nodes)
+        v2 = pf.prism_definite_integrals(
+            kernel, xyz, prisms.min_location, prisms.max_location, cycle=cycle
+        )
+        assert_allclose(v1, v2, rtol=1E-10, atol=1E-10 * np.abs(v2).max())
+
+    @pytest.mark.parametrize('weighted', [False, True])
+    def test_threads(self, weighted):
+        xyz = self.xyz.reshape(-1, 3)
+        weights = self.magnetization if weighted else None
+        prisms = (self.min_location, self.max_location)
+        nodes = self.tensor_nodes
+        tensor_weights = self.rng.normal(size=(6 * 5 * 4, 3)) if weighted else None
+        funcs = [
+            lambda **kw: pf.prism_definite_integrals(
+                pf.prism_fz, xyz, *prisms, weights=weights, cycle=1, **kw
+            ),
+            lambda **kw: pf.prism_tensor_definite_integrals(
+                'prism_fzz', xyz, *nodes, weights=tensor_weights, **kw
+            ),
+            lambda **kw: pf.prism_derivative_integrals(3, xyz, *prisms, weights=weights, **kw),
+            lambda **kw: pf.prism_tensor_derivative_integrals(
+                2, xyz, *nodes, weights=tensor_weights, dtype=np.float32, **kw
+            ),
+        ]
+        for func in funcs:
+            v = func(n_threads=1)
+            # more threads than locations
+            for n_threads in [3, 50]:
+                np.testing.assert_array_equal(func(n_threads=n_threads), v)
+
+        with pytest.raises(ValueError):
+            pf.prism_definite_integrals(pf.prism_fz, xyz, *prisms, n_threads=0)
+
+    @pytest.mark.parametrize('order', [2, 3])
+    def test_derivative_integrals(self, order):
+        xyz = self.xyz.reshape(-1, 3).copy()
+        # include locations on the prisms' corners, edges and faces
+        xyz[0] = self.min_location[0]
+        xyz[1] = [self.min_location[1, 0], self.max_location[1, 1], 0.0]
+        xyz[2, 2] = self.max_location[2, 2]
+        components = pf._DERIVATIVE_COMPONENTS[order]
+        v_test = np.stack([
+            pf._eval_def_int_chunk(kernel, xyz, self.min_location, self.max_location, cycle)
+            for kernel, cycle in components
+        ], axis=1)
+        atol = 1E-10 * np.abs(v_test).max()
+
+        v = pf.prism_derivative_integrals(order, xyz, self.min_location, self.max_location)
+        assert v.shape == (xyz.shape[0], len(components), 12)
+        assert_allclose(v, v_test, rtol=1E-10, atol=atol)
+
+        weights = self.magnetization
+        v = pf.prism_derivative_integrals(
+            order, xyz, self.min_location, self.max_location, weights=weights
+        )
+        assert_allclose(v, v_test @ weights, rtol=1E-10, atol=atol)
+
+        nodes = self.tensor_nodes
+        v_test = np.stack([
+            pf._tensor_def_int_chunk(kernel, xyz, *nodes, cycle)
+            for kernel, cycle in components
+        ], axis=1)
+        v = pf.prism_tensor_derivative_integrals(order, xyz, *nodes)
+        assert_allclose(v, v_test, rtol=1E-10, atol=1E-10 * np.abs(v_test).max())
+
+        with pytest.raises(ValueError):
+            pf.prism_derivative_integrals(1, xyz, self.min_location, self.max_location)
+
+    def test_tensor_collections(self):
+        nodes = self.tensor_nodes
+        n_cell = 6 * 5 * 4
+        active = self.rng.uniform(size=n_cell) > 0.3
+        rho = self.rng.uniform(size=active.sum())
+
+        tensor = grav.PrismCollection.from_tensor_nodes(*nodes, active_cells=active, rho=rho)
+        assert tensor.n_prism == active.sum()
+        prisms = grav.PrismCollection(tensor.min_location, tensor.max_location, rho=rho)
+        for method in ['gravitational_field', 'gravitational_gradient_sensitivity']:
+            v = getattr(tensor, method)(self.xyz)
+            v_test = getattr(prisms, method)(self.xyz)
+            assert_allclose(v, v_test, atol=1E-12 * np.abs(v_test).max())
+
+        tensor = MagneticPrismCollection.from_tensor_nodes(*nodes, magnetization=[1, 2, 3])
+        prisms = MagneticPrismCollection(
+            tensor.min_location, tensor.max_location, magnetization=[1, 2, 3]
+        )
+        for method in ['magnetic_field', 'magnetic_field_sensitivity']:
+            v = getattr(tensor, method)(self.xyz)
+            v_test = getattr(prisms, method)(self.xyz)
+            assert_allclose(v, v_test, atol=1E-12 * np.abs(v_test).max())
+
+        # changing the geometry turns off the tensor evaluation
+        tensor.min_location = tensor.min_location
+        assert tensor._tensor_nodes is None
+
+        with pytest.raises(ValueError):
+            grav.PrismCollection.from_tensor_nodes(*nodes, active_cells=active[:-1])
+        with pytest.raises(ValueError):
+            grav.PrismCollection.from_tensor_nodes(nodes[0][::-1], *nodes[1:])
+
+    @pytest.mark.parametrize('tensor', [False, True])
+    def test_float32(self, tensor):
+        kwargs = dict(rho=self.rho)
+        if tensor:
+            kwargs = dict(rho=np.linspace(-1, 1, 120))
+            prisms64 = grav.PrismCollection.from_tensor_nodes(*self.tensor_nodes, **kwargs)
+            prisms32 = grav.PrismCollection.from_tensor_nodes(
+                *self.tensor_nodes, dtype=np.float32, **kwargs
+            )
+        else:
+            prisms64 = grav.PrismCollection(self.min_location, self.max_location, **kwargs)
+            prisms32 = grav.PrismCollection(
+                self.min_location, self.max_location, dtype=np.float32, **kwargs
+            )
+        for method in [
+            'gravitational_potential', 'gravitational_field', 'gravitational_gradient',
+            'gravitational_field_sensitivity', 'gravitational_gradient_sensitivity',
+        ]:
+            v64 = getattr(prisms64, method)(self.xyz)
+            v32 = getattr(prisms32, method)(self.xyz)
+            assert v64.dtype == np.float64
+            assert v32.dtype == np.float32
+            assert_allclose(v32, v64, rtol=1E-6, atol=1E-6 * np.abs(v64).max())
+
+        mag64 = MagneticPrismCollection(
+            self.min_location, self.max_location, magnetization=self.magnetization
+        )
+        mag32 = MagneticPrismCollection(
+            self.min_location, self.max_location, magnetization=self.magnetization,
+            dtype='float32',
+        )
+        for method in ['magnetic_field', 'magnetic_field_gradient_sensitivity']:
+            v64 = getattr(mag64, method)(self.xyz)
+            v32 = getattr(mag32, method)(self.xyz)
+            assert v32.dtype == np.float32
+            assert_allclose(v32, v64, rtol=1E-6, atol=1E-6 * np.abs(v64).max())
+
+        prism = MagneticPrism(
+            self.min_location[0], self.max_location[0], magnetization=self.magnetization[0],
+            dtype=np.float32,
+        )
+        assert prism.magnetic_field_gradient(self.xyz).dtype == np.float32
+        prism = grav.Prism(self.min_location[0], self.max_location[0], dtype=np.float32)
+        assert prism.gravitational_gradient(self.xyz).dtype == np.float32
+
+        with pytest.raises(ValueError):
+            prisms32.dtype = np.int64
+        with pytest.raises(TypeError):
+            prism.dtype = 'not_a_dtype'
+        with pytest.raises(ValueError):
+            pf.prism_definite_integrals(
+                pf.prism_f, self.xyz.reshape(-1, 3), self.min_location, self.max_location,
+                dtype=np.complex128
+            )
+
+    @pytest.mark.parametrize('tensor', [False, True])
+    def test_build_sensitivity(self, tensor, tmp_path, capsys):
+        xyz = self.xyz.reshape(-1, 3)
+        if tensor:
+            prisms = grav.PrismCollection.from_tensor_nodes(
+                *self.tensor_nodes, active_cells=np.arange(120) % 3 > 0
+            )
+        else:
+            prisms = grav.PrismCollection(self.min_location, self.max_location)
+        field = prisms.gravitational_field_sensitivity(xyz)
+        gradient = prisms.gravitational_gradient_sensitivity(xyz)
+        components = ["gz", "potential", "gxy", "gx", "gzz"]
+        sens_test = np.stack([
+            field[:, 2], prisms.gravitational_potential_sensitivity(xyz),
+            gradient[:, 0, 1], field[:, 0], gradient[:, 2, 2],
+        ], axis=1).reshape(-1, prisms.n_prism)
+
+        sens = prisms.build_sensitivity(xyz, components, block_size=3, n_threads=2)
+        assert_allclose(sens, sens_test, rtol=1E-12, atol=1E-12 * np.abs(sens_test).max())
+
+        # straight into a memory mapped file
+        sens = prisms.build_sensitivity(
+            xyz, components, out=tmp_path / "sens.npy", block_size=7, verbose=True
+        )
+        assert isinstance(sens, np.memmap)
+        assert "sensitivity matrix" in capsys.readouterr().out
+        assert_allclose(
+            np.load(tmp_path / "sens.npy"), sens_test,
+            rtol=1E-12, atol=1E-12 * np.abs(sens_test).max()
+        )
+
+        # through a buffer for arrays that can't be written to in place
+        out = np.zeros((sens_test.shape[1], sens_test.shape[0])).T
+        assert prisms.build_sensitivity(xyz, components, out=out, block_size=4) is out
+        assert_allclose(out, sens_test, rtol=1E-12, atol=1E-12 * np.abs(sens_test).max())
+
+        mag = MagneticPrismCollection(prisms.min_location, prisms.max_location)
+        sens = mag.build_sensitivity(xyz, ["potential", "hy", "hxz"], block_size=6)
+        sens_test = np.stack([
+            mag.scalar_potential_sensitivity(xyz),
+            mag.magnetic_field_sensitivity(xyz)[:, 1],
+            mag.magnetic_field_gradient_sensitivity(xyz)[:, 0, 2],
+        ], axis=1).reshape(-1, 3 * prisms.n_prism)
+        assert_allclose(sens, sens_test, rtol=1E-12, atol=1E-12 * np.abs(sens_test).max())
+
+        mag32 = MagneticPrismCollection(self.min_location, self.max_location, dtype=np.float32)
+        sens = mag32.build_sensitivity(xyz, "hz")
+        assert sens.dtype == np.float32
+        assert sens.shape == (xyz.shape[0], 36)
+
+        with pytest.raises(ValueError):
+            prisms.build_sensitivity(xyz, "hz")
+        with pytest.raises(ValueError):
+            prisms.build_sensitivity(self.xyz, "gz")
+        with pytest.raises(ValueError):
+            prisms.build_sensitivity(xyz, "gz", out=np.empty((3, prisms.n_prism)))
+        with pytest.raises(ValueError):
+            prisms.build_sensitivity(xyz, "gz", out=tmp_path / "sens.txt")
+        with pytest.raises(ValueError):
+            prisms.build_sensitivity(xyz, "gz", block_size=0)
+
+    @pytest.mark.parametrize('kernel', list(pf._KERNELS))
+    def test_far_field_compiled_vs_numpy(self, kernel):
+        xyz = self.xyz.reshape(-1, 3)
+        for cycle in range(3):
+            v0 = pf._eval_def_int_chunk(
+                kernel, xyz, self.min_location, self.max_location, cycle, 3.0
+            )
+            v1 = pf.prism_definite_integrals(
+                kernel, xyz, self.min_location, self.max_location, cycle=cycle,
+                far_field_ratio=3.0
+            )
+            assert_allclose(v0, v1, rtol=1E-10, atol=1E-10 * np.abs(v0).max())
+
+    def test_far_field(self):
+        xyz = self.xyz.reshape(-1, 3)
+        exact = grav.PrismCollection(self.min_location, self.max_location, rho=self.rho)
+        far = grav.PrismCollection(
+            self.min_location, self.max_location, rho=self.rho, far_field_ratio=3
+        )
+        for method in ['gravitational_potential', 'gravitational_gradient_sensitivity']:
+            v = getattr(far, method)(xyz)
+            v_test = getattr(exact, method)(xyz)
+            assert not np.allclose(v, v_test, rtol=1E-10, atol=0)
+            assert_allclose(v, v_test, rtol=0, atol=1E-2 * np.abs(v_test).max())
+
+        # the far field approximation matches a point mass and a point dipole
+        prism = grav.Prism(self.min_location[0], self.max_location[0], far_field_ratio=10)
+        point = grav.PointMass(mass=prism.mass, location=prism.location)
+        size = np.linalg.norm(self.max_location[0] - self.min_location[0])
+        xyz = prism.location + 20 * size * np.array([1., -2., 3.])
+        for method in ['gravitational_field', 'gravitational_gradient']:
+            v = getattr(prism, method)(xyz)
+            v_test = getattr(point, method)(xyz)
+            assert_allclose(v, v_test, rtol=1E-10, atol=1E-10 * np.abs(v_test).max())
+
+        magnetic = MagneticPrism(
+            self.min_location[0], self.max_location[0], magnetization=self.magnetization[0],
+            far_field_ratio=10
+        )
+        m = magnetic.moment
+        dipole = MagneticDipoleWholeSpace(
+            location=magnetic.location, moment=np.linalg.norm(m),
+            orientation=m / np.linalg.norm(m)
+        )
+        H = magnetic.magnetic_field(xyz)
+        H_test = dipole.magnetic_field(xyz)
+        assert_allclose(H, H_test, rtol=1E-10, atol=1E-10 * np.abs(H_test).max())
+
+        # error bound, with n the order of the derivative of 1/r
+        rng = np.random.default_rng(0)
+        for h in [np.array([1., 2., 3.]), np.array([10., 0.1, 0.1])]:
+            prism = grav.Prism(-h, h, far_field_ratio=5)
+            exact = grav.Prism(-h, h)
+            direction = rng.normal(size=(200, 3))
+            r = 5.01 * 2 * np.linalg.norm(h)
+            xyz = r * direction / np.linalg.norm(direction, axis=-1, keepdims=True)
+            for n, method in enumerate([
+                'gravitational_potential', 'gravitational_field', 'gravitational_gradient'
+            ]):
+                err = np.abs(getattr(prism, method)(xyz) - getattr(exact, method)(xyz))
+                scale = np.abs(G * prism.mass) * math.factorial(n) / r**(n + 1)
+                assert err.max() <= 1.05 * (n + 1) * (n + 2) / (24 * 5**2) * scale
+
+        # tensor collections are evaluated prism by prism
+        tensor = grav.PrismCollection.from_tensor_nodes(
+            *self.tensor_nodes, far_field_ratio=2
+        )
+        prisms = grav.PrismCollection(
+            tensor.min_location, tensor.max_location, far_field_ratio=2
+        )
+        assert_allclose(
+            tensor.gravitational_field(self.xyz), prisms.gravitational_field(self.xyz)
+        )
+
+        with pytest.raises(ValueError):
+            grav.Prism(self.min_location[0], self.max_location[0], far_field_ratio=0)
+        with pytest.raises(TypeError):
+            far.far_field_ratio = 'far'
+        with pytest.raises(ValueError):
+            pf.prism_derivative_integrals(
+                2, xyz, self.min_location, self.max_location, far_field_ratio=-1
+            )
+
+    def test_init_and_errors(self):
+        prisms = grav.PrismCollection(self.min_location, self.max_location)
+        np.testing.assert_equal(prisms.rho, np.ones(12))
+        assert_allclose(prisms.mass, np.prod(self.max_location - self.min_location, axis=-1))
+        assert prisms.n_prism == 12
+
+        with pytest.raises(ValueError):
+            prisms.rho = np.ones(3)
+        with pytest.raises(TypeError):
+            prisms.rho = 'abc'
+        with pytest.raises(ValueError):
+            grav.PrismCollection(self.max_location, self.min_location)
+        with pytest.raises(ValueError):
+            grav.PrismCollection(self.min_location, self.max_location[:3])
+        with pytest.raises(ValueError):
+            grav.PrismCollection(np.ones((3, 2)), np.ones((3, 2)))
+
+        prisms = MagneticPrismCollection(self.min_location, self.max_location)
+        np.testing.assert_equal(prisms.magnetization, np.tile([0.0, 0.0, 1.0], (12, 1)))
+        assert_allclose(prisms.moment[:, 2], prisms.volume)
+        with pytest.raises(ValueError):
+            prisms.magnetization = np.ones((3, 3))
+        with pytest.raises(TypeError):
+            prisms.magnetization = 'abc'
+
+        with pytest.raises(ValueError):
+            pf.prism_definite_integrals(
+                'prism_q', self.xyz.reshape(-1, 3), self.min_location, self.max_location
+            )
+        with pytest.raises(ValueError):
+            pf.prism_definite_integrals(
+                pf.prism_fz, self.xyz, self.min_location, self.max_location
+            )
+        with pytest.raises(ValueError):
+            pf.prism_definite_integrals(
+                pf.prism_fz, self.xyz.reshape(-1, 3), self.min_location,
+                self.max_location, weights=np.ones(3)
+            )
+
+
 if njit is not None:
     @pytest.mark.parametrize('function', [
         pf.prism_f,
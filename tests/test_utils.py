@@ -1,6 +1,6 @@
 import numpy as np
 import geoana
-from geoana.utils import check_xyz_dim, mkvc, ndgrid
+from geoana.utils import check_out, check_xyz_dim, mkvc, ndgrid, Workspace
 import pytest
 
 
@@ -107,3 +107,25 @@ def test_bad_dim():
     with pytest.raises(ValueError):
         xyz = check_xyz_dim(xyz)
 
+
+
+def test_check_out():
+    out = check_out(None, (4, 3))
+    assert out.shape == (4, 3)
+    assert check_out(out, (4, 3)) is out
+    with pytest.raises(TypeError):
+        check_out([[0.0] * 3] * 4, (4, 3))
+    with pytest.raises(ValueError):
+        check_out(out, (3, 4))
+    with pytest.raises(ValueError):
+        check_out(out, (4, 3), dtype=complex)
+
+
+def test_workspace():
+    ws = Workspace()
+    a = ws.empty("a", (10, 3))
+    assert ws.empty("a", (10, 3)) is a
+    assert ws.empty("a", (5, 3)).shape == (5, 3)
+    assert ws.empty("a", (5, 3), dtype=complex).dtype == complex
+    ws.clear()
+    assert ws.empty("a", (10, 3)) is not a